@@ -1,17 +1,130 @@
-from fastapi import APIRouter, Depends, HTTPException
-from typing import Dict, Any
+import re
+import json
+import time
+import asyncio
+import httpx
+from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi.responses import Response, StreamingResponse
+from typing import AsyncIterator, Dict, Any, List, Optional
 
-from app.schemas.base import GenerateRequest, GenerateResponse, ClientConfig, ReloadResponse
-from app.clients.auth import get_client_auth, check_endpoint_access, client_manager
-from app.models.llm import get_model
+from app.schemas.base import (
+    GenerateRequest, GenerateResponse, BatchGenerateRequest, BatchItemResult, ClientAuth, ReloadResponse,
+    CacheStatsResponse, CircuitStatusResponse, TokenResponse, JobRequest, JobResponse,
+)
+from app.api.generation import (
+    chat_usage, encode_chat, generate, plan_batch, plan_chat, plan_generation, provider_unavailable, record_usage, reserve_batch,
+    run_batch, track_prefix,
+)
+from app.clients.auth import (
+    get_client_auth, require_endpoint_access, check_rate_limit, charge_requests, client_manager, release_tokens, reserve_tokens,
+)
+from app.api.responses import FastJSONRoute, generate_response, json_loads
+from app.clients.registry import ClientRecord
+from app.clients.tokens import token_service
+from app.core.cache import response_cache
+from app.core.semantic_cache import semantic_cache
+from app.core.config import settings
+from app.core.jobs import QUEUE_FULL_RETRY_AFTER, JobQueueFull, job_queue
+from app.core import metrics
+from app.models.circuit_breaker import CircuitOpenError, circuit_breakers
+from app.models.prompts import assemble_messages, prefix_tracker
+from app.models.routing import model_router
+from app.models.tokenizer import token_counter
 
-router = APIRouter()
+router = APIRouter(route_class=FastJSONRoute)
+
+# Stream chunks that report token usage
+_USAGE_PATTERN = re.compile(rb'"usage":\s*\{')
+# Chunks carrying generated text, counted when a stream ends before its usage is reported
+_CONTENT_PATTERN = re.compile(rb'"content":\s*"')
+
+def _sse_event(data: Dict[str, Any], event: Optional[str] = None) -> bytes:
+    """Encode a server-sent event.
+    
+    Args:
+        data: Event payload
+        event: Optional event name
+    
+    Returns:
+        bytes: Encoded event
+    """
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {json.dumps(data)}\n\n".encode()
+
+def _partial_usage(model: str, prompt_tokens: int, deltas: List[str]) -> Dict[str, int]:
+    """Count the usage of a stream that ended before the provider reported it.
+    
+    Args:
+        model: Model name, to pick the tokenizer
+        prompt_tokens: Prompt tokens counted when the request was planned
+        deltas: Text deltas sent to the client
+    
+    Returns:
+        Dict[str, int]: Token usage information
+    """
+    completion_tokens = token_counter.count(model, "".join(deltas))
+    return {
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "total_tokens": prompt_tokens + completion_tokens,
+    }
+
+async def _stream_events(
+    client_id: str,
+    first: Dict[str, Any],
+    events: AsyncIterator[Dict[str, Any]],
+    model: str,
+    prompt_tokens: int,
+    reserved: int = 0,
+) -> AsyncIterator[bytes]:
+    """Relay model stream events to the client as server-sent events.
+    
+    If the stream ends before its final event, because the client went away
+    or the provider failed, the prompt tokens and the text already sent are
+    charged instead of the usage the provider would have reported.
+    
+    Args:
+        client_id: Client ID to charge the usage to
+        first: First event, already received from the model
+        events: Remaining model stream events
+        model: Model name, to count the text sent if the stream ends early
+        prompt_tokens: Prompt tokens counted when the request was planned
+        reserved: Tokens reserved for the stream, released when it ends
+    
+    Yields:
+        bytes: Encoded server-sent events
+    """
+    event = first
+    deltas: List[str] = []
+    charged = False
+    try:
+        while True:
+            if event.get("done"):
+                record_usage(client_id, event.get("usage"))
+                charged = True
+            elif "text" in event:
+                deltas.append(event["text"])
+            yield _sse_event(event)
+            event = await events.__anext__()
+    except StopAsyncIteration:
+        return
+    except Exception as e:
+        # Headers are already sent, so report the failure in-band
+        yield _sse_event({"detail": f"Error generating text: {str(e)}"}, event="error")
+    finally:
+        if not charged:
+            record_usage(client_id, _partial_usage(model, prompt_tokens, deltas))
+        release_tokens(client_id, reserved)
+        # Close the provider stream too when the client goes away early
+        await events.aclose()
 
 @router.post("/generate", response_model=GenerateResponse)
+@metrics.timed_handler
 async def generate_text(
     request: GenerateRequest,
-    client_config: ClientConfig = Depends(get_client_auth),
-    _: None = Depends(lambda client_config=None: check_endpoint_access("generate", client_config)),
+    client_config: ClientRecord = Depends(get_client_auth),
+    _: None = Depends(require_endpoint_access("generate")),
+    __: None = Depends(check_rate_limit),
 ) -> Dict[str, Any]:
     """Generate text using the specified model and provider.
     
@@ -20,50 +133,342 @@ async def generate_text(
         client_config: Client configuration
     
     Returns:
-        Dict[str, Any]: Generated text and metadata
+        Dict[str, Any]: Generated text and metadata, or a server-sent event
+        stream of text deltas when `stream` is set
     
     Raises:
         HTTPException: If request is invalid or generation fails
     """
-    # Check max tokens limit
-    if request.max_tokens > client_config.max_tokens_limit:
-        raise HTTPException(
-            status_code=400, 
-            detail=f"Max tokens limit exceeded. Maximum allowed: {client_config.max_tokens_limit}"
+    plan = plan_generation(request, client_config)
+    if not request.stream:
+        response = await generate(request, client_config, plan)
+        # The result is built by the gateway, so it is encoded without validating it again
+        if settings.FAST_JSON_RESPONSES:
+            return generate_response(response)
+        return response
+    
+    track_prefix(client_config.client_id, request.prompt)
+    reserved = reserve_tokens(client_config, plan.prompt_tokens + plan.max_tokens, plan.prompt_tokens)
+    try:
+        # Wait for the first event so upstream failures still return an error status
+        provider_start = time.perf_counter()
+        first, events = await model_router.start_stream(
+            plan.targets,
+            prompt=request.prompt,
+            temperature=request.temperature,
+            max_tokens=plan.max_tokens,
+            fallbacks=plan.fallbacks
         )
+        metrics.observe_stage("provider", time.perf_counter() - provider_start)
+        stream = _stream_events(client_config.client_id, first, events, plan.model, plan.prompt_tokens, reserved)
+        # The stream releases the reservation when it ends
+        reserved = 0
+        return StreamingResponse(stream, media_type="text/event-stream")
+    except CircuitOpenError as e:
+        raise provider_unavailable(e)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error generating text: {str(e)}")
+    finally:
+        release_tokens(client_config.client_id, reserved)
+
+async def _batch_lines(errors: List[Dict[str, Any]], results: AsyncIterator[Dict[str, Any]]) -> AsyncIterator[bytes]:
+    """Encode batch results as newline-delimited JSON.
     
-    # Use client default provider if not specified
-    provider = request.provider or client_config.default_provider
+    Args:
+        errors: Results of requests that failed validation
+        results: Results of the requests that were run, as they complete
+    
+    Yields:
+        bytes: One JSON line per request
+    """
+    for error in errors:
+        yield f"{json.dumps(error)}\n".encode()
+    async for result in results:
+        yield f"{json.dumps(result)}\n".encode()
+
+@router.post(
+    "/generate/batch",
+    response_class=StreamingResponse,
+    responses={200: {"model": BatchItemResult, "description": "Newline-delimited JSON, one line per request"}},
+)
+@metrics.timed_handler
+async def generate_batch(
+    batch: BatchGenerateRequest,
+    client_config: ClientRecord = Depends(get_client_auth),
+    _: None = Depends(require_endpoint_access("generate")),
+) -> StreamingResponse:
+    """Generate text for a batch of requests.
+    
+    Every request is validated up front, and the valid ones are charged
+    against the rate limits together, with one reservation for the tokens
+    they can use, and run concurrently. Results are
+    streamed as newline-delimited JSON in completion order, one line per
+    request with its index, status and either the response or the error
+    detail.
+    
+    Args:
+        batch: Text generation requests
+        client_config: Client configuration
     
-    # Check provider permission
-    if provider not in client_config.allowed_providers:
+    Returns:
+        StreamingResponse: NDJSON stream of results
+    
+    Raises:
+        HTTPException: If the batch is too large or the client has no room in its rate limits for it
+    """
+    if len(batch.requests) > settings.BATCH_MAX_ITEMS:
         raise HTTPException(
-            status_code=403, 
-            detail=f"Client does not have permission to use provider: {provider}"
+            status_code=400,
+            detail=f"Batch too large. Maximum allowed: {settings.BATCH_MAX_ITEMS} requests"
         )
     
-    # Use client default model if not specified
-    model_name = request.model or client_config.default_model
+    # Validate every request before running any
+    items, errors = plan_batch(batch.requests, client_config)
     
+    # Charge the whole batch at once, so it is admitted or rejected as a unit
+    reserved = 0
+    if items:
+        if settings.RATE_LIMIT_ENABLED and len(items) > client_config.rate_limit.requests_per_minute:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Batch exceeds the rate limit. Maximum allowed: {client_config.rate_limit.requests_per_minute} requests per minute"
+            )
+        # Reserve the tokens first, so a batch rejected for its tokens uses none of the request budget
+        reserved = reserve_batch(client_config, items)
+        try:
+            charge_requests(client_config, len(items))
+        except HTTPException:
+            release_tokens(client_config.client_id, reserved)
+            raise
+    # The stream releases the reservation as the requests complete
+    return StreamingResponse(
+        _batch_lines(errors, run_batch(client_config, items, reserved)), media_type="application/x-ndjson"
+    )
+
+async def _relay_chat_stream(
+    client_id: str, response: httpx.Response, model: str, prompt_tokens: int, reserved: int = 0,
+) -> AsyncIterator[bytes]:
+    """Relay a provider's chat completion stream unchanged.
+    
+    If the stream ends before the provider reports its usage, the prompt
+    tokens and the content already relayed are charged instead.
+    
+    Args:
+        client_id: Client ID to charge the usage to
+        response: Provider response with an unread event stream
+        model: Model name, to count the content relayed if the stream ends early
+        prompt_tokens: Prompt tokens counted when the request was planned
+        reserved: Tokens reserved for the stream, released when it ends
+    
+    Yields:
+        bytes: Stream data as received from the provider
+    """
+    pending = b""
+    deltas: List[str] = []
+    charged = False
     try:
-        # Get model instance
-        model = get_model(provider, model_name)
-        
-        # Generate text
-        response = await model.generate(
-            prompt=request.prompt,
-            temperature=request.temperature,
-            max_tokens=request.max_tokens
+        async for chunk in response.aiter_bytes():
+            *lines, pending = (pending + chunk).split(b"\n")
+            for line in lines:
+                if not line.startswith(b"data: "):
+                    continue
+                if _USAGE_PATTERN.search(line):
+                    usage = chat_usage(json_loads(line[6:]))
+                    if usage:
+                        record_usage(client_id, usage)
+                        charged = True
+                elif not charged and _CONTENT_PATTERN.search(line):
+                    for choice in json_loads(line[6:]).get("choices") or ():
+                        content = (choice.get("delta") or {}).get("content")
+                        if isinstance(content, str):
+                            deltas.append(content)
+            yield chunk
+    except Exception as e:
+        # Headers are already sent, so report the failure in-band
+        yield _sse_event({"error": {"message": f"Error generating text: {str(e)}"}})
+    finally:
+        if not charged:
+            record_usage(client_id, _partial_usage(model, prompt_tokens, deltas))
+        release_tokens(client_id, reserved)
+        await response.aclose()
+
+@router.post(
+    "/chat/completions",
+    response_class=Response,
+    responses={200: {"description": "OpenAI chat completion, or server-sent chunks when `stream` is set"}},
+)
+@metrics.timed_handler
+async def chat_completions(
+    request: Request,
+    client_config: ClientRecord = Depends(get_client_auth),
+    _: None = Depends(require_endpoint_access("generate")),
+    __: None = Depends(check_rate_limit),
+) -> Response:
+    """OpenAI-compatible chat completions.
+    
+    Takes an OpenAI chat completions request (`messages`, `n`, `stop`,
+    `stream` and the other OpenAI parameters) and passes it through to the
+    provider. The body is only re-encoded when the gateway has to change a
+    field, and the provider's response is relayed as received.
+    
+    Args:
+        request: HTTP request with the chat completions body
+        client_config: Client configuration
+    
+    Returns:
+        Response: Provider response, or its event stream when `stream` is set
+    
+    Raises:
+        HTTPException: If the request is invalid or no provider can be reached
+    """
+    raw = await request.body()
+    try:
+        body = json_loads(raw)
+    except ValueError:
+        body = None
+    if not isinstance(body, dict):
+        raise HTTPException(status_code=400, detail="Request body must be a JSON object")
+    plan = plan_chat(body, client_config)
+    prompt = assemble_messages(body["messages"])
+    prefix_tracker.record(client_config.client_id, prompt.prefix_key)
+    # Each of the n completions may use up to max_tokens
+    reserved = reserve_tokens(client_config, plan.prompt_tokens + plan.completions * plan.max_tokens, plan.prompt_tokens)
+    
+    try:
+        provider_start = time.perf_counter()
+        target, response = await model_router.start_chat(
+            plan.targets,
+            lambda target: encode_chat(raw, body, target, plan.max_tokens, prompt),
+            plan.fallbacks
         )
+        if body.get("stream") and response.status_code == 200:
+            metrics.observe_stage("provider", time.perf_counter() - provider_start)
+            stream = _relay_chat_stream(client_config.client_id, response, target[1], plan.prompt_tokens, reserved)
+            # The stream releases the reservation when it ends
+            reserved = 0
+            return StreamingResponse(stream, media_type="text/event-stream")
+        try:
+            content = await response.aread()
+        finally:
+            await response.aclose()
+        metrics.observe_stage("provider", time.perf_counter() - provider_start)
         
-        return response
+        if response.status_code == 200:
+            record_usage(client_config.client_id, chat_usage(json_loads(content)))
+    except CircuitOpenError as e:
+        raise provider_unavailable(e)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error generating text: {str(e)}")
+    finally:
+        release_tokens(client_config.client_id, reserved)
+    return Response(content, status_code=response.status_code, media_type="application/json")
+
+def _check_jobs_enabled() -> None:
+    """Reject job requests when the job queue is disabled.
+    
+    Raises:
+        HTTPException: If JOBS_ENABLED is off
+    """
+    if not settings.JOBS_ENABLED:
+        raise HTTPException(status_code=503, detail="The job queue is not enabled")
+
+@router.post("/jobs", response_model=JobResponse, status_code=202)
+@metrics.timed_handler
+async def submit_job(
+    job: JobRequest,
+    client_config: ClientRecord = Depends(get_client_auth),
+    _: None = Depends(require_endpoint_access("generate")),
+) -> Dict[str, Any]:
+    """Queue a batch of generation requests to run in the background.
+    
+    The job is charged against the client's rate limits when it runs, not
+    when it is submitted, so bursts of jobs drain at the client's allowed
+    rate instead of being rejected.
+    
+    Args:
+        job: Generation requests and priority
+        client_config: Client configuration
+    
+    Returns:
+        Dict[str, Any]: Status of the queued job
+    
+    Raises:
+        HTTPException: If the job queue is disabled or full, or the job is too large
+    """
+    _check_jobs_enabled()
+    if len(job.requests) > settings.BATCH_MAX_ITEMS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Job too large. Maximum allowed: {settings.BATCH_MAX_ITEMS} requests"
+        )
+    if settings.RATE_LIMIT_ENABLED and len(job.requests) > client_config.rate_limit.requests_per_minute:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Job exceeds the rate limit. Maximum allowed: {client_config.rate_limit.requests_per_minute} requests per minute"
+        )
+    
+    payload = [request.model_dump(exclude_unset=True) for request in job.requests]
+    try:
+        job_id = await job_queue.enqueue(client_config.client_id, payload, job.priority)
+    except JobQueueFull as e:
+        raise HTTPException(
+            status_code=429 if e.client_limit else 503,
+            detail=str(e),
+            headers={"Retry-After": str(QUEUE_FULL_RETRY_AFTER)}
+        )
+    return {"job_id": job_id, "status": "queued", "priority": job.priority, "created_at": time.time()}
+
+@router.get("/jobs/{job_id}", response_model=JobResponse)
+async def get_job(
+    job_id: str,
+    client_config: ClientRecord = Depends(get_client_auth),
+    _: None = Depends(require_endpoint_access("generate")),
+) -> Dict[str, Any]:
+    """Get the status of a generation job, with its results once it has completed.
+    
+    Args:
+        job_id: Job ID
+        client_config: Client configuration
+    
+    Returns:
+        Dict[str, Any]: Job status
+    
+    Raises:
+        HTTPException: If the job queue is disabled, or the job does not exist, has expired or belongs to another client
+    """
+    _check_jobs_enabled()
+    job = await asyncio.to_thread(job_queue.get, job_id)
+    if job is None or job["client_id"] != client_config.client_id:
+        raise HTTPException(status_code=404, detail=f"Job not found: {job_id}")
+    job["results"] = job.pop("result")
+    return job
+
+@router.post("/token", response_model=TokenResponse)
+async def issue_token(credentials: ClientAuth) -> Dict[str, Any]:
+    """Exchange client credentials for a signed bearer token.
+    
+    The token carries the client's configuration, so requests made with it
+    are authorized without looking up the client.
+    
+    Args:
+        credentials: Client ID and secret
+    
+    Returns:
+        Dict[str, Any]: Token response
+    
+    Raises:
+        HTTPException: If token signing is not configured or authentication fails
+    """
+    if not token_service.enabled:
+        raise HTTPException(status_code=503, detail="Token signing is not configured")
+    client_config = await client_manager.authenticate(credentials.client_id, credentials.client_secret)
+    token, expires_in = token_service.issue(client_config)
+    return {"access_token": token, "token_type": "bearer", "expires_in": expires_in}
 
 @router.get("/clients/reload", response_model=ReloadResponse)
 async def reload_clients(
-    client_config: ClientConfig = Depends(get_client_auth),
-    _: None = Depends(lambda client_config=None: check_endpoint_access("clients/reload", client_config)),
+    client_config: ClientRecord = Depends(get_client_auth),
+    _: None = Depends(require_endpoint_access("clients/reload")),
 ) -> Dict[str, Any]:
     """Reload client configurations.
     
@@ -73,8 +478,43 @@ async def reload_clients(
     Returns:
         Dict[str, Any]: Reload response
     """
-    count = client_manager.reload_clients()
+    # The store is scanned in a worker thread, so requests in flight are not stalled
+    await client_manager.refresh_clients()
+    count = len(client_manager.clients)
     return {
         "message": f"Successfully reloaded {count} client configurations",
         "count": count
     }
+
+@router.get("/cache/stats", response_model=CacheStatsResponse)
+async def cache_stats(
+    client_config: ClientRecord = Depends(get_client_auth),
+    _: None = Depends(require_endpoint_access("cache/stats")),
+) -> Dict[str, Any]:
+    """Get response cache statistics.
+    
+    Args:
+        client_config: Client configuration
+    
+    Returns:
+        Dict[str, Any]: Cache hit, miss and size counters
+    """
+    stats = response_cache.stats()
+    for name, value in semantic_cache.stats().items():
+        stats[f"semantic_{name}"] = value
+    return stats
+
+@router.get("/circuits", response_model=CircuitStatusResponse)
+async def circuit_status(
+    client_config: ClientRecord = Depends(get_client_auth),
+    _: None = Depends(require_endpoint_access("circuits")),
+) -> Dict[str, Any]:
+    """Get the circuit breaker state and routing statistics of each provider target.
+    
+    Args:
+        client_config: Client configuration
+    
+    Returns:
+        Dict[str, Any]: Circuit breaker and routing statistics keyed by "provider/model"
+    """
+    return {"circuits": circuit_breakers.snapshot(), "routing": model_router.snapshot()}
@@ -0,0 +1,555 @@
+"""
+Text generation pipeline shared by the generation endpoints.
+
+A request is first planned: checked against the client's limits and
+permissions and resolved to the (provider, model) targets it may be routed
+to. Its prompt tokens are counted locally, so prompts that cannot fit the
+model's context window are rejected and max_tokens is trimmed to the room
+left before anything is sent upstream. The plan is then run through the
+response caches, single-flight coalescing and the model router, with the
+most the call can use reserved from the client's daily token limit. Batches
+reserve the tokens of all their requests at once and run their planned
+requests concurrently, at most BATCH_CONCURRENCY at a time per client, and
+queued jobs run as batches. OpenAI chat completions requests are planned the same
+way and passed through to the provider.
+"""
+import math
+import time
+import asyncio
+import weakref
+from typing import Any, AsyncIterator, Dict, List, NamedTuple, Optional, Tuple
+
+from fastapi import HTTPException
+
+from app.schemas.base import GenerateRequest
+from app.api.responses import json_dumps
+from app.clients.auth import charge_requests, client_manager, release_tokens, reserve_tokens
+from app.clients.registry import ClientRecord
+from app.core.cache import response_cache
+from app.core.semantic_cache import semantic_cache
+from app.core.singleflight import single_flight
+from app.core.config import settings
+from app.core.jobs import Job, JobDeferred
+from app.core.rate_limit import rate_limiter
+from app.core import metrics
+from app.models.circuit_breaker import CircuitOpenError, Target
+from app.models.prompts import AssembledPrompt, assemble_prompt, cache_hints, prefix_tracker
+from app.models.provider_clients import DEFAULT_API_BASE_URLS
+from app.models.routing import model_router
+from app.models.tokenizer import token_counter
+
+# Provider names that may prefix a chat completions model, as in "groq/llama3-8b-8192"
+PROVIDERS = ("openai", "groq", "triton")
+
+class GenerationPlan(NamedTuple):
+    """Where a generation request will be sent."""
+    provider: str
+    model: str
+    targets: List[Target]
+    fallbacks: List[Target]
+    # Estimated prompt tokens, and the max_tokens to send after fitting the context window
+    prompt_tokens: int
+    max_tokens: int
+    # Number of completions generated for the prompt (the chat completions n)
+    completions: int = 1
+
+def use_response_cache(request: GenerateRequest, client_config: ClientRecord) -> bool:
+    """Check whether a request may be served from the response cache.
+    
+    Args:
+        request: Text generation request
+        client_config: Client configuration
+    
+    Returns:
+        bool: True if the response cache should be used
+    """
+    if not settings.RESPONSE_CACHE_ENABLED or not client_config.response_cache_enabled or request.stream:
+        return False
+    if request.cache is not None:
+        return request.cache
+    return request.temperature == 0
+
+def is_deterministic(request: GenerateRequest) -> bool:
+    """Check whether identical requests may share one upstream call.
+    
+    Args:
+        request: Text generation request
+    
+    Returns:
+        bool: True for non-streaming requests with temperature 0 or an explicit cache opt-in
+    """
+    return not request.stream and (request.temperature == 0 or bool(request.cache))
+
+def record_usage(client_id: str, usage: Optional[Dict[str, int]]) -> None:
+    """Charge a generation's token usage to the client.
+    
+    Args:
+        client_id: Client ID
+        usage: Token usage information
+    """
+    if usage:
+        rate_limiter.record_tokens(client_id, usage["total_tokens"])
+        metrics.count_client_tokens(client_id, usage)
+
+def track_prefix(client_id: str, prompt: str) -> None:
+    """Record a generate prompt sent upstream in the client's prefix reuse statistics.
+    
+    Args:
+        client_id: Client ID
+        prompt: Prompt text
+    """
+    # Shorter prompts are never cached by the providers
+    if len(prompt) >= settings.PROMPT_CACHE_MIN_CHARS:
+        prefix_tracker.record(client_id, assemble_prompt(prompt).prefix_key)
+
+def plan_generation(request: GenerateRequest, client_config: ClientRecord) -> GenerationPlan:
+    """Check a request against the client's limits and resolve its targets.
+    
+    Args:
+        request: Text generation request
+        client_config: Client configuration
+    
+    Returns:
+        GenerationPlan: Provider, model, targets and token counts for the request
+    
+    Raises:
+        HTTPException: If the request exceeds the client's token limit or a context window, or uses a provider it may not use
+    """
+    plan = resolve_targets(request, client_config)
+    prompt_tokens = token_counter.count(plan.targets[0][1], request.prompt)
+    return fit_context(plan._replace(prompt_tokens=prompt_tokens), client_config.client_id)
+
+def resolve_targets(request: GenerateRequest, client_config: ClientRecord) -> GenerationPlan:
+    """Check a request against the client's limits and resolve its targets, without counting its prompt.
+    
+    Args:
+        request: Text generation request
+        client_config: Client configuration
+    
+    Returns:
+        GenerationPlan: Provider, model and targets for the request
+    
+    Raises:
+        HTTPException: If the request exceeds the client's token limit or uses a provider it may not use
+    """
+    # Check max tokens limit
+    if request.max_tokens > client_config.max_tokens_limit:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Max tokens limit exceeded. Maximum allowed: {client_config.max_tokens_limit}"
+        )
+    
+    # Use client default provider if not specified
+    provider = request.provider or client_config.default_provider
+    
+    # Use client default model if not specified
+    model_name = request.model or client_config.default_model
+    
+    # Resolve the (provider, model) targets the request may be routed to
+    if model_name in settings.MODEL_ALIASES:
+        targets = model_router.resolve(model_name, client_config.allowed_providers, request.provider)
+        fallbacks = []
+        if not targets:
+            raise HTTPException(
+                status_code=403,
+                detail=f"Client does not have permission to use any provider for model: {model_name}"
+            )
+    else:
+        # Check provider permission
+        if not client_manager.check_provider_permission(client_config, provider):
+            raise HTTPException(
+                status_code=403,
+                detail=f"Client does not have permission to use provider: {provider}"
+            )
+        targets = [(provider, model_name)]
+        fallbacks = model_router.fallbacks(targets[0], client_config.allowed_providers)
+    return GenerationPlan(provider, model_name, targets, fallbacks, 0, request.max_tokens)
+
+def fit_context(plan: GenerationPlan, client_id: str) -> GenerationPlan:
+    """Fit a planned request into its targets' context windows.
+    
+    Targets whose context window cannot hold the prompt are dropped, and
+    max_tokens is trimmed to the room the prompt leaves in the smallest
+    remaining window. Fallbacks without room for the trimmed request are
+    dropped too. Models with an unknown context window are assumed to fit.
+    
+    Args:
+        plan: Planned request with its prompt tokens counted
+        client_id: Client ID
+    
+    Returns:
+        GenerationPlan: Plan with the targets that fit and the max_tokens to send
+    
+    Raises:
+        HTTPException: If no target can hold the prompt, or max_tokens does not fit and TOKEN_TRIM_MAX_TOKENS is off
+    """
+    if not settings.TOKEN_PRECHECK_ENABLED:
+        return plan
+    windows = {target: token_counter.context_window(target[1]) for target in plan.targets}
+    targets = [target for target in plan.targets if windows[target] is None or windows[target] > plan.prompt_tokens]
+    if not targets:
+        metrics.TOKEN_PRECHECKS.inc((client_id, "rejected"))
+        raise HTTPException(
+            status_code=400,
+            detail=f"Prompt too long for model {plan.model}: about {plan.prompt_tokens} tokens. "
+                   f"Maximum allowed: {max(windows.values())} tokens"
+        )
+    
+    # Trim max_tokens to the room left in the smallest context window
+    max_tokens = plan.max_tokens
+    known = [windows[target] for target in targets if windows[target] is not None]
+    if known and plan.prompt_tokens + max_tokens > min(known):
+        room = min(known) - plan.prompt_tokens
+        if not settings.TOKEN_TRIM_MAX_TOKENS:
+            metrics.TOKEN_PRECHECKS.inc((client_id, "rejected"))
+            raise HTTPException(
+                status_code=400,
+                detail=f"Max tokens exceeds the room left by the prompt (about {plan.prompt_tokens} tokens) "
+                       f"in the context window of model {plan.model}. Maximum allowed: {room}"
+            )
+        metrics.TOKEN_PRECHECKS.inc((client_id, "trimmed"))
+        max_tokens = room
+    
+    needed = plan.prompt_tokens + max_tokens
+    fallbacks = [
+        target for target in plan.fallbacks
+        if (window := token_counter.context_window(target[1])) is None or window >= needed
+    ]
+    return plan._replace(targets=targets, fallbacks=fallbacks, max_tokens=max_tokens)
+
+async def generate(
+    request: GenerateRequest, client_config: ClientRecord, plan: GenerationPlan, reserve: bool = True
+) -> Dict[str, Any]:
+    """Generate text for a planned, non-streaming request.
+    
+    Args:
+        request: Text generation request
+        client_config: Client configuration
+        plan: Result of plan_generation()
+        reserve: Whether to reserve the call's tokens, unless its batch reserved them already
+    
+    Returns:
+        Dict[str, Any]: Generated text and metadata
+    
+    Raises:
+        HTTPException: If every target is unavailable or generation fails
+    """
+    provider, model_name, targets, fallbacks, prompt_tokens, max_tokens, _ = plan
+    
+    # Serve deterministic requests from the response cache
+    use_cache = use_response_cache(request, client_config)
+    coalesce = settings.SINGLE_FLIGHT_ENABLED and is_deterministic(request)
+    if use_cache or coalesce:
+        cache_key = response_cache.make_key(provider, model_name, request.prompt, request.temperature, max_tokens)
+    if use_cache:
+        cached = response_cache.get(cache_key)
+        if cached is not None:
+            return {**cached, "cached": True}
+        
+        # Fall back to responses for similar prompts
+        if settings.SEMANTIC_CACHE_ENABLED:
+            threshold = client_config.semantic_cache_threshold
+            if threshold is None:
+                threshold = settings.SEMANTIC_CACHE_THRESHOLD
+            semantic_scope = (provider, model_name, request.temperature, max_tokens)
+            prompt_vector, cached = semantic_cache.get(semantic_scope, request.prompt, threshold)
+            if cached is not None:
+                return {**cached, "cached": True}
+    
+    track_prefix(client_config.client_id, request.prompt)
+    reserved = reserve_tokens(client_config, prompt_tokens + max_tokens, prompt_tokens) if reserve else 0
+    try:
+        # Time spent waiting for the provider
+        provider_start = time.perf_counter()
+        
+        # Generate text with the best target, sharing the upstream call with identical in-flight requests
+        def call():
+            return model_router.generate(
+                targets,
+                prompt=request.prompt,
+                temperature=request.temperature,
+                max_tokens=max_tokens,
+                fallbacks=fallbacks
+            )
+        
+        if coalesce:
+            response = await single_flight.do(cache_key, call)
+        else:
+            response = await call()
+        metrics.observe_stage("provider", time.perf_counter() - provider_start)
+        
+        # Each caller is charged for the usage, even when the call was shared
+        record_usage(client_config.client_id, response.get("usage"))
+        if use_cache:
+            response_cache.set(cache_key, response)
+            if settings.SEMANTIC_CACHE_ENABLED:
+                semantic_cache.set(semantic_scope, prompt_vector, response)
+        return response
+    except CircuitOpenError as e:
+        raise provider_unavailable(e)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error generating text: {str(e)}")
+    finally:
+        release_tokens(client_config.client_id, reserved)
+
+def provider_unavailable(error: CircuitOpenError) -> HTTPException:
+    """Build the error for a request whose targets all have open circuits.
+    
+    Args:
+        error: Circuit breaker error
+    
+    Returns:
+        HTTPException: 503 error with a Retry-After header
+    """
+    return HTTPException(
+        status_code=503,
+        detail=f"Provider unavailable: {str(error)}",
+        headers={"Retry-After": str(max(1, math.ceil(error.retry_after)))}
+    )
+
+def plan_chat(body: Dict[str, Any], client_config: ClientRecord) -> GenerationPlan:
+    """Check an OpenAI chat completions request and resolve its targets.
+    
+    Only the fields the gateway needs are read; the rest of the request is
+    left to the provider. The model may be a model name, a model alias or
+    "provider/model" to choose the provider.
+    
+    Args:
+        body: Decoded chat completions request
+        client_config: Client configuration
+    
+    Returns:
+        GenerationPlan: Provider, model, targets on providers with an OpenAI-compatible API and token counts
+    
+    Raises:
+        HTTPException: If the request is malformed, exceeds the client's token limit or a context window, or uses a provider it may not use
+    """
+    messages = body.get("messages")
+    if not isinstance(messages, list) or not messages or not all(isinstance(message, dict) for message in messages):
+        raise HTTPException(status_code=400, detail="messages must be a non-empty list of objects")
+    model = body.get("model")
+    if model is not None and not isinstance(model, str):
+        raise HTTPException(status_code=400, detail="model must be a string")
+    max_tokens = body.get("max_completion_tokens", body.get("max_tokens"))
+    if max_tokens is None:
+        max_tokens = client_config.max_tokens_limit
+    elif not isinstance(max_tokens, int) or isinstance(max_tokens, bool) or max_tokens <= 0:
+        raise HTTPException(status_code=400, detail="max_tokens must be a positive integer")
+    completions = body.get("n", 1)
+    if completions is None:
+        completions = 1
+    elif not isinstance(completions, int) or isinstance(completions, bool) or completions <= 0:
+        raise HTTPException(status_code=400, detail="n must be a positive integer")
+    
+    # Split an explicit provider off the model name
+    provider = None
+    if model:
+        prefix, separator, name = model.partition("/")
+        if separator and prefix in PROVIDERS:
+            provider, model = prefix, name
+    
+    request = GenerateRequest.model_construct(prompt="", max_tokens=max_tokens, provider=provider, model=model or None)
+    plan = resolve_targets(request, client_config)
+    targets = [target for target in plan.targets if target[0] in DEFAULT_API_BASE_URLS]
+    if not targets:
+        raise HTTPException(status_code=400, detail=f"Provider {plan.provider} does not support chat completions")
+    fallbacks = [target for target in plan.fallbacks if target[0] in DEFAULT_API_BASE_URLS]
+    prompt_tokens = token_counter.count_messages(targets[0][1], messages)
+    return fit_context(
+        plan._replace(targets=targets, fallbacks=fallbacks, prompt_tokens=prompt_tokens, completions=completions),
+        client_config.client_id
+    )
+
+def encode_chat(raw: bytes, body: Dict[str, Any], target: Target, max_tokens: int, prompt: AssembledPrompt) -> bytes:
+    """Encode a chat completions request for a target.
+    
+    The client's body is sent as is unless the gateway has to change it: to
+    name the target's model, to send max_tokens when the request sets none
+    or it was trimmed to fit the context window, to send the assembled messages and prefix caching
+    hints, or to ask OpenAI for the usage of a stream.
+    
+    Args:
+        raw: Request body as received
+        body: Decoded request body
+        target: (provider, model) pair the request is sent to
+        max_tokens: Maximum tokens to generate, from the request's plan
+        prompt: Messages of the request, assembled by assemble_messages()
+    
+    Returns:
+        bytes: Encoded request body
+    """
+    provider, model = target
+    changes: Dict[str, Any] = {}
+    if body.get("model") != model:
+        changes["model"] = model
+    if prompt.changed:
+        changes["messages"] = prompt.messages
+    # Hints set by the client take precedence
+    for name, value in cache_hints(provider, prompt).items():
+        if name not in body:
+            changes[name] = value
+    if "max_completion_tokens" in body:
+        if body["max_completion_tokens"] != max_tokens:
+            changes["max_completion_tokens"] = max_tokens
+    elif body.get("max_tokens") != max_tokens:
+        changes["max_tokens"] = max_tokens
+    if body.get("stream") and provider == "openai":
+        options = body.get("stream_options") or {}
+        if not options.get("include_usage"):
+            changes["stream_options"] = {**options, "include_usage": True}
+    if not changes:
+        return raw
+    return json_dumps({**body, **changes})
+
+def chat_usage(event: Dict[str, Any]) -> Optional[Dict[str, int]]:
+    """Get the token usage reported in a chat completion or stream chunk.
+    
+    Args:
+        event: Decoded chat completion or chunk
+    
+    Returns:
+        Optional[Dict[str, int]]: Token usage information, if reported
+    """
+    # Groq reports the usage of streams under x_groq
+    return event.get("usage") or (event.get("x_groq") or {}).get("usage")
+
+def plan_batch(
+    requests: List[GenerateRequest],
+    client_config: ClientRecord,
+) -> Tuple[List[Tuple[int, GenerateRequest, GenerationPlan]], List[Dict[str, Any]]]:
+    """Plan every request of a batch before running any.
+    
+    Args:
+        requests: Text generation requests
+        client_config: Client configuration
+    
+    Returns:
+        Tuple: Position, request and plan of each valid request, and the
+        results of the requests that failed validation
+    """
+    items: List[Tuple[int, GenerateRequest, GenerationPlan]] = []
+    errors: List[Dict[str, Any]] = []
+    for index, request in enumerate(requests):
+        if request.stream:
+            errors.append({"index": index, "status": 400, "detail": "Streaming is not supported in batches"})
+            continue
+        try:
+            items.append((index, request, plan_generation(request, client_config)))
+        except HTTPException as e:
+            errors.append({"index": index, "status": e.status_code, "detail": e.detail})
+    return items, errors
+
+def reserve_batch(client_config: ClientRecord, items: List[Tuple[int, GenerateRequest, GenerationPlan]]) -> int:
+    """Reserve the tokens of a batch's planned requests with one reservation.
+    
+    Args:
+        client_config: Client configuration
+        items: Position in the batch, request and plan of each request
+    
+    Returns:
+        int: Tokens reserved, to be passed to run_batch(), which releases them as the requests complete
+    
+    Raises:
+        HTTPException: If the batch's prompt tokens do not fit in what is left of the client's daily limit
+    """
+    tokens = sum(plan.prompt_tokens + plan.max_tokens for _, _, plan in items)
+    required = sum(plan.prompt_tokens for _, _, plan in items)
+    return reserve_tokens(client_config, tokens, required)
+
+# Concurrency limit per client, shared by the client's running batches
+_batch_slots: "weakref.WeakValueDictionary[str, asyncio.Semaphore]" = weakref.WeakValueDictionary()
+
+async def run_batch(
+    client_config: ClientRecord,
+    items: List[Tuple[int, GenerateRequest, GenerationPlan]],
+    reserved: int = 0,
+) -> AsyncIterator[Dict[str, Any]]:
+    """Run planned requests concurrently and yield their results as they complete.
+    
+    Args:
+        client_config: Client configuration
+        items: Position in the batch, request and plan of each request
+        reserved: Tokens reserved for the requests with reserve_batch(), released request by request
+            as their usage is charged; requests reserve their own tokens if this is 0
+    
+    Yields:
+        Dict[str, Any]: Index and status of each request, with its response or error detail
+    """
+    slots = _batch_slots.get(client_config.client_id)
+    if slots is None:
+        slots = _batch_slots[client_config.client_id] = asyncio.Semaphore(settings.BATCH_CONCURRENCY)
+    results: asyncio.Queue = asyncio.Queue()
+    # Share of the batch reservation each request still holds, by position
+    held = {index: plan.prompt_tokens + plan.max_tokens for index, _, plan in items} if reserved else {}
+    
+    async def run(index: int, request: GenerateRequest, plan: GenerationPlan) -> None:
+        try:
+            async with slots:
+                try:
+                    response = await generate(request, client_config, plan, reserve=not reserved)
+                    result = {"index": index, "status": 200, "response": response}
+                except HTTPException as e:
+                    result = {"index": index, "status": e.status_code, "detail": e.detail}
+                except Exception as e:
+                    result = {"index": index, "status": 500, "detail": f"Error generating text: {str(e)}"}
+        finally:
+            release_tokens(client_config.client_id, held.pop(index, 0))
+        results.put_nowait(result)
+    
+    tasks = [asyncio.create_task(run(*item)) for item in items]
+    try:
+        for _ in tasks:
+            yield await results.get()
+    finally:
+        # Stop the remaining requests if the client goes away, and release what they still hold
+        for task in tasks:
+            task.cancel()
+        release_tokens(client_config.client_id, sum(held.values()))
+        held.clear()
+
+async def run_job(job: Job) -> List[Dict[str, Any]]:
+    """Run a queued generation job.
+    
+    The job's requests are planned with the client's current configuration
+    and charged against its rate limits when the job runs, so queued jobs
+    drain at the rate the client is allowed.
+    
+    Args:
+        job: Claimed job, with the requests of a JobRequest as payload
+    
+    Returns:
+        List[Dict[str, Any]]: Result of each request, in request order
+    
+    Raises:
+        JobDeferred: If the client has no room in its rate limits for the job yet
+        ValueError: If the client no longer exists or the job can never fit its rate limits
+    """
+    client_config = client_manager.clients.get(job.client_id)
+    if client_config is None:
+        raise ValueError(f"Client {job.client_id} no longer exists")
+    requests = [GenerateRequest.model_validate(request) for request in job.payload]
+    items, results = plan_batch(requests, client_config)
+    if items:
+        if settings.RATE_LIMIT_ENABLED and len(items) > client_config.rate_limit.requests_per_minute:
+            raise ValueError(
+                f"Job exceeds the rate limit. Maximum allowed: {client_config.rate_limit.requests_per_minute} requests per minute"
+            )
+        prompt_tokens = sum(plan.prompt_tokens for _, _, plan in items)
+        if settings.RATE_LIMIT_ENABLED and prompt_tokens > client_config.rate_limit.tokens_per_day:
+            raise ValueError(
+                f"Job exceeds the token limit. Maximum allowed: {client_config.rate_limit.tokens_per_day} tokens per day"
+            )
+        # Reserve the tokens first, so a job deferred for its tokens uses none of the request budget
+        try:
+            reserved = reserve_batch(client_config, items)
+        except HTTPException as e:
+            raise JobDeferred(float(e.headers["Retry-After"]))
+        try:
+            charge_requests(client_config, len(items))
+        except HTTPException as e:
+            release_tokens(client_config.client_id, reserved)
+            raise JobDeferred(float(e.headers["Retry-After"]))
+        async for result in run_batch(client_config, items, reserved):
+            results.append(result)
+    results.sort(key=lambda result: result["index"])
+    return results
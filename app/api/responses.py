@@ -0,0 +1,109 @@
+"""
+Fast JSON encoding and decoding for request and response bodies.
+
+Bodies are encoded and decoded with orjson when it is installed, and with
+the standard library otherwise. The API routes decode request bodies with
+it before FastAPI validates them, and the generation endpoints return the
+dicts they build themselves as pre-encoded responses, which skips a second
+validation against the response model. Response models are still declared
+on those routes for the API documentation.
+"""
+import json
+from typing import Any, Callable, Coroutine, Dict
+
+from fastapi import Request
+from fastapi.responses import JSONResponse, Response
+from fastapi.routing import APIRoute
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+def json_dumps(data: Any) -> bytes:
+    """Encode data as compact JSON.
+    
+    Args:
+        data: JSON-serializable data
+    
+    Returns:
+        bytes: UTF-8 encoded JSON
+    """
+    if orjson is not None:
+        return orjson.dumps(data)
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+def json_loads(data: bytes) -> Any:
+    """Decode JSON.
+    
+    Args:
+        data: JSON text
+    
+    Returns:
+        Any: Decoded data
+    
+    Raises:
+        json.JSONDecodeError: If the data is not valid JSON (orjson's error is a subclass)
+    """
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+class FastJSONResponse(JSONResponse):
+    """JSON response encoded with json_dumps()."""
+    
+    def render(self, content: Any) -> bytes:
+        """Encode the response content.
+        
+        Args:
+            content: JSON-serializable content
+        
+        Returns:
+            bytes: Encoded content
+        """
+        return json_dumps(content)
+
+class FastJSONRequest(Request):
+    """Request whose JSON body is decoded with json_loads()."""
+    
+    async def json(self) -> Any:
+        """Decode the request body, once.
+        
+        Returns:
+            Any: Decoded body
+        """
+        if not hasattr(self, "_json"):
+            self._json = json_loads(await self.body())
+        return self._json
+
+class FastJSONRoute(APIRoute):
+    """API route that decodes JSON request bodies with json_loads()."""
+    
+    def get_route_handler(self) -> Callable[[Request], Coroutine[Any, Any, Response]]:
+        """Wrap FastAPI's handler so it reads the body through FastJSONRequest.
+        
+        Returns:
+            Callable: Route handler
+        """
+        handler = super().get_route_handler()
+        
+        async def route_handler(request: Request) -> Response:
+            return await handler(FastJSONRequest(request.scope, request.receive))
+        
+        return route_handler
+
+def generate_response(response: Dict[str, Any]) -> FastJSONResponse:
+    """Encode a generation result as a GenerateResponse without validating it again.
+    
+    Args:
+        response: Generation result built by the gateway
+    
+    Returns:
+        FastJSONResponse: Response with exactly the fields of GenerateResponse
+    """
+    return FastJSONResponse({
+        "text": response["text"],
+        "model": response["model"],
+        "usage": response.get("usage"),
+        "cached": response.get("cached", False),
+    })
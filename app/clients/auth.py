@@ -1,11 +1,18 @@
-import os
-import json
+import asyncio
 import logging
-import hashlib
-from typing import Dict, List, Optional, Any
-from fastapi import HTTPException, Depends, Header
+import math
+import time
+from typing import Dict, List, Mapping, Optional, Any, Set, Tuple
+from fastapi import HTTPException, Depends, Security
+from fastapi.security import APIKeyHeader
 from app.core.config import settings
-from app.schemas.base import ClientConfig
+from app.core.rate_limit import rate_limiter, RateLimitExceeded
+from app.core import metrics
+from app.clients.secrets import VerifiedSecretCache, is_slow_hash, verify_secret
+from app.clients.config_loader import ConfigWatcher
+from app.clients.tokens import TokenError, token_service
+from app.clients.registry import ENDPOINT_BITS, ClientRecord
+from app.clients.store import ClientStore, create_client_store
 
 # Configure logging
 logger = logging.getLogger(__name__)
@@ -13,82 +20,245 @@ logger = logging.getLogger(__name__)
 class ClientManager:
     """Manager for client authentication and configuration."""
     
-    def __init__(self):
-        """Initialize the client manager."""
-        self.clients: Dict[str, ClientConfig] = {}
+    def __init__(self, store: Optional[ClientStore] = None):
+        """Initialize the client manager.
+        
+        Args:
+            store: Client configuration store, defaults to the configured store
+        """
+        self.store = store or create_client_store()
+        self.clients: Mapping[str, ClientRecord] = {}
+        self.secret_cache = VerifiedSecretCache(settings.AUTH_CACHE_MAX_ENTRIES, settings.AUTH_CACHE_TTL)
+        # Last failure log time and suppressed failure count per client
+        self._failure_logs: Dict[str, Tuple[float, int]] = {}
+        self._watcher: Optional[ConfigWatcher] = None
+        # Semaphore limiting slow hash checks, created for the event loop that uses it
+        self._kdf_semaphore: Optional[asyncio.Semaphore] = None
+        self._kdf_loop: Optional[asyncio.AbstractEventLoop] = None
         self.load_clients()
     
-    def load_clients(self) -> int:
-        """Load client configurations from JSON files.
+    def _apply(self, result: Any) -> bool:
+        """Apply a store scan and swap in its clients.
+        
+        Args:
+            result: Result of scanning the store
+        
+        Returns:
+            bool: True if the result was applied, False if a newer scan was applied first
+        """
+        update = self.store.apply(result)
+        if not update.applied:
+            return False
+        # A single assignment, so concurrent requests see either the old or the new clients
+        self.clients = self.store.clients
+        # Secrets of changed clients may have changed, so verify them again
+        if update.changed is None:
+            self.secret_cache.clear()
+        else:
+            for client_id in update.changed:
+                self.secret_cache.discard(client_id)
+        return True
+    
+    def load_clients(self, force: bool = False) -> int:
+        """Load client configurations from the store.
+        
+        For the file store, only files that changed since the last load are
+        parsed and the new configurations replace the old ones in one step;
+        with CLIENT_SNAPSHOT_PATH set, the snapshot is memory-mapped instead
+        and records are decoded when first used. For the database store, the
+        changes since the last load are applied to the lookup cache.
+        
+        Args:
+            force: Reload every client, even if it did not change
         
         Returns:
             int: Number of clients loaded
         """
-        client_count = 0
-        
-        # Create client config directory if it doesn't exist
-        os.makedirs(settings.CLIENT_CONFIG_DIR, exist_ok=True)
-        
-        # Load client configurations from JSON files
-        for filename in os.listdir(settings.CLIENT_CONFIG_DIR):
-            if filename.endswith(".json"):
-                try:
-                    file_path = os.path.join(settings.CLIENT_CONFIG_DIR, filename)
-                    with open(file_path, "r") as f:
-                        client_data = json.load(f)
-                        client_config = ClientConfig(**client_data)
-                        self.clients[client_config.client_id] = client_config
-                        client_count += 1
-                        logger.info(f"Loaded client configuration: {client_config.client_id}")
-                except Exception as e:
-                    logger.error(f"Error loading client configuration from {filename}: {e}")
-        
-        logger.info(f"Loaded {client_count} client configurations")
-        return client_count
+        self._apply(self.store.scan(force))
+        return len(self.clients)
     
     def reload_clients(self) -> int:
-        """Reload client configurations from JSON files.
+        """Reload client configurations from the store.
         
         Returns:
             int: Number of clients reloaded
         """
-        self.clients = {}
         return self.load_clients()
     
-    def authenticate_client(self, client_id: str, client_secret: str) -> ClientConfig:
-        """Authenticate a client using client ID and secret.
+    async def refresh_clients(self, names: Optional[Set[str]] = None) -> None:
+        """Reload client configurations without blocking the event loop.
+        
+        The store is scanned in a worker thread and the result applied on
+        the event loop. If a reload was applied while scanning, the result
+        is stale and the scan is repeated.
+        
+        Args:
+            names: Only reload these file names, or None to rescan the store
+        """
+        while True:
+            result = await asyncio.to_thread(self.store.scan, False, names)
+            if self._apply(result):
+                return
+    
+    def start_watching(self) -> None:
+        """Reload client configurations automatically when they change.
+        
+        File stores are watched as set by CLIENT_CONFIG_WATCH. Stores
+        without files are always polled, every CLIENT_CONFIG_POLL_INTERVAL
+        seconds, so replicas pick up each other's changes.
+        """
+        if self.store.watch_directory is None:
+            target, mode = getattr(self.store, "path", "client store"), "poll"
+        elif settings.CLIENT_CONFIG_WATCH != "off":
+            target, mode = self.store.watch_directory, settings.CLIENT_CONFIG_WATCH
+        else:
+            return
+        self._watcher = ConfigWatcher(
+            target,
+            self.refresh_clients,
+            mode=mode,
+            interval=settings.CLIENT_CONFIG_POLL_INTERVAL,
+        )
+        self._watcher.start()
+    
+    async def stop_watching(self) -> None:
+        """Stop reloading client configurations automatically."""
+        if self._watcher is not None:
+            await self._watcher.stop()
+            self._watcher = None
+    
+    def _find_client(self, client_id: str, client_secret: str) -> Tuple[ClientRecord, str, bool]:
+        """Look a client up and check whether its secret was verified recently.
         
         Args:
             client_id: Client ID
             client_secret: Client secret
         
         Returns:
-            ClientConfig: Client configuration
+            Tuple[ClientRecord, str, bool]: Client configuration, digest of the secret, and
+                whether the secret was verified recently
         
         Raises:
-            HTTPException: If authentication fails
+            HTTPException: If the client does not exist
         """
-        # Step 1: Check if client configuration exists
-        if client_id not in self.clients:
-            logger.warning(f"Client configuration not found: {client_id}")
+        client_config = self.clients.get(client_id)
+        if client_config is None:
+            # Unknown IDs share one log throttle so they cannot flood the logs
+            self._log_failure("unknown", f"Client configuration not found: {client_id}")
             raise HTTPException(status_code=401, detail="Invalid client credentials")
+        digest = self.secret_cache.digest(client_secret)
+        return client_config, digest, self.secret_cache.check(client_id, digest)
+    
+    def _verified(self, client_config: ClientRecord, digest: str, valid: bool) -> ClientRecord:
+        """Finish an authentication once the secret has been checked against its hash.
         
-        client_config = self.clients[client_id]
+        Args:
+            client_config: Client configuration
+            digest: Digest of the presented secret
+            valid: Whether the secret matched
         
-        # Step 2: Validate the provided secret
-        # Hash the provided secret
-        hashed_secret = hashlib.sha256(client_secret.encode()).hexdigest()
+        Returns:
+            ClientRecord: Client configuration
         
-        # Check if the client has a secret hash and if the hashed secret matches
-        if not client_config.client_secret_hash or hashed_secret != client_config.client_secret_hash:
-            logger.warning(f"Invalid credentials provided for client: {client_id}")
+        Raises:
+            HTTPException: If the secret did not match
+        """
+        client_id = client_config.client_id
+        if not valid:
+            self._log_failure(client_id, f"Invalid credentials provided for client: {client_id}")
             raise HTTPException(status_code=401, detail="Invalid client credentials")
-        
-        # Authentication successful
+        self.secret_cache.add(client_id, digest)
         logger.debug(f"Client authenticated successfully: {client_id}")
         return client_config
     
-    def check_endpoint_permission(self, client_config: ClientConfig, endpoint: str) -> bool:
+    def authenticate_client(self, client_id: str, client_secret: str) -> ClientRecord:
+        """Authenticate a client using client ID and secret.
+        
+        Slow secret hashes are checked in the calling thread; request handlers
+        use authenticate() instead.
+        
+        Args:
+            client_id: Client ID
+            client_secret: Client secret
+        
+        Returns:
+            ClientRecord: Client configuration
+        
+        Raises:
+            HTTPException: If authentication fails
+        """
+        # Step 1: Check if client configuration exists and the secret was verified recently
+        client_config, digest, cached = self._find_client(client_id, client_secret)
+        if cached:
+            return client_config
+        
+        # Step 2: Validate the provided secret against the stored hash
+        secret_hash = client_config.client_secret_hash
+        return self._verified(client_config, digest, bool(secret_hash) and verify_secret(client_secret, secret_hash))
+    
+    def _kdf_slots(self) -> asyncio.Semaphore:
+        """Get the semaphore limiting concurrent slow hash checks on the running event loop.
+        
+        Returns:
+            asyncio.Semaphore: Semaphore with AUTH_KDF_CONCURRENCY slots
+        """
+        loop = asyncio.get_running_loop()
+        if self._kdf_loop is not loop:
+            self._kdf_semaphore = asyncio.Semaphore(settings.AUTH_KDF_CONCURRENCY)
+            self._kdf_loop = loop
+        return self._kdf_semaphore
+    
+    async def authenticate(self, client_id: str, client_secret: str) -> ClientRecord:
+        """Authenticate a client using client ID and secret without blocking the event loop.
+        
+        Slow secret hashes (scrypt, argon2) are checked in a worker thread, at
+        most AUTH_KDF_CONCURRENCY at a time, so wrong secrets, which are never
+        cached, cannot stall other requests.
+        
+        Args:
+            client_id: Client ID
+            client_secret: Client secret
+        
+        Returns:
+            ClientRecord: Client configuration
+        
+        Raises:
+            HTTPException: If authentication fails
+        """
+        # Step 1: Check if client configuration exists and the secret was verified recently
+        client_config, digest, cached = self._find_client(client_id, client_secret)
+        if cached:
+            return client_config
+        
+        # Step 2: Validate the provided secret against the stored hash
+        secret_hash = client_config.client_secret_hash
+        if not secret_hash:
+            valid = False
+        elif is_slow_hash(secret_hash):
+            async with self._kdf_slots():
+                valid = await asyncio.to_thread(verify_secret, client_secret, secret_hash)
+        else:
+            valid = verify_secret(client_secret, secret_hash)
+        return self._verified(client_config, digest, valid)
+    
+    def _log_failure(self, key: str, message: str) -> None:
+        """Log an authentication failure, at most once per interval for each key.
+        
+        Args:
+            key: Throttle key (client ID, or "unknown" for unknown clients)
+            message: Log message
+        """
+        now = time.monotonic()
+        last, suppressed = self._failure_logs.get(key, (None, 0))
+        if last is not None and now - last < settings.AUTH_FAILURE_LOG_INTERVAL:
+            self._failure_logs[key] = (last, suppressed + 1)
+            return
+        if suppressed:
+            message = f"{message} ({suppressed} similar failures suppressed)"
+        logger.warning(message)
+        self._failure_logs[key] = (now, 0)
+    
+    def check_endpoint_permission(self, client_config: ClientRecord, endpoint: str) -> bool:
         """Check if a client has permission to access an endpoint.
         
         Args:
@@ -98,9 +268,9 @@ class ClientManager:
         Returns:
             bool: True if client has permission, False otherwise
         """
-        return endpoint in client_config.allowed_endpoints
+        return client_config.allows_endpoint(endpoint)
     
-    def check_provider_permission(self, client_config: ClientConfig, provider: str) -> bool:
+    def check_provider_permission(self, client_config: ClientRecord, provider: str) -> bool:
         """Check if a client has permission to use a provider.
         
         Args:
@@ -110,43 +280,86 @@ class ClientManager:
         Returns:
             bool: True if client has permission, False otherwise
         """
-        return provider in client_config.allowed_providers
+        return client_config.allows_provider(provider)
     
-    def get_client_config(self, client_id: str) -> Optional[ClientConfig]:
+    def get_client_config(self, client_id: str) -> Optional[ClientRecord]:
         """Get client configuration by client ID.
         
         Args:
             client_id: Client ID
         
         Returns:
-            Optional[ClientConfig]: Client configuration or None if not found
+            Optional[ClientRecord]: Client configuration or None if not found
         """
         return self.clients.get(client_id)
 
 # Create global client manager
 client_manager = ClientManager()
 
+def verify_bearer_token(authorization: str) -> ClientRecord:
+    """Authenticate a client from a signed bearer token.
+    
+    Args:
+        authorization: Authorization header value
+    
+    Returns:
+        ClientRecord: Client configuration built from the token's claims
+    
+    Raises:
+        HTTPException: If the header is not a bearer token or the token is invalid
+    """
+    scheme, _, token = authorization.partition(" ")
+    if scheme.lower() != "bearer" or not token:
+        raise HTTPException(status_code=401, detail="Invalid authorization header", headers={"WWW-Authenticate": "Bearer"})
+    try:
+        return token_service.verify(token.strip())
+    except TokenError as e:
+        client_manager._log_failure("token", f"Invalid bearer token: {e}")
+        raise HTTPException(status_code=401, detail="Invalid or expired token", headers={"WWW-Authenticate": "Bearer"})
+
+# Credential headers. They are read as security schemes, which take the raw header values,
+# rather than as header parameters, which FastAPI converts and validates again wherever
+# get_client_auth appears in a route's dependencies
+client_id_header = APIKeyHeader(name="client-id", scheme_name="ClientId", auto_error=False)
+client_secret_header = APIKeyHeader(name="client-secret", scheme_name="ClientSecret", auto_error=False)
+bearer_header = APIKeyHeader(
+    name="authorization", scheme_name="BearerToken", description="Bearer token from the token endpoint", auto_error=False
+)
+
 async def get_client_auth(
-    client_id: str = Header(...),
-    client_secret: str = Header(...),
-) -> ClientConfig:
+    client_id: Optional[str] = Security(client_id_header),
+    client_secret: Optional[str] = Security(client_secret_header),
+    authorization: Optional[str] = Security(bearer_header),
+) -> ClientRecord:
     """Dependency for client authentication.
     
+    Clients authenticate with a bearer token from the token endpoint or with
+    their client ID and secret.
+    
     Args:
         client_id: Client ID from header
         client_secret: Client secret from header
+        authorization: Authorization header with a bearer token
     
     Returns:
-        ClientConfig: Client configuration
+        ClientRecord: Client configuration
     
     Raises:
         HTTPException: If authentication fails
     """
-    return client_manager.authenticate_client(client_id, client_secret)
+    start = time.perf_counter()
+    try:
+        if authorization is not None:
+            return verify_bearer_token(authorization)
+        if client_id is None or client_secret is None:
+            raise HTTPException(status_code=401, detail="Missing client credentials")
+        return await client_manager.authenticate(client_id, client_secret)
+    finally:
+        metrics.observe_stage("auth", time.perf_counter() - start)
 
 async def check_endpoint_access(
     endpoint: str,
-    client_config: ClientConfig = Depends(get_client_auth),
+    client_config: ClientRecord = Depends(get_client_auth),
 ) -> None:
     """Dependency for checking endpoint access.
     
@@ -161,9 +374,27 @@ async def check_endpoint_access(
         logger.warning(f"Client {client_config.client_id} attempted to access unauthorized endpoint: {endpoint}")
         raise HTTPException(status_code=403, detail=f"Client does not have permission to access endpoint: {endpoint}")
 
+def require_endpoint_access(endpoint: str):
+    """Create a dependency that checks access to an endpoint.
+    
+    Args:
+        endpoint: Endpoint path
+    
+    Returns:
+        Callable: Dependency that raises if the client may not access the endpoint
+    """
+    # Look the endpoint's bit up once, so each request only tests a bit
+    bit = ENDPOINT_BITS.bit(endpoint)
+    
+    async def dependency(client_config: ClientRecord = Depends(get_client_auth)) -> None:
+        if not client_config.endpoint_bits & bit:
+            await check_endpoint_access(endpoint, client_config)
+    
+    return dependency
+
 async def check_provider_access(
     provider: str,
-    client_config: ClientConfig = Depends(get_client_auth),
+    client_config: ClientRecord = Depends(get_client_auth),
 ) -> None:
     """Dependency for checking provider access.
     
@@ -177,3 +408,83 @@ async def check_provider_access(
     if not client_manager.check_provider_permission(client_config, provider):
         logger.warning(f"Client {client_config.client_id} attempted to use unauthorized provider: {provider}")
         raise HTTPException(status_code=403, detail=f"Client does not have permission to use provider: {provider}")
+
+def charge_requests(client_config: ClientRecord, requests: int = 1) -> None:
+    """Charge requests against the client's rate limits in one step.
+    
+    Args:
+        client_config: Client configuration
+        requests: Number of requests to charge
+    
+    Raises:
+        HTTPException: If the client does not have room for all of the requests
+    """
+    if not settings.RATE_LIMIT_ENABLED:
+        return
+    try:
+        rate_limiter.acquire(client_config.client_id, client_config.rate_limit, requests)
+    except RateLimitExceeded as e:
+        raise _rate_limited(client_config, e)
+
+def reserve_tokens(client_config: ClientRecord, tokens: int, required: int) -> int:
+    """Reserve tokens of the client's daily limit for a provider call.
+    
+    Args:
+        client_config: Client configuration
+        tokens: Most tokens the call can use
+        required: Tokens the call uses for certain
+    
+    Returns:
+        int: Tokens reserved, to be released with release_tokens() once the usage is charged
+    
+    Raises:
+        HTTPException: If the required tokens do not fit in what is left of the client's daily limit
+    """
+    if not settings.RATE_LIMIT_ENABLED or not settings.TOKEN_RESERVATION_ENABLED:
+        return 0
+    try:
+        rate_limiter.reserve(client_config.client_id, client_config.rate_limit, tokens, required)
+    except RateLimitExceeded as e:
+        raise _rate_limited(client_config, e)
+    return tokens
+
+def release_tokens(client_id: str, tokens: int) -> None:
+    """Release tokens reserved with reserve_tokens().
+    
+    Args:
+        client_id: Client ID
+        tokens: Tokens reserved
+    """
+    if tokens:
+        rate_limiter.release(client_id, tokens)
+
+def _rate_limited(client_config: ClientRecord, error: RateLimitExceeded) -> HTTPException:
+    """Count and log a rate limited request and build its error.
+    
+    Args:
+        client_config: Client configuration
+        error: Rate limit error
+    
+    Returns:
+        HTTPException: 429 error with a Retry-After header
+    """
+    metrics.RATE_LIMITED.inc((client_config.client_id,))
+    logger.warning(f"Client {client_config.client_id} exceeded rate limit: {error}")
+    return HTTPException(
+        status_code=429,
+        detail=str(error),
+        headers={"Retry-After": str(max(1, math.ceil(error.retry_after)))}
+    )
+
+async def check_rate_limit(
+    client_config: ClientRecord = Depends(get_client_auth),
+) -> None:
+    """Dependency for enforcing the client's rate limits.
+    
+    Args:
+        client_config: Client configuration
+    
+    Raises:
+        HTTPException: If the client has exceeded its request or token limit
+    """
+    charge_requests(client_config)
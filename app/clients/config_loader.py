@@ -0,0 +1,346 @@
+"""
+Incremental loading and watching of client configuration files.
+
+The loader remembers the stat signature and content digest of every file it
+has parsed. A scan only reads files whose inode, size or mtime changed (or
+were modified so recently that an mtime comparison cannot be trusted) and
+only parses files whose content digest changed. Parsed files are stored as
+compact ClientRecords. Scans build a new client map
+without touching the current one, so it can be swapped in atomically.
+
+The watcher triggers scans when files change, using inotify on Linux and
+polling elsewhere.
+"""
+import os
+import time
+import struct
+import ctypes
+import ctypes.util
+import asyncio
+import hashlib
+import logging
+from typing import Awaitable, Callable, Dict, Iterable, NamedTuple, Optional, Set, Tuple
+
+from app.schemas.base import ClientConfig
+from app.clients.registry import ClientRecord
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Files modified this close to the last check are re-hashed even if their stat is unchanged,
+# since filesystem timestamps are too coarse to tell two quick writes apart
+RACY_WINDOW_NS = 1_000_000_000
+
+class FileState(NamedTuple):
+    """What the loader knows about a configuration file."""
+    signature: Tuple[int, int, int]
+    digest: bytes
+    checked_ns: int
+    config: Optional[ClientRecord]
+
+class ScanResult(NamedTuple):
+    """Outcome of scanning the configuration directory."""
+    files: Dict[str, FileState]
+    clients: Dict[str, ClientRecord]
+    changed: Set[str]
+    parsed: int
+    removed: int
+    generation: int
+
+class ClientConfigLoader:
+    """Incremental loader for a directory of client configuration files."""
+    
+    def __init__(self):
+        """Initialize the loader with no known files."""
+        self._files: Dict[str, FileState] = {}
+        self._clients: Dict[str, ClientRecord] = {}
+        self.generation = 0
+    
+    def _check_file(self, path: str, stat: os.stat_result, state: Optional[FileState], now_ns: int, force: bool) -> Tuple[Optional[FileState], bool]:
+        """Bring the state of one file up to date.
+        
+        Args:
+            path: File path
+            stat: Current stat of the file
+            state: Known state of the file, or None for a new file
+            now_ns: Wall clock time of the scan
+            force: Re-parse the file even if it did not change
+        
+        Returns:
+            Tuple[Optional[FileState], bool]: New state (None if unreadable) and whether the file was parsed
+        """
+        signature = (stat.st_ino, stat.st_size, stat.st_mtime_ns)
+        racy = state is not None and stat.st_mtime_ns + RACY_WINDOW_NS >= state.checked_ns
+        if state is not None and state.signature == signature and not racy and not force:
+            return state, False
+        
+        # The stat changed: compare the content before parsing
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+        except OSError as e:
+            logger.error(f"Error reading client configuration from {os.path.basename(path)}: {e}")
+            return None, False
+        digest = hashlib.blake2b(data, digest_size=16).digest()
+        if state is not None and state.digest == digest and not force:
+            return FileState(signature, digest, now_ns, state.config), False
+        
+        try:
+            config = ClientRecord.from_config(ClientConfig.model_validate_json(data))
+            logger.debug(f"Loaded client configuration: {config.client_id}")
+            return FileState(signature, digest, now_ns, config), True
+        except ValueError as e:
+            # Keep serving the last good version until the file is fixed
+            logger.error(f"Error loading client configuration from {os.path.basename(path)}: {e}")
+            return FileState(signature, digest, now_ns, state.config if state is not None else None), False
+    
+    def scan(self, directory: str, force: bool = False, names: Optional[Iterable[str]] = None) -> ScanResult:
+        """Scan the directory and build the new client map.
+        
+        The loader's state is not changed, so scans can run in a worker
+        thread; pass the result to apply() to commit it.
+        
+        Args:
+            directory: Client configuration directory
+            force: Re-parse every file, even if it did not change
+            names: Only check these file names (e.g. from file change events), keeping the rest as they are
+        
+        Returns:
+            ScanResult: New file states and client map, and the IDs of changed clients
+        """
+        previous = self._files
+        previous_clients = self._clients
+        generation = self.generation
+        now_ns = time.time_ns()
+        parsed = 0
+        
+        if names is None:
+            os.makedirs(directory, exist_ok=True)
+            files: Dict[str, FileState] = {}
+            with os.scandir(directory) as entries:
+                candidates = [(entry.path, entry) for entry in entries if entry.name.endswith(".json") and entry.is_file()]
+        else:
+            files = dict(previous)
+            candidates = [(os.path.join(directory, name), None) for name in names if name.endswith(".json")]
+        
+        for path, entry in candidates:
+            try:
+                stat = entry.stat() if entry is not None else os.stat(path)
+            except OSError:
+                files.pop(path, None)
+                continue
+            state, was_parsed = self._check_file(path, stat, previous.get(path), now_ns, force)
+            parsed += was_parsed
+            if state is None:
+                files.pop(path, None)
+            else:
+                files[path] = state
+        
+        if names is None:
+            # Files are taken in path order, so the last file wins if two share a client ID
+            clients = {}
+            for path in sorted(files):
+                config = files[path].config
+                if config is not None:
+                    clients[config.client_id] = config
+            changed = {
+                client_id for client_id in clients.keys() | previous_clients.keys()
+                if clients.get(client_id) is not previous_clients.get(client_id)
+            }
+        else:
+            # Only update the clients of the checked files
+            clients = dict(previous_clients)
+            changed = set()
+            for path, _ in candidates:
+                old = previous[path].config if path in previous else None
+                new = files[path].config if path in files else None
+                if old is new:
+                    continue
+                if old is not None and clients.get(old.client_id) is old:
+                    del clients[old.client_id]
+                    changed.add(old.client_id)
+                if new is not None:
+                    clients[new.client_id] = new
+                    changed.add(new.client_id)
+        removed = len(previous.keys() - files.keys())
+        return ScanResult(files, clients, changed, parsed, removed, generation)
+    
+    def apply(self, result: ScanResult) -> bool:
+        """Commit a scan result.
+        
+        Args:
+            result: Result of scan()
+        
+        Returns:
+            bool: False if another scan was applied since this one started, in which case it is dropped
+        """
+        if result.generation != self.generation:
+            return False
+        self._files = result.files
+        self._clients = result.clients
+        self.generation += 1
+        return True
+
+
+class Inotify:
+    """Minimal inotify binding for watching a directory (Linux only)."""
+    
+    IN_MODIFY = 0x002
+    IN_CLOSE_WRITE = 0x008
+    IN_MOVED_FROM = 0x040
+    IN_MOVED_TO = 0x080
+    IN_CREATE = 0x100
+    IN_DELETE = 0x200
+    IN_Q_OVERFLOW = 0x4000
+    IN_NONBLOCK = os.O_NONBLOCK
+    IN_CLOEXEC = getattr(os, "O_CLOEXEC", 0)
+    
+    def __init__(self, directory: str):
+        """Start watching a directory.
+        
+        Args:
+            directory: Directory to watch
+        
+        Raises:
+            OSError: If inotify is not available
+        """
+        libc_name = ctypes.util.find_library("c")
+        if not libc_name:
+            raise OSError("libc not found")
+        libc = ctypes.CDLL(libc_name, use_errno=True)
+        if not hasattr(libc, "inotify_init1"):
+            raise OSError("inotify is not available")
+        self.fd = libc.inotify_init1(self.IN_NONBLOCK | self.IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        mask = self.IN_CLOSE_WRITE | self.IN_MOVED_FROM | self.IN_MOVED_TO | self.IN_CREATE | self.IN_DELETE | self.IN_MODIFY
+        if libc.inotify_add_watch(self.fd, os.fsencode(directory), mask) < 0:
+            errno = ctypes.get_errno()
+            os.close(self.fd)
+            raise OSError(errno, f"inotify_add_watch failed for {directory}")
+    
+    def drain(self) -> Optional[Set[str]]:
+        """Read pending events.
+        
+        Returns:
+            Optional[Set[str]]: Names of the changed files, or None if events were lost
+        """
+        names: Optional[Set[str]] = set()
+        try:
+            while True:
+                data = os.read(self.fd, 65536)
+                if not data:
+                    break
+                offset = 0
+                while offset < len(data):
+                    _, mask, _, length = struct.unpack_from("iIII", data, offset)
+                    offset += 16
+                    if mask & self.IN_Q_OVERFLOW:
+                        names = None
+                    elif names is not None and length:
+                        names.add(os.fsdecode(data[offset:offset + length].rstrip(b"\0")))
+                    offset += length
+        except BlockingIOError:
+            pass
+        return names
+    
+    def close(self) -> None:
+        """Stop watching."""
+        os.close(self.fd)
+
+
+class ConfigWatcher:
+    """Calls a refresh function when the configuration directory changes."""
+    
+    def __init__(
+        self,
+        directory: str,
+        refresh: Callable[[Optional[Set[str]]], Awaitable[None]],
+        mode: str = "auto",
+        interval: float = 2.0,
+        debounce: float = 0.1,
+    ):
+        """Initialize the watcher.
+        
+        Args:
+            directory: Directory to watch
+            refresh: Coroutine function that rescans the given file names, or the whole directory for None
+            mode: "inotify", "poll" or "auto" (inotify if available, else polling)
+            interval: Seconds between polls
+            debounce: Seconds to wait after a change for related changes to arrive
+        """
+        self.directory = directory
+        self.refresh = refresh
+        self.mode = mode
+        self.interval = interval
+        self.debounce = debounce
+        self._task: Optional[asyncio.Task] = None
+        self._inotify: Optional[Inotify] = None
+    
+    def start(self) -> None:
+        """Start watching in a background task."""
+        if self.mode in ("auto", "inotify"):
+            try:
+                self._inotify = Inotify(self.directory)
+            except OSError as e:
+                if self.mode == "inotify":
+                    raise
+                logger.info(f"inotify unavailable ({e}), polling client configurations instead")
+        if self._inotify is not None:
+            self._task = asyncio.create_task(self._watch_inotify())
+            logger.info(f"Watching {self.directory} for client configuration changes with inotify")
+        else:
+            self._task = asyncio.create_task(self._watch_poll())
+            logger.info(f"Polling {self.directory} for client configuration changes every {self.interval}s")
+    
+    async def stop(self) -> None:
+        """Stop watching."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._inotify is not None:
+            asyncio.get_running_loop().remove_reader(self._inotify.fd)
+            self._inotify.close()
+            self._inotify = None
+    
+    async def _refresh(self, names: Optional[Set[str]] = None) -> None:
+        """Run the refresh function, logging errors instead of stopping the watcher.
+        
+        Args:
+            names: Changed file names, or None to rescan the whole directory
+        """
+        try:
+            await self.refresh(names)
+        except Exception as e:
+            logger.error(f"Error reloading client configurations: {e}")
+    
+    async def _watch_poll(self) -> None:
+        """Rescan the directory periodically."""
+        while True:
+            await asyncio.sleep(self.interval)
+            await self._refresh()
+    
+    async def _watch_inotify(self) -> None:
+        """Rescan the files that inotify reports as changed."""
+        changed = asyncio.Event()
+        pending: Optional[Set[str]] = set()
+        
+        def on_readable():
+            nonlocal pending
+            # Drain right away, since the reader is called for as long as events are pending
+            names = self._inotify.drain()
+            pending = None if names is None or pending is None else pending | names
+            changed.set()
+        
+        asyncio.get_running_loop().add_reader(self._inotify.fd, on_readable)
+        while True:
+            await changed.wait()
+            # Let a burst of writes settle before scanning
+            await asyncio.sleep(self.debounce)
+            changed.clear()
+            names, pending = pending, set()
+            await self._refresh(names)
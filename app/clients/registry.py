@@ -0,0 +1,481 @@
+"""
+Compact client registry.
+
+Client configurations are kept as frozen, slotted ClientRecord objects
+instead of Pydantic models: repeated strings are interned, identical rate
+limits are shared, and provider and endpoint permissions are bitsets, so
+permission checks are a single AND.
+
+For large tenant counts the registry can be loaded from one packed snapshot
+file that is memory-mapped instead of parsed. The snapshot has an on-disk
+hash index, so opening it takes constant time and a record is only decoded
+(and kept in memory) when its client first makes a request.
+
+Snapshot layout (little-endian):
+
+    header     magic, version, counts and section offsets
+    strings    (count + 1) uint32 offsets, then the UTF-8 data
+    endpoints  uint32 string index per endpoint bit
+    records    fixed-size records, string fields as string indexes
+    index      open-addressing hash table of uint32 record number + 1
+
+Build a snapshot from a configuration directory with:
+
+    python -m app.clients.registry <config_dir> <snapshot_file>
+"""
+import os
+import sys
+import mmap
+import zlib
+import struct
+import logging
+import threading
+from collections.abc import Mapping
+from dataclasses import dataclass
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+
+from app.schemas.base import ClientConfig
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+class BitTable:
+    """Assigns a bit to each name, so sets of names can be stored as ints."""
+    
+    def __init__(self, names: Iterable[str] = ()):
+        """Initialize the table.
+        
+        Args:
+            names: Names to assign the first bits to, in order
+        """
+        self._bits: Dict[str, int] = {}
+        self.names: List[str] = []
+        self._lock = threading.Lock()
+        for name in names:
+            self.bit(name)
+    
+    def bit(self, name: str) -> int:
+        """Get the bit of a name, assigning the next free bit to a new name.
+        
+        Args:
+            name: Name
+        
+        Returns:
+            int: Bit mask with a single bit set
+        """
+        bit = self._bits.get(name)
+        if bit is None:
+            with self._lock:
+                bit = self._bits.get(name)
+                if bit is None:
+                    bit = self._bits[sys.intern(name)] = 1 << len(self.names)
+                    self.names.append(sys.intern(name))
+        return bit
+    
+    def get(self, name: str) -> int:
+        """Get the bit of a name without assigning one.
+        
+        Args:
+            name: Name
+        
+        Returns:
+            int: Bit mask, or 0 for unknown names
+        """
+        return self._bits.get(name, 0)
+    
+    def encode(self, names: Iterable[str]) -> int:
+        """Encode names as a bitset.
+        
+        Args:
+            names: Names
+        
+        Returns:
+            int: Bitset
+        """
+        bits = 0
+        for name in names:
+            bits |= self.bit(name)
+        return bits
+    
+    def decode(self, bits: int) -> Tuple[str, ...]:
+        """Decode a bitset into names.
+        
+        Args:
+            bits: Bitset
+        
+        Returns:
+            Tuple[str, ...]: Names in bit order
+        """
+        return tuple(name for i, name in enumerate(self.names) if bits >> i & 1)
+
+# Bits for providers and endpoints shared by all records
+PROVIDER_BITS = BitTable(("openai", "groq", "triton"))
+ENDPOINT_BITS = BitTable()
+
+class RateLimits(NamedTuple):
+    """Rate limits of a client, shared between clients with the same limits."""
+    requests_per_minute: int
+    tokens_per_day: int
+
+_shared_limits: Dict[Tuple[int, int], RateLimits] = {}
+
+def shared_limits(requests_per_minute: int, tokens_per_day: int) -> RateLimits:
+    """Get the shared RateLimits object for a pair of limits.
+    
+    Args:
+        requests_per_minute: Maximum requests per minute
+        tokens_per_day: Maximum tokens per day
+    
+    Returns:
+        RateLimits: Shared rate limits
+    """
+    key = (requests_per_minute, tokens_per_day)
+    limits = _shared_limits.get(key)
+    if limits is None:
+        limits = _shared_limits.setdefault(key, RateLimits(requests_per_minute, tokens_per_day))
+    return limits
+
+def _intern(value: Optional[str]) -> Optional[str]:
+    """Intern a string, passing None through."""
+    return None if value is None else sys.intern(value)
+
+
+@dataclass(frozen=True, slots=True)
+class ClientRecord:
+    """Compact, immutable client configuration.
+    
+    Has the same attributes as ClientConfig, with allowed_providers and
+    allowed_endpoints decoded from bitsets on access.
+    """
+    client_id: str
+    name: str
+    client_secret_hash: Optional[str]
+    provider_bits: int
+    endpoint_bits: int
+    default_provider: str
+    default_model: str
+    max_tokens_limit: int
+    rate_limit: RateLimits
+    response_cache_enabled: bool = True
+    semantic_cache_threshold: Optional[float] = None
+    created_at: str = ""
+    updated_at: str = ""
+    
+    @property
+    def allowed_providers(self) -> Tuple[str, ...]:
+        """Providers the client may use."""
+        return PROVIDER_BITS.decode(self.provider_bits)
+    
+    @property
+    def allowed_endpoints(self) -> Tuple[str, ...]:
+        """Endpoints the client may access."""
+        return ENDPOINT_BITS.decode(self.endpoint_bits)
+    
+    def allows_provider(self, provider: str) -> bool:
+        """Check whether the client may use a provider.
+        
+        Args:
+            provider: Provider name
+        
+        Returns:
+            bool: True if the provider is allowed
+        """
+        return bool(self.provider_bits & PROVIDER_BITS.get(provider))
+    
+    def allows_endpoint(self, endpoint: str) -> bool:
+        """Check whether the client may access an endpoint.
+        
+        Args:
+            endpoint: Endpoint name
+        
+        Returns:
+            bool: True if the endpoint is allowed
+        """
+        return bool(self.endpoint_bits & ENDPOINT_BITS.get(endpoint))
+    
+    @classmethod
+    def from_config(cls, config: ClientConfig) -> "ClientRecord":
+        """Build a record from a validated client configuration.
+        
+        Args:
+            config: Client configuration
+        
+        Returns:
+            ClientRecord: Compact record
+        """
+        return cls(
+            client_id=sys.intern(config.client_id),
+            name=config.name,
+            client_secret_hash=config.client_secret_hash,
+            provider_bits=PROVIDER_BITS.encode(config.allowed_providers),
+            endpoint_bits=ENDPOINT_BITS.encode(config.allowed_endpoints),
+            default_provider=sys.intern(config.default_provider),
+            default_model=sys.intern(config.default_model),
+            max_tokens_limit=config.max_tokens_limit,
+            rate_limit=shared_limits(config.rate_limit.requests_per_minute, config.rate_limit.tokens_per_day),
+            response_cache_enabled=config.response_cache_enabled,
+            semantic_cache_threshold=config.semantic_cache_threshold,
+            created_at=sys.intern(config.created_at),
+            updated_at=sys.intern(config.updated_at),
+        )
+    
+    def to_config(self) -> ClientConfig:
+        """Convert the record back to a client configuration.
+        
+        Returns:
+            ClientConfig: Client configuration
+        """
+        return ClientConfig(
+            client_id=self.client_id,
+            name=self.name,
+            client_secret_hash=self.client_secret_hash,
+            allowed_providers=list(self.allowed_providers),
+            default_provider=self.default_provider,
+            default_model=self.default_model,
+            max_tokens_limit=self.max_tokens_limit,
+            rate_limit=self.rate_limit._asdict(),
+            allowed_endpoints=list(self.allowed_endpoints),
+            response_cache_enabled=self.response_cache_enabled,
+            semantic_cache_threshold=self.semantic_cache_threshold,
+            created_at=self.created_at,
+            updated_at=self.updated_at,
+        )
+
+
+SNAPSHOT_MAGIC = b"DSPCLNT\0"
+SNAPSHOT_VERSION = 1
+NO_STRING = 0xFFFFFFFF
+HAS_THRESHOLD = 1
+CACHE_ENABLED = 2
+
+# magic, version, records, strings, endpoints, index slots, section offsets
+_HEADER = struct.Struct("<8sIIIIIQQQQ")
+# client_id, name, secret hash, default provider, default model, created_at, updated_at,
+# provider bits, endpoint bits, max tokens, requests per minute, tokens per day, flags, threshold
+_RECORD = struct.Struct("<7IIQIIQBd")
+_U32 = struct.Struct("<I")
+
+def _slot_hash(client_id: bytes) -> int:
+    """Hash a client ID for the snapshot index."""
+    return zlib.crc32(client_id)
+
+def write_snapshot(records: Iterable[ClientRecord], path: str) -> int:
+    """Write records to a snapshot file, replacing it atomically.
+    
+    Args:
+        records: Client records
+        path: Snapshot file path
+    
+    Returns:
+        int: Number of records written
+    
+    Raises:
+        ValueError: If the records use more than 64 endpoints
+    """
+    records = list({record.client_id: record for record in records}.values())
+    strings: Dict[str, int] = {}
+    string_list: List[str] = []
+    
+    def string(value: Optional[str]) -> int:
+        if value is None:
+            return NO_STRING
+        index = strings.get(value)
+        if index is None:
+            index = strings[value] = len(string_list)
+            string_list.append(value)
+        return index
+    
+    endpoint_names = list(ENDPOINT_BITS.names)
+    if len(endpoint_names) > 64:
+        raise ValueError("Snapshots support at most 64 distinct endpoints")
+    endpoint_indexes = [string(name) for name in endpoint_names]
+    
+    packed_records = []
+    for record in records:
+        flags = (HAS_THRESHOLD if record.semantic_cache_threshold is not None else 0) | (
+            CACHE_ENABLED if record.response_cache_enabled else 0
+        )
+        packed_records.append(_RECORD.pack(
+            string(record.client_id), string(record.name), string(record.client_secret_hash),
+            string(record.default_provider), string(record.default_model),
+            string(record.created_at), string(record.updated_at),
+            record.provider_bits, record.endpoint_bits, record.max_tokens_limit,
+            record.rate_limit.requests_per_minute, record.rate_limit.tokens_per_day,
+            flags, record.semantic_cache_threshold or 0.0,
+        ))
+    
+    # Open-addressing index at most half full
+    slots = 1
+    while slots < 2 * len(records):
+        slots *= 2
+    index = [0] * slots
+    for number, record in enumerate(records):
+        slot = _slot_hash(record.client_id.encode()) & (slots - 1)
+        while index[slot]:
+            slot = (slot + 1) & (slots - 1)
+        index[slot] = number + 1
+    
+    encoded = [value.encode() for value in string_list]
+    offsets = [0]
+    for value in encoded:
+        offsets.append(offsets[-1] + len(value))
+    strings_section = struct.pack(f"<{len(offsets)}I", *offsets) + b"".join(encoded)
+    endpoints_section = struct.pack(f"<{len(endpoint_indexes)}I", *endpoint_indexes)
+    records_section = b"".join(packed_records)
+    
+    strings_offset = _HEADER.size
+    endpoints_offset = strings_offset + len(strings_section)
+    records_offset = endpoints_offset + len(endpoints_section)
+    index_offset = records_offset + len(records_section)
+    header = _HEADER.pack(
+        SNAPSHOT_MAGIC, SNAPSHOT_VERSION, len(records), len(string_list), len(endpoint_indexes), slots,
+        strings_offset, endpoints_offset, records_offset, index_offset,
+    )
+    
+    temp_path = f"{path}.tmp"
+    with open(temp_path, "wb") as f:
+        f.write(header)
+        f.write(strings_section)
+        f.write(endpoints_section)
+        f.write(records_section)
+        f.write(struct.pack(f"<{slots}I", *index))
+    os.replace(temp_path, path)
+    return len(records)
+
+
+class ClientSnapshot(Mapping):
+    """Read-only mapping of client ID to ClientRecord backed by a memory-mapped snapshot."""
+    
+    def __init__(self, path: str):
+        """Map a snapshot file.
+        
+        Args:
+            path: Snapshot file path
+        
+        Raises:
+            ValueError: If the file is not a valid snapshot
+        """
+        self.path = path
+        with open(path, "rb") as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(self._map) < _HEADER.size:
+            self._map.close()
+            raise ValueError(f"Not a client snapshot: {path}")
+        (
+            magic, version, self._count, self._string_count, endpoint_count, self._slots,
+            self._strings_offset, endpoints_offset, self._records_offset, self._index_offset,
+        ) = _HEADER.unpack_from(self._map, 0)
+        if magic != SNAPSHOT_MAGIC or version != SNAPSHOT_VERSION or self._index_offset + 4 * self._slots > len(self._map):
+            self._map.close()
+            raise ValueError(f"Not a client snapshot: {path}")
+        self._data_offset = self._strings_offset + 4 * (self._string_count + 1)
+        
+        # Translate the snapshot's endpoint bits to the process-wide endpoint bits
+        self._endpoint_bits = [
+            ENDPOINT_BITS.bit(self._string(_U32.unpack_from(self._map, endpoints_offset + 4 * i)[0]))
+            for i in range(endpoint_count)
+        ]
+        self._endpoints_match = all(bit == 1 << i for i, bit in enumerate(self._endpoint_bits))
+        self._records: Dict[str, ClientRecord] = {}
+    
+    def _string(self, index: int) -> Optional[str]:
+        """Decode a string from the string table."""
+        if index == NO_STRING:
+            return None
+        start, end = struct.unpack_from("<II", self._map, self._strings_offset + 4 * index)
+        return self._map[self._data_offset + start:self._data_offset + end].decode()
+    
+    def _decode(self, number: int) -> ClientRecord:
+        """Decode a record by its position in the snapshot."""
+        (
+            client_id, name, secret_hash, default_provider, default_model, created_at, updated_at,
+            provider_bits, endpoint_bits, max_tokens, requests_per_minute, tokens_per_day, flags, threshold,
+        ) = _RECORD.unpack_from(self._map, self._records_offset + number * _RECORD.size)
+        if not self._endpoints_match:
+            endpoint_bits = sum(bit for i, bit in enumerate(self._endpoint_bits) if endpoint_bits >> i & 1)
+        return ClientRecord(
+            client_id=sys.intern(self._string(client_id)),
+            name=self._string(name),
+            client_secret_hash=self._string(secret_hash),
+            provider_bits=provider_bits,
+            endpoint_bits=endpoint_bits,
+            default_provider=sys.intern(self._string(default_provider)),
+            default_model=sys.intern(self._string(default_model)),
+            max_tokens_limit=max_tokens,
+            rate_limit=shared_limits(requests_per_minute, tokens_per_day),
+            response_cache_enabled=bool(flags & CACHE_ENABLED),
+            semantic_cache_threshold=threshold if flags & HAS_THRESHOLD else None,
+            created_at=_intern(self._string(created_at)),
+            updated_at=_intern(self._string(updated_at)),
+        )
+    
+    def _find(self, client_id: str) -> Optional[int]:
+        """Find a record's position with the on-disk index."""
+        if not self._slots:
+            return None
+        encoded = client_id.encode()
+        slot = _slot_hash(encoded) & (self._slots - 1)
+        while True:
+            number = _U32.unpack_from(self._map, self._index_offset + 4 * slot)[0]
+            if not number:
+                return None
+            offset = self._records_offset + (number - 1) * _RECORD.size
+            start, end = struct.unpack_from("<II", self._map, self._strings_offset + 4 * _U32.unpack_from(self._map, offset)[0])
+            if self._map[self._data_offset + start:self._data_offset + end] == encoded:
+                return number - 1
+            slot = (slot + 1) & (self._slots - 1)
+    
+    def get(self, client_id: str, default: Optional[ClientRecord] = None) -> Optional[ClientRecord]:
+        """Get a client's record, decoding it on first use.
+        
+        Args:
+            client_id: Client ID
+            default: Value to return for unknown clients
+        
+        Returns:
+            Optional[ClientRecord]: Client record, or the default
+        """
+        record = self._records.get(client_id)
+        if record is None:
+            number = self._find(client_id)
+            if number is None:
+                return default
+            record = self._records[client_id] = self._decode(number)
+        return record
+    
+    def __getitem__(self, client_id: str) -> ClientRecord:
+        record = self.get(client_id)
+        if record is None:
+            raise KeyError(client_id)
+        return record
+    
+    def __contains__(self, client_id: object) -> bool:
+        return isinstance(client_id, str) and self.get(client_id) is not None
+    
+    def __len__(self) -> int:
+        return self._count
+    
+    def __iter__(self) -> Iterator[str]:
+        for number in range(self._count):
+            offset = self._records_offset + number * _RECORD.size
+            yield self._string(_U32.unpack_from(self._map, offset)[0])
+    
+    def close(self) -> None:
+        """Unmap the snapshot file."""
+        self._records = {}
+        self._map.close()
+
+def main(argv: List[str]) -> None:
+    """Build a snapshot from a directory of client configuration files."""
+    from app.clients.config_loader import ClientConfigLoader
+    
+    if len(argv) != 2:
+        print("Usage: python -m app.clients.registry <config_dir> <snapshot_file>")
+        sys.exit(1)
+    loader = ClientConfigLoader()
+    result = loader.scan(argv[0])
+    count = write_snapshot(result.clients.values(), argv[1])
+    print(f"Wrote {count} clients to {argv[1]}")
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,197 @@
+"""
+Client secret hashing and a cache of verified secrets.
+
+Stored secret hashes can use one of these formats:
+
+- 64 hex digits: unsalted SHA-256 (legacy)
+- scrypt$<n>$<r>$<p>$<salt>$<hash>: scrypt with base64 salt and hash
+- $argon2id$...: argon2 (needs the argon2-cffi package)
+
+Slow KDFs make every verification cost tens of milliseconds, so verified
+secrets are remembered in a bounded TTL cache keyed by a keyed digest of the
+presented secret.
+"""
+import os
+import hmac
+import time
+import base64
+import hashlib
+import logging
+from collections import OrderedDict
+from typing import Any, Dict, Tuple
+
+try:
+    import argon2
+except ImportError:
+    argon2 = None
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+SCRYPT_N = 2 ** 14
+SCRYPT_R = 8
+SCRYPT_P = 1
+SCRYPT_SALT_BYTES = 16
+SCRYPT_HASH_BYTES = 32
+
+def hash_secret(secret: str, scheme: str = "scrypt") -> str:
+    """Hash a client secret for storage in a client configuration.
+    
+    Args:
+        secret: Client secret
+        scheme: "scrypt", "argon2" or "sha256"
+    
+    Returns:
+        str: Encoded secret hash
+    
+    Raises:
+        ValueError: If the scheme is unknown or its package is not installed
+    """
+    if scheme == "sha256":
+        return hashlib.sha256(secret.encode()).hexdigest()
+    elif scheme == "scrypt":
+        salt = os.urandom(SCRYPT_SALT_BYTES)
+        digest = hashlib.scrypt(
+            secret.encode(), salt=salt, n=SCRYPT_N, r=SCRYPT_R, p=SCRYPT_P, dklen=SCRYPT_HASH_BYTES
+        )
+        return (
+            f"scrypt${SCRYPT_N}${SCRYPT_R}${SCRYPT_P}$"
+            f"{base64.b64encode(salt).decode()}${base64.b64encode(digest).decode()}"
+        )
+    elif scheme == "argon2":
+        if argon2 is None:
+            raise ValueError("argon2 hashes need the argon2-cffi package")
+        return argon2.PasswordHasher().hash(secret)
+    else:
+        raise ValueError(f"Invalid secret hash scheme: {scheme}")
+
+def is_slow_hash(secret_hash: str) -> bool:
+    """Check whether a stored hash uses a slow KDF.
+    
+    Args:
+        secret_hash: Stored secret hash
+    
+    Returns:
+        bool: True for scrypt and argon2 hashes
+    """
+    return secret_hash.startswith(("scrypt$", "$argon2"))
+
+def verify_secret(secret: str, secret_hash: str) -> bool:
+    """Check a client secret against a stored hash in constant time.
+    
+    Args:
+        secret: Presented client secret
+        secret_hash: Stored secret hash
+    
+    Returns:
+        bool: True if the secret matches, False otherwise (including malformed hashes)
+    """
+    try:
+        if secret_hash.startswith("scrypt$"):
+            n, r, p, salt, expected = secret_hash.split("$")[1:]
+            expected = base64.b64decode(expected)
+            digest = hashlib.scrypt(
+                secret.encode(), salt=base64.b64decode(salt), n=int(n), r=int(r), p=int(p),
+                dklen=len(expected), maxmem=256 * int(n) * int(r) + 1024 * 1024,
+            )
+            return hmac.compare_digest(digest, expected)
+        elif secret_hash.startswith("$argon2"):
+            if argon2 is None:
+                logger.error("Client secret uses argon2 but the argon2-cffi package is not installed")
+                return False
+            try:
+                return argon2.PasswordHasher().verify(secret_hash, secret)
+            except argon2.exceptions.VerificationError:
+                return False
+        else:
+            digest = hashlib.sha256(secret.encode()).hexdigest()
+            return hmac.compare_digest(digest, secret_hash.lower())
+    except (ValueError, TypeError) as e:
+        logger.error(f"Malformed client secret hash: {e}")
+        return False
+
+
+class VerifiedSecretCache:
+    """Bounded TTL cache of (client ID, secret digest) pairs that passed verification.
+    
+    Secrets are digested with HMAC-SHA-256 under a random per-process key, so
+    the cache never holds the secrets themselves and the digests are useless
+    outside the process.
+    """
+    
+    def __init__(self, max_entries: int = 10000, ttl: float = 300.0, clock=time.monotonic):
+        """Initialize the cache.
+        
+        Args:
+            max_entries: Maximum number of cached clients
+            ttl: Seconds a verification is remembered
+            clock: Monotonic clock
+        """
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.clock = clock
+        self._key = os.urandom(32)
+        self._entries: "OrderedDict[str, Tuple[bytes, float]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+    
+    def digest(self, secret: str) -> bytes:
+        """Digest a presented secret.
+        
+        Args:
+            secret: Client secret
+        
+        Returns:
+            bytes: Keyed digest of the secret
+        """
+        return hmac.new(self._key, secret.encode(), hashlib.sha256).digest()
+    
+    def check(self, client_id: str, digest: bytes) -> bool:
+        """Check whether a client's secret digest was verified recently.
+        
+        Args:
+            client_id: Client ID
+            digest: Digest of the presented secret
+        
+        Returns:
+            bool: True if the pair is cached and not expired
+        """
+        entry = self._entries.get(client_id)
+        if entry is not None and entry[1] > self.clock() and hmac.compare_digest(entry[0], digest):
+            self._entries.move_to_end(client_id)
+            self.hits += 1
+            return True
+        self.misses += 1
+        return False
+    
+    def add(self, client_id: str, digest: bytes) -> None:
+        """Remember a verified secret digest for a client.
+        
+        Args:
+            client_id: Client ID
+            digest: Digest of the verified secret
+        """
+        self._entries[client_id] = (digest, self.clock() + self.ttl)
+        self._entries.move_to_end(client_id)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+    
+    def discard(self, client_id: str) -> None:
+        """Forget the verified secret of a client.
+        
+        Args:
+            client_id: Client ID
+        """
+        self._entries.pop(client_id, None)
+    
+    def clear(self) -> None:
+        """Forget all verified secrets."""
+        self._entries.clear()
+    
+    def stats(self) -> Dict[str, Any]:
+        """Get cache statistics.
+        
+        Returns:
+            Dict[str, Any]: Entry count, hits and misses
+        """
+        return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
@@ -0,0 +1,570 @@
+"""
+Client configuration stores.
+
+The client manager reads client configurations from a store. Two stores are
+provided:
+
+- FileClientStore: the JSON files in CLIENT_CONFIG_DIR, or a packed snapshot
+  built from them, held in memory and reloaded incrementally
+- SQLiteClientStore: a SQLite database shared by the gateway replicas
+
+The database store does not load every client up front. Lookups go through a
+read-through cache, which also remembers unknown client IDs for a short time
+so repeated attempts with made-up IDs do not reach the database. Every write
+gives the row a new version from one increasing counter (deleted clients keep
+a row without a configuration), so a replica polls for the rows changed since
+the last version it saw and only applies those.
+
+Import a configuration directory into a database with:
+
+    python -m app.clients.store <config_dir> <database_file>
+"""
+import os
+import sys
+import time
+import sqlite3
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Iterable, List, Mapping, NamedTuple, Optional, Set, Tuple
+
+from app.core.config import settings
+from app.schemas.base import ClientConfig
+from app.clients.config_loader import ClientConfigLoader
+from app.clients.registry import ClientRecord, ClientSnapshot
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+class StoreUpdate(NamedTuple):
+    """Outcome of applying a scan to a store."""
+    applied: bool
+    # IDs of the clients that changed, or None if any client may have changed
+    changed: Optional[Set[str]]
+
+class ClientStore:
+    """Base class for client configuration stores.
+    
+    Reloads are split in two steps: scan() reads the changes without
+    touching the store's state, so it can run in a worker thread, and
+    apply() commits them on the event loop.
+    """
+    
+    # Directory to watch for changes, or None if the store can only be polled
+    watch_directory: Optional[str] = None
+    
+    def __init__(self):
+        """Initialize the store with no clients."""
+        # Client lookups go through this mapping
+        self.clients: Mapping[str, ClientRecord] = {}
+    
+    def scan(self, force: bool = False, names: Optional[Iterable[str]] = None) -> Any:
+        """Read the changes since the last applied scan.
+        
+        Args:
+            force: Reload everything, even if it did not change
+            names: Names of the changed files, if known
+        
+        Returns:
+            Any: Scan result to pass to apply()
+        """
+        raise NotImplementedError("Subclasses must implement scan method")
+    
+    def apply(self, result: Any) -> StoreUpdate:
+        """Commit a scan result.
+        
+        Args:
+            result: Result of scan()
+        
+        Returns:
+            StoreUpdate: Whether the result was applied (False if another scan was applied first) and the changed clients
+        """
+        raise NotImplementedError("Subclasses must implement apply method")
+    
+    def stats(self) -> Dict[str, Any]:
+        """Get lookup statistics.
+        
+        Returns:
+            Dict[str, Any]: Number of clients held in memory
+        """
+        return {"entries": len(self.clients)}
+    
+    def close(self) -> None:
+        """Release the store's resources."""
+
+
+class FileClientStore(ClientStore):
+    """Client store backed by JSON files or a snapshot built from them."""
+    
+    def __init__(self, directory: Optional[str] = None, snapshot_path: Optional[str] = None):
+        """Initialize the store.
+        
+        Args:
+            directory: Client configuration directory, defaults to CLIENT_CONFIG_DIR
+            snapshot_path: Snapshot file to map instead of reading the directory, defaults to
+                CLIENT_SNAPSHOT_PATH when no directory is given
+        """
+        super().__init__()
+        # Without a directory, follow the settings so they can be changed at runtime
+        self._directory = directory
+        self._snapshot_path = snapshot_path
+        self._loader = ClientConfigLoader()
+        self._snapshot: Optional[ClientSnapshot] = None
+        self._snapshot_signature: Optional[Tuple[int, int, int]] = None
+    
+    @property
+    def directory(self) -> str:
+        """Client configuration directory."""
+        return self._directory or settings.CLIENT_CONFIG_DIR
+    
+    @property
+    def snapshot_path(self) -> Optional[str]:
+        """Snapshot file, or None to read the directory."""
+        return self._snapshot_path if self._directory else self._snapshot_path or settings.CLIENT_SNAPSHOT_PATH
+    
+    @property
+    def watch_directory(self) -> str:
+        """Directory holding the configuration files or the snapshot."""
+        if self.snapshot_path:
+            return os.path.dirname(os.path.abspath(self.snapshot_path))
+        return self.directory
+    
+    def scan(self, force: bool = False, names: Optional[Iterable[str]] = None) -> Any:
+        """Scan the configuration directory, or open the snapshot if it changed.
+        
+        Args:
+            force: Re-parse every file, or map the snapshot even if it did not change
+            names: Only check these file names, or None to scan the directory
+        
+        Returns:
+            Any: Directory scan result, or the opened snapshot and its signature (None if it did not change)
+        """
+        if not self.snapshot_path:
+            return self._loader.scan(self.directory, force, names)
+        if names is not None and os.path.basename(self.snapshot_path) not in names:
+            return None
+        try:
+            stat = os.stat(self.snapshot_path)
+            signature = (stat.st_ino, stat.st_size, stat.st_mtime_ns)
+            if signature == self._snapshot_signature and not force:
+                return None
+            return ClientSnapshot(self.snapshot_path), signature
+        except (OSError, ValueError) as e:
+            # Keep serving the last good snapshot
+            logger.error(f"Error loading client snapshot from {self.snapshot_path}: {e}")
+            return None
+    
+    def apply(self, result: Any) -> StoreUpdate:
+        """Swap in the scanned clients.
+        
+        Args:
+            result: Result of scan()
+        
+        Returns:
+            StoreUpdate: Whether the result was applied and the changed clients
+        """
+        if self.snapshot_path:
+            if result is None:
+                return StoreUpdate(True, set())
+            snapshot, signature = result
+            if signature == self._snapshot_signature:
+                # A concurrent scan already mapped this file
+                snapshot.close()
+                return StoreUpdate(True, set())
+            previous = self._snapshot
+            self._snapshot, self._snapshot_signature = snapshot, signature
+            self.clients = snapshot
+            if previous is not None:
+                previous.close()
+            logger.info(f"Loaded {len(snapshot)} client configurations from snapshot {self.snapshot_path}")
+            return StoreUpdate(True, None)
+        
+        if not self._loader.apply(result):
+            return StoreUpdate(False, set())
+        # A single assignment, so concurrent requests see either the old or the new map
+        self.clients = result.clients
+        if result.parsed or result.removed:
+            logger.info(
+                f"Loaded {len(result.clients)} client configurations "
+                f"({result.parsed} parsed, {result.removed} files removed)"
+            )
+        return StoreUpdate(True, result.changed)
+
+
+class ReadThroughCache:
+    """Cache of client records in front of a slower lookup.
+    
+    Found records are kept until they change or are evicted by newer ones.
+    Unknown IDs are remembered for `negative_ttl` seconds in a bounded LRU,
+    so a flood of made-up IDs neither reaches the lookup nor grows memory
+    without bound.
+    """
+    
+    def __init__(
+        self,
+        fetch: Callable[[str], Optional[ClientRecord]],
+        max_entries: int,
+        negative_max_entries: int,
+        negative_ttl: float,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        """Initialize the cache.
+        
+        Args:
+            fetch: Looks a client up in the store, returning None for unknown IDs
+            max_entries: Maximum number of cached records
+            negative_max_entries: Maximum number of remembered unknown IDs
+            negative_ttl: Seconds to remember an unknown ID
+            clock: Monotonic clock, replaceable for tests
+        """
+        self._fetch = fetch
+        self.max_entries = max_entries
+        self.negative_max_entries = negative_max_entries
+        self.negative_ttl = negative_ttl
+        self._clock = clock
+        self._records: Dict[str, ClientRecord] = {}
+        self._missing: "OrderedDict[str, float]" = OrderedDict()
+        # Number of clients in the store, set by the store
+        self.total = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+    
+    def get(self, client_id: str, default: Optional[ClientRecord] = None) -> Optional[ClientRecord]:
+        """Get a client's record, looking it up in the store on a cache miss.
+        
+        Args:
+            client_id: Client ID
+            default: Value to return for unknown clients
+        
+        Returns:
+            Optional[ClientRecord]: Client record, or the default
+        """
+        record = self._records.get(client_id)
+        if record is not None:
+            self.hits += 1
+            return record
+        expires = self._missing.get(client_id)
+        if expires is not None and expires > self._clock():
+            self.hits += 1
+            return default
+        
+        self.misses += 1
+        record = self._fetch(client_id)
+        if record is None:
+            self._missing[client_id] = self._clock() + self.negative_ttl
+            self._missing.move_to_end(client_id)
+            while len(self._missing) > self.negative_max_entries:
+                self._missing.popitem(last=False)
+            return default
+        self._missing.pop(client_id, None)
+        self._records[client_id] = record
+        if len(self._records) > self.max_entries:
+            # Evict the record cached first
+            del self._records[next(iter(self._records))]
+            self.evictions += 1
+        return record
+    
+    def __getitem__(self, client_id: str) -> ClientRecord:
+        record = self.get(client_id)
+        if record is None:
+            raise KeyError(client_id)
+        return record
+    
+    def __contains__(self, client_id: object) -> bool:
+        return isinstance(client_id, str) and self.get(client_id) is not None
+    
+    def __len__(self) -> int:
+        return self.total
+    
+    def update(self, client_id: str, record: Optional[ClientRecord]) -> None:
+        """Apply a change to a client from the store.
+        
+        Args:
+            client_id: Client ID
+            record: New record, or None if the client was deleted
+        """
+        self._missing.pop(client_id, None)
+        if record is None:
+            self._records.pop(client_id, None)
+        elif client_id in self._records:
+            self._records[client_id] = record
+    
+    def clear(self) -> None:
+        """Forget all cached records and unknown IDs."""
+        self._records = {}
+        self._missing = OrderedDict()
+    
+    def stats(self) -> Dict[str, Any]:
+        """Get cache statistics.
+        
+        Returns:
+            Dict[str, Any]: Entry counts, hits, misses and evictions
+        """
+        return {
+            "entries": len(self._records),
+            "negative_entries": len(self._missing),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+
+class SQLiteScan(NamedTuple):
+    """Changes read from the database."""
+    since: Optional[int]
+    version: int
+    # Changed clients (None for deleted ones), or None to drop every cached client
+    changes: Optional[Dict[str, Optional[ClientRecord]]]
+    # Number of clients, or None if nothing changed
+    count: Optional[int]
+
+class SQLiteClientStore(ClientStore):
+    """Client store in a SQLite database shared by the gateway replicas."""
+    
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS clients (
+            client_id TEXT PRIMARY KEY,
+            config TEXT,
+            version INTEGER NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS clients_version ON clients (version);
+    """
+    
+    def __init__(
+        self,
+        path: str,
+        max_entries: int = 100000,
+        negative_max_entries: int = 10000,
+        negative_ttl: float = 30.0,
+    ):
+        """Open the database, creating the schema if needed.
+        
+        Args:
+            path: Database file path
+            max_entries: Maximum number of cached client records
+            negative_max_entries: Maximum number of remembered unknown client IDs
+            negative_ttl: Seconds to remember an unknown client ID
+        """
+        super().__init__()
+        self.path = path
+        self._local = threading.local()
+        self._connections: List[sqlite3.Connection] = []
+        self._lock = threading.Lock()
+        self._connection().executescript(self.SCHEMA)
+        # Version of the last applied scan, None before the first
+        self.version: Optional[int] = None
+        self.clients = ReadThroughCache(self.fetch, max_entries, negative_max_entries, negative_ttl)
+    
+    def _connection(self) -> sqlite3.Connection:
+        """Get this thread's database connection.
+        
+        Returns:
+            sqlite3.Connection: Connection in autocommit mode
+        """
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, isolation_level=None, check_same_thread=False)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA busy_timeout=5000")
+            self._local.connection = connection
+            with self._lock:
+                self._connections.append(connection)
+        return connection
+    
+    @staticmethod
+    def _parse(client_id: str, data: str) -> Optional[ClientRecord]:
+        """Parse a stored configuration.
+        
+        Args:
+            client_id: Client ID of the row
+            data: Configuration JSON
+        
+        Returns:
+            Optional[ClientRecord]: Client record, or None if the configuration is invalid
+        """
+        try:
+            return ClientRecord.from_config(ClientConfig.model_validate_json(data))
+        except ValueError as e:
+            logger.error(f"Error loading client configuration {client_id} from the database: {e}")
+            return None
+    
+    def fetch(self, client_id: str) -> Optional[ClientRecord]:
+        """Look a client up in the database.
+        
+        Args:
+            client_id: Client ID
+        
+        Returns:
+            Optional[ClientRecord]: Client record, or None if the client does not exist
+        """
+        row = self._connection().execute("SELECT config FROM clients WHERE client_id = ?", (client_id,)).fetchone()
+        if row is None or row[0] is None:
+            return None
+        return self._parse(client_id, row[0])
+    
+    def _write(self, rows: Iterable[Tuple[str, Optional[str]]]) -> int:
+        """Write client rows in one transaction, each with the next version.
+        
+        Args:
+            rows: Client IDs and configuration JSON (None to delete the client)
+        
+        Returns:
+            int: Version of the last write
+        """
+        connection = self._connection()
+        # IMMEDIATE takes the write lock first, so concurrent writers get distinct versions
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            version = connection.execute("SELECT COALESCE(MAX(version), 0) FROM clients").fetchone()[0]
+            for client_id, data in rows:
+                version += 1
+                connection.execute(
+                    "INSERT INTO clients (client_id, config, version) VALUES (?, ?, ?) "
+                    "ON CONFLICT (client_id) DO UPDATE SET config = excluded.config, version = excluded.version",
+                    (client_id, data, version),
+                )
+            connection.execute("COMMIT")
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        return version
+    
+    def put(self, *configs: ClientConfig) -> int:
+        """Create or replace client configurations.
+        
+        Args:
+            configs: Client configurations
+        
+        Returns:
+            int: Version of the last change
+        """
+        return self._write((config.client_id, config.model_dump_json()) for config in configs)
+    
+    def delete(self, client_id: str) -> int:
+        """Delete a client, keeping a row so replicas see the deletion.
+        
+        Args:
+            client_id: Client ID
+        
+        Returns:
+            int: Version of the change
+        """
+        return self._write([(client_id, None)])
+    
+    def scan(self, force: bool = False, names: Optional[Iterable[str]] = None) -> SQLiteScan:
+        """Read the rows changed since the last applied version.
+        
+        Args:
+            force: Drop every cached client instead of reading the changes
+            names: Ignored, the database has no files to name
+        
+        Returns:
+            SQLiteScan: Changed clients and the new version
+        """
+        connection = self._connection()
+        since = self.version
+        if since is None or force:
+            version = connection.execute("SELECT COALESCE(MAX(version), 0) FROM clients").fetchone()[0]
+            return SQLiteScan(since, version, None, self._count(connection))
+        
+        version = since
+        changes: Dict[str, Optional[ClientRecord]] = {}
+        for client_id, data, row_version in connection.execute(
+            "SELECT client_id, config, version FROM clients WHERE version > ? ORDER BY version", (since,)
+        ):
+            changes[client_id] = None if data is None else self._parse(client_id, data)
+            version = row_version
+        # Counting scans the table, so only recount when something changed
+        return SQLiteScan(since, version, changes, self._count(connection) if changes else None)
+    
+    @staticmethod
+    def _count(connection: sqlite3.Connection) -> int:
+        """Count the clients that are not deleted.
+        
+        Args:
+            connection: Database connection
+        
+        Returns:
+            int: Number of clients
+        """
+        return connection.execute("SELECT COUNT(*) FROM clients WHERE config IS NOT NULL").fetchone()[0]
+    
+    def apply(self, result: SQLiteScan) -> StoreUpdate:
+        """Apply changes read from the database to the cache.
+        
+        Args:
+            result: Result of scan()
+        
+        Returns:
+            StoreUpdate: Whether the result was applied and the changed clients
+        """
+        if result.since != self.version:
+            return StoreUpdate(False, set())
+        self.version = result.version
+        if result.count is not None:
+            self.clients.total = result.count
+        if result.changes is None:
+            self.clients.clear()
+            logger.info(f"Using {result.count} client configurations from {self.path} (version {result.version})")
+            return StoreUpdate(True, None)
+        if result.changes:
+            logger.info(f"Applied {len(result.changes)} client configuration changes (version {result.version})")
+        for client_id, record in result.changes.items():
+            self.clients.update(client_id, record)
+        return StoreUpdate(True, set(result.changes))
+    
+    def stats(self) -> Dict[str, Any]:
+        """Get read-through cache statistics.
+        
+        Returns:
+            Dict[str, Any]: Entry counts, hits, misses and evictions
+        """
+        return self.clients.stats()
+    
+    def close(self) -> None:
+        """Close the database connections."""
+        with self._lock:
+            for connection in self._connections:
+                connection.close()
+            self._connections = []
+        self._local = threading.local()
+
+def create_client_store(backend: Optional[str] = None) -> ClientStore:
+    """Create the configured client store.
+    
+    Args:
+        backend: Store name (file or sqlite), defaults to the configured store
+    
+    Returns:
+        ClientStore: Client store
+    
+    Raises:
+        ValueError: If the store is invalid
+    """
+    backend = backend or settings.CLIENT_STORE
+    if backend == "file":
+        return FileClientStore()
+    elif backend == "sqlite":
+        return SQLiteClientStore(
+            settings.CLIENT_STORE_PATH,
+            settings.CLIENT_CACHE_MAX_ENTRIES,
+            settings.CLIENT_NEGATIVE_CACHE_MAX_ENTRIES,
+            settings.CLIENT_NEGATIVE_CACHE_TTL,
+        )
+    else:
+        raise ValueError(f"Invalid client store: {backend}")
+
+def main(argv: List[str]) -> None:
+    """Import a directory of client configuration files into a database."""
+    if len(argv) != 2:
+        print("Usage: python -m app.clients.store <config_dir> <database_file>")
+        sys.exit(1)
+    store = SQLiteClientStore(argv[1])
+    records = ClientConfigLoader().scan(argv[0]).clients.values()
+    store.put(*(record.to_config() for record in records))
+    store.close()
+    print(f"Imported {len(records)} clients into {argv[1]}")
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,274 @@
+"""
+Signed bearer tokens for clients.
+
+A client exchanges its ID and secret for a short-lived JWT that carries its
+configuration (providers, endpoints, limits) as claims. Requests with the
+token are authorized from the claims alone: the signature is checked locally
+with keys loaded once, and no client configuration or secret hash is looked
+up.
+
+Tokens are signed with HS256 using JWT_SECRET, which can be shared with the
+APISIX jwt-auth plugin, or with RS256 using JWT_PRIVATE_KEY_FILE and
+JWT_PUBLIC_KEY_FILE (needs the cryptography package). Keys listed in
+JWT_VERIFY_KEYS are accepted for verification only, for key rotation.
+"""
+import hmac
+import json
+import time
+import base64
+import hashlib
+import logging
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+try:
+    from cryptography.exceptions import InvalidSignature
+    from cryptography.hazmat.primitives import hashes, serialization
+    from cryptography.hazmat.primitives.asymmetric import padding
+except ImportError:
+    serialization = None
+
+from app.core.config import settings
+from app.schemas.base import ClientConfig
+from app.clients.registry import ClientRecord
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+class TokenError(Exception):
+    """Raised when a token is malformed, has a bad signature or is expired."""
+    pass
+
+def b64url_encode(data: bytes) -> str:
+    """Encode bytes as unpadded base64url.
+    
+    Args:
+        data: Bytes to encode
+    
+    Returns:
+        str: Encoded string
+    """
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode()
+
+def b64url_decode(data: str) -> bytes:
+    """Decode unpadded base64url.
+    
+    Args:
+        data: Encoded string
+    
+    Returns:
+        bytes: Decoded bytes
+    
+    Raises:
+        TokenError: If the data is not valid base64url
+    """
+    try:
+        return base64.urlsafe_b64decode(data + "=" * (-len(data) % 4))
+    except (ValueError, TypeError) as e:
+        raise TokenError(f"Invalid token encoding: {e}")
+
+def _read_key_file(path: str) -> bytes:
+    """Read a PEM key file.
+    
+    Args:
+        path: Key file path
+    
+    Returns:
+        bytes: File contents
+    """
+    with open(path, "rb") as f:
+        return f.read()
+
+
+class TokenService:
+    """Issues and verifies client tokens with keys loaded once from settings."""
+    
+    def __init__(self):
+        """Initialize the token service."""
+        self._keys: Optional[Dict[str, Any]] = None
+        self._signing_key: Any = None
+        self._verified: "OrderedDict[str, Tuple[ClientRecord, float]]" = OrderedDict()
+    
+    @property
+    def enabled(self) -> bool:
+        """Whether a signing key is configured."""
+        if settings.JWT_ALGORITHM == "HS256":
+            return bool(settings.JWT_SECRET)
+        return bool(settings.JWT_PRIVATE_KEY_FILE)
+    
+    def _load_keys(self) -> Dict[str, Any]:
+        """Load the signing and verification keys, caching them.
+        
+        Returns:
+            Dict[str, Any]: Verification keys by key ID
+        
+        Raises:
+            ValueError: If the algorithm is unsupported or its keys are missing
+        """
+        if self._keys is not None:
+            return self._keys
+        
+        algorithm = settings.JWT_ALGORITHM
+        keys: Dict[str, Any] = {}
+        if algorithm == "HS256":
+            if settings.JWT_SECRET:
+                self._signing_key = keys[settings.JWT_KEY_ID] = settings.JWT_SECRET.encode()
+            for kid, secret in settings.JWT_VERIFY_KEYS.items():
+                keys[kid] = secret.encode()
+        elif algorithm == "RS256":
+            if serialization is None:
+                raise ValueError("RS256 tokens need the cryptography package")
+            if settings.JWT_PRIVATE_KEY_FILE:
+                self._signing_key = serialization.load_pem_private_key(
+                    _read_key_file(settings.JWT_PRIVATE_KEY_FILE), password=None
+                )
+            if settings.JWT_PUBLIC_KEY_FILE:
+                keys[settings.JWT_KEY_ID] = serialization.load_pem_public_key(_read_key_file(settings.JWT_PUBLIC_KEY_FILE))
+            elif self._signing_key is not None:
+                keys[settings.JWT_KEY_ID] = self._signing_key.public_key()
+            for kid, path in settings.JWT_VERIFY_KEYS.items():
+                keys[kid] = serialization.load_pem_public_key(_read_key_file(path))
+        else:
+            raise ValueError(f"Unsupported token algorithm: {algorithm}")
+        
+        self._keys = keys
+        logger.info(f"Loaded {len(keys)} token verification keys for {algorithm}")
+        return keys
+    
+    def _sign(self, signing_input: bytes) -> bytes:
+        """Sign the header and payload of a token.
+        
+        Args:
+            signing_input: Encoded header and payload joined by "."
+        
+        Returns:
+            bytes: Signature
+        """
+        if settings.JWT_ALGORITHM == "HS256":
+            return hmac.new(self._signing_key, signing_input, hashlib.sha256).digest()
+        return self._signing_key.sign(signing_input, padding.PKCS1v15(), hashes.SHA256())
+    
+    def _check_signature(self, key: Any, signing_input: bytes, signature: bytes) -> bool:
+        """Check a token signature.
+        
+        Args:
+            key: Verification key
+            signing_input: Encoded header and payload joined by "."
+            signature: Signature from the token
+        
+        Returns:
+            bool: True if the signature is valid
+        """
+        if settings.JWT_ALGORITHM == "HS256":
+            return hmac.compare_digest(hmac.new(key, signing_input, hashlib.sha256).digest(), signature)
+        try:
+            key.verify(signature, signing_input, padding.PKCS1v15(), hashes.SHA256())
+            return True
+        except InvalidSignature:
+            return False
+    
+    def issue(self, client_config: ClientRecord) -> Tuple[str, int]:
+        """Issue a token carrying a client's configuration.
+        
+        Args:
+            client_config: Authenticated client's configuration
+        
+        Returns:
+            Tuple[str, int]: Token and its lifetime in seconds
+        
+        Raises:
+            ValueError: If no signing key is configured
+        """
+        self._load_keys()
+        if self._signing_key is None:
+            raise ValueError("No token signing key is configured")
+        
+        now = int(time.time())
+        header = {"alg": settings.JWT_ALGORITHM, "typ": "JWT", "kid": settings.JWT_KEY_ID}
+        payload = {
+            "iss": settings.JWT_ISSUER,
+            "aud": settings.JWT_AUDIENCE,
+            "sub": client_config.client_id,
+            # APISIX jwt-auth looks the consumer up by this claim
+            "key": client_config.client_id,
+            "iat": now,
+            "exp": now + settings.JWT_TTL,
+            "cfg": client_config.to_config().model_dump(exclude={"client_id", "client_secret_hash"}),
+        }
+        signing_input = (
+            f"{b64url_encode(json.dumps(header, separators=(',', ':')).encode())}."
+            f"{b64url_encode(json.dumps(payload, separators=(',', ':')).encode())}"
+        ).encode()
+        token = f"{signing_input.decode()}.{b64url_encode(self._sign(signing_input))}"
+        return token, settings.JWT_TTL
+    
+    def verify(self, token: str) -> ClientRecord:
+        """Verify a token and build the client configuration from its claims.
+        
+        Verified tokens are remembered until they expire, so repeated
+        requests with the same token skip the signature check and parsing.
+        
+        Args:
+            token: Bearer token
+        
+        Returns:
+            ClientRecord: Client configuration from the token's claims
+        
+        Raises:
+            TokenError: If the token is malformed, has a bad signature, is expired or has the wrong issuer or audience
+        """
+        now = time.time()
+        cached = self._verified.get(token)
+        if cached is not None:
+            if cached[1] > now:
+                return cached[0]
+            del self._verified[token]
+            raise TokenError("Token has expired")
+        
+        try:
+            encoded_header, encoded_payload, encoded_signature = token.split(".")
+        except ValueError:
+            raise TokenError("Malformed token")
+        try:
+            header = json.loads(b64url_decode(encoded_header))
+            payload = json.loads(b64url_decode(encoded_payload))
+        except ValueError:
+            raise TokenError("Malformed token")
+        if not isinstance(header, dict) or not isinstance(payload, dict):
+            raise TokenError("Malformed token")
+        
+        # Only the configured algorithm is accepted, never "none" or one picked by the token
+        if header.get("alg") != settings.JWT_ALGORITHM:
+            raise TokenError("Unexpected token algorithm")
+        kid = header.get("kid", settings.JWT_KEY_ID)
+        if not isinstance(kid, str):
+            raise TokenError("Malformed token")
+        key = self._load_keys().get(kid)
+        if key is None:
+            raise TokenError("Unknown token key")
+        if not self._check_signature(key, f"{encoded_header}.{encoded_payload}".encode(), b64url_decode(encoded_signature)):
+            raise TokenError("Invalid token signature")
+        
+        exp = payload.get("exp")
+        if not isinstance(exp, (int, float)) or exp + settings.JWT_LEEWAY <= now:
+            raise TokenError("Token has expired")
+        if payload.get("iss") != settings.JWT_ISSUER or payload.get("aud") != settings.JWT_AUDIENCE:
+            raise TokenError("Token was not issued for this gateway")
+        try:
+            client_config = ClientRecord.from_config(ClientConfig(client_id=payload["sub"], **payload["cfg"]))
+        except (KeyError, TypeError, ValueError) as e:
+            raise TokenError(f"Invalid token claims: {e}")
+        
+        self._verified[token] = (client_config, exp + settings.JWT_LEEWAY)
+        while len(self._verified) > settings.JWT_CACHE_MAX_ENTRIES:
+            self._verified.popitem(last=False)
+        return client_config
+    
+    def reset(self) -> None:
+        """Forget the loaded keys and verified tokens."""
+        self._keys = None
+        self._signing_key = None
+        self._verified.clear()
+
+# Create global token service
+token_service = TokenService()
@@ -0,0 +1,133 @@
+"""
+Response cache for deterministic generate requests.
+
+Entries are kept in LRU order with a TTL and a bound on their total size in
+bytes. Keys hash the prompt so that large prompts do not stay in memory twice.
+"""
+import sys
+import time
+import hashlib
+import logging
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+from app.core.config import settings
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+CacheKey = Tuple[str, str, bytes, float, int]
+
+# Approximate per-entry overhead of the key, entry tuple and dict
+ENTRY_OVERHEAD_BYTES = 400
+
+class ResponseCache:
+    """LRU response cache with TTL expiry and a size bound in bytes."""
+    
+    def __init__(self, max_bytes: int, ttl: float):
+        """Initialize the response cache.
+        
+        Args:
+            max_bytes: Maximum total size of the cached entries
+            ttl: Seconds an entry stays valid
+        """
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.size_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries: "OrderedDict[CacheKey, Tuple[float, int, Dict[str, Any]]]" = OrderedDict()
+    
+    @staticmethod
+    def make_key(provider: str, model: str, prompt: str, temperature: float, max_tokens: int) -> CacheKey:
+        """Build the cache key for a request.
+        
+        Args:
+            provider: Provider name
+            model: Model name
+            prompt: Prompt text
+            temperature: Sampling temperature
+            max_tokens: Maximum number of tokens to generate
+        
+        Returns:
+            CacheKey: Cache key
+        """
+        digest = hashlib.blake2b(prompt.encode(), digest_size=16).digest()
+        return (provider, model, digest, temperature, max_tokens)
+    
+    @staticmethod
+    def _entry_size(response: Dict[str, Any]) -> int:
+        """Estimate the memory used by a cached response."""
+        return ENTRY_OVERHEAD_BYTES + sys.getsizeof(response.get("text") or "") + len(response.get("model") or "")
+    
+    def get(self, key: CacheKey) -> Optional[Dict[str, Any]]:
+        """Get a cached response.
+        
+        Args:
+            key: Cache key
+        
+        Returns:
+            Optional[Dict[str, Any]]: Cached response or None on a miss
+        """
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        
+        expires, size, response = entry
+        if expires <= time.monotonic():
+            del self._entries[key]
+            self.size_bytes -= size
+            self.misses += 1
+            return None
+        
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return response
+    
+    def set(self, key: CacheKey, response: Dict[str, Any]) -> None:
+        """Cache a response, evicting the least recently used entries if needed.
+        
+        Args:
+            key: Cache key
+            response: Response to cache
+        """
+        size = self._entry_size(response)
+        if size > self.max_bytes:
+            return
+        
+        previous = self._entries.pop(key, None)
+        if previous is not None:
+            self.size_bytes -= previous[1]
+        
+        self._entries[key] = (time.monotonic() + self.ttl, size, response)
+        self.size_bytes += size
+        
+        while self.size_bytes > self.max_bytes:
+            _, (_, evicted_size, _) = self._entries.popitem(last=False)
+            self.size_bytes -= evicted_size
+            self.evictions += 1
+    
+    def clear(self) -> None:
+        """Remove all cached responses."""
+        self._entries.clear()
+        self.size_bytes = 0
+    
+    def stats(self) -> Dict[str, int]:
+        """Get the cache counters.
+        
+        Returns:
+            Dict[str, int]: Cache counters
+        """
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "entries": len(self._entries),
+            "size_bytes": self.size_bytes,
+            "max_bytes": self.max_bytes,
+        }
+
+# Create global response cache
+response_cache = ResponseCache(settings.RESPONSE_CACHE_MAX_BYTES, settings.RESPONSE_CACHE_TTL)
@@ -1,6 +1,7 @@
 import os
 import logging
-from typing import Literal
+import tempfile
+from typing import Dict, List, Literal, Optional
 from pydantic_settings import BaseSettings
 from dotenv import load_dotenv
 
@@ -21,12 +22,189 @@ class Settings(BaseSettings):
     OPENAI_API_KEY: str = ""
     GROQ_API_KEY: str = ""
     
+    # Optional base URLs for provider APIs (e.g. proxies or self-hosted gateways)
+    OPENAI_BASE_URL: Optional[str] = None
+    GROQ_BASE_URL: Optional[str] = None
+    
+    # Base URL of a Triton Inference Server (e.g. http://localhost:8000)
+    TRITON_BASE_URL: Optional[str] = None
+    
+    # Micro-batching of concurrent Triton requests
+    TRITON_MAX_BATCH_SIZE: int = 16
+    TRITON_MAX_BATCH_WAIT: float = 0.005
+    
+    # Provider HTTP connection pool settings
+    PROVIDER_MAX_CONNECTIONS: int = 100
+    PROVIDER_MAX_KEEPALIVE_CONNECTIONS: int = 20
+    PROVIDER_KEEPALIVE_EXPIRY: float = 30.0
+    PROVIDER_TIMEOUT: float = 60.0
+    PROVIDER_MAX_RETRIES: int = 2
+    
     # Default provider and model
-    DEFAULT_PROVIDER: Literal["openai", "groq"] = "groq"
+    DEFAULT_PROVIDER: Literal["openai", "groq", "triton"] = "groq"
     DEFAULT_MODEL: str = "mixtral-8x7b-32768"
     
+    # Model aliases routed to the fastest healthy target, e.g.
+    # {"fast-chat": ["groq/llama3-8b-8192", "openai/gpt-4o-mini"]}
+    MODEL_ALIASES: Dict[str, List[str]] = {}
+    
+    # Latency-aware routing statistics
+    ROUTING_EWMA_ALPHA: float = 0.2
+    ROUTING_LATENCY_WINDOW: int = 256
+    ROUTING_MAX_ERROR_RATE: float = 0.5
+    ROUTING_PROBE_INTERVAL: float = 30.0
+    
+    # Hedged requests: send a duplicate when a call is slower than the target's
+    # HEDGE_PERCENTILE latency, or than HEDGE_DELAY seconds if set
+    HEDGE_ENABLED: bool = False
+    HEDGE_DELAY: Optional[float] = None
+    HEDGE_PERCENTILE: float = 95.0
+    HEDGE_MIN_SAMPLES: int = 20
+    HEDGE_MIN_DELAY: float = 0.05
+    
+    # Fallback targets used when a target's calls fail or its circuit is open, keyed by
+    # "provider/model" or "provider", e.g. {"groq": ["openai/gpt-4o-mini"]}
+    FALLBACK_TARGETS: Dict[str, List[str]] = {}
+    
+    # Circuit breakers per (provider, model) target
+    CIRCUIT_FAILURE_THRESHOLD: int = 5
+    CIRCUIT_RESET_TIMEOUT: float = 30.0
+    CIRCUIT_HALF_OPEN_MAX_CALLS: int = 1
+    CIRCUIT_SUCCESS_THRESHOLD: int = 1
+    
     # Client configuration directory
     CLIENT_CONFIG_DIR: str = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), "app", "clients", "configs")
+    # Reload client configurations when their files change: off, auto (inotify if available), inotify or poll
+    CLIENT_CONFIG_WATCH: Literal["off", "auto", "inotify", "poll"] = "off"
+    CLIENT_CONFIG_POLL_INTERVAL: float = 2.0
+    # Packed client snapshot built with `python -m app.clients.registry`; used instead of the directory when set
+    CLIENT_SNAPSHOT_PATH: Optional[str] = None
+    # Client store: file (CLIENT_CONFIG_DIR or CLIENT_SNAPSHOT_PATH) or sqlite (CLIENT_STORE_PATH, shared by replicas)
+    CLIENT_STORE: Literal["file", "sqlite"] = "file"
+    CLIENT_STORE_PATH: str = "clients.db"
+    # Read-through cache of the database store; unknown client IDs are remembered for CLIENT_NEGATIVE_CACHE_TTL seconds
+    CLIENT_CACHE_MAX_ENTRIES: int = 100000
+    CLIENT_NEGATIVE_CACHE_MAX_ENTRIES: int = 10000
+    CLIENT_NEGATIVE_CACHE_TTL: float = 30.0
+    
+    # Remember verified client secrets so slow secret hashes are not checked on every request
+    AUTH_CACHE_MAX_ENTRIES: int = 10000
+    AUTH_CACHE_TTL: float = 300.0
+    # Slow secret hashes checked at once per worker, in threads off the event loop
+    AUTH_KDF_CONCURRENCY: int = 4
+    # Log at most one authentication failure per client (and one for unknown clients) per interval
+    AUTH_FAILURE_LOG_INTERVAL: float = 60.0
+    
+    # Signed bearer tokens; HS256 uses JWT_SECRET, RS256 uses PEM key files
+    JWT_ALGORITHM: Literal["HS256", "RS256"] = "HS256"
+    JWT_SECRET: Optional[str] = None
+    JWT_PRIVATE_KEY_FILE: Optional[str] = None
+    JWT_PUBLIC_KEY_FILE: Optional[str] = None
+    JWT_KEY_ID: str = "default"
+    # Extra verification-only keys by key ID (HS256 secrets or RS256 public key files), for key rotation
+    JWT_VERIFY_KEYS: Dict[str, str] = {}
+    JWT_ISSUER: str = "dsp-ai-gateway"
+    JWT_AUDIENCE: str = "dsp-ai-gateway"
+    JWT_TTL: int = 900
+    JWT_LEEWAY: int = 30
+    JWT_CACHE_MAX_ENTRIES: int = 10000
+    
+    # Enforce per-client rate limits in the gateway
+    RATE_LIMIT_ENABLED: bool = True
+    
+    # Counter backend for sharing rate limits across workers (memory, mmap or redis)
+    RATE_LIMIT_BACKEND: Literal["memory", "mmap", "redis"] = "memory"
+    RATE_LIMIT_SYNC_INTERVAL: float = 0.25
+    RATE_LIMIT_MMAP_PATH: str = os.path.join(tempfile.gettempdir(), "dsp_ai_gateway_counters.bin")
+    RATE_LIMIT_MMAP_SLOTS: int = 65536
+    REDIS_URL: str = "redis://localhost:6379/0"
+    
+    # Response cache for deterministic generate requests
+    RESPONSE_CACHE_ENABLED: bool = True
+    RESPONSE_CACHE_MAX_BYTES: int = 64 * 1024 * 1024
+    RESPONSE_CACHE_TTL: float = 3600.0
+    
+    # Semantic cache for near-duplicate prompts
+    SEMANTIC_CACHE_ENABLED: bool = False
+    SEMANTIC_CACHE_THRESHOLD: float = 0.95
+    SEMANTIC_CACHE_MAX_ENTRIES: int = 100000
+    SEMANTIC_CACHE_HASH_BITS: int = 8
+    SEMANTIC_CACHE_EMBEDDER: str = "app.core.semantic_cache.HashingEmbedder"
+    
+    # Coalesce identical concurrent deterministic requests into one upstream call
+    SINGLE_FLIGHT_ENABLED: bool = True
+    
+    # Return generation results built by the gateway pre-encoded, without validating them against the response model
+    FAST_JSON_RESPONSES: bool = True
+    
+    # Prompt assembly: normalize prompts so shared prefixes are byte-identical, and send prefix
+    # caching hints to providers for prompts of at least PROMPT_CACHE_MIN_CHARS characters
+    PROMPT_NORMALIZE: bool = True
+    PROMPT_CACHE_HINTS: bool = True
+    PROMPT_CACHE_MIN_CHARS: int = 4096
+    # Recent prompt prefixes remembered per client to measure prefix reuse
+    PROMPT_PREFIX_MAX_ENTRIES: int = 10000
+    PROMPT_PREFIX_TTL: float = 600.0
+    
+    # Local prompt token counting: reject prompts that do not fit the model's context window, trim
+    # max_tokens to the room left, and reserve prompt plus max_tokens of the daily quota while a call runs
+    TOKEN_PRECHECK_ENABLED: bool = True
+    TOKEN_TRIM_MAX_TOKENS: bool = True
+    TOKEN_RESERVATION_ENABLED: bool = True
+    # Multiplier applied to estimated token counts; raise it to err on the high side
+    TOKEN_ESTIMATE_SCALE: float = 1.0
+    # Context windows by model name, overriding the built-in registry, e.g. {"my-finetune": 16384}
+    MODEL_CONTEXT_WINDOWS: Dict[str, int] = {}
+    # Memoized token counts of prompt segments of at least TOKEN_CACHE_MIN_CHARS characters
+    TOKEN_CACHE_MAX_ENTRIES: int = 4096
+    TOKEN_CACHE_MIN_CHARS: int = 256
+    
+    # Batch generation: maximum requests per batch and requests of one client run at once across its batches
+    BATCH_MAX_ITEMS: int = 1000
+    BATCH_CONCURRENCY: int = 8
+    
+    # Asynchronous generation jobs, queued in a SQLite database shared by the workers of a host
+    JOBS_ENABLED: bool = False
+    JOB_QUEUE_PATH: str = "jobs.db"
+    JOB_WORKERS: int = 4
+    # Backpressure: pending jobs allowed in the queue and per client
+    JOB_QUEUE_MAX: int = 10000
+    JOB_QUEUE_MAX_PER_CLIENT: int = 1000
+    # Seconds a job may run, attempts before it fails, and seconds its result is kept
+    JOB_TIMEOUT: float = 600.0
+    JOB_MAX_ATTEMPTS: int = 3
+    JOB_RESULT_TTL: float = 86400.0
+    # Seconds after submission a job deferred for its client's rate limits fails
+    JOB_MAX_DEFER: float = 86400.0
+    # Seconds between checks for jobs submitted by other processes and for expired results
+    JOB_POLL_INTERVAL: float = 1.0
+    
+    # Prometheus metrics; set METRICS_MULTIPROC_DIR when running several workers
+    METRICS_ENABLED: bool = True
+    METRICS_MULTIPROC_DIR: Optional[str] = None
+    METRICS_FLUSH_INTERVAL: float = 1.0
+    
+    # Request tracing; a fraction of requests get their bodies logged, up to TRACE_BODY_MAX_BYTES
+    TRACING_ENABLED: bool = True
+    TRACE_BODY_SAMPLE_RATE: float = 0.0
+    TRACE_BODY_MAX_BYTES: int = 2048
+    
+    # Production server (python -m app.server): address, worker processes (default: CPU count),
+    # event loop and HTTP parser (auto uses uvloop and httptools when installed)
+    SERVER_HOST: str = "0.0.0.0"
+    SERVER_PORT: int = 8000
+    SERVER_WORKERS: Optional[int] = None
+    SERVER_LOOP: Literal["auto", "asyncio", "uvloop"] = "auto"
+    SERVER_HTTP: Literal["auto", "h11", "httptools"] = "auto"
+    # Pending connections queued by the kernel, and seconds idle keep-alive connections are kept open
+    # (keep it above the idle timeout of a load balancer in front of the gateway)
+    SERVER_BACKLOG: int = 2048
+    SERVER_KEEPALIVE_TIMEOUT: int = 5
+    # Connections and requests a worker accepts at once before answering 503, unlimited if unset
+    SERVER_LIMIT_CONCURRENCY: Optional[int] = None
+    # Seconds workers get on shutdown to finish requests and streams in flight
+    SERVER_GRACEFUL_TIMEOUT: int = 60
+    SERVER_ACCESS_LOG: bool = False
     
     # API settings
     API_V1_STR: str = "/api/v1"
@@ -40,8 +218,8 @@ class Settings(BaseSettings):
         super().__init__(**data)
         
         # Validate provider
-        if self.DEFAULT_PROVIDER not in ["openai", "groq"]:
-            raise ValueError(f"Invalid provider: {self.DEFAULT_PROVIDER}. Must be one of: openai, groq")
+        if self.DEFAULT_PROVIDER not in ["openai", "groq", "triton"]:
+            raise ValueError(f"Invalid provider: {self.DEFAULT_PROVIDER}. Must be one of: openai, groq, triton")
         
         # Log settings
         logger.info(f"Loaded settings with provider: {self.DEFAULT_PROVIDER}")
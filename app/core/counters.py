@@ -0,0 +1,332 @@
+"""
+Shared counter backends for rate limits and quotas.
+
+Counters are incremented in batches: callers collect their deltas locally and
+flush them with a single `incr_many` call, so the request path never waits on
+shared state. Three backends are provided:
+
+- InMemoryCounterBackend: process-local, for single-worker deployments and tests
+- SharedMemoryCounterBackend: a memory-mapped hash table shared by the workers on one host
+- RedisCounterBackend: a pipelined Redis-protocol client shared by every replica
+"""
+import os
+import mmap
+import time
+import struct
+import asyncio
+import hashlib
+import logging
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urlparse
+
+from app.core.config import settings
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Seconds to wait before trying a shared counter file lock again
+LOCK_RETRY_DELAY = 0.001
+
+# (key, amount, ttl in seconds)
+CounterIncrement = Tuple[str, int, int]
+
+class CounterBackend:
+    """Base class for counter backends."""
+    
+    # Whether the counters are shared with other processes
+    shared = False
+    
+    async def incr_many(self, increments: List[CounterIncrement]) -> List[int]:
+        """Add to several counters and return their new values.
+        
+        Counters that do not exist start at zero and expire `ttl` seconds
+        after their last increment. An amount of 0 reads the counter.
+        
+        Args:
+            increments: Counter increments
+        
+        Returns:
+            List[int]: New counter values, in the order of the increments
+        """
+        raise NotImplementedError("Subclasses must implement incr_many method")
+    
+    async def close(self) -> None:
+        """Release the backend's resources."""
+
+
+class InMemoryCounterBackend(CounterBackend):
+    """Counter backend that keeps counters in process memory."""
+    
+    def __init__(self):
+        """Initialize the in-memory backend."""
+        self._counters: Dict[str, List[float]] = {}
+    
+    async def incr_many(self, increments: List[CounterIncrement]) -> List[int]:
+        """Add to several counters and return their new values.
+        
+        Args:
+            increments: Counter increments
+        
+        Returns:
+            List[int]: New counter values
+        """
+        now = time.time()
+        values = []
+        for key, amount, ttl in increments:
+            counter = self._counters.get(key)
+            if counter is None or counter[1] <= now:
+                counter = self._counters[key] = [0, 0.0]
+            counter[0] += amount
+            counter[1] = now + ttl
+            values.append(int(counter[0]))
+        return values
+
+
+class SharedMemoryCounterBackend(CounterBackend):
+    """Counter backend backed by a memory-mapped file shared between processes.
+    
+    The file holds an open-addressing hash table of fixed-size slots
+    (key hash, expiry, value). Each batch holds an exclusive file lock while
+    it updates the table, so workers on the same host see consistent counts.
+    """
+    
+    shared = True
+    SLOT = struct.Struct("<QQq")
+    
+    def __init__(self, path: str, slots: int = 65536):
+        """Open or create the shared counter file.
+        
+        Args:
+            path: Path to the counter file
+            slots: Number of slots in the hash table
+        
+        Raises:
+            RuntimeError: If file locks are not available on this platform
+        """
+        # fcntl only exists on POSIX systems, so it is imported here rather than with the module
+        try:
+            import fcntl
+        except ImportError:
+            raise RuntimeError("The mmap counter backend needs fcntl, which is not available on this platform") from None
+        self._fcntl = fcntl
+        self.path = path
+        self.slots = slots
+        size = slots * self.SLOT.size
+        
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        fcntl.flock(self._fd, fcntl.LOCK_EX)
+        try:
+            if os.fstat(self._fd).st_size != size:
+                os.ftruncate(self._fd, size)
+        finally:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+        self._map = mmap.mmap(self._fd, size)
+    
+    @staticmethod
+    def _hash(key: str) -> int:
+        """Hash a counter key to a non-zero 64-bit integer."""
+        digest = hashlib.blake2b(key.encode(), digest_size=8).digest()
+        return int.from_bytes(digest, "little") | 1
+    
+    def _incr(self, key_hash: int, amount: int, expires: int, now: int) -> int:
+        """Add to a single counter in the table.
+        
+        Args:
+            key_hash: Hash of the counter key
+            amount: Amount to add
+            expires: Expiry time for the counter (epoch seconds)
+            now: Current time (epoch seconds)
+        
+        Returns:
+            int: New counter value
+        """
+        slot_size = self.SLOT.size
+        index = key_hash % self.slots
+        free = None
+        for _ in range(self.slots):
+            offset = index * slot_size
+            slot_hash, slot_expires, value = self.SLOT.unpack_from(self._map, offset)
+            if slot_hash == key_hash:
+                if slot_expires <= now:
+                    value = 0
+                value += amount
+                self.SLOT.pack_into(self._map, offset, key_hash, expires, value)
+                return value
+            if slot_hash == 0 or slot_expires <= now:
+                if free is None:
+                    free = offset
+                if slot_hash == 0:
+                    # End of the probe chain, the key is not in the table
+                    break
+            index = (index + 1) % self.slots
+        
+        if free is None:
+            logger.error(f"Shared counter table is full: {self.path}")
+            return amount
+        self.SLOT.pack_into(self._map, free, key_hash, expires, amount)
+        return amount
+    
+    async def incr_many(self, increments: List[CounterIncrement]) -> List[int]:
+        """Add to several counters and return their new values.
+        
+        Args:
+            increments: Counter increments
+        
+        Returns:
+            List[int]: New counter values
+        """
+        fcntl = self._fcntl
+        # Other workers hold the lock for microseconds, so try it without blocking the event loop
+        while True:
+            try:
+                fcntl.flock(self._fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                break
+            except BlockingIOError:
+                await asyncio.sleep(LOCK_RETRY_DELAY)
+        try:
+            now = int(time.time())
+            return [self._incr(self._hash(key), amount, now + ttl, now) for key, amount, ttl in increments]
+        finally:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+    
+    async def close(self) -> None:
+        """Unmap and close the counter file."""
+        self._map.close()
+        os.close(self._fd)
+
+
+class RedisCounterBackend(CounterBackend):
+    """Counter backend that speaks the Redis protocol.
+    
+    Each batch is sent as a single pipeline of INCRBY/EXPIRE commands, so a
+    flush costs one network round trip regardless of its size.
+    """
+    
+    shared = True
+    
+    def __init__(self, url: str):
+        """Initialize the Redis backend.
+        
+        Args:
+            url: Redis URL (redis://[:password@]host[:port][/db])
+        """
+        parsed = urlparse(url)
+        self.host = parsed.hostname or "localhost"
+        self.port = parsed.port or 6379
+        self.password = parsed.password
+        self.db = int(parsed.path.lstrip("/") or 0)
+        self._reader: Optional[asyncio.StreamReader] = None
+        self._writer: Optional[asyncio.StreamWriter] = None
+        self._lock = asyncio.Lock()
+    
+    @staticmethod
+    def _encode(*args) -> bytes:
+        """Encode a command as a RESP array."""
+        parts = [f"*{len(args)}\r\n".encode()]
+        for arg in args:
+            data = str(arg).encode()
+            parts.append(f"${len(data)}\r\n".encode() + data + b"\r\n")
+        return b"".join(parts)
+    
+    async def _read_reply(self):
+        """Read a single RESP reply.
+        
+        Raises:
+            ConnectionError: If the server returns an error
+        """
+        line = await self._reader.readline()
+        if not line:
+            raise ConnectionError("Connection closed by Redis server")
+        kind, payload = line[:1], line[1:-2]
+        if kind == b":":
+            return int(payload)
+        if kind == b"+":
+            return payload.decode()
+        if kind == b"-":
+            raise ConnectionError(f"Redis error: {payload.decode()}")
+        if kind == b"$":
+            length = int(payload)
+            if length < 0:
+                return None
+            data = await self._reader.readexactly(length + 2)
+            return data[:-2].decode()
+        raise ConnectionError(f"Unsupported Redis reply: {line!r}")
+    
+    async def _connect(self) -> None:
+        """Open the connection and authenticate if needed."""
+        self._reader, self._writer = await asyncio.open_connection(self.host, self.port)
+        commands = []
+        if self.password:
+            commands.append(self._encode("AUTH", self.password))
+        if self.db:
+            commands.append(self._encode("SELECT", self.db))
+        if commands:
+            self._writer.write(b"".join(commands))
+            await self._writer.drain()
+            for _ in commands:
+                await self._read_reply()
+    
+    async def incr_many(self, increments: List[CounterIncrement]) -> List[int]:
+        """Add to several counters in one pipeline and return their new values.
+        
+        Args:
+            increments: Counter increments
+        
+        Returns:
+            List[int]: New counter values
+        """
+        if not increments:
+            return []
+        
+        payload = b"".join(
+            self._encode("INCRBY", key, amount) + self._encode("EXPIRE", key, ttl)
+            for key, amount, ttl in increments
+        )
+        async with self._lock:
+            try:
+                if self._writer is None:
+                    await self._connect()
+                self._writer.write(payload)
+                await self._writer.drain()
+                values = []
+                for _ in increments:
+                    values.append(await self._read_reply())
+                    await self._read_reply()
+                return values
+            except (ConnectionError, OSError, asyncio.IncompleteReadError):
+                # Drop the connection so the next flush reconnects
+                await self.close()
+                raise
+    
+    async def close(self) -> None:
+        """Close the connection to the Redis server."""
+        if self._writer is not None:
+            self._writer.close()
+            try:
+                await self._writer.wait_closed()
+            except (ConnectionError, OSError):
+                pass
+        self._reader = self._writer = None
+
+
+def create_counter_backend(backend: Optional[str] = None) -> CounterBackend:
+    """Create the configured counter backend.
+    
+    Args:
+        backend: Backend name (memory, mmap or redis), defaults to the configured backend
+    
+    Returns:
+        CounterBackend: Counter backend
+    
+    Raises:
+        ValueError: If the backend is invalid
+    """
+    backend = backend or settings.RATE_LIMIT_BACKEND
+    if backend == "memory":
+        return InMemoryCounterBackend()
+    elif backend == "mmap":
+        return SharedMemoryCounterBackend(settings.RATE_LIMIT_MMAP_PATH, settings.RATE_LIMIT_MMAP_SLOTS)
+    elif backend == "redis":
+        return RedisCounterBackend(settings.REDIS_URL)
+    else:
+        raise ValueError(f"Invalid counter backend: {backend}")
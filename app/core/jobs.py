@@ -0,0 +1,511 @@
+"""
+Persistent queue of asynchronous generation jobs.
+
+Jobs are stored in a SQLite database, so queued jobs survive restarts and
+every worker process of a host can share one queue. A pool of asyncio
+workers claims jobs and runs them with a handler:
+
+- Fairness: clients take turns. Each claim moves on to the next client with
+  a queued job, so a client with a thousand jobs does not hold up a client
+  with one. A job's priority only orders it among its own client's jobs.
+- Backpressure: submissions are rejected once JOB_QUEUE_MAX jobs (or
+  JOB_QUEUE_MAX_PER_CLIENT jobs of one client) are pending.
+- Leases: a claimed job must finish within JOB_TIMEOUT seconds. Failed jobs
+  and jobs whose worker died are queued again, up to JOB_MAX_ATTEMPTS
+  attempts; jobs interrupted by a shutdown are queued again right away.
+- Retention: results are kept for JOB_RESULT_TTL seconds after the job
+  finishes and then deleted.
+
+A handler can put a job back in the queue for a while without using up an
+attempt by raising JobDeferred, e.g. when the client is out of rate limit.
+Jobs still deferred JOB_MAX_DEFER seconds after they were submitted fail.
+"""
+import json
+import time
+import uuid
+import asyncio
+import sqlite3
+import logging
+import threading
+from typing import Any, Awaitable, Callable, Dict, List, NamedTuple, Optional
+
+from app.core.config import settings
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Seconds a client should wait before submitting to a full queue again
+QUEUE_FULL_RETRY_AFTER = 5
+
+class JobQueueFull(Exception):
+    """Raised when a job is submitted to a full queue."""
+    
+    def __init__(self, message: str, client_limit: bool):
+        """Initialize the exception.
+        
+        Args:
+            message: Error message
+            client_limit: True if the client's own limit was reached rather than the queue's
+        """
+        super().__init__(message)
+        self.client_limit = client_limit
+
+class JobDeferred(Exception):
+    """Raised by a job handler to run the job again later without counting an attempt."""
+    
+    def __init__(self, delay: float):
+        """Initialize the exception.
+        
+        Args:
+            delay: Seconds to wait before the job may be claimed again
+        """
+        super().__init__(f"Deferred for {delay}s")
+        self.delay = delay
+
+class Job(NamedTuple):
+    """A job claimed by a worker."""
+    job_id: str
+    client_id: str
+    priority: int
+    payload: Any
+    attempts: int
+
+class JobQueue:
+    """Job queue in a SQLite database, with a pool of asyncio workers."""
+    
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS jobs (
+            seq INTEGER PRIMARY KEY,
+            job_id TEXT NOT NULL UNIQUE,
+            client_id TEXT NOT NULL,
+            priority INTEGER NOT NULL,
+            status TEXT NOT NULL,
+            payload TEXT NOT NULL,
+            result TEXT,
+            detail TEXT,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            created_at REAL NOT NULL,
+            available_at REAL NOT NULL,
+            started_at REAL,
+            finished_at REAL,
+            expires_at REAL
+        );
+        CREATE INDEX IF NOT EXISTS jobs_queued ON jobs (status, client_id, priority DESC, seq);
+        CREATE INDEX IF NOT EXISTS jobs_expiry ON jobs (status, expires_at);
+    """
+    
+    def __init__(self, path: Optional[str] = None, clock: Callable[[], float] = time.time):
+        """Initialize the queue. The database is opened on first use.
+        
+        Args:
+            path: Database file path, defaults to JOB_QUEUE_PATH
+            clock: Wall clock, in seconds
+        """
+        self._path = path
+        self._clock = clock
+        self._local = threading.local()
+        self._connections: List[sqlite3.Connection] = []
+        self._lock = threading.Lock()
+        self._schema_ready = False
+        # Last client a job was claimed for, to take turns between clients
+        self._cursor = ""
+        self._workers: List[asyncio.Task] = []
+        self._wakeup: Optional[asyncio.Event] = None
+    
+    @property
+    def path(self) -> str:
+        """Database file path."""
+        return self._path or settings.JOB_QUEUE_PATH
+    
+    def _connection(self) -> sqlite3.Connection:
+        """Get this thread's database connection, creating the schema if needed.
+        
+        Returns:
+            sqlite3.Connection: Connection in autocommit mode
+        """
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, isolation_level=None, check_same_thread=False)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA busy_timeout=5000")
+            self._local.connection = connection
+            with self._lock:
+                self._connections.append(connection)
+                if not self._schema_ready:
+                    connection.executescript(self.SCHEMA)
+                    self._schema_ready = True
+        return connection
+    
+    def _transaction(self, work: Callable[[sqlite3.Connection], Any]) -> Any:
+        """Run work in a write transaction.
+        
+        Args:
+            work: Function called with the connection
+        
+        Returns:
+            Any: Result of work
+        """
+        connection = self._connection()
+        # IMMEDIATE takes the write lock first, so concurrent workers never claim the same job
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            result = work(connection)
+            connection.execute("COMMIT")
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        return result
+    
+    def submit(self, client_id: str, payload: Any, priority: int = 0) -> str:
+        """Add a job to the queue.
+        
+        Args:
+            client_id: Client the job belongs to
+            payload: JSON-serializable job input
+            priority: Jobs with a higher priority run before the client's other jobs
+        
+        Returns:
+            str: Job ID
+        
+        Raises:
+            JobQueueFull: If the queue or the client's share of it is full
+        """
+        job_id = uuid.uuid4().hex
+        data = json.dumps(payload)
+        
+        def insert(connection: sqlite3.Connection) -> None:
+            # Check the queue limits in the same transaction as the insert
+            pending = connection.execute(
+                "SELECT COUNT(*) FROM jobs WHERE status IN ('queued', 'running')"
+            ).fetchone()[0]
+            if pending >= settings.JOB_QUEUE_MAX:
+                raise JobQueueFull(f"Job queue is full ({pending} jobs pending)", client_limit=False)
+            pending = connection.execute(
+                "SELECT COUNT(*) FROM jobs WHERE status IN ('queued', 'running') AND client_id = ?", (client_id,)
+            ).fetchone()[0]
+            if pending >= settings.JOB_QUEUE_MAX_PER_CLIENT:
+                raise JobQueueFull(
+                    f"Too many pending jobs. Maximum allowed: {settings.JOB_QUEUE_MAX_PER_CLIENT}", client_limit=True
+                )
+            now = self._clock()
+            connection.execute(
+                "INSERT INTO jobs (job_id, client_id, priority, status, payload, created_at, available_at) "
+                "VALUES (?, ?, ?, 'queued', ?, ?, ?)",
+                (job_id, client_id, priority, data, now, now),
+            )
+        
+        self._transaction(insert)
+        return job_id
+    
+    async def enqueue(self, client_id: str, payload: Any, priority: int = 0) -> str:
+        """Add a job to the queue from the event loop and wake an idle worker.
+        
+        Args:
+            client_id: Client the job belongs to
+            payload: JSON-serializable job input
+            priority: Jobs with a higher priority run before the client's other jobs
+        
+        Returns:
+            str: Job ID
+        
+        Raises:
+            JobQueueFull: If the queue or the client's share of it is full
+        """
+        job_id = await asyncio.to_thread(self.submit, client_id, payload, priority)
+        if self._wakeup is not None:
+            self._wakeup.set()
+        return job_id
+    
+    def claim(self) -> Optional[Job]:
+        """Take the next job, taking turns between clients.
+        
+        Returns:
+            Optional[Job]: Claimed job, or None if no job is ready
+        """
+        def take(connection: sqlite3.Connection) -> Optional[Job]:
+            now = self._clock()
+            start = self._cursor
+            client_id = start
+            wrapped = False
+            while True:
+                # Walk the clients with queued jobs in order, one index seek per client
+                row = connection.execute(
+                    "SELECT MIN(client_id) FROM jobs WHERE status = 'queued' AND client_id > ?", (client_id,)
+                ).fetchone()
+                client_id = row[0]
+                if client_id is None:
+                    if wrapped or not start:
+                        return None
+                    wrapped, client_id = True, ""
+                    continue
+                if wrapped and client_id > start:
+                    return None
+                row = connection.execute(
+                    "SELECT seq, job_id, priority, payload, attempts FROM jobs "
+                    "WHERE status = 'queued' AND client_id = ? AND available_at <= ? "
+                    "ORDER BY priority DESC, seq LIMIT 1",
+                    (client_id, now),
+                ).fetchone()
+                if row is not None:
+                    break
+            seq, job_id, priority, payload, attempts = row
+            connection.execute(
+                "UPDATE jobs SET status = 'running', attempts = attempts + 1, started_at = ?, expires_at = ? WHERE seq = ?",
+                (now, now + settings.JOB_TIMEOUT, seq),
+            )
+            self._cursor = client_id
+            return Job(job_id, client_id, priority, json.loads(payload), attempts + 1)
+        
+        return self._transaction(take)
+    
+    def finish(self, job_id: str, result: Any = None, detail: Optional[str] = None) -> None:
+        """Store a job's outcome and start its retention period.
+        
+        Args:
+            job_id: Job ID
+            result: JSON-serializable result of a completed job
+            detail: Error details of a failed job
+        """
+        now = self._clock()
+        status = "failed" if detail is not None else "completed"
+        self._transaction(lambda connection: connection.execute(
+            "UPDATE jobs SET status = ?, result = ?, detail = ?, finished_at = ?, expires_at = ? "
+            "WHERE job_id = ? AND status = 'running'",
+            (status, None if result is None else json.dumps(result), detail, now, now + settings.JOB_RESULT_TTL, job_id),
+        ))
+    
+    def release(self, job_id: str, delay: float = 0, attempt: bool = True) -> None:
+        """Put a running job back in the queue.
+        
+        Args:
+            job_id: Job ID
+            delay: Seconds before the job may be claimed again
+            attempt: Whether the run counts towards JOB_MAX_ATTEMPTS
+        """
+        self._transaction(lambda connection: connection.execute(
+            "UPDATE jobs SET status = 'queued', available_at = ?, attempts = attempts - ?, "
+            "started_at = NULL, expires_at = NULL WHERE job_id = ? AND status = 'running'",
+            (self._clock() + delay, 0 if attempt else 1, job_id),
+        ))
+    
+    def defer(self, job_id: str, delay: float) -> bool:
+        """Put a running job back in the queue for a while without counting an attempt.
+        
+        Args:
+            job_id: Job ID
+            delay: Seconds before the job may be claimed again
+        
+        Returns:
+            bool: True if the job was deferred, False if it would exceed JOB_MAX_DEFER and failed instead
+        """
+        now = self._clock()
+        
+        def update(connection: sqlite3.Connection) -> bool:
+            row = connection.execute(
+                "SELECT created_at FROM jobs WHERE job_id = ? AND status = 'running'", (job_id,)
+            ).fetchone()
+            if row is not None and now + delay - row[0] > settings.JOB_MAX_DEFER:
+                connection.execute(
+                    "UPDATE jobs SET status = 'failed', detail = ?, finished_at = ?, expires_at = ? WHERE job_id = ?",
+                    (f"Job was deferred for more than {settings.JOB_MAX_DEFER}s", now, now + settings.JOB_RESULT_TTL, job_id),
+                )
+                return False
+            connection.execute(
+                "UPDATE jobs SET status = 'queued', available_at = ?, attempts = attempts - 1, "
+                "started_at = NULL, expires_at = NULL WHERE job_id = ? AND status = 'running'",
+                (now + delay, job_id),
+            )
+            return True
+        
+        return self._transaction(update)
+    
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Look a job up.
+        
+        Args:
+            job_id: Job ID
+        
+        Returns:
+            Optional[Dict[str, Any]]: Job status, or None if the job does not exist or has expired
+        """
+        row = self._connection().execute(
+            "SELECT client_id, priority, status, result, detail, attempts, created_at, started_at, finished_at, expires_at "
+            "FROM jobs WHERE job_id = ?",
+            (job_id,),
+        ).fetchone()
+        if row is None:
+            return None
+        client_id, priority, status, result, detail, attempts, created_at, started_at, finished_at, expires_at = row
+        if status in ("completed", "failed") and expires_at <= self._clock():
+            return None
+        return {
+            "job_id": job_id,
+            "client_id": client_id,
+            "priority": priority,
+            "status": status,
+            "result": None if result is None else json.loads(result),
+            "detail": detail,
+            "attempts": attempts,
+            "created_at": created_at,
+            "started_at": started_at,
+            "finished_at": finished_at,
+        }
+    
+    def maintain(self) -> None:
+        """Queue jobs again whose lease has expired and delete expired results."""
+        now = self._clock()
+        
+        def expire(connection: sqlite3.Connection) -> None:
+            # A running job past its lease lost its worker
+            lost = connection.execute(
+                "SELECT job_id, attempts FROM jobs WHERE status = 'running' AND expires_at < ?", (now,)
+            ).fetchall()
+            for job_id, attempts in lost:
+                if attempts >= settings.JOB_MAX_ATTEMPTS:
+                    connection.execute(
+                        "UPDATE jobs SET status = 'failed', detail = ?, finished_at = ?, expires_at = ? WHERE job_id = ?",
+                        (f"Job did not finish in {attempts} attempts", now, now + settings.JOB_RESULT_TTL, job_id),
+                    )
+                else:
+                    connection.execute(
+                        "UPDATE jobs SET status = 'queued', available_at = ?, started_at = NULL, expires_at = NULL "
+                        "WHERE job_id = ?",
+                        (now, job_id),
+                    )
+            if lost:
+                logger.warning(f"Recovered {len(lost)} jobs whose worker did not finish them")
+            connection.execute(
+                "DELETE FROM jobs WHERE status IN ('completed', 'failed') AND expires_at < ?", (now,)
+            )
+        
+        self._transaction(expire)
+    
+    def stats(self) -> Dict[str, int]:
+        """Count the jobs in each state.
+        
+        Returns:
+            Dict[str, int]: Number of queued, running, completed and failed jobs
+        """
+        counts = {"queued": 0, "running": 0, "completed": 0, "failed": 0}
+        for status, count in self._connection().execute("SELECT status, COUNT(*) FROM jobs GROUP BY status"):
+            counts[status] = count
+        return counts
+    
+    async def _in_thread(self, function: Callable[..., Any], *args: Any) -> Any:
+        """Run a database call in a worker thread, letting it finish if the caller is cancelled.
+        
+        A cancelled call keeps running in its thread, so it is waited for
+        before the cancellation goes on: stop() then only returns once no
+        thread is using a connection that close() would close. A job claimed
+        by a cancelled call is put back in the queue.
+        
+        Args:
+            function: Queue method to call
+            *args: Arguments for the method
+        
+        Returns:
+            Any: Result of the call
+        """
+        call = asyncio.ensure_future(asyncio.to_thread(function, *args))
+        try:
+            return await asyncio.shield(call)
+        except asyncio.CancelledError:
+            await asyncio.wait([call])
+            if not call.cancelled() and call.exception() is None and isinstance(call.result(), Job):
+                self.release(call.result().job_id, attempt=False)
+            raise
+    
+    async def _run(self, job: Job, handler: Callable[[Job], Awaitable[Any]]) -> None:
+        """Run a claimed job and store its outcome.
+        
+        Args:
+            job: Claimed job
+            handler: Job handler
+        """
+        try:
+            result = await asyncio.wait_for(handler(job), settings.JOB_TIMEOUT)
+        except asyncio.CancelledError:
+            # The worker is stopping, so hand the job to the next worker right away, off the event loop
+            await self._in_thread(self.release, job.job_id, 0, False)
+            raise
+        except JobDeferred as e:
+            if not await self._in_thread(self.defer, job.job_id, e.delay):
+                logger.error(f"Job {job.job_id} failed: deferred for more than {settings.JOB_MAX_DEFER}s")
+            return
+        except Exception as e:
+            if isinstance(e, asyncio.TimeoutError):
+                detail = f"Job did not finish within {settings.JOB_TIMEOUT}s"
+            else:
+                detail = str(e)
+            if job.attempts < settings.JOB_MAX_ATTEMPTS:
+                logger.warning(f"Job {job.job_id} failed (attempt {job.attempts}), retrying: {detail}")
+                await self._in_thread(self.release, job.job_id)
+            else:
+                logger.error(f"Job {job.job_id} failed after {job.attempts} attempts: {detail}")
+                await self._in_thread(self.finish, job.job_id, None, detail)
+            return
+        await self._in_thread(self.finish, job.job_id, result)
+    
+    async def _work(self, handler: Callable[[Job], Awaitable[Any]]) -> None:
+        """Claim and run jobs until cancelled.
+        
+        Args:
+            handler: Job handler
+        """
+        while True:
+            # Clear before claiming, so a job submitted meanwhile is not missed
+            self._wakeup.clear()
+            try:
+                job = await self._in_thread(self.claim)
+            except sqlite3.Error as e:
+                logger.error(f"Error claiming a job: {e}")
+                job = None
+            if job is None:
+                # Sleep until a job is submitted here, or poll for jobs from other processes
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), settings.JOB_POLL_INTERVAL)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            await self._run(job, handler)
+    
+    async def _maintain(self) -> None:
+        """Recover lost jobs and delete expired results periodically."""
+        while True:
+            try:
+                await self._in_thread(self.maintain)
+            except sqlite3.Error as e:
+                logger.error(f"Error maintaining the job queue: {e}")
+            await asyncio.sleep(settings.JOB_POLL_INTERVAL)
+    
+    def start(self, handler: Callable[[Job], Awaitable[Any]], workers: int) -> None:
+        """Start the worker pool.
+        
+        Args:
+            handler: Coroutine function that runs a job and returns its result
+            workers: Number of jobs run at once
+        """
+        self._wakeup = asyncio.Event()
+        self._workers = [asyncio.create_task(self._work(handler)) for _ in range(workers)]
+        self._workers.append(asyncio.create_task(self._maintain()))
+        logger.info(f"Started {workers} job workers on {self.path}")
+    
+    async def stop(self) -> None:
+        """Stop the worker pool, putting the jobs it was running back in the queue."""
+        for task in self._workers:
+            task.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        self._wakeup = None
+    
+    def close(self) -> None:
+        """Close every database connection."""
+        with self._lock:
+            for connection in self._connections:
+                connection.close()
+            self._connections.clear()
+            self._schema_ready = False
+        self._local = threading.local()
+
+# Create global job queue
+job_queue = JobQueue()
@@ -0,0 +1,513 @@
+"""
+Prometheus metrics for the gateway.
+
+Metrics are plain Python counters updated in place on the event loop, so the
+recording path takes no locks and does no I/O: a counter increment is a dict
+update and a histogram observation is a bisect plus a list update.
+
+With several uvicorn workers, each worker writes a snapshot of its metrics to
+`METRICS_MULTIPROC_DIR/<pid>.json` every `METRICS_FLUSH_INTERVAL` seconds and
+on shutdown. A scrape served by any worker merges the snapshots of all
+workers: counters and histograms are summed over every snapshot (so counts
+survive worker restarts) and gauges are summed over live workers.
+"""
+import os
+import json
+import time
+import asyncio
+import logging
+import functools
+import contextvars
+from bisect import bisect_left
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from app.core.config import settings
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+Labels = Tuple[str, ...]
+
+# Latency buckets in seconds, from sub-millisecond gateway stages to long generations
+DEFAULT_BUCKETS = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0
+)
+
+class Metric:
+    """Base class for metrics with a fixed set of label names."""
+    
+    type = ""
+    
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        """Initialize the metric.
+        
+        Args:
+            name: Metric name
+            documentation: Help text
+            labelnames: Names of the metric's labels
+        """
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Labels, Any] = {}
+    
+    def snapshot(self) -> Dict[str, Any]:
+        """Get the metric's current values in a JSON-serializable form."""
+        return {
+            "type": self.type,
+            "help": self.documentation,
+            "labelnames": list(self.labelnames),
+            "values": [[list(labels), value] for labels, value in self._values.items()],
+        }
+    
+    def clear(self) -> None:
+        """Remove all recorded values."""
+        self._values = {}
+
+
+class Counter(Metric):
+    """Monotonically increasing counter."""
+    
+    type = "counter"
+    
+    def inc(self, labels: Labels = (), amount: float = 1) -> None:
+        """Increase the counter.
+        
+        Args:
+            labels: Label values, in the order of the label names
+            amount: Amount to add
+        """
+        self._values[labels] = self._values.get(labels, 0) + amount
+    
+    def set(self, value: float, labels: Labels = ()) -> None:
+        """Set the counter to a total counted elsewhere (e.g. by a cache).
+        
+        Args:
+            value: Current total
+            labels: Label values
+        """
+        self._values[labels] = value
+
+
+class Gauge(Metric):
+    """Value that can go up and down."""
+    
+    type = "gauge"
+    
+    def inc(self, labels: Labels = (), amount: float = 1) -> None:
+        """Increase the gauge."""
+        self._values[labels] = self._values.get(labels, 0) + amount
+    
+    def dec(self, labels: Labels = (), amount: float = 1) -> None:
+        """Decrease the gauge."""
+        self._values[labels] = self._values.get(labels, 0) - amount
+    
+    def set(self, value: float, labels: Labels = ()) -> None:
+        """Set the gauge."""
+        self._values[labels] = value
+
+
+class Histogram(Metric):
+    """Histogram of observed values with fixed buckets.
+    
+    Each label set stores per-bucket counts (not cumulative) followed by the
+    sum of the observations; cumulative counts are computed when rendering.
+    """
+    
+    type = "histogram"
+    
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        """Initialize the histogram.
+        
+        Args:
+            name: Metric name
+            documentation: Help text
+            labelnames: Names of the metric's labels
+            buckets: Upper bounds of the buckets, in increasing order
+        """
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+    
+    def observe(self, value: float, labels: Labels = ()) -> None:
+        """Record an observation.
+        
+        Args:
+            value: Observed value
+            labels: Label values
+        """
+        state = self._values.get(labels)
+        if state is None:
+            state = self._values[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+        state[bisect_left(self.buckets, value)] += 1
+        state[-1] += value
+    
+    def snapshot(self) -> Dict[str, Any]:
+        """Get the histogram's current values in a JSON-serializable form."""
+        snapshot = super().snapshot()
+        snapshot["buckets"] = list(self.buckets)
+        return snapshot
+
+
+def _format_value(value: float) -> str:
+    """Format a sample value for the text exposition format."""
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+def _escape(value: str) -> str:
+    """Escape a label value for the text exposition format."""
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: Optional[Tuple[str, str]] = None) -> str:
+    """Format a label set for the text exposition format."""
+    pairs = list(zip(names, values))
+    if extra is not None:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(str(value))}"' for name, value in pairs) + "}"
+
+def render(snapshots: Dict[str, Dict[str, Any]]) -> str:
+    """Render metric snapshots in the Prometheus text exposition format.
+    
+    Args:
+        snapshots: Metric snapshots keyed by metric name
+    
+    Returns:
+        str: Metrics text
+    """
+    lines = []
+    for name, metric in snapshots.items():
+        lines.append(f"# HELP {name} {metric['help']}")
+        lines.append(f"# TYPE {name} {metric['type']}")
+        labelnames = metric["labelnames"]
+        for labels, value in metric["values"]:
+            if metric["type"] != "histogram":
+                lines.append(f"{name}{_format_labels(labelnames, labels)} {_format_value(value)}")
+                continue
+            cumulative = 0
+            for bound, count in zip(metric["buckets"] + ["+Inf"], value[:-1]):
+                cumulative += count
+                le = bound if bound == "+Inf" else _format_value(float(bound))
+                lines.append(f"{name}_bucket{_format_labels(labelnames, labels, ('le', le))} {cumulative}")
+            lines.append(f"{name}_sum{_format_labels(labelnames, labels)} {_format_value(value[-1])}")
+            lines.append(f"{name}_count{_format_labels(labelnames, labels)} {cumulative}")
+    return "\n".join(lines) + "\n"
+
+def _pid_alive(pid: int) -> bool:
+    """Check whether a process is still running."""
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+def merge(snapshots: List[Tuple[int, Dict[str, Dict[str, Any]]]]) -> Dict[str, Dict[str, Any]]:
+    """Merge the metric snapshots of several processes.
+    
+    Counters and histograms are summed over all snapshots; gauges are summed
+    over the snapshots of processes that are still running.
+    
+    Args:
+        snapshots: (pid, snapshot) pairs
+    
+    Returns:
+        Dict[str, Dict[str, Any]]: Merged snapshot
+    """
+    merged: Dict[str, Dict[str, Any]] = {}
+    alive: Dict[int, bool] = {}
+    for pid, snapshot in snapshots:
+        for name, metric in snapshot.items():
+            if metric["type"] == "gauge":
+                if pid not in alive:
+                    alive[pid] = _pid_alive(pid)
+                if not alive[pid]:
+                    continue
+            target = merged.setdefault(name, {**metric, "values": {}})
+            values = target["values"]
+            for labels, value in metric["values"]:
+                key = tuple(labels)
+                current = values.get(key)
+                if current is None:
+                    values[key] = list(value) if isinstance(value, list) else value
+                elif isinstance(value, list):
+                    values[key] = [a + b for a, b in zip(current, value)]
+                else:
+                    values[key] = current + value
+    for metric in merged.values():
+        metric["values"] = [[list(labels), value] for labels, value in metric["values"].items()]
+    return merged
+
+
+class MetricsRegistry:
+    """Registry of the gateway's metrics."""
+    
+    def __init__(self):
+        """Initialize an empty registry."""
+        self._metrics: Dict[str, Metric] = {}
+        self._callbacks: List[Callable[[], None]] = []
+        self._directory: Optional[str] = None
+        self._task: Optional[asyncio.Task] = None
+    
+    def _register(self, metric: Metric) -> Metric:
+        """Add a metric to the registry."""
+        self._metrics[metric.name] = metric
+        return metric
+    
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        """Create and register a counter."""
+        return self._register(Counter(name, documentation, labelnames))
+    
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+        """Create and register a gauge."""
+        return self._register(Gauge(name, documentation, labelnames))
+    
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        """Create and register a histogram."""
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+    
+    def add_callback(self, callback: Callable[[], None]) -> None:
+        """Register a function that updates metrics from other components before each snapshot.
+        
+        Args:
+            callback: Function that sets metric values
+        """
+        self._callbacks.append(callback)
+    
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        """Get the current values of every metric in this process.
+        
+        Returns:
+            Dict[str, Dict[str, Any]]: Metric snapshots keyed by metric name
+        """
+        for callback in self._callbacks:
+            try:
+                callback()
+            except Exception as e:
+                logger.error(f"Error updating metrics: {e}")
+        return {name: metric.snapshot() for name, metric in self._metrics.items()}
+    
+    def _write_snapshot(self) -> None:
+        """Write this process's snapshot to the multiprocess directory."""
+        path = os.path.join(self._directory, f"{os.getpid()}.json")
+        temp_path = f"{path}.tmp"
+        with open(temp_path, "w") as f:
+            json.dump(self.snapshot(), f)
+        os.replace(temp_path, path)
+    
+    def _read_snapshots(self) -> List[Tuple[int, Dict[str, Dict[str, Any]]]]:
+        """Read the snapshots of every process from the multiprocess directory."""
+        snapshots = []
+        for filename in os.listdir(self._directory):
+            pid, ext = os.path.splitext(filename)
+            if ext != ".json" or not pid.isdigit():
+                continue
+            try:
+                with open(os.path.join(self._directory, filename), "r") as f:
+                    snapshots.append((int(pid), json.load(f)))
+            except (OSError, ValueError) as e:
+                logger.warning(f"Skipping unreadable metrics snapshot {filename}: {e}")
+        return snapshots
+    
+    def exposition(self) -> str:
+        """Render the metrics of this process, or of every worker in multiprocess mode.
+        
+        Returns:
+            str: Metrics in the Prometheus text exposition format
+        """
+        if self._directory is None:
+            return render(self.snapshot())
+        self._write_snapshot()
+        return render(merge(self._read_snapshots()))
+    
+    async def _flush_loop(self, interval: float) -> None:
+        """Write this process's snapshot periodically."""
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                self._write_snapshot()
+            except OSError as e:
+                logger.error(f"Error writing metrics snapshot: {e}")
+    
+    async def start(self, directory: Optional[str], interval: float) -> None:
+        """Enable multiprocess mode if a directory is given.
+        
+        Args:
+            directory: Directory shared by the workers for metric snapshots, or None
+            interval: Seconds between snapshot writes
+        """
+        if not directory:
+            return
+        os.makedirs(directory, exist_ok=True)
+        self._directory = directory
+        self._task = asyncio.create_task(self._flush_loop(interval))
+        logger.info(f"Writing multiprocess metrics to {directory}")
+    
+    async def stop(self) -> None:
+        """Write a final snapshot and stop the flush loop."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._directory is not None:
+            self._write_snapshot()
+            self._directory = None
+    
+    def clear(self) -> None:
+        """Remove all recorded values."""
+        for metric in self._metrics.values():
+            metric.clear()
+
+# Create global metrics registry
+registry = MetricsRegistry()
+
+REQUEST_STAGE_SECONDS = registry.histogram(
+    "gateway_request_stage_seconds",
+    "Time spent in each stage of a request (auth, validation, provider, serialization)",
+    ("endpoint", "stage"),
+)
+REQUEST_SECONDS = registry.histogram(
+    "gateway_request_duration_seconds", "Total request latency", ("endpoint", "status"),
+)
+REQUESTS_IN_FLIGHT = registry.gauge("gateway_requests_in_flight", "Requests being processed")
+PROVIDER_SECONDS = registry.histogram(
+    "gateway_provider_request_duration_seconds", "Latency of provider calls", ("provider", "model", "outcome"),
+)
+PROVIDER_IN_FLIGHT = registry.gauge("gateway_provider_calls_in_flight", "Provider calls waiting for a response", ("provider",))
+PROVIDER_TOKENS = registry.counter(
+    "gateway_provider_tokens_total", "Tokens used by provider calls", ("provider", "model", "kind"),
+)
+CLIENT_TOKENS = registry.counter("gateway_client_tokens_total", "Tokens charged to clients", ("client", "kind"))
+RATE_LIMITED = registry.counter("gateway_rate_limited_total", "Requests rejected by rate limits", ("client",))
+CACHE_EVENTS = registry.counter("gateway_cache_events_total", "Response cache lookups and evictions", ("cache", "event"))
+CACHE_ENTRIES = registry.gauge("gateway_cache_entries", "Entries in the response caches", ("cache",))
+CIRCUIT_OPEN = registry.gauge("gateway_circuit_open", "Whether a target's circuit breaker is open (1) or half-open (0.5)", ("target",))
+PROMPT_PREFIXES = registry.counter(
+    "gateway_prompt_prefixes_total", "Cacheable prompt prefixes by whether the client sent them recently", ("client", "outcome"),
+)
+TOKEN_PRECHECKS = registry.counter(
+    "gateway_token_prechecks_total", "Requests rejected or trimmed to fit a context window by local token counting", ("client", "outcome"),
+)
+JOBS = registry.gauge("gateway_jobs", "Jobs in the job queue", ("state",))
+
+# Stage timings of the current request, set by the metrics middleware
+_request_timer: contextvars.ContextVar = contextvars.ContextVar("request_timer", default=None)
+
+class RequestTimer:
+    """Stage timings of a request."""
+    
+    __slots__ = ("scope", "start", "auth", "handler_end")
+    
+    def __init__(self, scope: Dict[str, Any]):
+        """Start timing a request.
+        
+        Args:
+            scope: ASGI scope of the request, where the router records the matched route
+        """
+        self.scope = scope
+        self.start = time.perf_counter()
+        self.auth = 0.0
+        self.handler_end: Optional[float] = None
+    
+    @property
+    def endpoint(self) -> str:
+        """Endpoint label: the matched route's path template, or "unmatched".
+        
+        Templates rather than request paths keep the number of series bounded,
+        e.g. every job shares "/jobs/{job_id}" and unknown paths share "unmatched".
+        """
+        path = getattr(self.scope.get("route"), "path", None)
+        if path is None:
+            return "unmatched"
+        return path[len(settings.API_V1_STR):] if path.startswith(settings.API_V1_STR) else path
+
+def start_request(scope: Dict[str, Any]) -> Tuple[RequestTimer, contextvars.Token]:
+    """Start timing the current request.
+    
+    Args:
+        scope: ASGI scope of the request
+    
+    Returns:
+        Tuple[RequestTimer, contextvars.Token]: Timer and the token to reset it with
+    """
+    timer = RequestTimer(scope)
+    return timer, _request_timer.set(timer)
+
+def end_request(token: contextvars.Token) -> None:
+    """Stop timing the current request.
+    
+    Args:
+        token: Token returned by start_request
+    """
+    _request_timer.reset(token)
+
+def observe_stage(stage: str, seconds: float) -> None:
+    """Record the time a stage of the current request took.
+    
+    Args:
+        stage: Stage name
+        seconds: Time spent in the stage
+    """
+    timer = _request_timer.get()
+    if timer is None:
+        return
+    if stage == "auth":
+        timer.auth += seconds
+    REQUEST_STAGE_SECONDS.observe(seconds, (timer.endpoint, stage))
+
+def handler_started() -> None:
+    """Record the validation stage when the endpoint handler starts.
+    
+    Validation covers reading and validating the request body and the
+    dependencies other than authentication.
+    """
+    timer = _request_timer.get()
+    if timer is not None:
+        observe_stage("validation", max(0.0, time.perf_counter() - timer.start - timer.auth))
+
+def handler_finished() -> None:
+    """Mark the end of the endpoint handler, where response serialization starts."""
+    timer = _request_timer.get()
+    if timer is not None:
+        timer.handler_end = time.perf_counter()
+
+def timed_handler(handler: Callable) -> Callable:
+    """Decorate an async endpoint handler to record its validation and serialization stages.
+    
+    Args:
+        handler: Endpoint handler
+    
+    Returns:
+        Callable: Wrapped handler with the same signature
+    """
+    @functools.wraps(handler)
+    async def wrapper(*args, **kwargs):
+        handler_started()
+        try:
+            return await handler(*args, **kwargs)
+        finally:
+            handler_finished()
+    return wrapper
+
+def count_client_tokens(client_id: str, usage: Optional[Dict[str, int]]) -> None:
+    """Count the tokens charged to a client.
+    
+    Args:
+        client_id: Client ID
+        usage: Token usage information
+    """
+    if usage:
+        CLIENT_TOKENS.inc((client_id, "prompt"), usage.get("prompt_tokens", 0))
+        CLIENT_TOKENS.inc((client_id, "completion"), usage.get("completion_tokens", 0))
+        # Prompt tokens served from the provider's prefix cache, reported flat by
+        # the generate endpoints and as in the provider API by chat completions
+        cached = usage.get("cached_prompt_tokens")
+        if cached is None:
+            cached = (usage.get("prompt_tokens_details") or {}).get("cached_tokens")
+        if cached:
+            CLIENT_TOKENS.inc((client_id, "cached_prompt"), cached)
@@ -0,0 +1,478 @@
+"""
+Rate limiting for client requests and token usage.
+
+Each client gets a token bucket for requests per minute and a sliding
+window of token usage for the day. All bookkeeping happens synchronously
+without awaiting, so on the asyncio event loop every check is atomic and
+needs no locks.
+
+With a shared counter backend, usage is also tracked across workers and
+replicas: admitted requests and charged tokens accumulate locally and are
+flushed to the backend in one batch per sync interval, which returns the
+global counts used by the following checks.
+
+Provider calls may reserve tokens up front: the most a call can use is
+charged before the call and the difference to its actual usage afterwards,
+so concurrent calls cannot together overrun the daily limit. A reservation
+that is never settled simply expires with the day's window.
+"""
+import time
+import asyncio
+import logging
+from collections import deque
+from typing import Deque, Dict, List, Optional, Tuple
+
+from app.core.counters import CounterBackend, CounterIncrement
+from app.schemas.base import RateLimit
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+MINUTE_SECONDS = 60
+DAY_SECONDS = 86400
+DAY_SLOT_SECONDS = 600
+
+class RateLimitExceeded(Exception):
+    """Raised when a client exceeds one of its rate limits."""
+    
+    def __init__(self, message: str, retry_after: float):
+        """Initialize the exception.
+        
+        Args:
+            message: Error message
+            retry_after: Seconds until the request may be retried
+        """
+        super().__init__(message)
+        self.retry_after = retry_after
+
+class TokenBucket:
+    """Token bucket that refills continuously up to its capacity."""
+    
+    __slots__ = ("capacity", "rate", "tokens", "updated")
+    
+    def __init__(self, capacity: float, rate: float, now: float):
+        """Initialize a full token bucket.
+        
+        Args:
+            capacity: Maximum number of tokens
+            rate: Tokens added per second
+            now: Current monotonic time
+        """
+        self.capacity = capacity
+        self.rate = rate
+        self.tokens = capacity
+        self.updated = now
+    
+    def try_acquire(self, now: float, amount: float = 1) -> float:
+        """Take tokens from the bucket if enough are available.
+        
+        Args:
+            now: Current monotonic time
+            amount: Number of tokens to take
+        
+        Returns:
+            float: 0 if the tokens were taken, otherwise seconds until they will be available
+        """
+        tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if tokens >= amount:
+            self.tokens = tokens - amount
+            return 0.0
+        self.tokens = tokens
+        return (amount - tokens) / self.rate
+
+class SlidingWindowCounter:
+    """Counter over a sliding time window, bucketed into fixed slots."""
+    
+    __slots__ = ("window", "slot_seconds", "slots", "total")
+    
+    def __init__(self, window: float = DAY_SECONDS, slot_seconds: float = DAY_SLOT_SECONDS):
+        """Initialize the counter.
+        
+        Args:
+            window: Window length in seconds
+            slot_seconds: Slot length in seconds
+        """
+        self.window = window
+        self.slot_seconds = slot_seconds
+        self.slots: Deque[List[float]] = deque()
+        self.total = 0
+    
+    def _evict(self, now: float) -> None:
+        """Drop slots that have left the window."""
+        slots = self.slots
+        while slots and slots[0][0] + self.window <= now:
+            self.total -= slots.popleft()[1]
+    
+    def add(self, now: float, amount: int) -> None:
+        """Add an amount at the current time.
+        
+        Args:
+            now: Current monotonic time
+            amount: Amount to add
+        """
+        self._evict(now)
+        slot_start = now - now % self.slot_seconds
+        if self.slots and self.slots[-1][0] == slot_start:
+            self.slots[-1][1] += amount
+        else:
+            self.slots.append([slot_start, amount])
+        self.total += amount
+    
+    def current(self, now: float) -> int:
+        """Get the total within the window.
+        
+        Args:
+            now: Current monotonic time
+        
+        Returns:
+            int: Total within the window
+        """
+        self._evict(now)
+        return self.total
+    
+    def retry_after(self, now: float) -> float:
+        """Get the seconds until the oldest slot leaves the window.
+        
+        Args:
+            now: Current monotonic time
+        
+        Returns:
+            float: Seconds until the oldest slot expires
+        """
+        if not self.slots:
+            return 0.0
+        return max(0.0, self.slots[0][0] + self.window - now)
+
+class SharedWindow:
+    """Estimate of a shared counter over a sliding window.
+    
+    The shared counter is kept per fixed window. The sliding estimate weighs
+    the previous window by how much of it still overlaps the sliding window,
+    and adds the local usage that has not been flushed yet.
+    """
+    
+    __slots__ = ("length", "index", "current", "previous", "pending")
+    
+    def __init__(self, length: int):
+        """Initialize the window.
+        
+        Args:
+            length: Window length in seconds
+        """
+        self.length = length
+        self.index = -1
+        self.current = 0
+        self.previous = 0
+        self.pending = 0
+    
+    def roll(self, now: float) -> None:
+        """Move to the fixed window containing the current time.
+        
+        Args:
+            now: Current wall clock time
+        """
+        index = int(now // self.length)
+        if index != self.index:
+            self.previous = self.current if index == self.index + 1 else 0
+            self.current = 0
+            self.index = index
+    
+    def estimate(self, now: float) -> float:
+        """Estimate the global usage within the sliding window.
+        
+        Args:
+            now: Current wall clock time
+        
+        Returns:
+            float: Estimated usage
+        """
+        self.roll(now)
+        overlap = 1.0 - (now % self.length) / self.length
+        return self.previous * overlap + self.current + self.pending
+    
+    def retry_after(self, now: float) -> float:
+        """Get the seconds until the next fixed window starts.
+        
+        Args:
+            now: Current wall clock time
+        
+        Returns:
+            float: Seconds until the next window
+        """
+        return self.length - now % self.length
+    
+    def update(self, now: float, index: int, sent: int, current: int, previous: int) -> None:
+        """Apply the global counts returned by a flush.
+        
+        Args:
+            now: Current wall clock time
+            index: Window index the flush was made for
+            sent: Local usage included in the flush
+            current: Global count of the flushed window
+            previous: Global count of the window before it
+        """
+        self.roll(now)
+        self.pending -= sent
+        if index == self.index:
+            self.current = current
+            self.previous = previous
+        elif index == self.index - 1:
+            self.previous = current
+
+class ClientLimits:
+    """Rate limiting state for a single client."""
+    
+    __slots__ = ("rate_limit", "requests", "tokens", "shared_requests", "shared_tokens")
+    
+    def __init__(self, rate_limit: RateLimit, now: float):
+        """Initialize the client state.
+        
+        Args:
+            rate_limit: Client rate limit configuration
+            now: Current monotonic time
+        """
+        self.rate_limit = rate_limit
+        self.requests = TokenBucket(rate_limit.requests_per_minute, rate_limit.requests_per_minute / 60.0, now)
+        self.tokens = SlidingWindowCounter()
+        self.shared_requests = SharedWindow(MINUTE_SECONDS)
+        self.shared_tokens = SharedWindow(DAY_SECONDS)
+
+class RateLimiter:
+    """Rate limiter keyed by client ID."""
+    
+    def __init__(self):
+        """Initialize the rate limiter."""
+        self._clients: Dict[str, ClientLimits] = {}
+        self._backend: Optional[CounterBackend] = None
+        self._active: Dict[str, float] = {}
+        self._sync_task: Optional[asyncio.Task] = None
+    
+    @property
+    def shared(self) -> bool:
+        """Whether usage is shared with other workers or replicas."""
+        return self._backend is not None and self._backend.shared
+    
+    def _state(self, client_id: str, rate_limit: RateLimit, now: float) -> ClientLimits:
+        """Get the state for a client, resetting the request bucket if its limits changed.
+        
+        Args:
+            client_id: Client ID
+            rate_limit: Client rate limit configuration
+            now: Current monotonic time
+        
+        Returns:
+            ClientLimits: Client state
+        """
+        state = self._clients.get(client_id)
+        if state is None:
+            state = self._clients[client_id] = ClientLimits(rate_limit, now)
+        elif state.rate_limit is not rate_limit and state.rate_limit != rate_limit:
+            # Keep the token usage across config reloads
+            previous = state
+            state = self._clients[client_id] = ClientLimits(rate_limit, now)
+            state.tokens = previous.tokens
+            state.shared_requests = previous.shared_requests
+            state.shared_tokens = previous.shared_tokens
+        return state
+    
+    def acquire(self, client_id: str, rate_limit: RateLimit, requests: int = 1) -> None:
+        """Admit requests for a client or raise if a limit is exhausted.
+        
+        Args:
+            client_id: Client ID
+            rate_limit: Client rate limit configuration
+            requests: Number of requests to admit
+        
+        Raises:
+            RateLimitExceeded: If the client is over its request or token limit
+        """
+        now = time.monotonic()
+        state = self._state(client_id, rate_limit, now)
+        
+        # Check the daily token window first so rejected requests don't consume the bucket
+        if state.tokens.current(now) >= rate_limit.tokens_per_day:
+            raise RateLimitExceeded(
+                f"Daily token limit exceeded. Maximum allowed: {rate_limit.tokens_per_day} tokens per day",
+                state.tokens.retry_after(now)
+            )
+        
+        if self.shared:
+            self._check_shared(state, rate_limit, requests)
+        
+        wait = state.requests.try_acquire(now, requests)
+        if wait:
+            raise RateLimitExceeded(
+                f"Rate limit exceeded. Maximum allowed: {rate_limit.requests_per_minute} requests per minute",
+                wait
+            )
+        
+        if self.shared:
+            state.shared_requests.pending += requests
+            self._active[client_id] = now
+    
+    def _check_shared(self, state: ClientLimits, rate_limit: RateLimit, requests: int) -> None:
+        """Check a client's usage across all workers and replicas.
+        
+        Args:
+            state: Client state
+            rate_limit: Client rate limit configuration
+            requests: Number of requests to admit
+        
+        Raises:
+            RateLimitExceeded: If the client is over its request or token limit
+        """
+        now = time.time()
+        if state.shared_tokens.estimate(now) >= rate_limit.tokens_per_day:
+            raise RateLimitExceeded(
+                f"Daily token limit exceeded. Maximum allowed: {rate_limit.tokens_per_day} tokens per day",
+                state.shared_tokens.retry_after(now)
+            )
+        if state.shared_requests.estimate(now) + requests > rate_limit.requests_per_minute:
+            raise RateLimitExceeded(
+                f"Rate limit exceeded. Maximum allowed: {rate_limit.requests_per_minute} requests per minute",
+                state.shared_requests.retry_after(now)
+            )
+    
+    def reserve(self, client_id: str, rate_limit: RateLimit, tokens: int, required: int) -> None:
+        """Charge a provider call's token reservation to a client's daily window.
+        
+        Args:
+            client_id: Client ID
+            rate_limit: Client rate limit configuration
+            tokens: Number of tokens to reserve, the most the call can use
+            required: Number of tokens the call uses for certain, which must fit the limit
+        
+        Raises:
+            RateLimitExceeded: If the required tokens do not fit in what is left of the daily limit
+        """
+        now = time.monotonic()
+        state = self._state(client_id, rate_limit, now)
+        used = state.tokens.current(now)
+        if self.shared:
+            used = max(used, state.shared_tokens.estimate(time.time()))
+        if used + required > rate_limit.tokens_per_day:
+            raise RateLimitExceeded(
+                f"Daily token limit exceeded. Maximum allowed: {rate_limit.tokens_per_day} tokens per day",
+                state.tokens.retry_after(now)
+            )
+        self.record_tokens(client_id, tokens)
+    
+    def release(self, client_id: str, tokens: int) -> None:
+        """Return a reservation made with reserve(), once the call's actual usage is charged.
+        
+        Args:
+            client_id: Client ID
+            tokens: Number of tokens reserved
+        """
+        self.record_tokens(client_id, -tokens)
+    
+    def record_tokens(self, client_id: str, tokens: int) -> None:
+        """Charge token usage to a client's daily window.
+        
+        Args:
+            client_id: Client ID
+            tokens: Number of tokens used
+        """
+        state = self._clients.get(client_id)
+        if state is not None and tokens:
+            state.tokens.add(time.monotonic(), tokens)
+            if self.shared:
+                state.shared_tokens.pending += tokens
+                self._active[client_id] = time.monotonic()
+    
+    def get_usage(self, client_id: str) -> Optional[int]:
+        """Get the tokens a client used in the last day.
+        
+        Args:
+            client_id: Client ID
+        
+        Returns:
+            Optional[int]: Token usage or None if the client has no state
+        """
+        state = self._clients.get(client_id)
+        if state is None:
+            return None
+        return state.tokens.current(time.monotonic())
+    
+    def reset(self) -> None:
+        """Clear all rate limiting state."""
+        self._clients = {}
+        self._active = {}
+    
+    async def sync(self) -> None:
+        """Flush local usage to the shared backend and refresh the global counts.
+        
+        Clients seen in the last minute are refreshed on every sync, so a busy
+        client sees the usage of other workers within one sync interval.
+        """
+        if not self.shared or not self._active:
+            return
+        
+        # Stop refreshing clients that have been idle for a minute
+        cutoff = time.monotonic() - MINUTE_SECONDS
+        self._active = {client_id: seen for client_id, seen in self._active.items() if seen > cutoff}
+        
+        now = time.time()
+        increments: List[CounterIncrement] = []
+        flushed: List[Tuple[SharedWindow, int, int]] = []
+        for client_id in list(self._active):
+            state = self._clients.get(client_id)
+            if state is None:
+                continue
+            for name, window in (("rpm", state.shared_requests), ("tpd", state.shared_tokens)):
+                window.roll(now)
+                ttl = window.length * 2
+                increments.append((f"rl:{client_id}:{name}:{window.index}", window.pending, ttl))
+                increments.append((f"rl:{client_id}:{name}:{window.index - 1}", 0, ttl))
+                flushed.append((window, window.index, window.pending))
+        
+        try:
+            values = await self._backend.incr_many(increments)
+        except Exception as e:
+            # Keep the pending usage and retry on the next sync
+            logger.error(f"Error syncing rate limits with counter backend: {e}")
+            return
+        
+        now = time.time()
+        for i, (window, index, sent) in enumerate(flushed):
+            window.update(now, index, sent, values[2 * i], values[2 * i + 1])
+    
+    async def _sync_loop(self, interval: float) -> None:
+        """Sync with the shared backend periodically.
+        
+        Args:
+            interval: Seconds between syncs
+        """
+        while True:
+            await asyncio.sleep(interval)
+            await self.sync()
+    
+    async def start(self, backend: CounterBackend, interval: float) -> None:
+        """Attach a counter backend and start syncing with it if it is shared.
+        
+        Args:
+            backend: Counter backend
+            interval: Seconds between syncs
+        """
+        self._backend = backend
+        if backend.shared:
+            self._sync_task = asyncio.create_task(self._sync_loop(interval))
+            logger.info(f"Syncing rate limits with {type(backend).__name__} every {interval}s")
+    
+    async def stop(self) -> None:
+        """Flush pending usage, stop syncing and close the backend."""
+        if self._sync_task is not None:
+            self._sync_task.cancel()
+            try:
+                await self._sync_task
+            except asyncio.CancelledError:
+                pass
+            self._sync_task = None
+        if self._backend is not None:
+            await self.sync()
+            await self._backend.close()
+            self._backend = None
+
+# Create global rate limiter
+rate_limiter = RateLimiter()
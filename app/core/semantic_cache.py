@@ -0,0 +1,325 @@
+"""
+Semantic cache for near-duplicate prompts.
+
+Prompts are embedded with a local embedder and stored in a bounded vector
+index. A lookup returns the cached response of the most similar prompt if its
+cosine similarity reaches the client's threshold.
+
+The index partitions vectors by scope (provider, model and generation
+parameters) and by a random-hyperplane hash of the vector. A search only scores
+the buckets within a Hamming distance of one from the query's bucket, so lookup
+cost stays flat as the cache grows.
+"""
+import re
+import math
+import time
+import zlib
+import logging
+import importlib
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, List, Optional, Tuple
+
+import numpy as np
+
+from app.core.config import settings
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+WORD_PATTERN = re.compile(r"\w+")
+
+class Embedder:
+    """Base class for prompt embedders."""
+    
+    dim: int = 0
+    
+    def embed(self, text: str) -> np.ndarray:
+        """Embed a text as an L2-normalized float32 vector.
+        
+        Args:
+            text: Text to embed
+        
+        Returns:
+            np.ndarray: Embedding of shape (dim,)
+        """
+        raise NotImplementedError("Subclasses must implement embed method")
+
+
+class HashingEmbedder(Embedder):
+    """Embedder that hashes words and character trigrams into a fixed-size vector."""
+    
+    def __init__(self, dim: int = 128):
+        """Initialize the embedder.
+        
+        Args:
+            dim: Embedding dimension
+        """
+        self.dim = dim
+    
+    def _features(self, text: str) -> List[str]:
+        """Extract word and character trigram features from a text."""
+        features = []
+        for word in WORD_PATTERN.findall(text.lower()):
+            features.append(word)
+            padded = f" {word} "
+            features.extend(padded[i:i + 3] for i in range(len(padded) - 2))
+        return features
+    
+    def embed(self, text: str) -> np.ndarray:
+        """Embed a text as an L2-normalized float32 vector.
+        
+        Args:
+            text: Text to embed
+        
+        Returns:
+            np.ndarray: Embedding of shape (dim,)
+        """
+        hashes = np.fromiter((zlib.crc32(feature.encode()) for feature in self._features(text)), dtype=np.uint32)
+        vector = np.zeros(self.dim, dtype=np.float32)
+        if hashes.size:
+            # The high bit of the hash picks the sign so collisions tend to cancel out
+            signs = np.where(hashes >> 31, -1.0, 1.0)
+            vector = np.bincount(hashes % self.dim, weights=signs, minlength=self.dim).astype(np.float32)
+            norm = np.linalg.norm(vector)
+            if norm:
+                vector /= norm
+        return vector
+
+
+class _Bucket:
+    """Contiguous block of vectors sharing a scope and hash code."""
+    
+    __slots__ = ("vectors", "expires", "entry_ids", "count")
+    
+    def __init__(self, dim: int):
+        """Initialize an empty bucket."""
+        self.vectors = np.empty((16, dim), dtype=np.float32)
+        self.expires = np.empty(16, dtype=np.float64)
+        self.entry_ids: List[int] = []
+        self.count = 0
+    
+    def append(self, vector: np.ndarray, expires: float, entry_id: int) -> int:
+        """Append a vector and its expiry time, growing the block if needed, and return its row."""
+        if self.count == len(self.vectors):
+            grown = np.empty((len(self.vectors) * 2, self.vectors.shape[1]), dtype=np.float32)
+            grown[:self.count] = self.vectors[:self.count]
+            self.vectors = grown
+            grown_expires = np.empty(len(self.vectors), dtype=np.float64)
+            grown_expires[:self.count] = self.expires[:self.count]
+            self.expires = grown_expires
+        self.vectors[self.count] = vector
+        self.expires[self.count] = expires
+        self.entry_ids.append(entry_id)
+        self.count += 1
+        return self.count - 1
+    
+    def remove(self, row: int) -> Optional[int]:
+        """Remove a row by moving the last row into it.
+        
+        Returns:
+            Optional[int]: ID of the entry that moved into the row, if any
+        """
+        last = self.count - 1
+        moved = None
+        if row != last:
+            self.vectors[row] = self.vectors[last]
+            self.expires[row] = self.expires[last]
+            self.entry_ids[row] = self.entry_ids[last]
+            moved = self.entry_ids[row]
+        self.entry_ids.pop()
+        self.count -= 1
+        return moved
+
+
+class VectorIndex:
+    """Bounded vector index with bucketed top-k cosine search."""
+    
+    def __init__(self, dim: int, max_entries: int, hash_bits: int = 8, seed: int = 0):
+        """Initialize the index.
+        
+        Args:
+            dim: Vector dimension
+            max_entries: Maximum number of entries; the oldest are evicted first
+            hash_bits: Number of random hyperplanes used to bucket vectors
+            seed: Seed for the random hyperplanes
+        """
+        self.dim = dim
+        self.max_entries = max_entries
+        self._planes = np.random.default_rng(seed).standard_normal((hash_bits, dim)).astype(np.float32)
+        self._bit_values = 1 << np.arange(hash_bits)
+        self._probe_masks = [0] + [1 << bit for bit in range(hash_bits)]
+        self._buckets: Dict[Tuple[Hashable, int], _Bucket] = {}
+        # entry ID -> (bucket key, row, payload, expiry time), in insertion order
+        self._entries: "OrderedDict[int, List[Any]]" = OrderedDict()
+        self._next_id = 0
+    
+    def __len__(self) -> int:
+        """Number of entries in the index."""
+        return len(self._entries)
+    
+    def _code(self, vector: np.ndarray) -> int:
+        """Hash a vector to its bucket code."""
+        return int(self._bit_values[(self._planes @ vector) > 0].sum())
+    
+    def add(self, vector: np.ndarray, scope: Hashable, payload: Any, expires: float = math.inf, now: float = -math.inf) -> None:
+        """Add a vector, evicting expired entries and then the oldest entry if the index is full.
+        
+        Args:
+            vector: L2-normalized vector
+            scope: Scope the vector can be matched within
+            payload: Value returned by searches that match the vector
+            expires: Time after which searches no longer match the vector
+            now: Current time, to evict expired entries
+        """
+        # Entries usually expire in insertion order, so expired ones are found at the front
+        while self._entries:
+            entry_id, entry = next(iter(self._entries.items()))
+            if entry[3] > now:
+                break
+            self._remove(entry_id)
+        if len(self._entries) >= self.max_entries:
+            self._remove(next(iter(self._entries)))
+        
+        key = (scope, self._code(vector))
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = _Bucket(self.dim)
+        
+        entry_id = self._next_id
+        self._next_id += 1
+        row = bucket.append(vector, expires, entry_id)
+        self._entries[entry_id] = [key, row, payload, expires]
+    
+    def _remove(self, entry_id: int) -> None:
+        """Remove an entry from the index."""
+        key, row, _, _ = self._entries.pop(entry_id)
+        bucket = self._buckets[key]
+        moved = bucket.remove(row)
+        if moved is not None:
+            self._entries[moved][1] = row
+        if bucket.count == 0:
+            del self._buckets[key]
+    
+    def search(self, vector: np.ndarray, scope: Hashable, k: int = 1, now: float = -math.inf) -> List[Tuple[float, Any]]:
+        """Find the most similar unexpired vectors within a scope, evicting expired ones it comes across.
+        
+        Args:
+            vector: L2-normalized query vector
+            scope: Scope to search in
+            k: Number of results
+            now: Current time; vectors that expired by then are not matched
+        
+        Returns:
+            List[Tuple[float, Any]]: (cosine similarity, payload) pairs, most similar first
+        """
+        code = self._code(vector)
+        candidates: List[Tuple[float, int]] = []
+        expired: List[int] = []
+        for mask in self._probe_masks:
+            bucket = self._buckets.get((scope, code ^ mask))
+            if bucket is None:
+                continue
+            scores = bucket.vectors[:bucket.count] @ vector
+            stale = bucket.expires[:bucket.count] <= now
+            if stale.any():
+                expired.extend(bucket.entry_ids[row] for row in np.flatnonzero(stale))
+                scores[stale] = -np.inf
+            if k == 1:
+                rows = (int(scores.argmax()),)
+            elif bucket.count > k:
+                rows = np.argpartition(scores, -k)[-k:]
+            else:
+                rows = range(bucket.count)
+            candidates.extend((float(scores[row]), bucket.entry_ids[row]) for row in rows if scores[row] > -np.inf)
+        
+        for entry_id in expired:
+            self._remove(entry_id)
+        candidates.sort(reverse=True)
+        return [(score, self._entries[entry_id][2]) for score, entry_id in candidates[:k]]
+    
+    def clear(self) -> None:
+        """Remove all entries."""
+        self._buckets = {}
+        self._entries.clear()
+
+
+class SemanticCache:
+    """Cache of responses looked up by prompt similarity."""
+    
+    def __init__(self, embedder: Embedder, max_entries: int, hash_bits: int = 8, ttl: float = 3600.0):
+        """Initialize the semantic cache.
+        
+        Args:
+            embedder: Prompt embedder
+            max_entries: Maximum number of cached responses
+            hash_bits: Number of hash bits used to bucket the index
+            ttl: Seconds a response stays valid, as in the exact-match response cache
+        """
+        self.embedder = embedder
+        self.ttl = ttl
+        self.index = VectorIndex(embedder.dim, max_entries, hash_bits)
+        self.hits = 0
+        self.misses = 0
+    
+    def get(self, scope: Hashable, prompt: str, threshold: float) -> Tuple[np.ndarray, Optional[Dict[str, Any]]]:
+        """Look up the response of the most similar cached prompt.
+        
+        Args:
+            scope: Scope of the request (provider, model and generation parameters)
+            prompt: Prompt text
+            threshold: Minimum cosine similarity for a hit
+        
+        Returns:
+            Tuple[np.ndarray, Optional[Dict[str, Any]]]: Prompt embedding (to reuse when
+            storing the response) and the cached response or None on a miss
+        """
+        vector = self.embedder.embed(prompt)
+        results = self.index.search(vector, scope, k=1, now=time.monotonic())
+        if results and results[0][0] >= threshold:
+            self.hits += 1
+            logger.debug(f"Semantic cache hit with similarity {results[0][0]:.3f}")
+            return vector, results[0][1]
+        self.misses += 1
+        return vector, None
+    
+    def set(self, scope: Hashable, vector: np.ndarray, response: Dict[str, Any]) -> None:
+        """Cache a response under a prompt embedding.
+        
+        Args:
+            scope: Scope of the request
+            vector: Prompt embedding returned by get
+            response: Response to cache
+        """
+        now = time.monotonic()
+        self.index.add(vector, scope, response, expires=now + self.ttl, now=now)
+    
+    def clear(self) -> None:
+        """Remove all cached responses."""
+        self.index.clear()
+    
+    def stats(self) -> Dict[str, int]:
+        """Get the cache counters.
+        
+        Returns:
+            Dict[str, int]: Cache counters
+        """
+        return {"hits": self.hits, "misses": self.misses, "entries": len(self.index)}
+
+
+def create_embedder(path: Optional[str] = None) -> Embedder:
+    """Create the configured embedder from its import path.
+    
+    Args:
+        path: Import path of the embedder class (module.ClassName)
+    
+    Returns:
+        Embedder: Embedder instance
+    """
+    path = path or settings.SEMANTIC_CACHE_EMBEDDER
+    module_name, class_name = path.rsplit(".", 1)
+    return getattr(importlib.import_module(module_name), class_name)()
+
+# Create global semantic cache
+semantic_cache = SemanticCache(
+    create_embedder(), settings.SEMANTIC_CACHE_MAX_ENTRIES, settings.SEMANTIC_CACHE_HASH_BITS, settings.RESPONSE_CACHE_TTL
+)
@@ -0,0 +1,66 @@
+"""
+Request coalescing for identical concurrent calls.
+
+The first caller for a key starts the call; callers that arrive while it is
+in flight wait for the same result instead of starting their own.
+"""
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, Hashable
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+class SingleFlight:
+    """Coalesces concurrent calls that share a key into one call."""
+    
+    def __init__(self):
+        """Initialize the single-flight group."""
+        self._calls: Dict[Hashable, asyncio.Task] = {}
+        self.calls = 0
+        self.shared = 0
+    
+    def _done(self, key: Hashable, task: asyncio.Task) -> None:
+        """Forget a finished call and retrieve its exception so it is never reported as unhandled."""
+        if self._calls.get(key) is task:
+            del self._calls[key]
+        if not task.cancelled():
+            task.exception()
+    
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """Run a call, or wait for the in-flight call with the same key.
+        
+        The call runs in its own task, so a waiter that is cancelled (for example
+        when its client disconnects) does not cancel the call for the others.
+        
+        Args:
+            key: Key identifying identical calls
+            fn: Function that starts the call
+        
+        Returns:
+            Any: Result of the call
+        
+        Raises:
+            Exception: Any exception raised by the call
+        """
+        task = self._calls.get(key)
+        if task is not None:
+            self.shared += 1
+            logger.debug(f"Coalesced request onto in-flight call: {key}")
+        else:
+            self.calls += 1
+            task = asyncio.ensure_future(fn())
+            self._calls[key] = task
+            task.add_done_callback(lambda finished: self._done(key, finished))
+        return await asyncio.shield(task)
+    
+    def in_flight(self) -> int:
+        """Get the number of calls in flight.
+        
+        Returns:
+            int: Number of calls in flight
+        """
+        return len(self._calls)
+
+# Create global single-flight group for generate requests
+single_flight = SingleFlight()
@@ -0,0 +1,164 @@
+"""
+Request tracing context.
+
+Each request gets a trace context following the W3C Trace Context format. An
+incoming `traceparent` header continues the caller's trace, otherwise a new
+trace is started. The context lives in a context variable so logs and
+outgoing provider calls can refer to the current request.
+"""
+import os
+import re
+import contextvars
+from typing import Any, Optional, Tuple
+
+# Version 00 traceparent: version-trace_id-parent_id-flags
+_TRACEPARENT = re.compile(r"([0-9a-f]{2})-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})")
+_INVALID_TRACE_ID = "0" * 32
+_INVALID_SPAN_ID = "0" * 16
+
+# Longest X-Request-ID accepted from callers
+MAX_REQUEST_ID_LENGTH = 128
+
+class TraceContext:
+    """Trace context of a request."""
+    
+    __slots__ = ("trace_id", "span_id", "parent_id", "flags", "tracestate", "request_id", "start_ns")
+    
+    def __init__(
+        self,
+        trace_id: str,
+        span_id: str,
+        parent_id: Optional[str] = None,
+        flags: str = "01",
+        tracestate: Optional[str] = None,
+        request_id: Optional[str] = None,
+        start_ns: int = 0,
+    ):
+        """Initialize the trace context.
+        
+        Args:
+            trace_id: 32 hex digit trace ID
+            span_id: 16 hex digit ID of this request's span
+            parent_id: Span ID of the caller, if the trace was continued
+            flags: Trace flags as two hex digits
+            tracestate: Vendor trace state passed through unchanged
+            request_id: Request ID (defaults to the trace ID)
+            start_ns: perf_counter_ns() when the request started
+        """
+        self.trace_id = trace_id
+        self.span_id = span_id
+        self.parent_id = parent_id
+        self.flags = flags
+        self.tracestate = tracestate
+        self.request_id = request_id or trace_id
+        self.start_ns = start_ns
+    
+    @property
+    def traceparent(self) -> str:
+        """The traceparent header value for calls made by this request."""
+        return f"00-{self.trace_id}-{self.span_id}-{self.flags}"
+
+def new_id(size: int) -> str:
+    """Generate a random non-zero hex ID.
+    
+    Args:
+        size: Number of random bytes
+    
+    Returns:
+        str: ID with 2 * size hex digits
+    """
+    while True:
+        value = os.urandom(size).hex()
+        if value.strip("0"):
+            return value
+
+def parse_traceparent(value: Optional[str]) -> Optional[Tuple[str, str, str]]:
+    """Parse a traceparent header.
+    
+    Args:
+        value: Header value
+    
+    Returns:
+        Optional[Tuple[str, str, str]]: (trace_id, parent_id, flags), or None if the header is missing or invalid
+    """
+    if not value:
+        return None
+    match = _TRACEPARENT.match(value.strip())
+    if match is None:
+        return None
+    version, trace_id, parent_id, flags = match.groups()
+    # Version ff is forbidden; version 00 headers must not carry extra fields
+    if version == "ff" or (version == "00" and match.end() != len(value.strip())):
+        return None
+    if trace_id == _INVALID_TRACE_ID or parent_id == _INVALID_SPAN_ID:
+        return None
+    return trace_id, parent_id, flags
+
+def start_trace(
+    traceparent: Optional[str] = None,
+    tracestate: Optional[str] = None,
+    request_id: Optional[str] = None,
+    start_ns: int = 0,
+) -> TraceContext:
+    """Create the trace context for a request.
+    
+    Args:
+        traceparent: Incoming traceparent header
+        tracestate: Incoming tracestate header
+        request_id: Incoming X-Request-ID header
+        start_ns: perf_counter_ns() when the request started
+    
+    Returns:
+        TraceContext: Context continuing the caller's trace, or a new trace
+    """
+    if request_id is not None and (len(request_id) > MAX_REQUEST_ID_LENGTH or not request_id.isprintable()):
+        request_id = None
+    
+    parent = parse_traceparent(traceparent)
+    if parent is None:
+        return TraceContext(new_id(16), new_id(8), request_id=request_id, start_ns=start_ns)
+    trace_id, parent_id, flags = parent
+    return TraceContext(trace_id, new_id(8), parent_id, flags, tracestate, request_id, start_ns)
+
+# Trace context of the current request, set by the tracing middleware
+_current_trace: contextvars.ContextVar = contextvars.ContextVar("current_trace", default=None)
+
+def current_trace() -> Optional[TraceContext]:
+    """Get the trace context of the current request.
+    
+    Returns:
+        Optional[TraceContext]: Trace context, or None outside a traced request
+    """
+    return _current_trace.get()
+
+def set_trace(trace: TraceContext) -> contextvars.Token:
+    """Make a trace context current.
+    
+    Args:
+        trace: Trace context
+    
+    Returns:
+        contextvars.Token: Token to reset the context with
+    """
+    return _current_trace.set(trace)
+
+def reset_trace(token: contextvars.Token) -> None:
+    """Restore the trace context that was current before set_trace.
+    
+    Args:
+        token: Token returned by set_trace
+    """
+    _current_trace.reset(token)
+
+async def inject_trace_headers(request: Any) -> None:
+    """httpx request hook that propagates the current trace to provider calls.
+    
+    Args:
+        request: Outgoing httpx request
+    """
+    trace = _current_trace.get()
+    if trace is None:
+        return
+    request.headers["traceparent"] = trace.traceparent
+    if trace.tracestate:
+        request.headers["tracestate"] = trace.tracestate
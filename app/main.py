@@ -1,13 +1,26 @@
 from fastapi import FastAPI, Request, HTTPException
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, Response
 from fastapi.middleware.cors import CORSMiddleware
+from contextlib import asynccontextmanager
 import logging
 import uvicorn
 import os
 
 from app.core.config import settings
 from app.api.endpoints import router as api_router
-from app.middleware.debug_middleware import DebugMiddleware
+from app.middleware.metrics_middleware import MetricsMiddleware
+from app.middleware.tracing_middleware import TracingMiddleware
+from app.models.provider_clients import provider_clients
+from app.core.counters import create_counter_backend
+from app.core.rate_limit import rate_limiter
+from app.core.cache import response_cache
+from app.core.semantic_cache import semantic_cache
+from app.core.singleflight import single_flight
+from app.core.jobs import job_queue
+from app.core import metrics
+from app.models.circuit_breaker import circuit_breakers
+from app.clients.auth import client_manager
+from app.api.generation import run_job
 
 # Configure logging
 logging.basicConfig(
@@ -16,11 +29,41 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Create shared resources on startup and release them on shutdown."""
+    # Open pooled provider clients
+    provider_clients.startup()
+    # Attach the rate limit counter backend
+    await rate_limiter.start(create_counter_backend(), settings.RATE_LIMIT_SYNC_INTERVAL)
+    # Reload client configurations when they change
+    client_manager.start_watching()
+    # Share metrics between workers
+    if settings.METRICS_ENABLED:
+        await metrics.registry.start(settings.METRICS_MULTIPROC_DIR, settings.METRICS_FLUSH_INTERVAL)
+    # Run queued generation jobs
+    if settings.JOBS_ENABLED:
+        job_queue.start(run_job, settings.JOB_WORKERS)
+    yield
+    # Stop the job workers, queueing their jobs again
+    if settings.JOBS_ENABLED:
+        await job_queue.stop()
+        job_queue.close()
+    # Stop watching client configurations
+    await client_manager.stop_watching()
+    # Write the final metrics snapshot
+    await metrics.registry.stop()
+    # Flush rate limit usage and close the counter backend
+    await rate_limiter.stop()
+    # Close pooled provider clients
+    await provider_clients.close()
+
 # Create FastAPI application
 app = FastAPI(
     title=settings.PROJECT_NAME,
     description="API Gateway for accessing large language models",
     version="0.1.0",
+    lifespan=lifespan,
 )
 
 # Add CORS middleware
@@ -32,10 +75,13 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Add debug middleware (only in debug mode)
-if os.environ.get("LOG_LEVEL") == "DEBUG":
-    app.add_middleware(DebugMiddleware)
-    logger.info("Debug middleware enabled")
+# Add metrics middleware
+if settings.METRICS_ENABLED:
+    app.add_middleware(MetricsMiddleware)
+
+# Add tracing middleware (outermost, so every request has an ID)
+if settings.TRACING_ENABLED:
+    app.add_middleware(TracingMiddleware)
 
 # Include API router
 app.include_router(api_router, prefix=settings.API_V1_STR)
@@ -56,6 +102,34 @@ async def health_check():
     """Health check endpoint."""
     return {"status": "ok"}
 
+def update_component_metrics() -> None:
+    """Copy cache, coalescing, circuit breaker and job queue counters into the metrics registry."""
+    for name, cache_stats in (
+        ("response", response_cache.stats()),
+        ("semantic", semantic_cache.stats()),
+        ("auth", client_manager.secret_cache.stats()),
+        ("clients", client_manager.store.stats()),
+    ):
+        metrics.CACHE_ENTRIES.set(cache_stats["entries"], (name,))
+        for event in ("hits", "misses", "evictions"):
+            if event in cache_stats:
+                metrics.CACHE_EVENTS.set(cache_stats[event], (name, event))
+    metrics.CACHE_EVENTS.set(single_flight.shared, ("single_flight", "coalesced"))
+    for target, circuit in circuit_breakers.snapshot().items():
+        metrics.CIRCUIT_OPEN.set({"open": 1, "half_open": 0.5}.get(circuit["state"], 0), (target,))
+    if settings.JOBS_ENABLED:
+        for state, count in job_queue.stats().items():
+            metrics.JOBS.set(count, (state,))
+
+metrics.registry.add_callback(update_component_metrics)
+
+# Add metrics endpoint
+if settings.METRICS_ENABLED:
+    @app.get("/metrics", include_in_schema=False)
+    async def prometheus_metrics():
+        """Prometheus metrics endpoint."""
+        return Response(metrics.registry.exposition(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
 # Add root endpoint
 @app.get("/")
 async def root():
@@ -67,7 +141,7 @@ async def root():
     }
 
 if __name__ == "__main__":
-    # Run the application with uvicorn
+    # Run the development server with auto-reload; use `python -m app.server` in production
     uvicorn.run(
         "app.main:app",
         host="0.0.0.0",
@@ -0,0 +1,43 @@
+"""
+Metrics middleware for FastAPI application.
+This middleware times each request, its serialization stage and the number of
+requests in flight.
+"""
+import time
+
+from app.core import metrics
+
+class MetricsMiddleware:
+    """
+    Pure ASGI middleware that records request metrics.
+    It does not buffer the request or response, so streaming responses pass
+    through unchanged.
+    """
+    
+    def __init__(self, app):
+        self.app = app
+    
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        
+        # Labelled with the route the app matches, once it has run
+        timer, token = metrics.start_request(scope)
+        status = 500
+        
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                if timer.handler_end is not None:
+                    metrics.observe_stage("serialization", time.perf_counter() - timer.handler_end)
+            await send(message)
+        
+        metrics.REQUESTS_IN_FLIGHT.inc()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            metrics.REQUESTS_IN_FLIGHT.dec()
+            metrics.REQUEST_SECONDS.observe(time.perf_counter() - timer.start, (timer.endpoint, str(status)))
+            metrics.end_request(token)
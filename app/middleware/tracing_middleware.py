@@ -0,0 +1,104 @@
+"""
+Tracing middleware for FastAPI application.
+This middleware assigns each request an ID and a W3C trace context, logs its
+timings and optionally samples request and response bodies.
+"""
+import time
+import random
+import logging
+
+from starlette.datastructures import MutableHeaders
+
+from app.core.config import settings
+from app.core import tracing
+
+logger = logging.getLogger(__name__)
+
+# Paths whose bodies hold credentials (client secrets and issued tokens), never sampled
+CREDENTIAL_PATHS = frozenset({f"{settings.API_V1_STR}/token"})
+
+class TracingMiddleware:
+    """
+    Pure ASGI middleware for tracing requests.
+    Bodies are never buffered: the middleware only looks at the messages as
+    they pass, so streaming requests and responses are unaffected. Sampled
+    bodies are copied up to TRACE_BODY_MAX_BYTES.
+    """
+    
+    def __init__(self, app):
+        self.app = app
+    
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        
+        start_ns = time.perf_counter_ns()
+        
+        # Pick the trace headers out of the raw header list
+        traceparent = tracestate = request_id = None
+        for name, value in scope["headers"]:
+            if name == b"traceparent":
+                traceparent = value.decode("latin-1")
+            elif name == b"tracestate":
+                tracestate = value.decode("latin-1")
+            elif name == b"x-request-id":
+                request_id = value.decode("latin-1")
+        trace = tracing.start_trace(traceparent, tracestate, request_id, start_ns)
+        token = tracing.set_trace(trace)
+        
+        # Decide whether to sample the bodies of this request
+        max_bytes = settings.TRACE_BODY_MAX_BYTES
+        sampled = (
+            settings.TRACE_BODY_SAMPLE_RATE > 0
+            and random.random() < settings.TRACE_BODY_SAMPLE_RATE
+            and scope["path"].rstrip("/") not in CREDENTIAL_PATHS
+        )
+        request_body = bytearray()
+        response_body = bytearray()
+        status = 500
+        response_start_ns = 0
+        
+        async def receive_wrapper():
+            message = await receive()
+            if message["type"] == "http.request" and len(request_body) < max_bytes:
+                request_body.extend(message.get("body", b"")[:max_bytes - len(request_body)])
+            return message
+        
+        async def send_wrapper(message):
+            nonlocal status, response_start_ns
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                response_start_ns = time.perf_counter_ns()
+                headers = MutableHeaders(scope=message)
+                headers.append("X-Request-ID", trace.request_id)
+                headers.append("traceparent", trace.traceparent)
+                headers.append("Server-Timing", f"app;dur={(response_start_ns - start_ns) / 1e6:.3f}")
+            elif sampled and message["type"] == "http.response.body" and len(response_body) < max_bytes:
+                response_body.extend(message.get("body", b"")[:max_bytes - len(response_body)])
+            await send(message)
+        
+        try:
+            await self.app(scope, receive_wrapper if sampled else receive, send_wrapper)
+        except Exception as e:
+            logger.error(
+                f"Request {trace.request_id} failed after {(time.perf_counter_ns() - start_ns) / 1e6:.2f}ms: {e}"
+            )
+            raise
+        finally:
+            tracing.reset_trace(token)
+        
+        # Log the request once it has completed
+        if logger.isEnabledFor(logging.INFO):
+            end_ns = time.perf_counter_ns()
+            ttfb_ms = (response_start_ns - start_ns) / 1e6 if response_start_ns else 0.0
+            logger.info(
+                f"Request {trace.request_id} {scope['method']} {scope['path']} {status} "
+                f"in {(end_ns - start_ns) / 1e6:.2f}ms (first byte {ttfb_ms:.2f}ms) "
+                f"trace={trace.trace_id} span={trace.span_id}"
+            )
+        if sampled:
+            logger.info(
+                f"Request {trace.request_id} body: {request_body.decode('utf-8', 'replace')!r} "
+                f"response body: {response_body.decode('utf-8', 'replace')!r}"
+            )
@@ -0,0 +1,107 @@
+"""
+Async micro-batching for backends that serve batched inputs.
+
+Self-hosted inference servers get much higher throughput from one call with
+many inputs than from many calls with one input each. The batcher collects
+concurrent requests that share a key (for example the generation parameters
+of a model) until the batch is full or the oldest request has waited
+`max_wait` seconds, sends them as one call and hands each caller its result.
+"""
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Tuple
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Sends a batch of items for a key and returns one result per item, in order
+BatchFunction = Callable[[Hashable, List[Any]], Awaitable[List[Any]]]
+
+class MicroBatcher:
+    """Collects concurrent requests into batched calls."""
+    
+    def __init__(self, send_batch: BatchFunction, max_batch_size: int = 16, max_wait: float = 0.005):
+        """Initialize the batcher.
+        
+        Args:
+            send_batch: Function that sends a batch and returns its results
+            max_batch_size: Maximum number of items per batch
+            max_wait: Maximum seconds the first item of a batch waits for more items
+        """
+        self.send_batch = send_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.batches = 0
+        self.items = 0
+        self._pending: Dict[Hashable, List[Tuple[Any, asyncio.Future]]] = {}
+        self._timers: Dict[Hashable, asyncio.TimerHandle] = {}
+        self._tasks = set()
+    
+    async def submit(self, key: Hashable, item: Any) -> Any:
+        """Add an item to the next batch for a key and wait for its result.
+        
+        Args:
+            key: Key of the batch; only items with equal keys are batched together
+            item: Item to send
+        
+        Returns:
+            Any: Result for the item
+        
+        Raises:
+            Exception: Any exception raised while sending the batch
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        pending = self._pending.setdefault(key, [])
+        pending.append((item, future))
+        
+        if len(pending) >= self.max_batch_size:
+            self._flush(key)
+        elif len(pending) == 1:
+            self._timers[key] = loop.call_later(self.max_wait, self._flush, key)
+        return await future
+    
+    def _flush(self, key: Hashable) -> None:
+        """Send the pending items for a key as one batch."""
+        timer = self._timers.pop(key, None)
+        if timer is not None:
+            timer.cancel()
+        pending = self._pending.pop(key, None)
+        if not pending:
+            return
+        
+        task = asyncio.ensure_future(self._send(key, pending))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+    
+    async def _send(self, key: Hashable, pending: List[Tuple[Any, asyncio.Future]]) -> None:
+        """Send a batch and resolve the futures of its items."""
+        self.batches += 1
+        self.items += len(pending)
+        try:
+            results = await self.send_batch(key, [item for item, _ in pending])
+            if len(results) != len(pending):
+                raise ValueError(f"Batch returned {len(results)} results for {len(pending)} items")
+        except Exception as e:
+            logger.error(f"Error sending batch of {len(pending)} items: {e}")
+            for _, future in pending:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        
+        # Callers that gave up (e.g. disconnected clients) have cancelled futures
+        for (_, future), result in zip(pending, results):
+            if not future.done():
+                future.set_result(result)
+    
+    def stats(self) -> Dict[str, float]:
+        """Get the batching counters.
+        
+        Returns:
+            Dict[str, float]: Number of batches and items sent, and the mean batch size
+        """
+        return {
+            "batches": self.batches,
+            "items": self.items,
+            "mean_batch_size": self.items / self.batches if self.batches else 0.0,
+        }
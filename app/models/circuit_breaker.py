@@ -0,0 +1,258 @@
+"""
+Circuit breakers for provider targets.
+
+Each (provider, model) target has a breaker with three states:
+
+- closed: calls go through; consecutive failures are counted
+- open: calls are rejected immediately until the reset timeout has passed
+- half-open: a limited number of probe calls go through; enough successes
+  close the breaker, a failure opens it again
+
+Only failures that point at an unhealthy provider (connection errors,
+timeouts, 429 and 5xx responses) count. Client errors such as an invalid
+request leave the breaker alone.
+"""
+import time
+import asyncio
+import logging
+from typing import Any, Callable, Dict, Iterable, Optional, Tuple
+
+import httpx
+import openai
+import groq
+
+from app.core.config import settings
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+Target = Tuple[str, str]
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+# Errors raised when a provider cannot be reached or does not answer in time
+TRANSPORT_ERRORS = (
+    httpx.TransportError,
+    openai.APIConnectionError,
+    groq.APIConnectionError,
+    ConnectionError,
+    TimeoutError,
+    asyncio.TimeoutError,
+)
+
+class CircuitOpenError(Exception):
+    """Raised when a call is rejected because a target's circuit is open."""
+    
+    def __init__(self, message: str, retry_after: float):
+        """Initialize the exception.
+        
+        Args:
+            message: Error message
+            retry_after: Seconds until the circuit lets a probe call through
+        """
+        super().__init__(message)
+        self.retry_after = retry_after
+
+def is_provider_failure(error: BaseException) -> bool:
+    """Check whether an error means the provider is unhealthy.
+    
+    Args:
+        error: Error raised by a provider call
+    
+    Returns:
+        bool: True for connection errors, timeouts and 429 or 5xx responses; False for client
+        errors and for errors raised by the gateway's own code
+    """
+    if isinstance(error, TRANSPORT_ERRORS):
+        return True
+    status = getattr(error, "status_code", None)
+    if status is None:
+        status = getattr(getattr(error, "response", None), "status_code", None)
+    if not isinstance(status, int):
+        return False
+    return status == 429 or status >= 500
+
+
+class CircuitBreaker:
+    """Circuit breaker for a single target."""
+    
+    def __init__(
+        self,
+        name: str,
+        failure_threshold: int = 5,
+        reset_timeout: float = 30.0,
+        half_open_max_calls: int = 1,
+        success_threshold: int = 1,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        """Initialize a closed circuit breaker.
+        
+        Args:
+            name: Name of the target, used in logs and errors
+            failure_threshold: Consecutive failures that open the circuit
+            reset_timeout: Seconds the circuit stays open before allowing probes
+            half_open_max_calls: Maximum concurrent probe calls while half-open
+            success_threshold: Successful probes needed to close the circuit
+            clock: Monotonic clock
+        """
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.half_open_max_calls = half_open_max_calls
+        self.success_threshold = success_threshold
+        self.clock = clock
+        self._state = CLOSED
+        self.failures = 0
+        self.successes = 0
+        self.probes = 0
+        self.opened_at = 0.0
+        self.rejected = 0
+    
+    @property
+    def state(self) -> str:
+        """Current state, moving from open to half-open once the reset timeout has passed."""
+        if self._state == OPEN and self.clock() - self.opened_at >= self.reset_timeout:
+            self._state = HALF_OPEN
+            self.successes = 0
+            self.probes = 0
+            logger.info(f"Circuit for {self.name} is half-open")
+        return self._state
+    
+    def retry_after(self) -> float:
+        """Get the seconds until the circuit lets a probe call through.
+        
+        Returns:
+            float: Seconds to wait, 0 if calls are allowed
+        """
+        if self.state == OPEN:
+            return max(0.0, self.reset_timeout - (self.clock() - self.opened_at))
+        return 0.0
+    
+    def available(self) -> bool:
+        """Check whether a call would be allowed, without reserving a probe.
+        
+        Returns:
+            bool: True if the circuit is closed or has a free probe slot
+        """
+        state = self.state
+        return state == CLOSED or (state == HALF_OPEN and self.probes < self.half_open_max_calls)
+    
+    def acquire(self) -> None:
+        """Allow a call through the circuit, reserving a probe slot if half-open.
+        
+        Raises:
+            CircuitOpenError: If the circuit is open or has no free probe slot
+        """
+        if self.available():
+            if self._state == HALF_OPEN:
+                self.probes += 1
+            return
+        self.rejected += 1
+        raise CircuitOpenError(f"Circuit open for {self.name}", max(self.retry_after(), 1.0))
+    
+    def release(self) -> None:
+        """Free a call's probe slot without recording an outcome (e.g. when it is cancelled)."""
+        if self._state == HALF_OPEN and self.probes > 0:
+            self.probes -= 1
+    
+    def record_success(self) -> None:
+        """Record a successful call."""
+        if self._state == HALF_OPEN:
+            self.release()
+            self.successes += 1
+            if self.successes >= self.success_threshold:
+                self._state = CLOSED
+                logger.info(f"Circuit for {self.name} closed")
+        self.failures = 0
+    
+    def record_failure(self) -> None:
+        """Record a failed call, opening the circuit if needed."""
+        self.failures += 1
+        if self._state == HALF_OPEN or (self._state == CLOSED and self.failures >= self.failure_threshold):
+            self._open()
+    
+    def _open(self) -> None:
+        """Open the circuit."""
+        self._state = OPEN
+        self.opened_at = self.clock()
+        self.probes = 0
+        logger.warning(f"Circuit for {self.name} opened after {self.failures} consecutive failures")
+    
+    def snapshot(self) -> Dict[str, Any]:
+        """Get the breaker state.
+        
+        Returns:
+            Dict[str, Any]: State, counters and seconds until a probe is allowed
+        """
+        return {
+            "state": self.state,
+            "failures": self.failures,
+            "rejected": self.rejected,
+            "retry_after": self.retry_after(),
+        }
+
+
+class CircuitBreakerRegistry:
+    """Circuit breakers for every target, created on first use."""
+    
+    def __init__(self):
+        """Initialize the registry."""
+        self._breakers: Dict[Target, CircuitBreaker] = {}
+    
+    def get(self, target: Target) -> CircuitBreaker:
+        """Get the breaker for a target.
+        
+        Args:
+            target: (provider, model) pair
+        
+        Returns:
+            CircuitBreaker: Circuit breaker for the target
+        """
+        breaker = self._breakers.get(target)
+        if breaker is None:
+            breaker = self._breakers[target] = CircuitBreaker(
+                f"{target[0]}/{target[1]}",
+                failure_threshold=settings.CIRCUIT_FAILURE_THRESHOLD,
+                reset_timeout=settings.CIRCUIT_RESET_TIMEOUT,
+                half_open_max_calls=settings.CIRCUIT_HALF_OPEN_MAX_CALLS,
+                success_threshold=settings.CIRCUIT_SUCCESS_THRESHOLD,
+            )
+        return breaker
+    
+    def open_error(self, targets: Iterable[Target]) -> CircuitOpenError:
+        """Build the error for a request whose targets all have open circuits.
+        
+        Args:
+            targets: Targets of the request
+        
+        Returns:
+            CircuitOpenError: Error with the shortest wait until a probe is allowed
+        """
+        breakers = [self.get(target) for target in targets]
+        retry_after = min((breaker.retry_after() for breaker in breakers), default=0.0)
+        names = ", ".join(breaker.name for breaker in breakers)
+        return CircuitOpenError(f"Circuit open for {names}", max(retry_after, 1.0))
+    
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        """Get the state of every breaker.
+        
+        Returns:
+            Dict[str, Dict[str, Any]]: Breaker states keyed by "provider/model"
+        """
+        return {breaker.name: breaker.snapshot() for breaker in self._breakers.values()}
+    
+    def reset(self, target: Optional[Target] = None) -> None:
+        """Close breakers by forgetting their state.
+        
+        Args:
+            target: Target to reset, or None for all targets
+        """
+        if target is None:
+            self._breakers = {}
+        else:
+            self._breakers.pop(target, None)
+
+# Create global circuit breaker registry
+circuit_breakers = CircuitBreakerRegistry()
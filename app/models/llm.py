@@ -1,8 +1,11 @@
-from typing import Dict, Optional, Any, Literal
+from typing import AsyncIterator, Dict, List, Optional, Any, Literal, Tuple
 import logging
-from openai import OpenAI
-from groq import Groq
+import httpx
 from app.core.config import settings
+from app.models.batching import MicroBatcher
+from app.models.prompts import assemble_prompt, cache_hints
+from app.models.provider_clients import provider_clients
+from app.models.tokenizer import token_counter
 
 # Configure logging
 logger = logging.getLogger(__name__)
@@ -10,6 +13,8 @@ logger = logging.getLogger(__name__)
 class BaseModel:
     """Base class for LLM models."""
     
+    provider: str = ""
+    
     def __init__(self, model_name: str):
         """Initialize the model.
         
@@ -18,6 +23,11 @@ class BaseModel:
         """
         self.model_name = model_name
     
+    @property
+    def client(self) -> Any:
+        """Pooled provider client shared by all models of this provider."""
+        return provider_clients.get_client(self.provider)
+    
     async def generate(self, prompt: str, temperature: float = 0.7, max_tokens: int = 150) -> Dict[str, Any]:
         """Generate text from a prompt.
         
@@ -30,11 +40,44 @@ class BaseModel:
             Dict[str, Any]: Generated text and metadata
         """
         raise NotImplementedError("Subclasses must implement generate method")
+    
+    async def generate_stream(self, prompt: str, temperature: float = 0.7, max_tokens: int = 150) -> AsyncIterator[Dict[str, Any]]:
+        """Generate text from a prompt as a stream of deltas.
+        
+        Yields one {"text": ...} event per token delta, followed by a final
+        {"done": True, "model": ..., "usage": ...} event.
+        
+        Args:
+            prompt: The prompt to generate text from
+            temperature: Controls randomness
+            max_tokens: Maximum number of tokens to generate
+        
+        Yields:
+            Dict[str, Any]: Stream events
+        """
+        raise NotImplementedError("Subclasses must implement generate_stream method")
+        yield
+    
+    async def chat_completions(self, body: bytes) -> httpx.Response:
+        """Send an OpenAI chat completions request body to the provider unchanged.
+        
+        The response body is not read, so it can be relayed as it arrives.
+        The caller must close the response.
+        
+        Args:
+            body: Encoded chat completions request for this model
+        
+        Returns:
+            httpx.Response: Provider response with an unread body
+        """
+        raise NotImplementedError(f"Provider {self.provider} does not support chat completions")
 
 
 class OpenAIModel(BaseModel):
     """OpenAI model implementation."""
     
+    provider = "openai"
+    
     def __init__(self, model_name: str = "gpt-3.5-turbo"):
         """Initialize the OpenAI model.
         
@@ -42,7 +85,6 @@ class OpenAIModel(BaseModel):
             model_name: Name of the OpenAI model
         """
         super().__init__(model_name)
-        self.client = OpenAI(api_key=settings.OPENAI_API_KEY)
     
     async def generate(self, prompt: str, temperature: float = 0.7, max_tokens: int = 150) -> Dict[str, Any]:
         """Generate text using OpenAI.
@@ -56,30 +98,76 @@ class OpenAIModel(BaseModel):
             Dict[str, Any]: Generated text and metadata
         """
         try:
-            response = self.client.chat.completions.create(
+            assembled = assemble_prompt(prompt)
+            response = await self.client.chat.completions.create(
                 model=self.model_name,
-                messages=[{"role": "user", "content": prompt}],
+                messages=assembled.messages,
                 temperature=temperature,
-                max_tokens=max_tokens
+                max_tokens=max_tokens,
+                extra_body=cache_hints(self.provider, assembled) or None,
             )
             
             return {
                 "text": response.choices[0].message.content,
                 "model": self.model_name,
-                "usage": {
-                    "prompt_tokens": response.usage.prompt_tokens,
-                    "completion_tokens": response.usage.completion_tokens,
-                    "total_tokens": response.usage.total_tokens
-                }
+                "usage": _usage_to_dict(response.usage)
             }
         except Exception as e:
             logger.error(f"Error generating text with OpenAI: {e}")
             raise
+    
+    async def generate_stream(self, prompt: str, temperature: float = 0.7, max_tokens: int = 150) -> AsyncIterator[Dict[str, Any]]:
+        """Generate text using OpenAI as a stream of deltas.
+        
+        Args:
+            prompt: The prompt to generate text from
+            temperature: Controls randomness
+            max_tokens: Maximum number of tokens to generate
+        
+        Yields:
+            Dict[str, Any]: Stream events
+        """
+        usage = None
+        try:
+            assembled = assemble_prompt(prompt)
+            stream = await self.client.chat.completions.create(
+                model=self.model_name,
+                messages=assembled.messages,
+                temperature=temperature,
+                max_tokens=max_tokens,
+                extra_body=cache_hints(self.provider, assembled) or None,
+                stream=True,
+                stream_options={"include_usage": True},
+            )
+            
+            async for chunk in stream:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield {"text": chunk.choices[0].delta.content}
+                if chunk.usage:
+                    usage = chunk.usage
+            
+            yield {"done": True, "model": self.model_name, "usage": _usage_to_dict(usage)}
+        except Exception as e:
+            logger.error(f"Error streaming text with OpenAI: {e}")
+            raise
+    
+    async def chat_completions(self, body: bytes) -> httpx.Response:
+        """Send a chat completions request to OpenAI unchanged.
+        
+        Args:
+            body: Encoded chat completions request for this model
+        
+        Returns:
+            httpx.Response: Provider response with an unread body
+        """
+        return await _send_chat_completions(self.provider, body)
 
 
 class GroqModel(BaseModel):
     """Groq model implementation."""
     
+    provider = "groq"
+    
     def __init__(self, model_name: str = "mixtral-8x7b-32768"):
         """Initialize the Groq model.
         
@@ -87,7 +175,6 @@ class GroqModel(BaseModel):
             model_name: Name of the Groq model
         """
         super().__init__(model_name)
-        self.client = Groq(api_key=settings.GROQ_API_KEY)
     
     async def generate(self, prompt: str, temperature: float = 0.7, max_tokens: int = 150) -> Dict[str, Any]:
         """Generate text using Groq.
@@ -101,32 +188,224 @@ class GroqModel(BaseModel):
             Dict[str, Any]: Generated text and metadata
         """
         try:
-            response = self.client.chat.completions.create(
+            assembled = assemble_prompt(prompt)
+            response = await self.client.chat.completions.create(
                 model=self.model_name,
-                messages=[{"role": "user", "content": prompt}],
+                messages=assembled.messages,
                 temperature=temperature,
-                max_tokens=max_tokens
+                max_tokens=max_tokens,
+                extra_body=cache_hints(self.provider, assembled) or None,
             )
             
             return {
                 "text": response.choices[0].message.content,
                 "model": self.model_name,
-                "usage": {
-                    "prompt_tokens": response.usage.prompt_tokens,
-                    "completion_tokens": response.usage.completion_tokens,
-                    "total_tokens": response.usage.total_tokens
-                }
+                "usage": _usage_to_dict(response.usage)
             }
         except Exception as e:
             logger.error(f"Error generating text with Groq: {e}")
             raise
+    
+    async def generate_stream(self, prompt: str, temperature: float = 0.7, max_tokens: int = 150) -> AsyncIterator[Dict[str, Any]]:
+        """Generate text using Groq as a stream of deltas.
+        
+        Args:
+            prompt: The prompt to generate text from
+            temperature: Controls randomness
+            max_tokens: Maximum number of tokens to generate
+        
+        Yields:
+            Dict[str, Any]: Stream events
+        """
+        usage = None
+        try:
+            assembled = assemble_prompt(prompt)
+            stream = await self.client.chat.completions.create(
+                model=self.model_name,
+                messages=assembled.messages,
+                temperature=temperature,
+                max_tokens=max_tokens,
+                extra_body=cache_hints(self.provider, assembled) or None,
+                stream=True,
+            )
+            
+            async for chunk in stream:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield {"text": chunk.choices[0].delta.content}
+                # Groq reports usage on the final chunk under x_groq
+                x_groq = getattr(chunk, "x_groq", None)
+                if x_groq is not None and x_groq.usage:
+                    usage = x_groq.usage
+            
+            yield {"done": True, "model": self.model_name, "usage": _usage_to_dict(usage)}
+        except Exception as e:
+            logger.error(f"Error streaming text with Groq: {e}")
+            raise
+    
+    async def chat_completions(self, body: bytes) -> httpx.Response:
+        """Send a chat completions request to Groq unchanged.
+        
+        Args:
+            body: Encoded chat completions request for this model
+        
+        Returns:
+            httpx.Response: Provider response with an unread body
+        """
+        return await _send_chat_completions(self.provider, body)
+
+
+class TritonModel(BaseModel):
+    """Triton Inference Server model implementation.
+    
+    Concurrent requests with the same generation parameters are micro-batched
+    into one call to the model's generate endpoint, with one `text_input` per
+    request. The generate endpoint does not report token usage, so it is
+    counted locally from each prompt and its output.
+    """
+    
+    provider = "triton"
+    
+    def __init__(self, model_name: str):
+        """Initialize the Triton model.
+        
+        Args:
+            model_name: Name of the model deployed on the Triton server
+        """
+        super().__init__(model_name)
+        self.batcher = MicroBatcher(
+            self._generate_batch,
+            max_batch_size=settings.TRITON_MAX_BATCH_SIZE,
+            max_wait=settings.TRITON_MAX_BATCH_WAIT,
+        )
+    
+    async def _generate_batch(self, parameters: Tuple[float, int], prompts: List[str]) -> List[str]:
+        """Generate text for a batch of prompts in one Triton call.
+        
+        Args:
+            parameters: Temperature and max tokens shared by the batch
+            prompts: Prompts to generate text from
+        
+        Returns:
+            List[str]: Generated text for each prompt
+        """
+        temperature, max_tokens = parameters
+        response = await self.client.post(
+            f"/v2/models/{self.model_name}/generate",
+            json={
+                "inputs": [
+                    {"name": "text_input", "shape": [len(prompts)], "datatype": "BYTES", "data": prompts}
+                ],
+                "parameters": {"temperature": temperature, "max_tokens": max_tokens},
+            },
+        )
+        response.raise_for_status()
+        return response.json()["outputs"][0]["data"]
+    
+    def _usage(self, prompt: str, text: str) -> Dict[str, int]:
+        """Count the token usage of a generation with the local token counter.
+        
+        Args:
+            prompt: Prompt sent
+            text: Generated text
+        
+        Returns:
+            Dict[str, int]: Token usage information
+        """
+        prompt_tokens = token_counter.count(self.model_name, prompt)
+        completion_tokens = token_counter.count(self.model_name, text)
+        return {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens
+        }
+    
+    async def generate(self, prompt: str, temperature: float = 0.7, max_tokens: int = 150) -> Dict[str, Any]:
+        """Generate text using Triton.
+        
+        Args:
+            prompt: The prompt to generate text from
+            temperature: Controls randomness
+            max_tokens: Maximum number of tokens to generate
+        
+        Returns:
+            Dict[str, Any]: Generated text and metadata
+        """
+        try:
+            text = await self.batcher.submit((temperature, max_tokens), prompt)
+            return {"text": text, "model": self.model_name, "usage": self._usage(prompt, text)}
+        except Exception as e:
+            logger.error(f"Error generating text with Triton: {e}")
+            raise
+    
+    async def generate_stream(self, prompt: str, temperature: float = 0.7, max_tokens: int = 150) -> AsyncIterator[Dict[str, Any]]:
+        """Generate text using Triton as a single-delta stream.
+        
+        Batched generation returns complete outputs, so the stream carries the
+        whole text in one delta.
+        
+        Args:
+            prompt: The prompt to generate text from
+            temperature: Controls randomness
+            max_tokens: Maximum number of tokens to generate
+        
+        Yields:
+            Dict[str, Any]: Stream events
+        """
+        response = await self.generate(prompt, temperature, max_tokens)
+        yield {"text": response["text"]}
+        yield {"done": True, "model": self.model_name, "usage": response["usage"]}
+
+
+async def _send_chat_completions(provider: str, body: bytes) -> httpx.Response:
+    """Send a chat completions request body to a provider's OpenAI-compatible API.
+    
+    Args:
+        provider: Provider name
+        body: Encoded chat completions request
+    
+    Returns:
+        httpx.Response: Provider response with an unread body
+    """
+    client = provider_clients.get_http_client(provider)
+    request = client.build_request(
+        "POST", "chat/completions", content=body, headers={"Content-Type": "application/json"}
+    )
+    return await client.send(request, stream=True)
+
+
+def _usage_to_dict(usage: Any) -> Optional[Dict[str, int]]:
+    """Convert a provider usage object to a usage dict.
+    
+    Args:
+        usage: Provider usage object or None
+    
+    Returns:
+        Optional[Dict[str, int]]: Token usage information
+    """
+    if usage is None:
+        return None
+    result = {
+        "prompt_tokens": usage.prompt_tokens,
+        "completion_tokens": usage.completion_tokens,
+        "total_tokens": usage.total_tokens
+    }
+    # Prompt tokens served from the provider's prefix cache
+    details = getattr(usage, "prompt_tokens_details", None)
+    if details is not None and details.cached_tokens is not None:
+        result["cached_prompt_tokens"] = details.cached_tokens
+    return result
 
 
-def get_model(provider: Optional[Literal["openai", "groq"]] = None, model_name: Optional[str] = None) -> BaseModel:
+# Cache of model instances keyed by (provider, model name)
+_models: Dict[Tuple[str, str], BaseModel] = {}
+
+def get_model(provider: Optional[Literal["openai", "groq", "triton"]] = None, model_name: Optional[str] = None) -> BaseModel:
     """Get a model instance based on provider and model name.
     
+    Model instances are cached and share the pooled provider clients.
+    
     Args:
-        provider: Provider name (openai or groq)
+        provider: Provider name (openai, groq or triton)
         model_name: Model name
     
     Returns:
@@ -143,10 +422,20 @@ def get_model(provider: Optional[Literal["openai", "groq"]] = None, model_name:
     if model_name is None:
         model_name = settings.DEFAULT_MODEL
     
+    # Return the cached model instance if there is one
+    model = _models.get((provider, model_name))
+    if model is not None:
+        return model
+    
     # Create model instance based on provider
     if provider == "openai":
-        return OpenAIModel(model_name)
+        model = OpenAIModel(model_name)
     elif provider == "groq":
-        return GroqModel(model_name)
+        model = GroqModel(model_name)
+    elif provider == "triton":
+        model = TritonModel(model_name)
     else:
         raise ValueError(f"Invalid provider: {provider}")
+    
+    _models[(provider, model_name)] = model
+    return model
@@ -0,0 +1,230 @@
+"""
+Prompt assembly for provider calls.
+
+Providers cache the longest prompt prefix they have recently seen, but only
+on an exact byte match. Prompts are assembled so that shared prefixes stay
+byte-identical across requests:
+
+- System (and developer) messages sent before the first assistant message
+  are moved to the front, keeping their order
+- Message keys are put in one order (role, name, content, then the rest)
+- In system messages, line endings are normalized and trailing
+  whitespace is removed from each line
+
+Conversation messages and generate prompts are user content and are left
+as they are; clients also resend conversation messages unchanged on the
+next turn.
+
+Prompts long enough to be cached (PROMPT_CACHE_MIN_CHARS) get a prefix key
+from their system messages, or from the start of the prompt if there are
+none. The key is sent as a caching hint to providers that accept one
+(OpenAI's prompt_cache_key), and the prefix tracker records how often each
+client reuses a prefix.
+"""
+import time
+import hashlib
+import logging
+from collections import OrderedDict
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+from app.core.config import settings
+from app.core import metrics
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Roles whose messages hold instructions rather than conversation
+INSTRUCTION_ROLES = ("system", "developer")
+
+# Leading message keys, in the order they are encoded
+KEY_ORDER = ("role", "name", "content")
+
+class AssembledPrompt(NamedTuple):
+    """Messages of a prompt, ready to send."""
+    messages: List[Dict[str, Any]]
+    # Whether the messages differ from the ones given
+    changed: bool
+    # Key of the cacheable prefix, or None if the prompt is too short to be cached
+    prefix_key: Optional[str]
+
+def normalize_text(text: str) -> str:
+    """Normalize line endings and trailing whitespace of instruction text.
+    
+    Args:
+        text: Text to normalize
+    
+    Returns:
+        str: Normalized text
+    """
+    if "\r" in text:
+        text = text.replace("\r\n", "\n").replace("\r", "\n")
+    # Substring checks are much faster than rebuilding the text, which is rarely needed
+    if " \n" in text or "\t\n" in text:
+        text = "\n".join([line.rstrip(" \t") for line in text.split("\n")])
+    return text.rstrip()
+
+def _normalize_message(message: Dict[str, Any]) -> Dict[str, Any]:
+    """Put a message's keys in order and normalize instruction text.
+    
+    Args:
+        message: Chat message
+    
+    Returns:
+        Dict[str, Any]: The same message if it is already normalized, otherwise a normalized copy
+    """
+    content = message.get("content")
+    if message.get("role") in INSTRUCTION_ROLES and isinstance(content, str):
+        normalized = normalize_text(content)
+    else:
+        normalized = content
+    keys = list(message)
+    leading = [key for key in KEY_ORDER if key in message]
+    ordered = leading + sorted(key for key in keys if key not in KEY_ORDER)
+    if keys == ordered and normalized is content:
+        return message
+    result = {key: message[key] for key in ordered}
+    if "content" in result:
+        result["content"] = normalized
+    return result
+
+def _prefix_key(messages: List[Dict[str, Any]]) -> Optional[str]:
+    """Compute the key of a prompt's cacheable prefix.
+    
+    Args:
+        messages: Normalized messages
+    
+    Returns:
+        Optional[str]: Prefix key, or None if the prompt is too short to be cached
+    """
+    texts = [message.get("content") for message in messages]
+    texts = [text for text in texts if isinstance(text, str)]
+    if sum(len(text) for text in texts) < settings.PROMPT_CACHE_MIN_CHARS:
+        return None
+    digest = hashlib.blake2b(digest_size=8)
+    instructions = [
+        message for message in messages[:len(messages) - 1]
+        if message.get("role") in INSTRUCTION_ROLES and isinstance(message.get("content"), str)
+    ]
+    if instructions:
+        for message in instructions:
+            digest.update(message["role"].encode())
+            digest.update(message["content"].encode())
+    else:
+        digest.update("".join(texts)[:settings.PROMPT_CACHE_MIN_CHARS].encode())
+    return digest.hexdigest()
+
+def assemble_messages(messages: List[Dict[str, Any]]) -> AssembledPrompt:
+    """Assemble chat messages so shared prefixes are byte-identical.
+    
+    Args:
+        messages: Chat messages as sent by the client
+    
+    Returns:
+        AssembledPrompt: Assembled messages and their prefix key
+    """
+    if not settings.PROMPT_NORMALIZE:
+        return AssembledPrompt(messages, False, _prefix_key(messages))
+    
+    # Move instructions given before the first assistant message to the front
+    first_reply = next(
+        (i for i, message in enumerate(messages) if message.get("role") == "assistant"), len(messages)
+    )
+    head = messages[:first_reply]
+    instructions = [message for message in head if message.get("role") in INSTRUCTION_ROLES]
+    ordered = instructions + [message for message in head if message.get("role") not in INSTRUCTION_ROLES]
+    ordered += messages[first_reply:]
+    
+    assembled = [_normalize_message(message) for message in ordered]
+    changed = any(new is not old for new, old in zip(assembled, messages))
+    return AssembledPrompt(assembled, changed, _prefix_key(assembled))
+
+def assemble_prompt(prompt: str) -> AssembledPrompt:
+    """Assemble a generate prompt as a single user message.
+    
+    The prompt is user content, so only its prefix key is computed; the text is sent unchanged.
+    
+    Args:
+        prompt: Prompt text
+    
+    Returns:
+        AssembledPrompt: Assembled message and its prefix key
+    """
+    messages = [{"role": "user", "content": prompt}]
+    return AssembledPrompt(messages, False, _prefix_key(messages))
+
+def cache_hints(provider: str, prompt: AssembledPrompt) -> Dict[str, Any]:
+    """Get the request parameters that help a provider reuse its prefix cache.
+    
+    Args:
+        provider: Provider name
+        prompt: Assembled prompt
+    
+    Returns:
+        Dict[str, Any]: Extra request parameters, empty if the provider takes no hints
+    """
+    if not settings.PROMPT_CACHE_HINTS or prompt.prefix_key is None:
+        return {}
+    # OpenAI routes requests with the same key to the same cache; Groq caches without hints
+    if provider == "openai":
+        return {"prompt_cache_key": prompt.prefix_key}
+    return {}
+
+
+class PrefixTracker:
+    """Tracks which cacheable prompt prefixes each client sent recently."""
+    
+    def __init__(self, max_entries: int = 10000, ttl: float = 600.0):
+        """Initialize the tracker.
+        
+        Args:
+            max_entries: Maximum number of (client, prefix) pairs remembered
+            ttl: Seconds a prefix counts as recent, about as long as providers keep it cached
+        """
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._seen: "OrderedDict[Tuple[str, str], float]" = OrderedDict()
+        self.reused = 0
+        self.new = 0
+    
+    def record(self, client_id: str, prefix_key: Optional[str]) -> Optional[bool]:
+        """Record that a client sent a prompt.
+        
+        Args:
+            client_id: Client ID
+            prefix_key: Prefix key of the prompt, or None if it cannot be cached
+        
+        Returns:
+            Optional[bool]: Whether the client sent the prefix recently, or None for uncacheable prompts
+        """
+        if prefix_key is None:
+            return None
+        now = time.monotonic()
+        key = (client_id, prefix_key)
+        seen = self._seen.pop(key, None)
+        reused = seen is not None and now - seen < self.ttl
+        self._seen[key] = now
+        if len(self._seen) > self.max_entries:
+            self._seen.popitem(last=False)
+        if reused:
+            self.reused += 1
+        else:
+            self.new += 1
+        metrics.PROMPT_PREFIXES.inc((client_id, "reused" if reused else "new"))
+        return reused
+    
+    def stats(self) -> Dict[str, int]:
+        """Get prefix reuse counters.
+        
+        Returns:
+            Dict[str, int]: Tracked prefixes and the number of new and reused prefixes
+        """
+        return {"entries": len(self._seen), "reused": self.reused, "new": self.new}
+    
+    def clear(self) -> None:
+        """Forget every tracked prefix and reset the counters."""
+        self._seen.clear()
+        self.reused = 0
+        self.new = 0
+
+# Create global prefix tracker
+prefix_tracker = PrefixTracker(settings.PROMPT_PREFIX_MAX_ENTRIES, settings.PROMPT_PREFIX_TTL)
@@ -0,0 +1,184 @@
+"""
+Registry of long-lived async provider SDK clients.
+
+Creating an SDK client per request opens a new connection pool (and a new TLS
+handshake) for every generation. The registry keeps one keep-alive client per
+(provider, api key, base URL) and closes them on application shutdown.
+"""
+import logging
+from typing import Any, Dict, Optional, Tuple
+
+import httpx
+import openai
+import groq
+
+from app.core.config import settings
+from app.core.tracing import inject_trace_headers
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+ClientKey = Tuple[str, str, Optional[str]]
+
+# Base URLs of the OpenAI-compatible APIs, used for raw calls when no base URL is configured
+DEFAULT_API_BASE_URLS = {
+    "openai": "https://api.openai.com/v1",
+    "groq": "https://api.groq.com/openai/v1",
+}
+
+class ProviderClientRegistry:
+    """Registry of pooled provider clients."""
+    
+    def __init__(self):
+        """Initialize the provider client registry."""
+        self._clients: Dict[ClientKey, Any] = {}
+        self._http_clients: Dict[ClientKey, httpx.AsyncClient] = {}
+    
+    def _default_credentials(self, provider: str) -> Tuple[str, Optional[str]]:
+        """Get the configured API key and base URL for a provider.
+        
+        Args:
+            provider: Provider name
+        
+        Returns:
+            Tuple[str, Optional[str]]: API key and base URL
+        
+        Raises:
+            ValueError: If provider is invalid
+        """
+        if provider == "openai":
+            return settings.OPENAI_API_KEY, settings.OPENAI_BASE_URL
+        elif provider == "groq":
+            return settings.GROQ_API_KEY, settings.GROQ_BASE_URL
+        elif provider == "triton":
+            # Triton servers are self-hosted and do not use an API key
+            return "", settings.TRITON_BASE_URL
+        else:
+            raise ValueError(f"Invalid provider: {provider}")
+    
+    def _limits(self) -> httpx.Limits:
+        """Build the connection pool limits from settings.
+        
+        Returns:
+            httpx.Limits: Connection pool limits
+        """
+        return httpx.Limits(
+            max_connections=settings.PROVIDER_MAX_CONNECTIONS,
+            max_keepalive_connections=settings.PROVIDER_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=settings.PROVIDER_KEEPALIVE_EXPIRY,
+        )
+    
+    def _create_client(self, provider: str, api_key: str, base_url: Optional[str]) -> Any:
+        """Create a new pooled client for a provider.
+        
+        Args:
+            provider: Provider name
+            api_key: Provider API key
+            base_url: Optional provider base URL
+        
+        Returns:
+            Any: Async provider SDK client
+        
+        Raises:
+            ValueError: If provider is invalid
+        """
+        # Propagate the trace context of the calling request
+        event_hooks = {"request": [inject_trace_headers]}
+        if provider == "openai":
+            http_client = openai.DefaultAsyncHttpxClient(
+                limits=self._limits(), timeout=settings.PROVIDER_TIMEOUT, event_hooks=event_hooks
+            )
+            return openai.AsyncOpenAI(
+                api_key=api_key, base_url=base_url, http_client=http_client, max_retries=settings.PROVIDER_MAX_RETRIES
+            )
+        elif provider == "groq":
+            http_client = groq.DefaultAsyncHttpxClient(
+                limits=self._limits(), timeout=settings.PROVIDER_TIMEOUT, event_hooks=event_hooks
+            )
+            return groq.AsyncGroq(
+                api_key=api_key, base_url=base_url, http_client=http_client, max_retries=settings.PROVIDER_MAX_RETRIES
+            )
+        elif provider == "triton":
+            return httpx.AsyncClient(
+                base_url=base_url, limits=self._limits(), timeout=settings.PROVIDER_TIMEOUT, event_hooks=event_hooks
+            )
+        else:
+            raise ValueError(f"Invalid provider: {provider}")
+    
+    def get_client(self, provider: str, api_key: Optional[str] = None, base_url: Optional[str] = None) -> Any:
+        """Get the pooled client for a provider, creating it on first use.
+        
+        Args:
+            provider: Provider name
+            api_key: API key (defaults to the configured key for the provider)
+            base_url: Base URL (defaults to the configured base URL for the provider)
+        
+        Returns:
+            Any: Provider SDK client
+        """
+        default_key, default_url = self._default_credentials(provider)
+        key = (provider, api_key or default_key, base_url or default_url)
+        
+        client = self._clients.get(key)
+        if client is None:
+            client = self._create_client(*key)
+            self._clients[key] = client
+            logger.info(f"Created pooled client for provider: {provider}")
+        return client
+    
+    def get_http_client(self, provider: str) -> httpx.AsyncClient:
+        """Get the pooled HTTP client for raw calls to a provider's OpenAI-compatible API.
+        
+        Used to pass requests through without the SDK parsing and rebuilding
+        the request and response bodies.
+        
+        Args:
+            provider: Provider name (openai or groq)
+        
+        Returns:
+            httpx.AsyncClient: Client with the provider's base URL and credentials
+        
+        Raises:
+            ValueError: If the provider has no OpenAI-compatible API
+        """
+        if provider not in DEFAULT_API_BASE_URLS:
+            raise ValueError(f"Provider {provider} does not have an OpenAI-compatible API")
+        key = (provider, *self._default_credentials(provider))
+        
+        client = self._http_clients.get(key)
+        if client is None:
+            _, api_key, base_url = key
+            client = httpx.AsyncClient(
+                base_url=base_url or DEFAULT_API_BASE_URLS[provider],
+                headers={"Authorization": f"Bearer {api_key}"},
+                limits=self._limits(),
+                timeout=settings.PROVIDER_TIMEOUT,
+                event_hooks={"request": [inject_trace_headers]},
+            )
+            self._http_clients[key] = client
+            logger.info(f"Created pooled HTTP client for provider: {provider}")
+        return client
+    
+    def startup(self) -> None:
+        """Create clients for every provider that has credentials configured."""
+        for provider in ("openai", "groq", "triton"):
+            api_key, base_url = self._default_credentials(provider)
+            if api_key or (provider == "triton" and base_url):
+                self.get_client(provider)
+    
+    async def close(self) -> None:
+        """Close all pooled clients and release their connections."""
+        for (provider, _, _), client in [*self._clients.items(), *self._http_clients.items()]:
+            try:
+                if isinstance(client, httpx.AsyncClient):
+                    await client.aclose()
+                else:
+                    await client.close()
+            except Exception as e:
+                logger.error(f"Error closing client for provider {provider}: {e}")
+        self._clients = {}
+        self._http_clients = {}
+        logger.info("Closed all pooled provider clients")
+
+# Create global provider client registry
+provider_clients = ProviderClientRegistry()
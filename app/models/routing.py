@@ -0,0 +1,488 @@
+"""
+Latency-aware routing and hedged requests across provider targets.
+
+A target is a (provider, model) pair. The router tracks an exponentially
+weighted moving average (EWMA) of latency and error rate per target, plus a
+window of recent latencies for percentile estimates. Requests for a model
+alias are sent to the fastest healthy target the client may use. When
+hedging is enabled and the first call takes longer than the target's p95
+latency, a duplicate call is sent to the next best target and whichever
+call loses is cancelled.
+
+Targets whose circuit breaker is open are skipped, and calls that fail
+because their provider is unhealthy fail over to the next candidate or to
+the configured fallback targets. This also applies to chat completions
+passed through to the providers, which are not hedged.
+"""
+import time
+import asyncio
+import logging
+from collections import deque
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Sequence, Set, Tuple
+
+import httpx
+
+from app.core.config import settings
+from app.core import metrics
+from app.models.circuit_breaker import CircuitOpenError, Target, circuit_breakers, is_provider_failure
+from app.models.llm import get_model
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+class TargetStats:
+    """Latency and error statistics for a routing target."""
+    
+    __slots__ = ("latency", "error_rate", "samples", "requests", "errors", "last_error")
+    
+    def __init__(self, window: int):
+        """Initialize empty statistics.
+        
+        Args:
+            window: Number of recent latencies kept for percentile estimates
+        """
+        self.latency: Optional[float] = None
+        self.error_rate = 0.0
+        self.samples: deque = deque(maxlen=window)
+        self.requests = 0
+        self.errors = 0
+        self.last_error = 0.0
+    
+    def record(self, latency: float, error: bool, alpha: float) -> None:
+        """Record the outcome of a call.
+        
+        Args:
+            latency: Call latency in seconds
+            error: Whether the call failed
+            alpha: EWMA smoothing factor
+        """
+        self.requests += 1
+        self.error_rate += alpha * (float(error) - self.error_rate)
+        if error:
+            self.errors += 1
+            self.last_error = time.monotonic()
+            return
+        self.samples.append(latency)
+        self.latency = latency if self.latency is None else self.latency + alpha * (latency - self.latency)
+    
+    def percentile(self, q: float) -> Optional[float]:
+        """Get a percentile of the recent latencies.
+        
+        Args:
+            q: Percentile between 0 and 100
+        
+        Returns:
+            Optional[float]: Latency in seconds, or None without samples
+        """
+        if not self.samples:
+            return None
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * q / 100))]
+
+
+class Router:
+    """Routes generations to the fastest healthy target and hedges slow calls."""
+    
+    def __init__(self):
+        """Initialize the router."""
+        self._stats: Dict[Target, TargetStats] = {}
+        # Calls cancelled because another call of their hedge race won
+        self._hedge_losers: Set[asyncio.Task] = set()
+        self.hedges = 0
+        self.hedge_wins = 0
+    
+    def stats(self, target: Target) -> TargetStats:
+        """Get the statistics for a target, creating them on first use.
+        
+        Args:
+            target: (provider, model) pair
+        
+        Returns:
+            TargetStats: Target statistics
+        """
+        stats = self._stats.get(target)
+        if stats is None:
+            stats = self._stats[target] = TargetStats(settings.ROUTING_LATENCY_WINDOW)
+        return stats
+    
+    def resolve(self, alias: str, allowed_providers: Sequence[str], provider: Optional[str] = None) -> List[Target]:
+        """Get the targets a model alias may be routed to.
+        
+        Args:
+            alias: Model alias from MODEL_ALIASES
+            allowed_providers: Providers the client may use
+            provider: Provider requested explicitly, if any
+        
+        Returns:
+            List[Target]: Candidate targets, empty if the client may use none of them
+        """
+        targets = []
+        for entry in settings.MODEL_ALIASES.get(alias, []):
+            target_provider, _, target_model = entry.partition("/")
+            if target_provider in allowed_providers and (provider is None or target_provider == provider):
+                targets.append((target_provider, target_model))
+        return targets
+    
+    def _is_healthy(self, stats: TargetStats) -> bool:
+        """Check whether a target's error rate allows sending it traffic."""
+        if stats.error_rate < settings.ROUTING_MAX_ERROR_RATE:
+            return True
+        # Let an unhealthy target take a probe request once in a while so it can recover
+        return time.monotonic() - stats.last_error >= settings.ROUTING_PROBE_INTERVAL
+    
+    def rank(self, targets: Sequence[Target]) -> List[Target]:
+        """Order targets from best to worst.
+        
+        Healthy targets come first, ordered by EWMA latency. Targets without
+        latency samples sort first so they get measured.
+        
+        Args:
+            targets: Candidate targets
+        
+        Returns:
+            List[Target]: Targets, best first
+        """
+        def score(target: Target) -> Tuple[bool, float]:
+            stats = self.stats(target)
+            return (not self._is_healthy(stats), stats.latency or 0.0)
+        
+        return sorted(targets, key=score)
+    
+    def hedge_delay(self, target: Target) -> Optional[float]:
+        """Get how long to wait for a target before sending a hedged request.
+        
+        Args:
+            target: Primary target
+        
+        Returns:
+            Optional[float]: Delay in seconds, or None if there are too few samples to estimate it
+        """
+        if settings.HEDGE_DELAY is not None:
+            return settings.HEDGE_DELAY
+        stats = self.stats(target)
+        if len(stats.samples) < settings.HEDGE_MIN_SAMPLES:
+            return None
+        return max(stats.percentile(settings.HEDGE_PERCENTILE), settings.HEDGE_MIN_DELAY)
+    
+    async def _call(self, target: Target, prompt: str, temperature: float, max_tokens: int) -> Dict[str, Any]:
+        """Generate text with one target and record the outcome.
+        
+        A call cancelled because it lost a hedge race records its elapsed
+        time, or the target's EWMA latency if that is higher, since the call
+        would have taken at least that long. A call cancelled because its
+        caller went away records nothing.
+        
+        Raises:
+            CircuitOpenError: If the target's circuit is open
+        """
+        breaker = circuit_breakers.get(target)
+        breaker.acquire()
+        stats = self.stats(target)
+        provider, model = target
+        metrics.PROVIDER_IN_FLIGHT.inc((provider,))
+        start = time.perf_counter()
+        try:
+            response = await get_model(*target).generate(prompt=prompt, temperature=temperature, max_tokens=max_tokens)
+        except asyncio.CancelledError:
+            elapsed = time.perf_counter() - start
+            task = asyncio.current_task()
+            if task in self._hedge_losers:
+                self._hedge_losers.discard(task)
+                stats.record(max(elapsed, stats.latency or 0.0), False, settings.ROUTING_EWMA_ALPHA)
+            breaker.release()
+            metrics.PROVIDER_SECONDS.observe(elapsed, (provider, model, "cancelled"))
+            raise
+        except Exception as e:
+            elapsed = time.perf_counter() - start
+            failure = is_provider_failure(e)
+            stats.record(elapsed, failure, settings.ROUTING_EWMA_ALPHA)
+            if failure:
+                breaker.record_failure()
+            else:
+                breaker.record_success()
+            metrics.PROVIDER_SECONDS.observe(elapsed, (provider, model, "error"))
+            raise
+        finally:
+            metrics.PROVIDER_IN_FLIGHT.dec((provider,))
+        elapsed = time.perf_counter() - start
+        stats.record(elapsed, False, settings.ROUTING_EWMA_ALPHA)
+        breaker.record_success()
+        metrics.PROVIDER_SECONDS.observe(elapsed, (provider, model, "ok"))
+        usage = response.get("usage")
+        if usage:
+            metrics.PROVIDER_TOKENS.inc((provider, model, "prompt"), usage.get("prompt_tokens", 0))
+            metrics.PROVIDER_TOKENS.inc((provider, model, "completion"), usage.get("completion_tokens", 0))
+        return response
+    
+    def fallbacks(self, target: Target, allowed_providers: Sequence[str]) -> List[Target]:
+        """Get the configured fallback targets for a target.
+        
+        Fallbacks are looked up in FALLBACK_TARGETS under "provider/model",
+        then under "provider".
+        
+        Args:
+            target: (provider, model) pair
+            allowed_providers: Providers the client may use
+        
+        Returns:
+            List[Target]: Fallback targets on the client's providers
+        """
+        provider, model = target
+        entries = settings.FALLBACK_TARGETS.get(f"{provider}/{model}", []) + settings.FALLBACK_TARGETS.get(provider, [])
+        fallbacks = []
+        for entry in entries:
+            fallback_provider, _, fallback_model = entry.partition("/")
+            fallback = (fallback_provider, fallback_model)
+            if fallback_provider in allowed_providers and fallback != target and fallback not in fallbacks:
+                fallbacks.append(fallback)
+        return fallbacks
+    
+    def candidates(self, targets: Sequence[Target], fallbacks: Sequence[Target] = ()) -> List[Target]:
+        """Get the targets a call may go to, in the order they should be tried.
+        
+        Args:
+            targets: Targets of the request
+            fallbacks: Targets to use only after the request's targets
+        
+        Returns:
+            List[Target]: Ranked targets followed by fallbacks, without open circuits
+        """
+        ordered = self.rank(targets) + [target for target in fallbacks if target not in targets]
+        return [target for target in ordered if circuit_breakers.get(target).available()]
+    
+    async def _attempt(self, candidates: List[Target], prompt: str, temperature: float, max_tokens: int, hedge: bool) -> Dict[str, Any]:
+        """Generate text with the first candidate, hedging with the next one if the call is slow.
+        
+        Candidates that were called are removed from the list.
+        """
+        target = candidates.pop(0)
+        primary = asyncio.ensure_future(self._call(target, prompt, temperature, max_tokens))
+        delay = self.hedge_delay(target) if hedge else None
+        if delay is None:
+            return await primary
+        
+        backup = None
+        try:
+            done, _ = await asyncio.wait({primary}, timeout=delay)
+            if done:
+                return primary.result()
+            
+            # The primary is slower than its p95, race it against the next best target
+            backup_target = candidates.pop(0) if candidates else target
+            backup = asyncio.ensure_future(self._call(backup_target, prompt, temperature, max_tokens))
+            self.hedges += 1
+            logger.debug(f"Hedging {target} after {delay:.3f}s with {backup_target}")
+            
+            pending = {primary, backup}
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                winner = next((task for task in done if not task.cancelled() and task.exception() is None), None)
+                if winner is not None:
+                    if winner is backup:
+                        self.hedge_wins += 1
+                    # The other call lost the race rather than being abandoned by the caller
+                    self._hedge_losers.update(task for task in pending if not task.done())
+                    return winner.result()
+            # Both calls failed
+            return primary.result()
+        finally:
+            for task in (primary, backup):
+                if task is not None and not task.done():
+                    task.cancel()
+    
+    async def generate(
+        self,
+        targets: Sequence[Target],
+        prompt: str,
+        temperature: float,
+        max_tokens: int,
+        hedge: Optional[bool] = None,
+        fallbacks: Sequence[Target] = (),
+    ) -> Dict[str, Any]:
+        """Generate text with the best target, hedging if the call is slow.
+        
+        Targets with open circuits are skipped. If a call fails because its
+        provider is unhealthy, the next candidate is tried.
+        
+        Args:
+            targets: Candidate targets
+            prompt: The prompt to generate text from
+            temperature: Controls randomness
+            max_tokens: Maximum number of tokens to generate
+            hedge: Whether to send a hedged request (defaults to HEDGE_ENABLED)
+            fallbacks: Targets to try after the candidate targets
+        
+        Returns:
+            Dict[str, Any]: Generated text and metadata of the first call to succeed
+        
+        Raises:
+            CircuitOpenError: If every target's circuit is open
+            Exception: The last error if no call succeeds
+        """
+        if hedge is None:
+            hedge = settings.HEDGE_ENABLED
+        candidates = self.candidates(targets, fallbacks)
+        if not candidates:
+            raise circuit_breakers.open_error(list(targets) + list(fallbacks))
+        
+        error = None
+        while candidates:
+            try:
+                return await self._attempt(candidates, prompt, temperature, max_tokens, hedge)
+            except CircuitOpenError as e:
+                error = error or e
+            except Exception as e:
+                if not is_provider_failure(e):
+                    raise
+                error = e
+                if candidates:
+                    logger.warning(f"Failing over to {candidates[0]} after error: {e}")
+        raise error
+    
+    async def start_stream(
+        self,
+        targets: Sequence[Target],
+        prompt: str,
+        temperature: float,
+        max_tokens: int,
+        fallbacks: Sequence[Target] = (),
+    ) -> Tuple[Dict[str, Any], AsyncIterator[Dict[str, Any]]]:
+        """Start a stream with the best target whose first event arrives.
+        
+        Args:
+            targets: Candidate targets
+            prompt: The prompt to generate text from
+            temperature: Controls randomness
+            max_tokens: Maximum number of tokens to generate
+            fallbacks: Targets to try after the candidate targets
+        
+        Returns:
+            Tuple[Dict[str, Any], AsyncIterator[Dict[str, Any]]]: First event and the remaining events
+        
+        Raises:
+            CircuitOpenError: If every target's circuit is open
+            Exception: The last error if no stream starts
+        """
+        candidates = self.candidates(targets, fallbacks)
+        if not candidates:
+            raise circuit_breakers.open_error(list(targets) + list(fallbacks))
+        
+        error = None
+        for target in candidates:
+            breaker = circuit_breakers.get(target)
+            try:
+                breaker.acquire()
+            except CircuitOpenError as e:
+                error = error or e
+                continue
+            
+            events = get_model(*target).generate_stream(prompt=prompt, temperature=temperature, max_tokens=max_tokens)
+            try:
+                first = await events.__anext__()
+            except asyncio.CancelledError:
+                breaker.release()
+                await events.aclose()
+                raise
+            except Exception as e:
+                # Release the stream's connection before trying the next target
+                await events.aclose()
+                if not is_provider_failure(e):
+                    breaker.record_success()
+                    raise
+                breaker.record_failure()
+                error = e
+                continue
+            breaker.record_success()
+            return first, events
+        raise error
+    
+    async def start_chat(
+        self,
+        targets: Sequence[Target],
+        encode: Callable[[Target], bytes],
+        fallbacks: Sequence[Target] = (),
+    ) -> Tuple[Target, httpx.Response]:
+        """Send a chat completions request to the best target whose response starts.
+        
+        Responses with a 429 or 5xx status fail over to the next candidate.
+        If every candidate fails, the last failed response is returned so its
+        error reaches the client unchanged.
+        
+        Args:
+            targets: Candidate targets
+            encode: Function that encodes the request body for a target
+            fallbacks: Targets to try after the candidate targets
+        
+        Returns:
+            Tuple[Target, httpx.Response]: Target and its response, with an unread body
+        
+        Raises:
+            CircuitOpenError: If every target's circuit is open
+            Exception: The last error if no call gets a response
+        """
+        candidates = self.candidates(targets, fallbacks)
+        if not candidates:
+            raise circuit_breakers.open_error(list(targets) + list(fallbacks))
+        
+        error = None
+        failed = None
+        for target in candidates:
+            breaker = circuit_breakers.get(target)
+            try:
+                breaker.acquire()
+            except CircuitOpenError as e:
+                error = error or e
+                continue
+            
+            try:
+                response = await get_model(*target).chat_completions(encode(target))
+            except asyncio.CancelledError:
+                breaker.release()
+                raise
+            except Exception as e:
+                if not is_provider_failure(e):
+                    breaker.record_success()
+                    raise
+                breaker.record_failure()
+                error = e
+                continue
+            if response.status_code == 429 or response.status_code >= 500:
+                breaker.record_failure()
+                if failed is not None:
+                    await failed[1].aclose()
+                failed = (target, response)
+                continue
+            breaker.record_success()
+            if failed is not None:
+                await failed[1].aclose()
+            return target, response
+        if failed is not None:
+            return failed
+        raise error
+    
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        """Get the statistics of every target.
+        
+        Returns:
+            Dict[str, Dict[str, Any]]: Statistics keyed by "provider/model"
+        """
+        return {
+            f"{provider}/{model}": {
+                "latency": stats.latency,
+                "p95": stats.percentile(95),
+                "error_rate": stats.error_rate,
+                "requests": stats.requests,
+                "errors": stats.errors,
+                "healthy": self._is_healthy(stats),
+            }
+            for (provider, model), stats in self._stats.items()
+        }
+    
+    def reset(self) -> None:
+        """Forget all target statistics."""
+        self._stats = {}
+        self.hedges = 0
+        self.hedge_wins = 0
+
+# Create global model router
+model_router = Router()
@@ -0,0 +1,299 @@
+"""
+Local token counting for requests before they are sent upstream.
+
+Each model is mapped to a tokenizer family and a context window by a
+registry of model name prefixes. Prompt tokens are counted with tiktoken
+when it is installed and the model uses one of its encodings, and otherwise
+estimated from the text's length: ASCII characters count as a fraction of a
+token according to the family's average characters per token, and every
+extra UTF-8 byte of other characters as half a token, which matches how
+byte-level tokenizers split non-Latin scripts.
+
+Exact counts are memoized per text segment (a message or a prompt), so a
+long system prompt resent with every request is only encoded once. The
+memo is keyed by a digest of the segment, so it does not keep prompts in
+memory.
+"""
+import math
+import hashlib
+import logging
+from collections import OrderedDict
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+from app.core.config import settings
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Tokens added by the chat format for each message and to prime the reply
+MESSAGE_OVERHEAD_TOKENS = 3
+REPLY_OVERHEAD_TOKENS = 3
+
+class ModelInfo(NamedTuple):
+    """Tokenizer family and context window of a model."""
+    encoding: str
+    context_window: Optional[int]
+
+# Average characters per token of English text for each tokenizer family
+ENCODING_CHARS_PER_TOKEN = {
+    "o200k_base": 4.2,
+    "cl100k_base": 4.0,
+    "llama3": 4.0,
+    "mistral": 3.5,
+    "gemma": 4.0,
+}
+
+# Model name prefixes, matched longest first
+MODEL_REGISTRY: Dict[str, ModelInfo] = {
+    "gpt-4o": ModelInfo("o200k_base", 128000),
+    "gpt-4.1": ModelInfo("o200k_base", 1047576),
+    "o1": ModelInfo("o200k_base", 200000),
+    "o3": ModelInfo("o200k_base", 200000),
+    "o4-mini": ModelInfo("o200k_base", 200000),
+    "gpt-4-turbo": ModelInfo("cl100k_base", 128000),
+    "gpt-4-32k": ModelInfo("cl100k_base", 32768),
+    "gpt-4": ModelInfo("cl100k_base", 8192),
+    "gpt-3.5-turbo-instruct": ModelInfo("cl100k_base", 4096),
+    "gpt-3.5-turbo": ModelInfo("cl100k_base", 16385),
+    "llama3-8b-8192": ModelInfo("llama3", 8192),
+    "llama3-70b-8192": ModelInfo("llama3", 8192),
+    "llama-3.1-8b-instant": ModelInfo("llama3", 131072),
+    "llama-3.3-70b-versatile": ModelInfo("llama3", 131072),
+    "mixtral-8x7b-32768": ModelInfo("mistral", 32768),
+    "gemma2-9b-it": ModelInfo("gemma", 8192),
+}
+
+# Used for models not in the registry; their context window is unknown
+UNKNOWN_MODEL = ModelInfo("unknown", None)
+DEFAULT_CHARS_PER_TOKEN = 3.5
+
+class Tokenizer:
+    """Base class for prompt token counters."""
+    
+    # Whether counts are worth memoizing, i.e. counting costs more than a lookup
+    memoize: bool = False
+    
+    def count(self, text: str) -> int:
+        """Count the tokens of a text.
+        
+        Args:
+            text: Text to count
+        
+        Returns:
+            int: Number of tokens
+        """
+        raise NotImplementedError("Subclasses must implement count method")
+
+
+class HeuristicTokenizer(Tokenizer):
+    """Estimates token counts from text length."""
+    
+    def __init__(self, chars_per_token: float = DEFAULT_CHARS_PER_TOKEN):
+        """Initialize the tokenizer.
+        
+        Args:
+            chars_per_token: Average characters per token of ASCII text
+        """
+        self.chars_per_token = chars_per_token
+    
+    def count(self, text: str) -> int:
+        """Estimate the tokens of a text.
+        
+        Args:
+            text: Text to count
+        
+        Returns:
+            int: Estimated number of tokens
+        """
+        length = len(text)
+        # str.isascii() is constant time, so ASCII text is counted without scanning it
+        if text.isascii():
+            return math.ceil(length / self.chars_per_token)
+        extra_bytes = len(text.encode("utf-8", "surrogatepass")) - length
+        return math.ceil(length / self.chars_per_token + extra_bytes / 2)
+
+
+class TiktokenTokenizer(Tokenizer):
+    """Counts tokens exactly with a tiktoken encoding."""
+    
+    memoize = True
+    
+    def __init__(self, encoding: str):
+        """Initialize the tokenizer.
+        
+        Args:
+            encoding: tiktoken encoding name
+        """
+        self.encoding = tiktoken.get_encoding(encoding)
+    
+    def count(self, text: str) -> int:
+        """Count the tokens of a text.
+        
+        Args:
+            text: Text to count
+        
+        Returns:
+            int: Number of tokens
+        """
+        return len(self.encoding.encode_ordinary(text))
+
+
+def create_tokenizer(encoding: str) -> Tokenizer:
+    """Create the tokenizer for a tokenizer family.
+    
+    Args:
+        encoding: Tokenizer family from the model registry
+    
+    Returns:
+        Tokenizer: tiktoken tokenizer if available for the family, otherwise a heuristic one
+    """
+    if tiktoken is not None and encoding in ("o200k_base", "cl100k_base"):
+        try:
+            return TiktokenTokenizer(encoding)
+        except Exception as e:
+            # Encodings are downloaded on first use, which fails without network access
+            logger.warning(f"Could not load tiktoken encoding {encoding}, estimating token counts: {e}")
+    chars_per_token = ENCODING_CHARS_PER_TOKEN.get(encoding, DEFAULT_CHARS_PER_TOKEN)
+    return HeuristicTokenizer(chars_per_token / settings.TOKEN_ESTIMATE_SCALE)
+
+
+class TokenCounter:
+    """Counts prompt tokens per model, memoizing the counts of repeated segments."""
+    
+    def __init__(self, max_entries: int = 4096, min_chars: int = 256):
+        """Initialize the counter.
+        
+        Args:
+            max_entries: Maximum number of memoized segment counts
+            min_chars: Minimum segment length worth memoizing
+        """
+        self.max_entries = max_entries
+        self.min_chars = min_chars
+        self._models: Dict[str, Tuple[Tokenizer, Optional[int]]] = {}
+        self._tokenizers: Dict[str, Tokenizer] = {}
+        # (tokenizer, segment digest) -> token count
+        self._segments: "OrderedDict[Tuple[Tokenizer, bytes], int]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+    
+    def _model(self, model: str) -> Tuple[Tokenizer, Optional[int]]:
+        """Look up a model's tokenizer and context window.
+        
+        Args:
+            model: Model name
+        
+        Returns:
+            Tuple[Tokenizer, Optional[int]]: Tokenizer and context window, None if unknown
+        """
+        entry = self._models.get(model)
+        if entry is None:
+            info = UNKNOWN_MODEL
+            for prefix in sorted(MODEL_REGISTRY, key=len, reverse=True):
+                if model.startswith(prefix):
+                    info = MODEL_REGISTRY[prefix]
+                    break
+            tokenizer = self._tokenizers.get(info.encoding)
+            if tokenizer is None:
+                tokenizer = self._tokenizers[info.encoding] = create_tokenizer(info.encoding)
+            context_window = settings.MODEL_CONTEXT_WINDOWS.get(model, info.context_window)
+            entry = self._models[model] = (tokenizer, context_window)
+        return entry
+    
+    def context_window(self, model: str) -> Optional[int]:
+        """Get a model's context window.
+        
+        Args:
+            model: Model name
+        
+        Returns:
+            Optional[int]: Context window in tokens, or None if unknown
+        """
+        return self._model(model)[1]
+    
+    def _count(self, tokenizer: Tokenizer, text: str) -> int:
+        """Count a segment's tokens, memoizing the count of long segments.
+        
+        Args:
+            tokenizer: Tokenizer to count with
+            text: Segment text
+        
+        Returns:
+            int: Number of tokens
+        """
+        if not tokenizer.memoize or len(text) < self.min_chars:
+            return tokenizer.count(text)
+        memo_key = (tokenizer, hashlib.blake2b(text.encode(), digest_size=16).digest())
+        count = self._segments.get(memo_key)
+        if count is not None:
+            self._segments.move_to_end(memo_key)
+            self.hits += 1
+            return count
+        self.misses += 1
+        count = self._segments[memo_key] = tokenizer.count(text)
+        if len(self._segments) > self.max_entries:
+            self._segments.popitem(last=False)
+        return count
+    
+    def count(self, model: str, text: str) -> int:
+        """Count the tokens of a prompt.
+        
+        Args:
+            model: Model name
+            text: Prompt text
+        
+        Returns:
+            int: Number of tokens
+        """
+        tokenizer, _ = self._model(model)
+        return self._count(tokenizer, text)
+    
+    def count_messages(self, model: str, messages: List[Dict[str, Any]]) -> int:
+        """Count the prompt tokens of chat messages, including the chat format overhead.
+        
+        Args:
+            model: Model name
+            messages: Chat messages
+        
+        Returns:
+            int: Number of tokens
+        """
+        tokenizer, _ = self._model(model)
+        total = REPLY_OVERHEAD_TOKENS
+        for message in messages:
+            total += MESSAGE_OVERHEAD_TOKENS
+            content = message.get("content")
+            if isinstance(content, str):
+                total += self._count(tokenizer, content)
+            elif isinstance(content, list):
+                # Only text parts are counted; images and audio are left to the provider
+                for part in content:
+                    if isinstance(part, dict) and isinstance(part.get("text"), str):
+                        total += self._count(tokenizer, part["text"])
+            name = message.get("name")
+            if isinstance(name, str):
+                total += tokenizer.count(name) + 1
+        return total
+    
+    def stats(self) -> Dict[str, int]:
+        """Get the memo counters.
+        
+        Returns:
+            Dict[str, int]: Memoized segments, hits and misses
+        """
+        return {"entries": len(self._segments), "hits": self.hits, "misses": self.misses}
+    
+    def clear(self) -> None:
+        """Forget memoized counts, looked up models and tokenizers."""
+        self._models.clear()
+        self._tokenizers.clear()
+        self._segments.clear()
+        self.hits = 0
+        self.misses = 0
+
+# Create global token counter
+token_counter = TokenCounter(settings.TOKEN_CACHE_MAX_ENTRIES, settings.TOKEN_CACHE_MIN_CHARS)
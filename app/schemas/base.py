@@ -6,14 +6,45 @@ class GenerateRequest(BaseModel):
     prompt: str = Field(..., description="The prompt to generate text from")
     temperature: float = Field(0.7, ge=0, le=1, description="Controls randomness. Lower values make responses more deterministic")
     max_tokens: int = Field(150, gt=0, description="Maximum number of tokens to generate")
-    provider: Optional[Literal["openai", "groq"]] = Field(None, description="The provider to use for generation")
+    provider: Optional[Literal["openai", "groq", "triton"]] = Field(None, description="The provider to use for generation")
     model: Optional[str] = Field(None, description="The model to use for generation")
+    stream: bool = Field(False, description="Stream the generated text as server-sent events")
+    cache: Optional[bool] = Field(None, description="Use the response cache. By default only deterministic (temperature 0) requests are cached")
 
 class GenerateResponse(BaseModel):
     """Schema for text generation response."""
     text: str = Field(..., description="The generated text")
     model: str = Field(..., description="The model used for generation")
     usage: Optional[Dict[str, int]] = Field(None, description="Token usage information")
+    cached: bool = Field(False, description="Whether the response was served from the cache")
+
+class BatchGenerateRequest(BaseModel):
+    """Schema for a batch of text generation requests."""
+    requests: List[GenerateRequest] = Field(..., min_length=1, description="Generation requests, run concurrently")
+
+class BatchItemResult(BaseModel):
+    """Schema for one line of a batch generation response."""
+    index: int = Field(..., description="Position of the request in the batch")
+    status: int = Field(..., description="HTTP status code of the request")
+    response: Optional[GenerateResponse] = Field(None, description="Generated text, for successful requests")
+    detail: Optional[str] = Field(None, description="Error details, for failed requests")
+
+class JobRequest(BaseModel):
+    """Schema for submitting a generation job."""
+    requests: List[GenerateRequest] = Field(..., min_length=1, description="Generation requests, run as a batch")
+    priority: int = Field(0, ge=0, le=9, description="Jobs with a higher priority run before the client's other jobs")
+
+class JobResponse(BaseModel):
+    """Schema for the status of a generation job."""
+    job_id: str = Field(..., description="Job ID")
+    status: Literal["queued", "running", "completed", "failed"] = Field(..., description="Job status")
+    priority: int = Field(..., description="Job priority")
+    attempts: int = Field(0, description="Number of times the job was started")
+    created_at: float = Field(..., description="Unix time the job was submitted")
+    started_at: Optional[float] = Field(None, description="Unix time the job was last started")
+    finished_at: Optional[float] = Field(None, description="Unix time the job finished")
+    results: Optional[List[BatchItemResult]] = Field(None, description="Result of each request, once the job has completed")
+    detail: Optional[str] = Field(None, description="Error details, if the job failed")
 
 class ClientAuth(BaseModel):
     """Schema for client authentication."""
@@ -30,12 +61,14 @@ class ClientConfig(BaseModel):
     client_id: str = Field(..., description="Client ID")
     name: str = Field(..., description="Client name")
     client_secret_hash: Optional[str] = Field(None, description="Hashed client secret")
-    allowed_providers: List[Literal["openai", "groq"]] = Field(..., description="List of allowed providers")
-    default_provider: Literal["openai", "groq"] = Field(..., description="Default provider")
+    allowed_providers: List[Literal["openai", "groq", "triton"]] = Field(..., description="List of allowed providers")
+    default_provider: Literal["openai", "groq", "triton"] = Field(..., description="Default provider")
     default_model: str = Field(..., description="Default model")
     max_tokens_limit: int = Field(..., gt=0, description="Maximum tokens limit")
     rate_limit: RateLimit = Field(..., description="Rate limiting configuration")
     allowed_endpoints: List[str] = Field(..., description="List of allowed endpoints")
+    response_cache_enabled: bool = Field(True, description="Whether the client's requests may be served from the response cache")
+    semantic_cache_threshold: Optional[float] = Field(None, ge=0, le=1, description="Minimum prompt similarity for semantic cache hits. Defaults to the gateway setting")
     created_at: str = Field(..., description="Creation timestamp")
     updated_at: str = Field(..., description="Last update timestamp")
 
@@ -48,3 +81,42 @@ class ReloadResponse(BaseModel):
     """Schema for client reload response."""
     message: str = Field(..., description="Response message")
     count: int = Field(..., description="Number of clients reloaded")
+
+class CacheStatsResponse(BaseModel):
+    """Schema for response cache statistics."""
+    hits: int = Field(..., description="Number of cache hits")
+    misses: int = Field(..., description="Number of cache misses")
+    evictions: int = Field(..., description="Number of entries evicted to stay within the size bound")
+    entries: int = Field(..., description="Number of cached responses")
+    size_bytes: int = Field(..., description="Approximate size of the cached responses in bytes")
+    max_bytes: int = Field(..., description="Maximum size of the cache in bytes")
+    semantic_hits: int = Field(0, description="Number of semantic cache hits")
+    semantic_misses: int = Field(0, description="Number of semantic cache misses")
+    semantic_entries: int = Field(0, description="Number of responses in the semantic cache")
+
+class CircuitState(BaseModel):
+    """Schema for the state of a provider target's circuit breaker."""
+    state: Literal["closed", "open", "half_open"] = Field(..., description="Circuit state")
+    failures: int = Field(..., description="Number of consecutive failures")
+    rejected: int = Field(..., description="Number of calls rejected while the circuit was open")
+    retry_after: float = Field(..., description="Seconds until the circuit lets a probe call through")
+
+class TargetRoutingStats(BaseModel):
+    """Schema for the routing statistics of a provider target."""
+    latency: Optional[float] = Field(None, description="Moving average latency in seconds")
+    p95: Optional[float] = Field(None, description="95th percentile of recent latencies in seconds")
+    error_rate: float = Field(..., description="Moving average error rate")
+    requests: int = Field(..., description="Number of calls")
+    errors: int = Field(..., description="Number of failed calls")
+    healthy: bool = Field(..., description="Whether the target receives traffic")
+
+class CircuitStatusResponse(BaseModel):
+    """Schema for circuit breaker status response."""
+    circuits: Dict[str, CircuitState] = Field(..., description="Circuit breaker state keyed by provider/model")
+    routing: Dict[str, TargetRoutingStats] = Field(..., description="Routing statistics keyed by provider/model")
+
+class TokenResponse(BaseModel):
+    """Schema for token response."""
+    access_token: str = Field(..., description="Signed bearer token")
+    token_type: str = Field("bearer", description="Token type")
+    expires_in: int = Field(..., description="Seconds until the token expires")
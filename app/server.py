@@ -0,0 +1,315 @@
+"""
+Production server: pre-forked uvicorn workers sharing one listening socket.
+
+The supervisor binds the socket and imports the application (settings,
+client registry, routes and their validators) once, then forks the
+workers, so that memory is shared between them copy-on-write. Objects
+created before the fork are moved out of the garbage collector's reach
+with gc.freeze(), since collections would otherwise write to every page
+holding them. Each worker runs the application lifespan itself, which
+opens provider clients, counters and database connections after the fork.
+
+uvloop and httptools are used when they are installed. On SIGTERM or
+SIGINT the workers stop accepting connections and finish the requests
+and streams in flight, for up to SERVER_GRACEFUL_TIMEOUT seconds, before
+running the lifespan shutdown. Workers that exit unexpectedly are
+replaced.
+
+Usage: python -m app.server [--host HOST] [--port PORT] [--workers N]
+
+Platforms without fork() run a single worker in the supervisor's process.
+"""
+import argparse
+import gc
+import os
+import select
+import shutil
+import signal
+import sys
+import tempfile
+import time
+import logging
+from typing import Dict, List, Optional
+
+import uvicorn
+from uvicorn.server import STARTUP_FAILURE
+
+try:
+    import uvloop
+except ImportError:
+    uvloop = None
+
+try:
+    import httptools
+except ImportError:
+    httptools = None
+
+from app.core.config import settings
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Seconds the workers get after the graceful timeout to run the lifespan shutdown
+SHUTDOWN_GRACE = 10.0
+
+# Workers that exit sooner than this after starting are replaced after the same delay
+RESPAWN_DELAY = 1.0
+
+def server_config(host: str, port: int) -> uvicorn.Config:
+    """Build the worker server configuration from the settings.
+    
+    Args:
+        host: Address to listen on
+        port: Port to listen on
+    
+    Returns:
+        uvicorn.Config: Server configuration
+    """
+    from app.main import app
+    
+    return uvicorn.Config(
+        app,
+        host=host,
+        port=port,
+        # auto picks uvloop and httptools when they are installed
+        loop=settings.SERVER_LOOP,
+        http=settings.SERVER_HTTP,
+        backlog=settings.SERVER_BACKLOG,
+        timeout_keep_alive=settings.SERVER_KEEPALIVE_TIMEOUT,
+        limit_concurrency=settings.SERVER_LIMIT_CONCURRENCY,
+        timeout_graceful_shutdown=settings.SERVER_GRACEFUL_TIMEOUT,
+        # Requests are already logged by the tracing middleware
+        access_log=settings.SERVER_ACCESS_LOG,
+        log_config=None,
+        lifespan="on",
+    )
+
+def prepare_fork() -> None:
+    """Release resources that must not be shared with forked workers.
+    
+    SQLite connections cannot be used across fork(); the stores open new
+    ones in each worker on first use.
+    """
+    from app.clients.auth import client_manager
+    from app.core.jobs import job_queue
+    
+    client_manager.store.close()
+    job_queue.close()
+
+
+class Supervisor:
+    """Forks the worker processes and replaces them when they exit."""
+    
+    def __init__(self, config: uvicorn.Config, workers: int, graceful_timeout: float):
+        """Initialize the supervisor.
+        
+        Args:
+            config: Worker server configuration
+            workers: Number of worker processes
+            graceful_timeout: Seconds the workers get to finish requests in flight on shutdown
+        """
+        self.config = config
+        self.workers = workers
+        self.graceful_timeout = graceful_timeout
+        # Start times of the running workers by process ID
+        self.children: Dict[int, float] = {}
+        self.stopping = False
+        self.failed = False
+        self._socket = None
+        self._wakeup: Optional[List[int]] = None
+        self._signals: List[int] = []
+    
+    def _handle_signal(self, sig: int, frame) -> None:
+        """Record a signal; the main loop acts on it."""
+        self._signals.append(sig)
+    
+    def _spawn(self) -> None:
+        """Fork a worker process."""
+        pid = os.fork()
+        if pid:
+            self.children[pid] = time.monotonic()
+            return
+        
+        # In the worker: restore signal handling and collect garbage again
+        exit_code = 0
+        try:
+            signal.set_wakeup_fd(-1)
+            for fd in self._wakeup:
+                os.close(fd)
+            signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+            # The server handles these while it runs and raises them again once drained; ignore them then
+            signal.signal(signal.SIGTERM, signal.SIG_IGN)
+            signal.signal(signal.SIGINT, signal.SIG_IGN)
+            gc.enable()
+            server = uvicorn.Server(self.config)
+            server.run(sockets=[self._socket])
+            if not server.started:
+                exit_code = STARTUP_FAILURE
+        except SystemExit as e:
+            exit_code = e.code if isinstance(e.code, int) else 1
+        except BaseException:
+            logger.exception(f"Worker {os.getpid()} crashed")
+            exit_code = 1
+        finally:
+            logging.shutdown()
+            os._exit(exit_code)
+    
+    def _reap(self) -> None:
+        """Collect exited workers and replace them unless shutting down."""
+        while self.children:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                self.children.clear()
+                return
+            if pid == 0:
+                return
+            started = self.children.pop(pid, None)
+            if started is None:
+                continue
+            exit_code = os.waitstatus_to_exitcode(status)
+            if self.stopping:
+                logger.info(f"Worker {pid} exited with code {exit_code}")
+            elif exit_code == STARTUP_FAILURE:
+                # A worker that cannot start would fail again; give up instead of forking in a loop
+                logger.error(f"Worker {pid} failed to start, shutting down")
+                self.failed = True
+                self.stop()
+            else:
+                lifetime = time.monotonic() - started
+                logger.error(f"Worker {pid} exited unexpectedly with code {exit_code} after {lifetime:.1f}s")
+                if lifetime < RESPAWN_DELAY:
+                    time.sleep(RESPAWN_DELAY)
+        if not self.stopping:
+            while len(self.children) < self.workers:
+                self._spawn()
+    
+    def _wait(self, timeout: float) -> None:
+        """Wait for a signal, handling the ones received.
+        
+        Args:
+            timeout: Maximum seconds to wait
+        """
+        try:
+            select.select([self._wakeup[0]], [], [], timeout)
+            while os.read(self._wakeup[0], 512):
+                pass
+        except (BlockingIOError, InterruptedError):
+            pass
+        while self._signals:
+            sig = self._signals.pop(0)
+            if sig in (signal.SIGTERM, signal.SIGINT):
+                if self.stopping:
+                    # A second signal skips the rest of the graceful shutdown
+                    self.kill(signal.SIGINT)
+                else:
+                    logger.info(f"Received {signal.Signals(sig).name}, draining workers")
+                    self.stop()
+        self._reap()
+    
+    def kill(self, sig: int) -> None:
+        """Send a signal to every worker.
+        
+        Args:
+            sig: Signal to send
+        """
+        for pid in list(self.children):
+            try:
+                os.kill(pid, sig)
+            except ProcessLookupError:
+                pass
+    
+    def stop(self) -> None:
+        """Ask the workers to finish their requests and exit."""
+        if not self.stopping:
+            self.stopping = True
+            self.kill(signal.SIGTERM)
+    
+    def run(self, sock) -> int:
+        """Fork the workers and supervise them until they are stopped.
+        
+        Args:
+            sock: Bound listening socket shared by the workers
+        
+        Returns:
+            int: Exit code
+        """
+        self._socket = sock
+        # Signals wake the main loop through a pipe, so none is missed between checks
+        self._wakeup = list(os.pipe())
+        for fd in self._wakeup:
+            os.set_blocking(fd, False)
+        signal.set_wakeup_fd(self._wakeup[1])
+        for sig in (signal.SIGTERM, signal.SIGINT, signal.SIGCHLD):
+            signal.signal(sig, self._handle_signal)
+        
+        # Freeze the objects created so far so the workers' collections leave their pages shared
+        gc.freeze()
+        logger.info(f"Starting {self.workers} workers (supervisor {os.getpid()})")
+        self._reap()
+        
+        while not self.stopping:
+            self._wait(1.0)
+        
+        deadline = time.monotonic() + self.graceful_timeout + SHUTDOWN_GRACE
+        while self.children and time.monotonic() < deadline:
+            self._wait(min(1.0, deadline - time.monotonic()))
+        if self.children:
+            logger.warning(f"Killing {len(self.children)} workers that did not exit in time")
+            self.kill(signal.SIGKILL)
+            while self.children:
+                self._wait(0.1)
+        sock.close()
+        return 1 if self.failed else 0
+
+
+def main(argv: List[str]) -> int:
+    """Run the production server.
+    
+    Args:
+        argv: Command line arguments
+    
+    Returns:
+        int: Exit code
+    """
+    parser = argparse.ArgumentParser(prog="python -m app.server", description="Run the gateway with pre-forked workers.")
+    parser.add_argument("--host", default=settings.SERVER_HOST, help="address to listen on")
+    parser.add_argument("--port", type=int, default=settings.SERVER_PORT, help="port to listen on")
+    parser.add_argument("--workers", type=int, default=settings.SERVER_WORKERS, help="worker processes (default: CPU count)")
+    args = parser.parse_args(argv)
+    workers = args.workers or os.cpu_count() or 1
+    
+    # Keep garbage collection off while preloading so the shared pages are not left with holes
+    gc.disable()
+    
+    # Workers report metrics through a shared directory and need shared rate limit counters
+    metrics_dir = None
+    if workers > 1 and settings.METRICS_ENABLED and not settings.METRICS_MULTIPROC_DIR:
+        metrics_dir = settings.METRICS_MULTIPROC_DIR = tempfile.mkdtemp(prefix="dsp_ai_gateway_metrics_")
+    if workers > 1 and settings.RATE_LIMIT_ENABLED and settings.RATE_LIMIT_BACKEND == "memory":
+        logger.warning("RATE_LIMIT_BACKEND is memory, so each worker enforces the rate limits separately")
+    
+    # Preload the application before forking
+    config = server_config(args.host, args.port)
+    config.load()
+    loop = settings.SERVER_LOOP if settings.SERVER_LOOP != "auto" else ("uvloop" if uvloop is not None else "asyncio")
+    http = settings.SERVER_HTTP if settings.SERVER_HTTP != "auto" else ("httptools" if httptools is not None else "h11")
+    logger.info(f"Loaded the application; workers use the {loop} event loop and the {http} HTTP parser")
+    
+    try:
+        if not hasattr(os, "fork"):
+            logger.warning("fork() is not available, running a single worker")
+            gc.enable()
+            server = uvicorn.Server(config)
+            server.run()
+            return 0 if server.started else 1
+        
+        prepare_fork()
+        sock = config.bind_socket()
+        return Supervisor(config, workers, settings.SERVER_GRACEFUL_TIMEOUT).run(sock)
+    finally:
+        if metrics_dir is not None:
+            shutil.rmtree(metrics_dir, ignore_errors=True)
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,73 @@
+"""
+Benchmark for client authentication.
+
+Measures the cost per request of each way a request can be authenticated:
+client ID and secret against a SHA-256 or scrypt hash (with and without the
+verified secret cache) and signed bearer tokens (first use and repeated use).
+
+Usage:
+    python -m benchmarks.bench_auth [iterations]
+"""
+import sys
+import time
+
+from app.core.config import settings
+from app.clients.auth import ClientManager
+from app.clients.secrets import hash_secret
+from app.clients.tokens import token_service
+from app.clients.registry import ClientRecord
+from app.schemas.base import ClientConfig, RateLimit
+
+SECRET = "bench-secret"
+
+def bench_config(scheme: str) -> ClientConfig:
+    """Build a client configuration with the secret hashed using a scheme."""
+    return ClientConfig(
+        client_id=f"bench_{scheme}",
+        name="Benchmark Client",
+        client_secret_hash=hash_secret(SECRET, scheme),
+        allowed_providers=["openai", "groq"],
+        default_provider="openai",
+        default_model="gpt-4o-mini",
+        max_tokens_limit=2000,
+        rate_limit=RateLimit(requests_per_minute=600, tokens_per_day=1000000),
+        allowed_endpoints=["generate"],
+        created_at="2025-01-01T00:00:00Z",
+        updated_at="2025-01-01T00:00:00Z",
+    )
+
+def measure(label: str, operation, iterations: int) -> None:
+    """Run an operation and print its cost per call."""
+    operation()
+    start = time.perf_counter_ns()
+    for _ in range(iterations):
+        operation()
+    elapsed = time.perf_counter_ns() - start
+    print(f"{label:<32} {elapsed / iterations / 1000:10.1f} us/request")
+
+def bench(iterations: int = 20000) -> None:
+    """Run the benchmark and print the cost of each authentication mode."""
+    manager = ClientManager()
+    records = [ClientRecord.from_config(bench_config(scheme)) for scheme in ("sha256", "scrypt")]
+    manager.clients = {record.client_id: record for record in records}
+    settings.JWT_SECRET = "bench-signing-secret"
+    token_service.reset()
+    token, _ = token_service.issue(manager.clients["bench_scrypt"])
+    
+    def uncached(client_id):
+        manager.secret_cache.clear()
+        manager.authenticate_client(client_id, SECRET)
+    
+    def fresh_token():
+        token_service._verified.clear()
+        token_service.verify(token)
+    
+    measure("sha256 secret, no cache", lambda: uncached("bench_sha256"), iterations)
+    measure("scrypt secret, no cache", lambda: uncached("bench_scrypt"), max(1, iterations // 1000))
+    measure("scrypt secret, cached", lambda: manager.authenticate_client("bench_scrypt", SECRET), iterations)
+    measure("HS256 token, first use", fresh_token, iterations)
+    measure("HS256 token, repeated", lambda: token_service.verify(token), iterations)
+
+if __name__ == "__main__":
+    args = [int(arg) for arg in sys.argv[1:]]
+    bench(*args)
@@ -0,0 +1,58 @@
+"""
+Benchmark for micro-batching Triton requests.
+
+Runs concurrent generations against a local stub Triton server whose calls
+take a fixed time regardless of batch size (like a GPU-bound server that is
+not saturated), with and without batching, and reports the throughput.
+
+Usage:
+    python -m benchmarks.bench_batching [requests] [concurrency] [delay_ms]
+"""
+import sys
+import time
+import asyncio
+
+from app.core.config import settings
+from app.models.llm import TritonModel
+from app.models.provider_clients import provider_clients
+from tests.mock_upstream import run_mock_upstream
+
+async def run_requests(model: TritonModel, requests: int, concurrency: int) -> float:
+    """Run generations with a bounded number in flight and return the elapsed seconds."""
+    semaphore = asyncio.Semaphore(concurrency)
+    
+    async def generate(i: int):
+        async with semaphore:
+            await model.generate(prompt=f"prompt {i}", temperature=0, max_tokens=16)
+    
+    start = time.perf_counter()
+    await asyncio.gather(*[generate(i) for i in range(requests)])
+    return time.perf_counter() - start
+
+async def bench_mode(label: str, max_batch_size: int, requests: int, concurrency: int, upstream) -> None:
+    """Benchmark one batching configuration."""
+    settings.TRITON_MAX_BATCH_SIZE = max_batch_size
+    model = TritonModel("bench-model")
+    upstream.requests = 0
+    upstream.batch_sizes = []
+    try:
+        elapsed = await run_requests(model, requests, concurrency)
+    finally:
+        await provider_clients.close()
+    
+    print(
+        f"{label:<14} {requests / elapsed:8.0f} req/s  "
+        f"{upstream.requests:5d} upstream calls  mean batch {model.batcher.stats()['mean_batch_size']:.1f}"
+    )
+
+def bench(requests: int = 2000, concurrency: int = 64, delay_ms: int = 20) -> None:
+    """Run the benchmark and print the throughput of each mode."""
+    with run_mock_upstream(delay=delay_ms / 1000) as upstream:
+        settings.TRITON_BASE_URL = upstream.base_url
+        asyncio.run(bench_mode("unbatched", 1, requests, concurrency, upstream))
+        for size in (8, 32):
+            asyncio.run(bench_mode(f"batch <= {size}", size, requests, concurrency, upstream))
+
+if __name__ == "__main__":
+    args = [int(arg) for arg in sys.argv[1:]]
+    bench(*args)
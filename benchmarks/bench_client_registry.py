@@ -0,0 +1,114 @@
+"""
+Benchmark for the client registry.
+
+Writes a directory of client configuration files and a snapshot built from
+it, then loads them in fresh processes and reports the startup time and the
+memory used by the registry for:
+
+- Pydantic ClientConfig models parsed from the directory (the old registry)
+- compact ClientRecords parsed from the directory
+- the memory-mapped snapshot, after looking up 1% of the clients and all of them
+
+Also compares a permission check against a list with the bitset check.
+
+Usage:
+    python -m benchmarks.bench_client_registry [clients]
+"""
+import os
+import sys
+import time
+import json
+import random
+import timeit
+import tempfile
+import subprocess
+
+from app.clients.registry import ENDPOINT_BITS, ClientRecord, write_snapshot
+from app.schemas.base import ClientConfig
+from app.clients.config_loader import ClientConfigLoader
+from tests.test_config_reload import write_clients
+
+def rss_kb() -> int:
+    """Get the resident set size of this process in KiB."""
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1])
+    return 0
+
+def load(mode: str, path: str, clients: int) -> None:
+    """Load the registry in this process and print the time and memory it took."""
+    before = rss_kb()
+    start = time.perf_counter()
+    if mode == "models":
+        registry = {}
+        for name in os.listdir(path):
+            with open(os.path.join(path, name), "rb") as f:
+                config = ClientConfig.model_validate_json(f.read())
+            registry[config.client_id] = config
+    elif mode == "records":
+        registry = ClientConfigLoader().scan(path).clients
+    else:
+        from app.clients.registry import ClientSnapshot
+        registry = ClientSnapshot(path)
+    elapsed = time.perf_counter() - start
+    print(json.dumps({"seconds": elapsed, "rss_kb": rss_kb() - before}))
+    
+    if mode == "snapshot":
+        # Decode records as their clients make requests
+        for touched in (clients // 100, clients):
+            start = time.perf_counter()
+            for i in random.sample(range(clients), touched):
+                registry.get(f"client_{i}")
+            elapsed = time.perf_counter() - start
+            print(json.dumps({"touched": touched, "seconds": elapsed, "rss_kb": rss_kb() - before}))
+
+def run(mode: str, path: str, clients: int) -> None:
+    """Load the registry in a fresh process and print its results."""
+    output = subprocess.run(
+        [sys.executable, "-m", "benchmarks.bench_client_registry", "--load", mode, path, str(clients)],
+        check=True, capture_output=True, text=True,
+    ).stdout
+    for line in output.splitlines():
+        result = json.loads(line)
+        label = f"{mode}, {result['touched']} used" if "touched" in result else mode
+        print(f"{label:<28} {result['seconds'] * 1000:9.1f} ms {result['rss_kb'] / 1024:9.1f} MiB")
+
+def bench_permissions(iterations: int = 1000000) -> None:
+    """Compare a permission check against a list with the bitset check."""
+    config = ClientConfig.model_validate_json(json.dumps({
+        "client_id": "c", "name": "c", "allowed_providers": ["openai", "groq"], "default_provider": "openai",
+        "default_model": "m", "max_tokens_limit": 1, "rate_limit": {"requests_per_minute": 1, "tokens_per_day": 1},
+        "allowed_endpoints": ["generate", "cache/stats", "clients/reload", "batch", "jobs", "circuits"],
+        "created_at": "", "updated_at": "",
+    }))
+    record = ClientRecord.from_config(config)
+    bit = ENDPOINT_BITS.bit("circuits")
+    for label, statement in (
+        ("list permission check", "'circuits' in config.allowed_endpoints"),
+        ("bitset permission check", "record.allows_endpoint('circuits')"),
+        ("precomputed bit check", "record.endpoint_bits & bit"),
+    ):
+        seconds = timeit.timeit(statement, globals={"config": config, "record": record, "bit": bit}, number=iterations)
+        print(f"{label:<28} {seconds / iterations * 1e9:9.1f} ns")
+
+def bench(clients: int = 100000) -> None:
+    """Run the benchmark."""
+    with tempfile.TemporaryDirectory() as directory:
+        configs = os.path.join(directory, "configs")
+        snapshot = os.path.join(directory, "clients.snapshot")
+        write_clients(configs, clients)
+        write_snapshot(ClientConfigLoader().scan(configs).clients.values(), snapshot)
+        print(f"{clients} clients, snapshot {os.path.getsize(snapshot) / 1024 / 1024:.1f} MiB")
+        
+        run("models", configs, clients)
+        run("records", configs, clients)
+        run("snapshot", snapshot, clients)
+    bench_permissions()
+
+if __name__ == "__main__":
+    if sys.argv[1:2] == ["--load"]:
+        load(sys.argv[2], sys.argv[3], int(sys.argv[4]))
+    else:
+        args = [int(arg) for arg in sys.argv[1:]]
+        bench(*args)
@@ -0,0 +1,56 @@
+"""
+Benchmark for the database client store.
+
+Imports client configurations into a SQLite database and measures the cost
+of a client lookup when it is cached, when an unknown ID is remembered, and
+when it reaches the database, and the cost of polling for changes.
+
+Usage:
+    python -m benchmarks.bench_client_store [clients] [iterations]
+"""
+import os
+import sys
+import time
+import random
+import tempfile
+
+from app.clients.store import SQLiteClientStore, main
+from tests.test_config_reload import write_clients
+from tests.test_registry import make_config
+
+def measure(label: str, operation, iterations: int) -> None:
+    """Run an operation and print its cost per call."""
+    start = time.perf_counter_ns()
+    for i in range(iterations):
+        operation(i)
+    elapsed = time.perf_counter_ns() - start
+    print(f"{label:<32} {elapsed / iterations / 1000:10.2f} us")
+
+def bench(clients: int = 10000, iterations: int = 100000) -> None:
+    """Run the benchmark."""
+    with tempfile.TemporaryDirectory() as directory:
+        write_clients(os.path.join(directory, "configs"), clients)
+        path = os.path.join(directory, "clients.db")
+        main([os.path.join(directory, "configs"), path])
+        store = SQLiteClientStore(path, max_entries=clients)
+        store.apply(store.scan())
+        cache = store.clients
+        ids = [f"client_{random.randrange(clients)}" for _ in range(iterations)]
+        
+        measure("cold lookup (database)", lambda i: cache.get(f"client_{i}"), clients)
+        measure("warm lookup", lambda i: cache.get(ids[i]), iterations)
+        cache.get("unknown")
+        measure("remembered unknown ID", lambda i: cache.get("unknown"), iterations)
+        measure("poll, no changes", lambda i: store.apply(store.scan()), 1000)
+        writer = SQLiteClientStore(path)
+        
+        def poll_after_change(i):
+            writer.put(make_config(f"client_{i}"))
+            store.apply(store.scan())
+        measure("write + poll, 1 change", poll_after_change, 1000)
+        writer.close()
+        store.close()
+
+if __name__ == "__main__":
+    args = [int(arg) for arg in sys.argv[1:]]
+    bench(*args)
@@ -0,0 +1,78 @@
+"""
+Benchmark for client configuration reloads.
+
+Writes a directory of client configuration files and measures a full load,
+a rescan with no changes, a rescan after changing 1% of the files and a
+rescan of one named file (as done for inotify events). Then runs
+authentication traffic while files change and reloads run, and reports how
+many authentications failed.
+
+Usage:
+    python -m benchmarks.bench_config_reload [clients] [seconds]
+"""
+import sys
+import time
+import random
+import asyncio
+import tempfile
+
+from fastapi import HTTPException
+
+from app.core.config import settings
+from app.clients.auth import ClientManager
+from tests.test_config_reload import rename_client, write_clients
+
+def timed(label: str, operation) -> None:
+    """Run an operation and print how long it took."""
+    start = time.perf_counter()
+    operation()
+    print(f"{label:<28} {(time.perf_counter() - start) * 1000:9.1f} ms")
+
+async def traffic(manager: ClientManager, clients: int, seconds: float) -> None:
+    """Authenticate random clients while reloading changed files."""
+    stop = asyncio.Event()
+    counts = {"ok": 0, "failed": 0, "reloads": 0}
+    
+    async def authenticate():
+        while not stop.is_set():
+            i = random.randrange(clients)
+            try:
+                manager.authenticate_client(f"client_{i}", f"secret_{i}")
+                counts["ok"] += 1
+            except HTTPException:
+                counts["failed"] += 1
+            await asyncio.sleep(0)
+    
+    async def reload():
+        deadline = time.monotonic() + seconds
+        while time.monotonic() < deadline:
+            for i in random.sample(range(clients), max(1, clients // 100)):
+                rename_client(settings.CLIENT_CONFIG_DIR, i, f"Client {i} r{counts['reloads']}")
+            await manager.refresh_clients()
+            counts["reloads"] += 1
+        stop.set()
+    
+    await asyncio.gather(reload(), *[authenticate() for _ in range(8)])
+    print(f"{counts['reloads']} reloads during traffic: {counts['ok']} successful auths, {counts['failed']} failed")
+
+def bench(clients: int = 50000, seconds: float = 10.0) -> None:
+    """Run the benchmark."""
+    with tempfile.TemporaryDirectory() as directory:
+        settings.CLIENT_CONFIG_DIR = directory
+        write_clients(directory, clients)
+        manager = ClientManager()
+        time.sleep(1.1)
+        
+        timed(f"full load ({clients} files)", lambda: manager.load_clients(force=True))
+        timed("rescan, no changes", manager.reload_clients)
+        changed = random.sample(range(clients), clients // 100)
+        for i in changed:
+            rename_client(directory, i, f"Client {i} changed")
+        timed(f"rescan, {len(changed)} changed", manager.reload_clients)
+        rename_client(directory, 0, "Client 0 changed again")
+        timed("rescan 1 file by name", lambda: asyncio.run(manager.refresh_clients({"client_0.json"})))
+        asyncio.run(traffic(manager, clients, seconds))
+
+if __name__ == "__main__":
+    args = [int(arg) for arg in sys.argv[1:]]
+    bench(*args)
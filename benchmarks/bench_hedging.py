@@ -0,0 +1,73 @@
+"""
+Benchmark for hedged requests against a long-tail provider.
+
+Simulates a provider whose latency is usually short but occasionally very
+long, and compares the latency percentiles and the number of upstream calls
+with and without hedging.
+
+Usage:
+    python -m benchmarks.bench_hedging [requests] [concurrency]
+"""
+import sys
+import random
+import asyncio
+
+import numpy as np
+
+from app.core.config import settings
+from app.models import llm
+from app.models.routing import Router
+
+class LongTailModel(llm.BaseModel):
+    """Stub model with a mostly fast, occasionally slow latency."""
+    
+    provider = "stub"
+    calls = 0
+    
+    async def generate(self, prompt: str, temperature: float = 0.7, max_tokens: int = 150):
+        """Return a fixed response after a long-tail delay."""
+        LongTailModel.calls += 1
+        # 95% of calls take 20-40 ms, the rest 300-600 ms
+        delay = random.uniform(0.02, 0.04) if random.random() < 0.95 else random.uniform(0.3, 0.6)
+        await asyncio.sleep(delay)
+        return {"text": "ok", "model": self.model_name, "usage": None}
+
+async def run_requests(router: Router, targets, requests: int, concurrency: int, hedge: bool):
+    """Run generations and return their latencies in milliseconds."""
+    semaphore = asyncio.Semaphore(concurrency)
+    loop = asyncio.get_running_loop()
+    latencies = []
+    
+    async def generate():
+        async with semaphore:
+            start = loop.time()
+            await router.generate(targets, prompt="hello", temperature=0, max_tokens=16, hedge=hedge)
+            latencies.append((loop.time() - start) * 1000)
+    
+    await asyncio.gather(*[generate() for _ in range(requests)])
+    return latencies
+
+def bench(requests: int = 2000, concurrency: int = 32) -> None:
+    """Run the benchmark and print the latency percentiles of each mode."""
+    targets = [("stub", "a"), ("stub", "b")]
+    for target in targets:
+        llm._models[target] = LongTailModel(target[1])
+    
+    for hedge in (False, True):
+        random.seed(42)
+        LongTailModel.calls = 0
+        router = Router()
+        # Warm up the latency statistics so the p95 estimate is available
+        asyncio.run(run_requests(router, targets, settings.HEDGE_MIN_SAMPLES * 5, concurrency, hedge=False))
+        LongTailModel.calls = 0
+        
+        latencies = asyncio.run(run_requests(router, targets, requests, concurrency, hedge))
+        p50, p99 = np.percentile(latencies, [50, 99])
+        print(
+            f"{'hedged' if hedge else 'unhedged':<9} p50 {p50:6.1f} ms  p99 {p99:6.1f} ms  "
+            f"mean {np.mean(latencies):6.1f} ms  upstream calls {LongTailModel.calls / requests:.3f} per request"
+        )
+
+if __name__ == "__main__":
+    args = [int(arg) for arg in sys.argv[1:]]
+    bench(*args)
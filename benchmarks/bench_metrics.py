@@ -0,0 +1,36 @@
+"""
+Benchmark for the metrics recording path.
+
+Measures the cost of the operations done on every request: counter
+increments, gauge updates and histogram observations.
+
+Usage:
+    python -m benchmarks.bench_metrics [iterations]
+"""
+import sys
+import time
+
+from app.core.metrics import Counter, Gauge, Histogram
+
+def bench(iterations: int = 1_000_000) -> None:
+    """Run the benchmark and print the cost per operation."""
+    counter = Counter("bench_total", "Benchmark counter", ("client", "kind"))
+    gauge = Gauge("bench_in_flight", "Benchmark gauge")
+    histogram = Histogram("bench_seconds", "Benchmark histogram", ("endpoint", "stage"))
+    labels = ("client", "prompt")
+    stage_labels = ("/generate", "auth")
+    
+    for name, operation in (
+        ("counter.inc", lambda: counter.inc(labels, 3)),
+        ("gauge.inc/dec", lambda: (gauge.inc(), gauge.dec())),
+        ("histogram.observe", lambda: histogram.observe(0.0123, stage_labels)),
+    ):
+        start = time.perf_counter_ns()
+        for _ in range(iterations):
+            operation()
+        elapsed = time.perf_counter_ns() - start
+        print(f"{name:<18} {elapsed / iterations:6.0f} ns/op")
+
+if __name__ == "__main__":
+    args = [int(arg) for arg in sys.argv[1:]]
+    bench(*args)
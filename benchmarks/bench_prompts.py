@@ -0,0 +1,42 @@
+"""
+Benchmark for prompt assembly.
+
+Measures what prompt assembly adds to a request: assembling messages that
+are already normalized, messages that need normalizing, and a long generate
+prompt, each including the prefix key.
+
+Usage:
+    python -m benchmarks.bench_prompts [system_prompt_chars] [iterations]
+"""
+import sys
+import time
+
+from app.models.prompts import assemble_messages, assemble_prompt
+
+def measure(label: str, operation, iterations: int) -> None:
+    """Run an operation and print its cost per call."""
+    start = time.perf_counter_ns()
+    for _ in range(iterations):
+        operation()
+    elapsed = time.perf_counter_ns() - start
+    print(f"{label:<32} {elapsed / iterations / 1000:10.2f} us")
+
+def bench(system_prompt_chars: int = 16000, iterations: int = 10000) -> None:
+    """Run the benchmark."""
+    system = ("Answer from the manual below.\n" * (system_prompt_chars // 30 + 1))[:system_prompt_chars].rstrip()
+    history = [
+        {"role": "user", "content": "How do I reset the device?"},
+        {"role": "assistant", "content": "Hold the power button for ten seconds."},
+        {"role": "user", "content": "And then?"},
+    ]
+    normalized = [{"role": "system", "content": system}] + history
+    unnormalized = history[:1] + [{"content": system.replace("\n", "  \r\n"), "role": "system"}] + history[1:]
+    
+    measure("chat, already normalized", lambda: assemble_messages(normalized), iterations)
+    measure("chat, needs normalizing", lambda: assemble_messages(unnormalized), iterations)
+    measure("generate prompt", lambda: assemble_prompt(system), iterations)
+    print(f"Identical prefixes: {assemble_messages(normalized).messages == assemble_messages(unnormalized).messages[:1] + history}")
+
+if __name__ == "__main__":
+    args = [int(arg) for arg in sys.argv[1:]]
+    bench(*args)
@@ -0,0 +1,42 @@
+"""
+Micro-benchmark for the in-process rate limiter.
+
+Measures the per-request cost of the rate limit check and of charging token
+usage, across a configurable number of clients.
+
+Usage:
+    python -m benchmarks.bench_rate_limit [iterations] [clients]
+"""
+import sys
+import time
+
+from app.core.rate_limit import RateLimiter
+from app.schemas.base import RateLimit
+
+def bench(iterations: int = 1_000_000, clients: int = 1000) -> None:
+    """Run the benchmark and print the cost per operation."""
+    limiter = RateLimiter()
+    rate_limit = RateLimit(requests_per_minute=10**9, tokens_per_day=10**12)
+    client_ids = [f"client_{i}" for i in range(clients)]
+    
+    # Warm up client state
+    for client_id in client_ids:
+        limiter.acquire(client_id, rate_limit)
+    
+    start = time.perf_counter_ns()
+    for i in range(iterations):
+        limiter.acquire(client_ids[i % clients], rate_limit)
+    acquire_ns = (time.perf_counter_ns() - start) / iterations
+    
+    start = time.perf_counter_ns()
+    for i in range(iterations):
+        limiter.record_tokens(client_ids[i % clients], 42)
+    record_ns = (time.perf_counter_ns() - start) / iterations
+    
+    print(f"clients={clients} iterations={iterations}")
+    print(f"acquire:       {acquire_ns:8.0f} ns/op")
+    print(f"record_tokens: {record_ns:8.0f} ns/op")
+
+if __name__ == "__main__":
+    args = [int(arg) for arg in sys.argv[1:]]
+    bench(*args)
@@ -0,0 +1,66 @@
+"""
+Benchmark for semantic cache lookups.
+
+Fills the semantic cache with synthetic prompts and measures the latency of
+the index search alone and of a full lookup (embedding plus search).
+
+Usage:
+    python -m benchmarks.bench_semantic_cache [entries] [lookups]
+"""
+import sys
+import time
+import random
+
+import numpy as np
+
+from app.core.semantic_cache import HashingEmbedder, SemanticCache
+
+WORDS = (
+    "how what why when where can does should the a an to of in for on with my your "
+    "account password reset billing invoice refund order shipping delivery status "
+    "change update cancel subscription plan price upgrade error login email phone "
+    "address payment card bank transfer report export data api key limit quota"
+).split()
+
+def make_prompt(rng: random.Random) -> str:
+    """Build a random prompt from the vocabulary."""
+    return " ".join(rng.choice(WORDS) for _ in range(rng.randint(6, 16)))
+
+def percentile(samples, q):
+    """Get a percentile of the samples in microseconds."""
+    return float(np.percentile(samples, q)) / 1000
+
+def bench(entries: int = 100_000, lookups: int = 2000) -> None:
+    """Run the benchmark and print the latency percentiles."""
+    rng = random.Random(42)
+    cache = SemanticCache(HashingEmbedder(), max_entries=entries)
+    scope = ("groq", "mixtral-8x7b-32768", 0.0, 150)
+    response = {"text": "cached", "model": "mixtral-8x7b-32768", "usage": None}
+    
+    start = time.perf_counter()
+    for _ in range(entries):
+        vector, _ = cache.get(scope, make_prompt(rng), threshold=1.1)
+        cache.set(scope, vector, response)
+    print(f"filled {len(cache.index)} entries in {time.perf_counter() - start:.1f}s")
+    
+    queries = [make_prompt(rng) for _ in range(lookups)]
+    vectors = [cache.embedder.embed(query) for query in queries]
+    
+    search_ns = []
+    for vector in vectors:
+        start = time.perf_counter_ns()
+        cache.index.search(vector, scope, k=5)
+        search_ns.append(time.perf_counter_ns() - start)
+    
+    lookup_ns = []
+    for query in queries:
+        start = time.perf_counter_ns()
+        cache.get(scope, query, threshold=0.95)
+        lookup_ns.append(time.perf_counter_ns() - start)
+    
+    print(f"index search (top-5): p50 {percentile(search_ns, 50):.0f} us  p99 {percentile(search_ns, 99):.0f} us")
+    print(f"full lookup:          p50 {percentile(lookup_ns, 50):.0f} us  p99 {percentile(lookup_ns, 99):.0f} us")
+
+if __name__ == "__main__":
+    args = [int(arg) for arg in sys.argv[1:]]
+    bench(*args)
@@ -0,0 +1,109 @@
+"""
+Benchmark for request and response serialization.
+
+Sends generate and chat completions requests through the whole app
+in-process against a mocked provider, and prints requests per second on
+one core with the standard library JSON path (before) and with the fast
+path (after): orjson, when installed, for bodies, and generate results
+encoded without validating them against the response model again.
+
+Usage:
+    python -m benchmarks.bench_serialization [iterations] [system_prompt_chars]
+"""
+import sys
+import time
+import asyncio
+import logging
+import tempfile
+
+import httpx
+
+from app.main import app
+from app.api import responses
+from app.core.config import settings
+from app.clients.auth import client_manager
+from app.clients.secrets import hash_secret
+from app.models.routing import model_router
+from app.schemas.base import ClientConfig, RateLimit
+
+SECRET = "bench-secret"
+HEADERS = {"client-id": "bench_client", "client-secret": SECRET}
+
+async def mock_generate(targets, prompt, temperature, max_tokens, hedge=None, fallbacks=()):
+    """Answer like a provider, without a network call."""
+    return {
+        "text": "Hold the power button for ten seconds, then release it. " * 4,
+        "model": targets[0][1],
+        "usage": {"prompt_tokens": 12, "completion_tokens": 48, "total_tokens": 60},
+    }
+
+async def mock_start_chat(targets, encode, fallbacks=()):
+    """Answer a chat completions request like a provider, without a network call."""
+    encode(targets[0])
+    content = (
+        b'{"id":"chatcmpl-1","object":"chat.completion","model":"gpt-4o-mini","choices":[{"index":0,'
+        b'"message":{"role":"assistant","content":"Hold the power button for ten seconds."},"finish_reason":"stop"}],'
+        b'"usage":{"prompt_tokens":12,"completion_tokens":9,"total_tokens":21}}'
+    )
+    return targets[0], httpx.Response(200, content=content)
+
+def setup(config_dir: str) -> None:
+    """Load a benchmark client and replace the provider calls with mocks."""
+    config = ClientConfig(
+        client_id="bench_client",
+        name="Benchmark Client",
+        client_secret_hash=hash_secret(SECRET, "sha256"),
+        allowed_providers=["openai"],
+        default_provider="openai",
+        default_model="gpt-4o-mini",
+        max_tokens_limit=2000,
+        rate_limit=RateLimit(requests_per_minute=10_000_000, tokens_per_day=10_000_000_000),
+        allowed_endpoints=["generate"],
+        created_at="2025-01-01T00:00:00Z",
+        updated_at="2025-01-01T00:00:00Z",
+    )
+    with open(f"{config_dir}/bench_client.json", "w") as f:
+        f.write(config.model_dump_json())
+    settings.CLIENT_CONFIG_DIR = config_dir
+    settings.RESPONSE_CACHE_ENABLED = False
+    client_manager.reload_clients()
+    model_router.generate = mock_generate
+    model_router.start_chat = mock_start_chat
+
+async def measure(label: str, client: httpx.AsyncClient, path: str, body: dict, iterations: int) -> None:
+    """Send requests one after another and print the request rate."""
+    response = await client.post(path, json=body, headers=HEADERS)
+    assert response.status_code == 200, response.text
+    start = time.perf_counter()
+    for _ in range(iterations):
+        await client.post(path, json=body, headers=HEADERS)
+    elapsed = time.perf_counter() - start
+    print(f"{label:<32} {iterations / elapsed:10.0f} requests/s {elapsed / iterations * 1e6:10.1f} us/request")
+
+async def run(iterations: int, system_prompt_chars: int) -> None:
+    """Run each request type with the slow and the fast path."""
+    generate_body = {"prompt": "How do I reset the device?", "max_tokens": 100}
+    system = ("Answer from the manual below.\n" * (system_prompt_chars // 30 + 1))[:system_prompt_chars]
+    chat_body = {"messages": [{"role": "system", "content": system}, {"role": "user", "content": "How do I reset it?"}]}
+    orjson = responses.orjson
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        for path, body in (("/api/v1/generate", generate_body), ("/api/v1/chat/completions", chat_body)):
+            for label, fast in (("before", False), ("after", True)):
+                settings.FAST_JSON_RESPONSES = fast
+                responses.orjson = orjson if fast else None
+                await measure(f"{path.rsplit('/', 1)[-1]}, {label}", client, path, body, iterations)
+    responses.orjson = orjson
+    if orjson is None:
+        print("orjson is not installed, so only response validation is skipped")
+
+def bench(iterations: int = 5000, system_prompt_chars: int = 16000) -> None:
+    """Run the benchmark."""
+    logging.disable(logging.INFO)
+    with tempfile.TemporaryDirectory() as config_dir:
+        setup(config_dir)
+        asyncio.run(run(iterations, system_prompt_chars))
+
+if __name__ == "__main__":
+    args = [int(arg) for arg in sys.argv[1:]]
+    bench(*args)
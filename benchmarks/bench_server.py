@@ -0,0 +1,107 @@
+"""
+Benchmark for the pre-forked production server.
+
+Starts the gateway with uvicorn's own multi-worker mode, where each worker
+imports the application separately (before), and with `python -m app.server`,
+where the workers are forked from a process that already loaded it (after).
+Sends health check requests through the full middleware stack from
+concurrent connections and prints the request rate and the memory used by
+all server processes (proportional set size, so shared pages are counted
+once). Reads memory from /proc, so it runs on Linux only.
+
+Usage:
+    python -m benchmarks.bench_server [requests] [concurrency] [workers]
+"""
+import os
+import sys
+import time
+import socket
+import asyncio
+import subprocess
+from typing import List
+
+import httpx
+
+def children(pid: int) -> List[int]:
+    """Find the process IDs of a process and all its descendants."""
+    parents = {}
+    for entry in os.listdir("/proc"):
+        if entry.isdigit():
+            try:
+                with open(f"/proc/{entry}/stat") as f:
+                    # The command name may contain spaces, so split after its closing parenthesis
+                    parents[int(entry)] = int(f.read().rsplit(")", 1)[1].split()[1])
+            except (OSError, IndexError, ValueError):
+                pass
+    found = [pid]
+    for process in found:
+        found.extend(child for child, parent in parents.items() if parent == process)
+    return found
+
+def memory(pid: int) -> int:
+    """Sum the proportional set size of a process tree, in bytes."""
+    total = 0
+    for process in children(pid):
+        try:
+            with open(f"/proc/{process}/smaps_rollup") as f:
+                for line in f:
+                    if line.startswith("Pss:"):
+                        total += int(line.split()[1]) * 1024
+        except OSError:
+            pass
+    return total
+
+async def load(base_url: str, requests: int, concurrency: int) -> float:
+    """Send health check requests from concurrent connections and return the elapsed seconds."""
+    # Warm up every connection and worker first
+    remaining = iter(range(concurrency * 10))
+    
+    async def worker(client: httpx.AsyncClient) -> None:
+        for _ in remaining:
+            await client.get("/health")
+    
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits) as client:
+        await asyncio.gather(*(worker(client) for _ in range(concurrency)))
+        start = time.perf_counter()
+        remaining = iter(range(requests))
+        await asyncio.gather(*(worker(client) for _ in range(concurrency)))
+        return time.perf_counter() - start
+
+def measure(label: str, command: List[str], requests: int, concurrency: int) -> None:
+    """Start a server, load it and print the request rate and memory."""
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    env = {**os.environ, "LOG_LEVEL": "WARNING", "TRACING_ENABLED": "false"}
+    process = subprocess.Popen(
+        command + ["--host", "127.0.0.1", "--port", str(port)],
+        env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    base_url = f"http://127.0.0.1:{port}"
+    try:
+        while True:
+            try:
+                httpx.get(f"{base_url}/health")
+                break
+            except httpx.TransportError:
+                assert process.poll() is None, "server did not start"
+                time.sleep(0.1)
+        elapsed = asyncio.run(load(base_url, requests, concurrency))
+        print(f"{label:<24} {requests / elapsed:10.0f} requests/s {memory(process.pid) / 2**20:10.1f} MiB")
+    finally:
+        process.terminate()
+        process.wait()
+
+def bench(requests: int = 20000, concurrency: int = 64, workers: int = 4) -> None:
+    """Run the benchmark."""
+    measure("before (uvicorn workers)", [
+        sys.executable, "-m", "uvicorn", "app.main:app", "--workers", str(workers), "--no-access-log",
+    ], requests, concurrency)
+    measure("after (app.server)", [
+        sys.executable, "-m", "app.server", "--workers", str(workers),
+    ], requests, concurrency)
+
+if __name__ == "__main__":
+    args = [int(arg) for arg in sys.argv[1:]]
+    bench(*args)
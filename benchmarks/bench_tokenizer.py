@@ -0,0 +1,51 @@
+"""
+Benchmark for local token counting.
+
+Measures the throughput of the token counter in tokens per second on one
+core: estimating ASCII and non-ASCII prompts, counting chat messages with a
+long system prompt, and, when tiktoken is installed, exact counting with and
+without the memoized segment counts.
+
+Usage:
+    python -m benchmarks.bench_tokenizer [prompt_chars] [iterations]
+"""
+import sys
+import time
+
+from app.models.tokenizer import TokenCounter, tiktoken
+
+def measure(label: str, operation, iterations: int) -> None:
+    """Run an operation and print its cost per call and its throughput."""
+    tokens = operation()
+    start = time.perf_counter_ns()
+    for _ in range(iterations):
+        operation()
+    elapsed = time.perf_counter_ns() - start
+    per_call = elapsed / iterations
+    print(f"{label:<32} {per_call / 1000:10.2f} us {tokens * 1e9 / per_call / 1e6:12.1f} M tokens/s")
+
+def bench(prompt_chars: int = 16000, iterations: int = 10000) -> None:
+    """Run the benchmark."""
+    english = ("Answer from the manual below and cite the section.\n" * (prompt_chars // 51 + 1))[:prompt_chars]
+    mixed = ("Réponds à partir du manuel, 手册第三节。\n" * (prompt_chars // 30 + 1))[:prompt_chars]
+    messages = [
+        {"role": "system", "content": english},
+        {"role": "user", "content": "How do I reset the device?"},
+    ]
+    counter = TokenCounter()
+    
+    measure("estimate, ASCII", lambda: counter.count("gpt-3.5-turbo", english), iterations)
+    measure("estimate, non-ASCII", lambda: counter.count("gpt-3.5-turbo", mixed), iterations)
+    measure("estimate, chat messages", lambda: counter.count_messages("gpt-3.5-turbo", messages), iterations)
+    
+    if tiktoken is None:
+        print("tiktoken is not installed, skipping exact counting")
+        return
+    exact = TokenCounter(min_chars=sys.maxsize)
+    memoized = TokenCounter()
+    measure("tiktoken, chat messages", lambda: exact.count_messages("gpt-4o", messages), max(1, iterations // 100))
+    measure("tiktoken, memoized", lambda: memoized.count_messages("gpt-4o", messages), iterations)
+
+if __name__ == "__main__":
+    args = [int(arg) for arg in sys.argv[1:]]
+    bench(*args)
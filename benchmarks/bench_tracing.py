@@ -0,0 +1,118 @@
+"""
+Benchmark for the request tracing middleware.
+
+Sends requests straight into the ASGI app (no server or sockets) for a small
+JSON endpoint and a streaming endpoint, bare and wrapped in a copy of the
+removed BaseHTTPMiddleware-based DebugMiddleware or the pure ASGI
+TracingMiddleware, and reports the time per request. Log output goes to /dev/null so formatting
+and handler costs are included but terminal I/O is not.
+
+Usage:
+    python -m benchmarks.bench_tracing [requests]
+"""
+import os
+import sys
+import time
+import uuid
+import asyncio
+import logging
+
+from starlette.applications import Starlette
+from starlette.middleware.base import BaseHTTPMiddleware
+from starlette.responses import JSONResponse, StreamingResponse
+from starlette.routing import Route
+
+from app.core.config import settings
+from app.middleware.tracing_middleware import TracingMiddleware
+
+BODY = b'{"prompt": "' + b"x" * 2000 + b'", "max_tokens": 100}'
+
+logger = logging.getLogger(__name__)
+
+class DebugMiddleware(BaseHTTPMiddleware):
+    """The request logging middleware TracingMiddleware replaced, kept here for comparison."""
+    
+    async def dispatch(self, request, call_next):
+        request_id = str(uuid.uuid4())
+        logger.debug(f"Request {request_id} started: {request.method} {request.url.path}")
+        body = await request.body()
+        if body:
+            logger.debug(f"Request {request_id} body: {body.decode()}")
+        logger.debug(f"Request {request_id} headers: {request.headers}")
+        start_time = time.time()
+        response = await call_next(request)
+        process_time = time.time() - start_time
+        logger.debug(f"Request {request_id} completed: {response.status_code} in {process_time:.4f}s")
+        response.headers["X-Process-Time"] = str(process_time)
+        response.headers["X-Request-ID"] = request_id
+        return response
+
+async def generate(request):
+    """Read the request body and return a small JSON response."""
+    await request.body()
+    return JSONResponse({"text": "hello", "model": "bench"})
+
+async def stream(request):
+    """Stream a response in 20 chunks."""
+    async def chunks():
+        for _ in range(20):
+            yield b'data: {"text": "token"}\n\n'
+    return StreamingResponse(chunks(), media_type="text/event-stream")
+
+def build_app(middleware=None):
+    """Build the benchmark app, optionally wrapped in a middleware."""
+    app = Starlette(routes=[Route("/generate", generate, methods=["POST"]), Route("/stream", stream, methods=["POST"])])
+    if middleware is not None:
+        app.add_middleware(middleware)
+    return app
+
+async def call(app, path: str) -> None:
+    """Send one request into the ASGI app and drain the response."""
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "POST", "scheme": "http",
+        "path": path, "raw_path": path.encode(), "root_path": "", "query_string": b"",
+        "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(BODY)).encode())],
+        "client": ("127.0.0.1", 1234), "server": ("127.0.0.1", 8000),
+    }
+    messages = [{"type": "http.request", "body": BODY, "more_body": False}]
+    
+    async def receive():
+        if messages:
+            return messages.pop()
+        return {"type": "http.disconnect"}
+    
+    async def send(message):
+        pass
+    
+    await app(scope, receive, send)
+
+async def run(app, path: str, requests: int) -> float:
+    """Send requests one after another and return the microseconds per request."""
+    for _ in range(200):
+        await call(app, path)
+    start = time.perf_counter_ns()
+    for _ in range(requests):
+        await call(app, path)
+    return (time.perf_counter_ns() - start) / requests / 1000
+
+def bench(requests: int = 20000) -> None:
+    """Run the benchmark and print the time per request for each middleware."""
+    logging.basicConfig(level=logging.INFO, stream=open(os.devnull, "w"), force=True)
+    modes = [
+        ("no middleware", None, None),
+        ("DebugMiddleware", DebugMiddleware, logging.INFO),
+        ("DebugMiddleware (debug log)", DebugMiddleware, logging.DEBUG),
+        ("TracingMiddleware", TracingMiddleware, logging.INFO),
+        ("TracingMiddleware (1% bodies)", TracingMiddleware, logging.INFO),
+    ]
+    for label, middleware, level in modes:
+        settings.TRACE_BODY_SAMPLE_RATE = 0.01 if "1%" in label else 0.0
+        logging.getLogger().setLevel(level or logging.INFO)
+        app = build_app(middleware)
+        json_us = asyncio.run(run(app, "/generate", requests))
+        stream_us = asyncio.run(run(app, "/stream", requests))
+        print(f"{label:<30} json {json_us:7.1f} us/req   stream {stream_us:7.1f} us/req")
+
+if __name__ == "__main__":
+    args = [int(arg) for arg in sys.argv[1:]]
+    bench(*args)
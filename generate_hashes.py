@@ -1,11 +1,18 @@
 """
-Generate SHA-256 hashes for client secrets.
+Generate hashes for client secrets.
+
+Usage:
+    python generate_hashes.py [sha256|scrypt|argon2]
 """
-import hashlib
+import sys
+
+from app.clients.secrets import hash_secret
+
+scheme = sys.argv[1] if len(sys.argv) > 1 else "sha256"
 
 def generate_hash(secret):
-    """Generate a SHA-256 hash for a secret."""
-    return hashlib.sha256(secret.encode()).hexdigest()
+    """Generate a hash for a secret using the selected scheme."""
+    return hash_secret(secret, scheme)
 
 # Client secrets
 clients = {
@@ -0,0 +1,90 @@
+"""
+Shared fixtures for tests that run the gateway against a local mock upstream.
+"""
+import json
+import os
+import shutil
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.core.config import settings
+from app.clients.auth import client_manager
+from app.core.cache import response_cache
+from app.core.semantic_cache import semantic_cache
+from app.core.rate_limit import rate_limiter
+from app.models.circuit_breaker import circuit_breakers
+from app.models.routing import model_router
+from app.models.prompts import prefix_tracker
+from app.models.tokenizer import token_counter
+from tests.mock_upstream import run_mock_upstream
+from tests.test_api_auth import create_test_client_config
+
+GATEWAY_CLIENT_ID = "gateway_client"
+GATEWAY_CLIENT_SECRET = "gateway_password"
+GATEWAY_CONFIG_DIR = "temp_gateway_configs"
+
+@pytest.fixture
+def upstream():
+    """Run a mock upstream and point the OpenAI provider at it."""
+    original = (settings.OPENAI_API_KEY, settings.OPENAI_BASE_URL)
+    
+    with run_mock_upstream() as mock:
+        settings.OPENAI_API_KEY = "sk-test"
+        settings.OPENAI_BASE_URL = f"{mock.base_url}/v1"
+        yield mock
+    
+    settings.OPENAI_API_KEY, settings.OPENAI_BASE_URL = original
+
+@pytest.fixture
+def gateway_headers():
+    """Authentication headers for the gateway test client configuration."""
+    return {"client-id": GATEWAY_CLIENT_ID, "client-secret": GATEWAY_CLIENT_SECRET}
+
+@pytest.fixture
+def gateway_config(upstream):
+    """Load a single OpenAI-enabled client configuration and reset gateway state.
+    
+    Yields a function that updates fields of the client configuration and
+    reloads it.
+    """
+    original_config_dir = settings.CLIENT_CONFIG_DIR
+    settings.CLIENT_CONFIG_DIR = GATEWAY_CONFIG_DIR
+    config_file = create_test_client_config(
+        client_id=GATEWAY_CLIENT_ID,
+        name="Gateway Client",
+        secret=GATEWAY_CLIENT_SECRET,
+        allowed_providers=["openai"],
+        output_dir=GATEWAY_CONFIG_DIR
+    )
+    client_manager.reload_clients()
+    rate_limiter.reset()
+    response_cache.clear()
+    semantic_cache.clear()
+    circuit_breakers.reset()
+    model_router.reset()
+    prefix_tracker.clear()
+    token_counter.clear()
+    
+    def update(**changes):
+        with open(config_file, "r") as f:
+            config = json.load(f)
+        config.update(changes)
+        with open(config_file, "w") as f:
+            json.dump(config, f, indent=4)
+        client_manager.reload_clients()
+    
+    yield update
+    
+    settings.CLIENT_CONFIG_DIR = original_config_dir
+    client_manager.reload_clients()
+    if os.path.exists(GATEWAY_CONFIG_DIR):
+        shutil.rmtree(GATEWAY_CONFIG_DIR)
+
+@pytest.fixture
+def gateway_client(gateway_config):
+    """Create a test client that runs the app lifespan."""
+    # Run the app lifespan so pooled clients are bound to the test client's loop
+    with TestClient(app) as client:
+        yield client
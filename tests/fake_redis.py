@@ -0,0 +1,87 @@
+"""
+Minimal in-process fake of a Redis server for tests.
+
+Supports the commands used by the counter backend (INCRBY, EXPIRE, AUTH,
+SELECT) and records how many network reads each connection needed, so tests
+can check that batches are pipelined.
+"""
+import asyncio
+from contextlib import asynccontextmanager
+
+class FakeRedis:
+    """State of the fake Redis server."""
+    
+    def __init__(self):
+        """Initialize the fake server."""
+        self.data = {}
+        self.ttls = {}
+        self.commands = []
+        self.reads = 0
+        self.port = 0
+    
+    def execute(self, args):
+        """Execute a single command and return its RESP reply."""
+        command = args[0].upper()
+        self.commands.append(command)
+        if command == "INCRBY":
+            self.data[args[1]] = self.data.get(args[1], 0) + int(args[2])
+            return f":{self.data[args[1]]}\r\n".encode()
+        if command == "EXPIRE":
+            self.ttls[args[1]] = int(args[2])
+            return b":1\r\n"
+        if command in ("AUTH", "SELECT"):
+            return b"+OK\r\n"
+        return f"-ERR unknown command '{command}'\r\n".encode()
+    
+    async def handle(self, reader, writer):
+        """Serve a client connection."""
+        buffer = b""
+        while True:
+            data = await reader.read(65536)
+            if not data:
+                break
+            self.reads += 1
+            buffer += data
+            replies = []
+            while True:
+                command, buffer = self.parse(buffer)
+                if command is None:
+                    break
+                replies.append(self.execute(command))
+            writer.write(b"".join(replies))
+            await writer.drain()
+        writer.close()
+    
+    @staticmethod
+    def parse(buffer):
+        """Parse one RESP array command from the buffer."""
+        if not buffer.startswith(b"*") or b"\r\n" not in buffer:
+            return None, buffer
+        header, rest = buffer.split(b"\r\n", 1)
+        args = []
+        for _ in range(int(header[1:])):
+            if b"\r\n" not in rest:
+                return None, buffer
+            length_line, rest = rest.split(b"\r\n", 1)
+            length = int(length_line[1:])
+            if len(rest) < length + 2:
+                return None, buffer
+            args.append(rest[:length].decode())
+            rest = rest[length + 2:]
+        return args, rest
+
+@asynccontextmanager
+async def run_fake_redis():
+    """Run a fake Redis server on a free local port.
+    
+    Yields:
+        FakeRedis: The running fake server
+    """
+    fake = FakeRedis()
+    server = await asyncio.start_server(fake.handle, "127.0.0.1", 0)
+    fake.port = server.sockets[0].getsockname()[1]
+    try:
+        yield fake
+    finally:
+        server.close()
+        await server.wait_closed()
@@ -0,0 +1,156 @@
+"""
+Local mock of the OpenAI-compatible chat completions API for tests.
+
+Serves the OpenAI (`/v1/chat/completions`), Groq
+(`/openai/v1/chat/completions`) and Triton (`/v2/models/{model}/generate`)
+routes from a uvicorn server running in a background thread. The delay and failure behaviour can be changed while the
+server is running.
+"""
+import asyncio
+import json
+import socket
+import threading
+import time
+from contextlib import contextmanager
+
+import uvicorn
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, StreamingResponse
+from starlette.routing import Route
+
+class MockUpstream:
+    """State and request handlers for the mock upstream."""
+    
+    def __init__(self, delay: float = 0.0):
+        """Initialize the mock upstream.
+        
+        Args:
+            delay: Seconds to wait before answering each request
+        """
+        self.delay = delay
+        self.fail_status = None
+        self.requests = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.batch_sizes = []
+        self.last_headers = {}
+        self.last_body = b""
+        self.base_url = ""
+    
+    def completion(self, body: dict) -> dict:
+        """Build a chat completion response for a request body."""
+        prompt = body["messages"][-1]["content"]
+        return {
+            "id": "chatcmpl-mock",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body["model"],
+            "choices": [
+                {
+                    "index": 0,
+                    "message": {"role": "assistant", "content": f"echo: {prompt}"},
+                    "finish_reason": "stop",
+                }
+            ],
+            "usage": {"prompt_tokens": 3, "completion_tokens": 2, "total_tokens": 5},
+        }
+    
+    async def completion_stream(self, body: dict, groq_usage: bool):
+        """Stream a chat completion as server-sent events."""
+        completion = self.completion(body)
+        words = completion["choices"][0]["message"]["content"].split(" ")
+        chunk = {"id": completion["id"], "object": "chat.completion.chunk", "created": completion["created"], "model": completion["model"]}
+        
+        for i, word in enumerate(words):
+            text = word if i == 0 else f" {word}"
+            choices = [{"index": 0, "delta": {"content": text}, "finish_reason": None}]
+            yield f"data: {json.dumps({**chunk, 'choices': choices})}\n\n"
+            if self.delay:
+                await asyncio.sleep(self.delay)
+        
+        # OpenAI reports usage in a final chunk, Groq under x_groq on the last chunk
+        if groq_usage:
+            final = {**chunk, "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}], "x_groq": {"id": "req", "usage": completion["usage"]}}
+        else:
+            final = {**chunk, "choices": [], "usage": completion["usage"]}
+        yield f"data: {json.dumps(final)}\n\n"
+        yield "data: [DONE]\n\n"
+    
+    async def chat_completions(self, request: Request):
+        """Handle a chat completions request."""
+        self.last_body = await request.body()
+        body = json.loads(self.last_body)
+        self.requests += 1
+        self.last_headers = dict(request.headers)
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        if body.get("stream") and not self.fail_status:
+            self.in_flight -= 1
+            groq_usage = request.url.path.startswith("/openai/")
+            return StreamingResponse(self.completion_stream(body, groq_usage), media_type="text/event-stream")
+        try:
+            if self.delay:
+                await asyncio.sleep(self.delay)
+            if self.fail_status:
+                return JSONResponse({"error": {"message": "injected failure"}}, status_code=self.fail_status)
+            return JSONResponse(self.completion(body))
+        finally:
+            self.in_flight -= 1
+    
+    async def triton_generate(self, request: Request):
+        """Handle a (possibly batched) Triton generate request."""
+        body = await request.json()
+        prompts = body["inputs"][0]["data"]
+        self.requests += 1
+        self.batch_sizes.append(len(prompts))
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            if self.delay:
+                await asyncio.sleep(self.delay)
+            if self.fail_status:
+                return JSONResponse({"error": "injected failure"}, status_code=self.fail_status)
+            outputs = [f"echo: {prompt}" for prompt in prompts]
+            return JSONResponse({
+                "model_name": request.path_params["model"],
+                "outputs": [{"name": "text_output", "shape": [len(outputs)], "datatype": "BYTES", "data": outputs}],
+            })
+        finally:
+            self.in_flight -= 1
+    
+    def app(self) -> Starlette:
+        """Build the Starlette application for the mock upstream."""
+        return Starlette(routes=[
+            Route("/v1/chat/completions", self.chat_completions, methods=["POST"]),
+            Route("/openai/v1/chat/completions", self.chat_completions, methods=["POST"]),
+            Route("/v2/models/{model}/generate", self.triton_generate, methods=["POST"]),
+        ])
+
+@contextmanager
+def run_mock_upstream(delay: float = 0.0):
+    """Run a mock upstream server on a free local port.
+    
+    Args:
+        delay: Seconds to wait before answering each request
+    
+    Yields:
+        MockUpstream: The running mock upstream
+    """
+    upstream = MockUpstream(delay=delay)
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind(("127.0.0.1", 0))
+    upstream.base_url = f"http://127.0.0.1:{sock.getsockname()[1]}"
+    
+    server = uvicorn.Server(uvicorn.Config(upstream.app(), log_level="warning", lifespan="off"))
+    thread = threading.Thread(target=server.run, kwargs={"sockets": [sock]}, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.01)
+    try:
+        yield upstream
+    finally:
+        server.should_exit = True
+        thread.join(timeout=5)
+        sock.close()
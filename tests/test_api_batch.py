@@ -0,0 +1,99 @@
+"""
+Tests for the batch generate endpoint against a local mock upstream.
+"""
+import json
+
+import pytest
+
+from app.core.config import settings
+from app.core.rate_limit import rate_limiter
+from tests.conftest import GATEWAY_CLIENT_ID
+
+def post_batch(client, headers, requests):
+    """Send a batch and decode its NDJSON lines, ordered by index."""
+    response = client.post("/api/v1/generate/batch", json={"requests": requests}, headers=headers)
+    if response.status_code != 200:
+        return response, None
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    return response, sorted(lines, key=lambda line: line["index"])
+
+@pytest.fixture
+def batch_concurrency():
+    """Allow two requests of a client to run at once."""
+    original = settings.BATCH_CONCURRENCY
+    settings.BATCH_CONCURRENCY = 2
+    yield
+    settings.BATCH_CONCURRENCY = original
+
+class TestGenerateBatch:
+    """Tests for the batch generate endpoint."""
+    
+    def test_results_and_item_errors(self, gateway_client, gateway_headers):
+        """Test that each request gets its own line, with errors for invalid requests."""
+        response, lines = post_batch(gateway_client, gateway_headers, [
+            {"prompt": "one", "max_tokens": 10},
+            {"prompt": "too long", "max_tokens": 100000},
+            {"prompt": "groq", "max_tokens": 10, "provider": "groq"},
+            {"prompt": "stream", "max_tokens": 10, "stream": True},
+            {"prompt": "two", "max_tokens": 10},
+        ])
+        
+        assert [line["status"] for line in lines] == [200, 400, 403, 400, 200]
+        assert lines[0]["response"]["text"] == "echo: one"
+        assert lines[4]["response"]["text"] == "echo: two"
+        assert "Max tokens" in lines[1]["detail"]
+    
+    def test_concurrency_is_capped(self, batch_concurrency, gateway_client, gateway_headers, upstream):
+        """Test that no more than BATCH_CONCURRENCY requests of a client reach the provider at once."""
+        upstream.delay = 0.05
+        response, lines = post_batch(
+            gateway_client, gateway_headers, [{"prompt": f"item {i}", "max_tokens": 10} for i in range(6)]
+        )
+        
+        assert all(line["status"] == 200 for line in lines)
+        assert upstream.requests == 6
+        assert upstream.max_in_flight == 2
+    
+    def test_batch_is_charged_as_a_unit(self, gateway_client, gateway_headers, gateway_config, upstream):
+        """Test that a batch is admitted or rejected whole by the rate limiter."""
+        gateway_config(rate_limit={"requests_per_minute": 5, "tokens_per_day": 100000})
+        requests = [{"prompt": f"item {i}", "max_tokens": 10} for i in range(4)]
+        
+        response, lines = post_batch(gateway_client, gateway_headers, requests)
+        assert len(lines) == 4
+        
+        response, _ = post_batch(gateway_client, gateway_headers, requests[:2])
+        assert response.status_code == 429
+        assert upstream.requests == 4
+        
+        response, _ = post_batch(gateway_client, gateway_headers, requests * 2)
+        assert response.status_code == 400
+    
+    def test_batch_tokens_are_reserved_up_front(self, gateway_client, gateway_headers, gateway_config, upstream):
+        """Test that a batch whose prompts do not fit the daily quota together is rejected before any request runs."""
+        # Each prompt fits the quota on its own, the four do not
+        gateway_config(rate_limit={"requests_per_minute": 4, "tokens_per_day": 500})
+        
+        response, _ = post_batch(gateway_client, gateway_headers, [{"prompt": "x" * 800}] * 4)
+        assert response.status_code == 429
+        assert upstream.requests == 0
+        
+        # The rejected batch used none of the request budget
+        response, lines = post_batch(gateway_client, gateway_headers, [{"prompt": f"item {i}", "max_tokens": 10} for i in range(4)])
+        assert all(line["status"] == 200 for line in lines)
+        # The reservation is replaced by the actual usage of each request
+        assert rate_limiter.get_usage(GATEWAY_CLIENT_ID) == 20
+    
+    def test_empty_and_oversized_batches(self, gateway_client, gateway_headers):
+        """Test that empty batches and batches over BATCH_MAX_ITEMS are rejected."""
+        response, _ = post_batch(gateway_client, gateway_headers, [])
+        assert response.status_code == 422
+        
+        original = settings.BATCH_MAX_ITEMS
+        settings.BATCH_MAX_ITEMS = 2
+        try:
+            response, _ = post_batch(gateway_client, gateway_headers, [{"prompt": "x"}] * 3)
+        finally:
+            settings.BATCH_MAX_ITEMS = original
+        assert response.status_code == 400
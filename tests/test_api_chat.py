@@ -0,0 +1,146 @@
+"""
+Tests for the OpenAI-compatible chat completions endpoint against a local mock upstream.
+"""
+import json
+import asyncio
+
+import httpx
+import openai
+
+from app.api.endpoints import _relay_chat_stream
+from app.core.rate_limit import rate_limiter
+from app.models.tokenizer import token_counter
+from app.schemas.base import RateLimit
+from tests.conftest import GATEWAY_CLIENT_ID
+from tests.test_tokens import jwt_secret
+
+MESSAGES = [
+    {"role": "system", "content": "You are terse."},
+    {"role": "user", "content": "hello there"},
+]
+
+class TestChatCompletions:
+    """Tests for the chat completions endpoint."""
+    
+    def test_passthrough(self, gateway_client, gateway_headers, upstream):
+        """Test that a request is passed through and the provider's response relayed."""
+        response = gateway_client.post("/api/v1/chat/completions", json={
+            "messages": MESSAGES, "n": 1, "stop": ["\n\n"], "max_tokens": 20,
+        }, headers=gateway_headers)
+        
+        assert response.status_code == 200
+        assert response.json()["object"] == "chat.completion"
+        assert response.json()["choices"][0]["message"]["content"] == "echo: hello there"
+        sent = json.loads(upstream.last_body)
+        assert sent["messages"] == MESSAGES
+        assert sent["stop"] == ["\n\n"]
+        assert sent["model"] == "gpt-3.5-turbo"
+        assert rate_limiter.get_usage(GATEWAY_CLIENT_ID) == 5
+    
+    def test_body_is_not_reencoded(self, gateway_client, gateway_headers, upstream):
+        """Test that a body the gateway does not need to change reaches the provider byte for byte."""
+        body = b'{"model":"gpt-3.5-turbo","max_tokens":20,"messages":[{"role":"user","content":"hi"}],"logprobs":false}'
+        response = gateway_client.post(
+            "/api/v1/chat/completions", content=body, headers={**gateway_headers, "content-type": "application/json"}
+        )
+        
+        assert response.status_code == 200
+        assert upstream.last_body == body
+    
+    def test_limits_are_applied(self, gateway_client, gateway_headers, upstream):
+        """Test that the client's token limit applies and is sent when the request sets none."""
+        response = gateway_client.post(
+            "/api/v1/chat/completions", json={"messages": MESSAGES, "max_tokens": 100000}, headers=gateway_headers
+        )
+        assert response.status_code == 400
+        
+        gateway_client.post("/api/v1/chat/completions", json={"messages": MESSAGES}, headers=gateway_headers)
+        assert json.loads(upstream.last_body)["max_tokens"] == 2000
+    
+    def test_invalid_requests(self, gateway_client, gateway_headers, upstream):
+        """Test that malformed requests and other providers' models are rejected before reaching the provider."""
+        for body in (
+            {"model": "gpt-3.5-turbo"},
+            {"messages": []},
+            {"messages": MESSAGES, "model": "groq/llama3-8b-8192"},
+            {"messages": MESSAGES, "n": 0},
+            {"messages": MESSAGES, "n": "2"},
+        ):
+            response = gateway_client.post("/api/v1/chat/completions", json=body, headers=gateway_headers)
+            assert response.status_code in (400, 403)
+        assert upstream.requests == 0
+    
+    def test_reservation_covers_every_completion(self, gateway_client, gateway_headers, upstream, monkeypatch):
+        """Test that the token reservation allows max_tokens for each of the n completions."""
+        reservations = []
+        
+        def reserve_tokens(client_config, tokens, required):
+            reservations.append((tokens, required))
+            return 0
+        
+        monkeypatch.setattr("app.api.endpoints.reserve_tokens", reserve_tokens)
+        response = gateway_client.post(
+            "/api/v1/chat/completions", json={"messages": MESSAGES, "n": 3, "max_tokens": 20}, headers=gateway_headers
+        )
+        
+        assert response.status_code == 200
+        [(tokens, required)] = reservations
+        assert tokens == required + 3 * 20
+    
+    def test_provider_errors_are_relayed(self, gateway_client, gateway_headers, upstream):
+        """Test that provider client errors reach the client unchanged."""
+        upstream.fail_status = 400
+        response = gateway_client.post("/api/v1/chat/completions", json={"messages": MESSAGES}, headers=gateway_headers)
+        
+        assert response.status_code == 400
+        assert response.json() == {"error": {"message": "injected failure"}}
+    
+    def test_stream(self, gateway_client, gateway_headers, upstream):
+        """Test that streams are relayed and their usage charged."""
+        with gateway_client.stream("POST", "/api/v1/chat/completions", json={
+            "messages": MESSAGES, "stream": True,
+        }, headers=gateway_headers) as response:
+            assert response.headers["content-type"].startswith("text/event-stream")
+            lines = [line for line in response.iter_lines() if line.startswith("data: ")]
+        
+        assert lines[-1] == "data: [DONE]"
+        text = "".join(
+            choice["delta"].get("content", "")
+            for line in lines[:-1] for choice in json.loads(line[6:])["choices"]
+        )
+        assert text == "echo: hello there"
+        assert json.loads(upstream.last_body)["stream_options"] == {"include_usage": True}
+        assert rate_limiter.get_usage(GATEWAY_CLIENT_ID) == 5
+    
+    def test_stream_ended_early_is_charged(self):
+        """Test that a stream the client leaves before the usage chunk is charged for the content relayed."""
+        rate_limit = RateLimit(requests_per_minute=10, tokens_per_day=100000)
+        rate_limiter.acquire("early-chat-client", rate_limit)
+        rate_limiter.reserve("early-chat-client", rate_limit, 1020, 20)
+        
+        async def chunks():
+            for _ in range(1000):
+                yield b'data: {"choices":[{"index":0,"delta":{"content":"token "}}]}\n\n'
+            yield b'data: {"choices":[],"usage":{"prompt_tokens":20,"completion_tokens":1000,"total_tokens":1020}}\n\n'
+        
+        async def disconnect():
+            stream = _relay_chat_stream("early-chat-client", httpx.Response(200, content=chunks()), "gpt-3.5-turbo", 20, 1020)
+            for _ in range(100):
+                await stream.__anext__()
+            await stream.aclose()
+        
+        asyncio.run(disconnect())
+        assert rate_limiter.get_usage("early-chat-client") == 20 + token_counter.count("gpt-3.5-turbo", "token " * 100)
+    
+    def test_openai_sdk(self, jwt_secret, gateway_client, gateway_headers, upstream):
+        """Test that the OpenAI SDK works against the gateway with a bearer token as API key."""
+        token = gateway_client.post("/api/v1/token", json={
+            "client_id": gateway_headers["client-id"], "client_secret": gateway_headers["client-secret"],
+        }).json()["access_token"]
+        client = openai.OpenAI(api_key=token, base_url="http://testserver/api/v1", http_client=gateway_client)
+        
+        completion = client.chat.completions.create(model="gpt-3.5-turbo", messages=MESSAGES, max_tokens=20)
+        assert completion.choices[0].message.content == "echo: hello there"
+        
+        stream = client.chat.completions.create(model="gpt-3.5-turbo", messages=MESSAGES, max_tokens=20, stream=True)
+        assert "".join(chunk.choices[0].delta.content or "" for chunk in stream if chunk.choices) == "echo: hello there"
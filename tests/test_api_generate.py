@@ -0,0 +1,158 @@
+"""
+Tests for the generate endpoint against a local mock upstream.
+"""
+import json
+import asyncio
+
+from app.api.endpoints import _stream_events
+from app.core.config import settings
+from app.core.rate_limit import rate_limiter
+from app.models.tokenizer import token_counter
+from app.schemas.base import RateLimit
+from tests.conftest import GATEWAY_CLIENT_ID
+
+class TestGenerate:
+    """Tests for the generate endpoint."""
+    
+    def test_generate(self, gateway_client, gateway_headers):
+        """Test a regular generate request."""
+        response = gateway_client.post(
+            "/api/v1/generate",
+            json={"prompt": "Hello", "max_tokens": 10},
+            headers=gateway_headers
+        )
+        
+        assert response.status_code == 200
+        assert response.json()["text"] == "echo: Hello"
+    
+    def test_generate_stream(self, gateway_client, gateway_headers):
+        """Test that a streaming request returns deltas and a final usage event."""
+        with gateway_client.stream(
+            "POST",
+            "/api/v1/generate",
+            json={"prompt": "Hello there", "max_tokens": 10, "stream": True},
+            headers=gateway_headers
+        ) as response:
+            assert response.status_code == 200
+            assert response.headers["content-type"].startswith("text/event-stream")
+            events = [
+                json.loads(line[len("data: "):])
+                for line in response.iter_lines()
+                if line.startswith("data: ")
+            ]
+        
+        assert "".join(event["text"] for event in events[:-1]) == "echo: Hello there"
+        assert events[-1]["done"] is True
+        assert events[-1]["usage"]["total_tokens"] == 5
+    
+    def test_generate_stream_checks_max_tokens(self, gateway_client, gateway_headers):
+        """Test that streaming requests keep the max tokens check."""
+        response = gateway_client.post(
+            "/api/v1/generate",
+            json={"prompt": "Hello", "max_tokens": 100000, "stream": True},
+            headers=gateway_headers
+        )
+        
+        assert response.status_code == 400
+    
+    def test_rate_limit(self, gateway_client, gateway_headers, gateway_config):
+        """Test that requests beyond the client's per-minute limit get a 429."""
+        gateway_config(rate_limit={"requests_per_minute": 2, "tokens_per_day": 100000})
+        
+        statuses = [
+            gateway_client.post("/api/v1/generate", json={"prompt": "Hello", "max_tokens": 10}, headers=gateway_headers)
+            for _ in range(3)
+        ]
+        
+        assert [response.status_code for response in statuses] == [200, 200, 429]
+        assert int(statuses[-1].headers["Retry-After"]) >= 1
+        assert rate_limiter.get_usage(GATEWAY_CLIENT_ID) == 10
+    
+    def test_deterministic_requests_are_cached(self, gateway_client, gateway_headers, upstream):
+        """Test that a repeated temperature 0 request is served from the cache."""
+        request_data = {"prompt": "Cache me", "max_tokens": 10, "temperature": 0}
+        
+        first = gateway_client.post("/api/v1/generate", json=request_data, headers=gateway_headers)
+        second = gateway_client.post("/api/v1/generate", json=request_data, headers=gateway_headers)
+        
+        assert first.json()["cached"] is False
+        assert second.json()["cached"] is True
+        assert second.json()["text"] == first.json()["text"]
+        assert upstream.requests == 1
+    
+    def test_sampled_requests_are_not_cached(self, gateway_client, gateway_headers, upstream):
+        """Test that requests with a non-zero temperature skip the cache unless they opt in."""
+        request_data = {"prompt": "Sample me", "max_tokens": 10, "temperature": 0.7}
+        
+        gateway_client.post("/api/v1/generate", json=request_data, headers=gateway_headers)
+        gateway_client.post("/api/v1/generate", json=request_data, headers=gateway_headers)
+        assert upstream.requests == 2
+        
+        request_data["cache"] = True
+        gateway_client.post("/api/v1/generate", json=request_data, headers=gateway_headers)
+        response = gateway_client.post("/api/v1/generate", json=request_data, headers=gateway_headers)
+        assert response.json()["cached"] is True
+        assert upstream.requests == 3
+    
+    def test_semantic_cache(self, gateway_client, gateway_headers, upstream):
+        """Test that a near-duplicate prompt is served from the semantic cache."""
+        settings.SEMANTIC_CACHE_ENABLED = True
+        try:
+            first = gateway_client.post(
+                "/api/v1/generate",
+                json={"prompt": "What is the capital of France?", "max_tokens": 10, "temperature": 0},
+                headers=gateway_headers
+            )
+            second = gateway_client.post(
+                "/api/v1/generate",
+                json={"prompt": "what is the capital of france", "max_tokens": 10, "temperature": 0},
+                headers=gateway_headers
+            )
+        finally:
+            settings.SEMANTIC_CACHE_ENABLED = False
+        
+        assert second.json()["cached"] is True
+        assert second.json()["text"] == first.json()["text"]
+        assert upstream.requests == 1
+    
+    def test_stream_is_closed_on_disconnect(self):
+        """Test that the provider stream is closed when the client stops reading early."""
+        closed = []
+        
+        async def events():
+            try:
+                for _ in range(1000):
+                    yield {"text": "x"}
+            finally:
+                closed.append(True)
+        
+        async def disconnect():
+            stream = _stream_events(GATEWAY_CLIENT_ID, {"text": "x"}, events(), "gpt-3.5-turbo", 0)
+            await stream.__anext__()
+            await stream.__anext__()
+            await stream.aclose()
+            # Checked before the event loop finalizes leftover generators on exit
+            return list(closed)
+        
+        assert asyncio.run(disconnect()) == [True]
+    
+    def test_stream_ended_early_is_charged(self):
+        """Test that a stream the client leaves before its usage event is charged for what was sent."""
+        rate_limit = RateLimit(requests_per_minute=10, tokens_per_day=100000)
+        rate_limiter.acquire("early-leaver", rate_limit)
+        rate_limiter.reserve("early-leaver", rate_limit, 1020, 20)
+        
+        async def events():
+            for _ in range(1000):
+                yield {"text": "token "}
+            yield {"done": True, "usage": {"prompt_tokens": 20, "completion_tokens": 1000, "total_tokens": 1020}}
+        
+        async def disconnect():
+            stream = _stream_events("early-leaver", {"text": "token "}, events(), "gpt-3.5-turbo", 20, reserved=1020)
+            for _ in range(100):
+                await stream.__anext__()
+            await stream.aclose()
+        
+        asyncio.run(disconnect())
+        
+        assert rate_limiter.get_usage("early-leaver") == 20 + token_counter.count("gpt-3.5-turbo", "token " * 100)
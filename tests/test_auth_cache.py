@@ -0,0 +1,181 @@
+"""
+Tests for client secret hashing and the verified secret cache.
+"""
+import time
+import asyncio
+import logging
+import threading
+
+import pytest
+from fastapi import HTTPException
+
+from app.clients import auth, secrets
+from app.clients.auth import client_manager
+from app.clients.secrets import VerifiedSecretCache, hash_secret, verify_secret
+from tests.conftest import GATEWAY_CLIENT_ID, GATEWAY_CLIENT_SECRET
+
+class FakeClock:
+    """Manually advanced clock."""
+    
+    def __init__(self):
+        self.now = 0.0
+    
+    def __call__(self):
+        return self.now
+
+@pytest.fixture
+def scrypt_client(gateway_config):
+    """Store the gateway client's secret as an scrypt hash."""
+    gateway_config(client_secret_hash=hash_secret(GATEWAY_CLIENT_SECRET, "scrypt"))
+
+@pytest.fixture
+def counted_verify(monkeypatch):
+    """Count calls to the slow secret verification."""
+    calls = []
+    
+    def verify(secret, secret_hash):
+        calls.append(secret)
+        return verify_secret(secret, secret_hash)
+    
+    monkeypatch.setattr(auth, "verify_secret", verify)
+    return calls
+
+class TestSecretHashing:
+    """Tests for secret hash formats."""
+    
+    def test_sha256_hashes(self):
+        """Test that legacy SHA-256 hex hashes still verify."""
+        secret_hash = hash_secret("password", "sha256")
+        
+        assert secret_hash == "5e884898da28047151d0e56f8dc6292773603d0d6aabbdd62a11ef721d1542d8"
+        assert verify_secret("password", secret_hash)
+        assert verify_secret("password", secret_hash.upper())
+        assert not verify_secret("Password", secret_hash)
+    
+    def test_scrypt_hashes(self):
+        """Test that scrypt hashes are salted and verify."""
+        secret_hash = hash_secret("password", "scrypt")
+        
+        assert secret_hash.startswith("scrypt$16384$8$1$")
+        assert secret_hash != hash_secret("password", "scrypt")
+        assert verify_secret("password", secret_hash)
+        assert not verify_secret("wrong", secret_hash)
+    
+    def test_malformed_hashes_fail(self):
+        """Test that malformed hashes reject every secret instead of raising."""
+        assert not verify_secret("password", "scrypt$not$a$valid$hash")
+        assert not verify_secret("password", "scrypt$16384$8$1$!!!$!!!")
+    
+    @pytest.mark.skipif(secrets.argon2 is not None, reason="argon2-cffi is installed")
+    def test_argon2_needs_package(self):
+        """Test that argon2 hashes are rejected when argon2-cffi is missing."""
+        with pytest.raises(ValueError):
+            hash_secret("password", "argon2")
+        assert not verify_secret("password", "$argon2id$v=19$m=65536,t=3,p=4$c2FsdA$aGFzaA")
+
+
+class TestVerifiedSecretCache:
+    """Tests for the verified secret cache."""
+    
+    def test_entries_expire(self):
+        """Test that verifications are forgotten after the TTL."""
+        clock = FakeClock()
+        cache = VerifiedSecretCache(ttl=10, clock=clock)
+        cache.add("client", cache.digest("secret"))
+        
+        assert cache.check("client", cache.digest("secret"))
+        assert not cache.check("client", cache.digest("other"))
+        clock.now = 11
+        assert not cache.check("client", cache.digest("secret"))
+    
+    def test_size_is_bounded(self):
+        """Test that the least recently used client is evicted."""
+        cache = VerifiedSecretCache(max_entries=2)
+        for client_id in ("a", "b"):
+            cache.add(client_id, cache.digest("secret"))
+        cache.check("a", cache.digest("secret"))
+        cache.add("c", cache.digest("secret"))
+        
+        assert cache.stats()["entries"] == 2
+        assert not cache.check("b", cache.digest("secret"))
+        assert cache.check("a", cache.digest("secret"))
+
+
+class TestClientAuthentication:
+    """Tests for client authentication with the secret cache."""
+    
+    def test_verified_secrets_skip_the_kdf(self, scrypt_client, counted_verify):
+        """Test that only the first request with a secret runs the slow hash."""
+        for _ in range(3):
+            config = client_manager.authenticate_client(GATEWAY_CLIENT_ID, GATEWAY_CLIENT_SECRET)
+        
+        assert config.client_id == GATEWAY_CLIENT_ID
+        assert len(counted_verify) == 1
+    
+    def test_wrong_secret_is_rejected_after_caching(self, scrypt_client):
+        """Test that a cached verification does not admit a different secret."""
+        client_manager.authenticate_client(GATEWAY_CLIENT_ID, GATEWAY_CLIENT_SECRET)
+        
+        with pytest.raises(HTTPException) as exc_info:
+            client_manager.authenticate_client(GATEWAY_CLIENT_ID, "wrong")
+        assert exc_info.value.status_code == 401
+    
+    def test_reload_invalidates_cache(self, gateway_config, counted_verify):
+        """Test that a reload forgets verified secrets, so a rotated secret takes effect."""
+        client_manager.authenticate_client(GATEWAY_CLIENT_ID, GATEWAY_CLIENT_SECRET)
+        gateway_config(client_secret_hash=hash_secret("rotated", "scrypt"))
+        
+        with pytest.raises(HTTPException):
+            client_manager.authenticate_client(GATEWAY_CLIENT_ID, GATEWAY_CLIENT_SECRET)
+        assert client_manager.authenticate_client(GATEWAY_CLIENT_ID, "rotated").client_id == GATEWAY_CLIENT_ID
+    
+    def test_failure_logs_are_throttled(self, gateway_config, caplog):
+        """Test that repeated failures for a client are logged once per interval."""
+        client_manager._failure_logs.clear()
+        with caplog.at_level(logging.WARNING, logger="app.clients.auth"):
+            for _ in range(5):
+                with pytest.raises(HTTPException):
+                    client_manager.authenticate_client(GATEWAY_CLIENT_ID, "wrong")
+            for i in range(5):
+                with pytest.raises(HTTPException):
+                    client_manager.authenticate_client(f"unknown-{i}", "wrong")
+        
+        messages = [record.getMessage() for record in caplog.records]
+        assert len([m for m in messages if m.startswith("Invalid credentials")]) == 1
+        assert [m for m in messages if m.startswith("Client configuration not found")] == [
+            "Client configuration not found: unknown-0"
+        ]
+    
+    def test_slow_hashes_run_off_the_event_loop(self, scrypt_client, monkeypatch):
+        """Test that slow hash checks run in threads, at most AUTH_KDF_CONCURRENCY at a time."""
+        active, peak = [0], [0]
+        lock = threading.Lock()
+        
+        def verify(secret, secret_hash):
+            with lock:
+                active[0] += 1
+                peak[0] = max(peak[0], active[0])
+            time.sleep(0.05)
+            with lock:
+                active[0] -= 1
+            return False
+        
+        monkeypatch.setattr(auth, "verify_secret", verify)
+        monkeypatch.setattr(auth.settings, "AUTH_KDF_CONCURRENCY", 2)
+        
+        async def run():
+            ticks = 0
+            
+            async def attempt():
+                with pytest.raises(HTTPException):
+                    await client_manager.authenticate(GATEWAY_CLIENT_ID, "wrong")
+            
+            attempts = asyncio.gather(*(attempt() for _ in range(4)))
+            while not attempts.done():
+                ticks += 1
+                await asyncio.sleep(0.01)
+            await attempts
+            return ticks
+        
+        assert asyncio.run(run()) > 5
+        assert peak[0] == 2
@@ -0,0 +1,120 @@
+"""
+Tests for micro-batching and the Triton provider.
+"""
+import asyncio
+
+import pytest
+
+from app.core.config import settings
+from app.models.batching import MicroBatcher
+from app.models.llm import get_model
+from tests.mock_upstream import run_mock_upstream
+from tests.test_models import run
+
+@pytest.fixture
+def triton_upstream():
+    """Point the Triton provider at a local mock upstream."""
+    original = settings.TRITON_BASE_URL
+    
+    with run_mock_upstream(delay=0.05) as upstream:
+        settings.TRITON_BASE_URL = upstream.base_url
+        yield upstream
+    
+    settings.TRITON_BASE_URL = original
+
+class TestMicroBatcher:
+    """Tests for the micro-batcher."""
+    
+    def test_concurrent_items_share_a_batch(self):
+        """Test that concurrent items with the same key are sent as one batch, in order."""
+        batches = []
+        
+        async def send_batch(key, items):
+            batches.append((key, list(items)))
+            return [item * 2 for item in items]
+        
+        batcher = MicroBatcher(send_batch, max_batch_size=16, max_wait=0.01)
+        
+        async def submit_all():
+            return await asyncio.gather(*[batcher.submit("key", i) for i in range(5)])
+        
+        assert asyncio.run(submit_all()) == [0, 2, 4, 6, 8]
+        assert batches == [("key", [0, 1, 2, 3, 4])]
+    
+    def test_full_batches_flush_immediately(self):
+        """Test that a batch is sent as soon as it reaches the maximum size."""
+        sizes = []
+        
+        async def send_batch(key, items):
+            sizes.append(len(items))
+            return items
+        
+        batcher = MicroBatcher(send_batch, max_batch_size=4, max_wait=10)
+        
+        async def submit_all():
+            return await asyncio.wait_for(asyncio.gather(*[batcher.submit("key", i) for i in range(8)]), timeout=1)
+        
+        assert asyncio.run(submit_all()) == list(range(8))
+        assert sizes == [4, 4]
+    
+    def test_keys_are_batched_separately(self):
+        """Test that items with different keys never share a batch."""
+        batches = []
+        
+        async def send_batch(key, items):
+            batches.append((key, len(items)))
+            return items
+        
+        batcher = MicroBatcher(send_batch, max_batch_size=16, max_wait=0.01)
+        
+        async def submit_all():
+            await asyncio.gather(*[batcher.submit(i % 2, i) for i in range(6)])
+        
+        asyncio.run(submit_all())
+        assert sorted(batches) == [(0, 3), (1, 3)]
+    
+    def test_batch_errors_reach_every_caller(self):
+        """Test that a failed batch raises the error for each of its items."""
+        async def send_batch(key, items):
+            raise RuntimeError("backend down")
+        
+        batcher = MicroBatcher(send_batch, max_batch_size=16, max_wait=0.01)
+        
+        async def submit_all():
+            return await asyncio.gather(*[batcher.submit("key", i) for i in range(3)], return_exceptions=True)
+        
+        results = asyncio.run(submit_all())
+        assert all(isinstance(result, RuntimeError) for result in results)
+
+
+class TestTritonModel:
+    """Tests for the Triton provider."""
+    
+    def test_concurrent_generations_are_batched(self, triton_upstream):
+        """Test that concurrent generations reach Triton as batched calls."""
+        model = get_model("triton", "mock-llama")
+        
+        async def generate_all():
+            return await asyncio.gather(*[
+                model.generate(prompt=f"prompt {i}", temperature=0, max_tokens=10)
+                for i in range(20)
+            ])
+        
+        responses = run(generate_all())
+        
+        assert [response["text"] for response in responses] == [f"echo: prompt {i}" for i in range(20)]
+        # Triton does not report usage, so it is counted locally
+        usage = responses[0]["usage"]
+        assert usage["prompt_tokens"] > 0 and usage["completion_tokens"] > 0
+        assert usage["total_tokens"] == usage["prompt_tokens"] + usage["completion_tokens"]
+        assert sum(triton_upstream.batch_sizes) == 20
+        assert triton_upstream.requests < 20
+        assert max(triton_upstream.batch_sizes) <= settings.TRITON_MAX_BATCH_SIZE
+    
+    def test_generation_errors_are_raised(self, triton_upstream):
+        """Test that an upstream failure raises for the caller."""
+        model = get_model("triton", "mock-llama")
+        triton_upstream.fail_status = 503
+        
+        with pytest.raises(Exception):
+            run(model.generate(prompt="Hello", max_tokens=10))
@@ -0,0 +1,54 @@
+"""
+Tests for the response cache.
+"""
+import time
+
+from app.core.cache import ResponseCache, ENTRY_OVERHEAD_BYTES
+
+def make_response(text):
+    """Build a generate response dict."""
+    return {"text": text, "model": "model", "usage": {"prompt_tokens": 1, "completion_tokens": 1, "total_tokens": 2}}
+
+class TestResponseCache:
+    """Tests for the LRU response cache."""
+    
+    def test_hit_and_miss(self):
+        """Test that cached responses are returned and counted."""
+        cache = ResponseCache(max_bytes=1024 * 1024, ttl=60)
+        key = cache.make_key("groq", "model", "prompt", 0.0, 10)
+        
+        assert cache.get(key) is None
+        cache.set(key, make_response("hello"))
+        
+        assert cache.get(key)["text"] == "hello"
+        assert cache.get(cache.make_key("groq", "model", "prompt", 0.0, 20)) is None
+        assert cache.stats()["hits"] == 1
+        assert cache.stats()["misses"] == 2
+    
+    def test_ttl_expiry(self):
+        """Test that entries expire after the TTL."""
+        cache = ResponseCache(max_bytes=1024 * 1024, ttl=0.01)
+        key = cache.make_key("groq", "model", "prompt", 0.0, 10)
+        cache.set(key, make_response("hello"))
+        
+        time.sleep(0.02)
+        
+        assert cache.get(key) is None
+        assert cache.stats()["entries"] == 0
+        assert cache.stats()["size_bytes"] == 0
+    
+    def test_lru_eviction_by_size(self):
+        """Test that the least recently used entries are evicted to stay within the size bound."""
+        cache = ResponseCache(max_bytes=3 * (ENTRY_OVERHEAD_BYTES + 100), ttl=60)
+        keys = [cache.make_key("groq", "model", f"prompt {i}", 0.0, 10) for i in range(4)]
+        for key in keys[:3]:
+            cache.set(key, make_response("x"))
+        
+        # Touch the oldest entry so the second one becomes least recently used
+        cache.get(keys[0])
+        cache.set(keys[3], make_response("x"))
+        
+        assert cache.get(keys[1]) is None
+        assert cache.get(keys[0]) is not None
+        assert cache.stats()["evictions"] == 1
+        assert cache.size_bytes <= cache.max_bytes
@@ -0,0 +1,167 @@
+"""
+Tests for provider circuit breakers and fallback routing.
+"""
+import httpx
+import pytest
+
+from app.core.config import settings
+from app.models.circuit_breaker import CircuitBreaker, CircuitOpenError, circuit_breakers, is_provider_failure
+from tests.mock_upstream import run_mock_upstream
+
+class FakeClock:
+    """Manually advanced monotonic clock."""
+    
+    def __init__(self):
+        """Start the clock at zero."""
+        self.now = 0.0
+    
+    def __call__(self):
+        """Get the current time."""
+        return self.now
+
+class StatusError(Exception):
+    """Error carrying an HTTP status code, like the provider SDK errors."""
+    
+    def __init__(self, status_code):
+        """Initialize the error with a status code."""
+        super().__init__(f"status {status_code}")
+        self.status_code = status_code
+
+@pytest.fixture
+def fast_fail():
+    """Disable SDK retries and open circuits after two failures.
+    
+    Request this fixture before the gateway client so the pooled clients are
+    created without retries.
+    """
+    original = (settings.PROVIDER_MAX_RETRIES, settings.CIRCUIT_FAILURE_THRESHOLD, settings.FALLBACK_TARGETS)
+    settings.PROVIDER_MAX_RETRIES = 0
+    settings.CIRCUIT_FAILURE_THRESHOLD = 2
+    yield
+    settings.PROVIDER_MAX_RETRIES, settings.CIRCUIT_FAILURE_THRESHOLD, settings.FALLBACK_TARGETS = original
+
+class TestCircuitBreaker:
+    """Tests for the circuit breaker state machine."""
+    
+    def test_opens_after_consecutive_failures(self):
+        """Test that the circuit opens at the failure threshold and rejects calls."""
+        breaker = CircuitBreaker("groq/model", failure_threshold=3, clock=FakeClock())
+        
+        for _ in range(2):
+            breaker.acquire()
+            breaker.record_failure()
+        breaker.acquire()
+        breaker.record_success()
+        for _ in range(3):
+            breaker.acquire()
+            breaker.record_failure()
+        
+        assert breaker.state == "open"
+        with pytest.raises(CircuitOpenError):
+            breaker.acquire()
+        assert breaker.rejected == 1
+    
+    def test_half_open_probe_closes_circuit(self):
+        """Test that a successful probe after the reset timeout closes the circuit."""
+        clock = FakeClock()
+        breaker = CircuitBreaker("groq/model", failure_threshold=1, reset_timeout=10, clock=clock)
+        breaker.acquire()
+        breaker.record_failure()
+        
+        clock.now = 9
+        assert not breaker.available()
+        assert breaker.retry_after() == pytest.approx(1)
+        
+        clock.now = 10
+        assert breaker.state == "half_open"
+        breaker.acquire()
+        # Only one probe at a time
+        with pytest.raises(CircuitOpenError):
+            breaker.acquire()
+        breaker.record_success()
+        assert breaker.state == "closed"
+    
+    def test_failed_probe_reopens_circuit(self):
+        """Test that a failed probe opens the circuit for another reset timeout."""
+        clock = FakeClock()
+        breaker = CircuitBreaker("groq/model", failure_threshold=1, reset_timeout=10, clock=clock)
+        breaker.acquire()
+        breaker.record_failure()
+        
+        clock.now = 10
+        breaker.acquire()
+        breaker.record_failure()
+        
+        assert breaker.state == "open"
+        assert breaker.retry_after() == pytest.approx(10)
+    
+    def test_client_errors_are_not_failures(self):
+        """Test that only provider-side errors count as failures."""
+        assert is_provider_failure(StatusError(503))
+        assert is_provider_failure(StatusError(429))
+        assert is_provider_failure(TimeoutError())
+        assert is_provider_failure(httpx.ConnectError("refused"))
+        assert not is_provider_failure(StatusError(400))
+        assert not is_provider_failure(StatusError(404))
+        assert not is_provider_failure(TypeError("bug in the gateway"))
+
+
+class TestCircuitBreakerAPI:
+    """Tests for circuit breaking through the generate endpoint."""
+    
+    def test_failing_provider_is_rejected_fast(self, fast_fail, gateway_client, gateway_headers, upstream):
+        """Test that calls to a failing provider are rejected once its circuit opens."""
+        upstream.fail_status = 503
+        request_data = {"prompt": "Hello", "max_tokens": 10}
+        
+        statuses = [
+            gateway_client.post("/api/v1/generate", json=request_data, headers=gateway_headers).status_code
+            for _ in range(2)
+        ]
+        rejected = gateway_client.post("/api/v1/generate", json=request_data, headers=gateway_headers)
+        
+        assert statuses == [500, 500]
+        assert rejected.status_code == 503
+        assert int(rejected.headers["Retry-After"]) >= 1
+        assert upstream.requests == 2
+    
+    def test_probe_closes_circuit_after_recovery(self, fast_fail, gateway_client, gateway_headers, upstream):
+        """Test that a probe call after the reset timeout closes the circuit."""
+        upstream.fail_status = 503
+        request_data = {"prompt": "Hello", "max_tokens": 10}
+        for _ in range(2):
+            gateway_client.post("/api/v1/generate", json=request_data, headers=gateway_headers)
+        
+        upstream.fail_status = None
+        breaker = circuit_breakers.get(("openai", "gpt-3.5-turbo"))
+        breaker.opened_at -= breaker.reset_timeout
+        
+        response = gateway_client.post("/api/v1/generate", json=request_data, headers=gateway_headers)
+        
+        assert response.status_code == 200
+        assert breaker.state == "closed"
+    
+    def test_fallback_provider_serves_requests(self, fast_fail, gateway_client, gateway_headers, gateway_config, upstream):
+        """Test that requests fail over to an allowed fallback provider."""
+        original = (settings.GROQ_API_KEY, settings.GROQ_BASE_URL)
+        with run_mock_upstream() as fallback:
+            settings.GROQ_API_KEY = "gsk-test"
+            settings.GROQ_BASE_URL = fallback.base_url
+            settings.FALLBACK_TARGETS = {"openai": ["groq/mock-groq"]}
+            gateway_config(allowed_providers=["openai", "groq"], allowed_endpoints=["generate", "circuits"])
+            upstream.fail_status = 503
+            try:
+                responses = [
+                    gateway_client.post("/api/v1/generate", json={"prompt": "Hello", "max_tokens": 10}, headers=gateway_headers)
+                    for _ in range(4)
+                ]
+                circuits = gateway_client.get("/api/v1/circuits", headers=gateway_headers).json()["circuits"]
+            finally:
+                settings.GROQ_API_KEY, settings.GROQ_BASE_URL = original
+        
+        assert [response.status_code for response in responses] == [200] * 4
+        assert all(response.json()["model"] == "mock-groq" for response in responses)
+        # The failing provider is only called until its circuit opens
+        assert upstream.requests == 2
+        assert circuits["openai/gpt-3.5-turbo"]["state"] == "open"
+        assert circuits["groq/mock-groq"]["state"] == "closed"
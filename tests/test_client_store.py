@@ -0,0 +1,152 @@
+"""
+Tests for client stores and the read-through client cache.
+"""
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+
+from app.core.config import settings
+from app.clients.auth import ClientManager
+from app.clients.secrets import hash_secret
+from app.clients.store import FileClientStore, ReadThroughCache, SQLiteClientStore, create_client_store, main
+from tests.test_config_reload import write_clients
+from tests.test_registry import make_config
+
+class FakeClock:
+    """Manually advanced monotonic clock."""
+    
+    def __init__(self):
+        self.now = 0.0
+    
+    def __call__(self) -> float:
+        return self.now
+
+@pytest.fixture
+def database(tmp_path):
+    """Create a database with three clients imported from configuration files."""
+    write_clients(tmp_path / "configs", 3)
+    path = str(tmp_path / "clients.db")
+    main([str(tmp_path / "configs"), path])
+    return path
+
+def set_secret(store: SQLiteClientStore, client_id: str, secret: str) -> None:
+    """Store a client configuration with a new secret."""
+    store.put(make_config(client_id, client_secret_hash=hash_secret(secret, "sha256")))
+
+class TestReadThroughCache:
+    """Tests for the read-through cache."""
+    
+    def test_found_and_unknown_ids_are_cached(self):
+        """Test that repeated lookups of known and unknown IDs do not reach the store."""
+        fetched = []
+        record = object()
+        clock = FakeClock()
+        cache = ReadThroughCache(lambda client_id: fetched.append(client_id) or (record if client_id == "a" else None), 10, 10, 30, clock)
+        
+        for _ in range(3):
+            assert cache.get("a") is record
+            assert cache.get("unknown") is None
+        assert fetched == ["a", "unknown"]
+        
+        clock.now = 31
+        assert cache.get("unknown") is None
+        assert fetched == ["a", "unknown", "unknown"]
+    
+    def test_unknown_ids_are_bounded(self):
+        """Test that a flood of unknown IDs keeps only the most recent ones."""
+        cache = ReadThroughCache(lambda client_id: None, 10, 100, 30, FakeClock())
+        for i in range(1000):
+            cache.get(f"attacker_{i}")
+        
+        assert cache.stats()["negative_entries"] == 100
+        assert cache.stats()["misses"] == 1000
+    
+    def test_updates(self):
+        """Test that changes replace cached records and clear remembered unknown IDs."""
+        records = {"a": "old"}
+        cache = ReadThroughCache(records.get, 10, 10, 30, FakeClock())
+        cache.get("a")
+        cache.get("b")
+        
+        cache.update("a", "new")
+        records["b"] = "created"
+        cache.update("b", "created")
+        assert cache.get("a") == "new"
+        assert cache.get("b") == "created"
+        
+        cache.update("a", None)
+        assert cache.stats()["entries"] == 1
+
+
+class TestSQLiteClientStore:
+    """Tests for the database client store."""
+    
+    def test_authenticates_without_warm_database_reads(self, database):
+        """Test that repeated authentications are served from the cache."""
+        manager = ClientManager(SQLiteClientStore(database))
+        assert len(manager.clients) == 3
+        
+        for _ in range(5):
+            assert manager.authenticate_client("client_1", "secret_1").client_id == "client_1"
+            with pytest.raises(HTTPException):
+                manager.authenticate_client("missing", "secret")
+        
+        assert manager.store.stats()["misses"] == 2
+        manager.store.close()
+    
+    def test_replicas_pull_changes(self, database):
+        """Test that a replica applies only the rows changed by another replica."""
+        writer = SQLiteClientStore(database)
+        reader = ClientManager(SQLiteClientStore(database))
+        reader.authenticate_client("client_0", "secret_0")
+        with pytest.raises(HTTPException):
+            reader.authenticate_client("client_9", "secret_9")
+        
+        set_secret(writer, "client_0", "rotated")
+        set_secret(writer, "client_9", "secret_9")
+        writer.delete("client_2")
+        result = reader.store.scan()
+        assert set(result.changes) == {"client_0", "client_2", "client_9"}
+        reader._apply(result)
+        
+        with pytest.raises(HTTPException):
+            reader.authenticate_client("client_0", "secret_0")
+        assert reader.authenticate_client("client_0", "rotated").client_id == "client_0"
+        assert reader.authenticate_client("client_9", "secret_9").client_id == "client_9"
+        with pytest.raises(HTTPException):
+            reader.authenticate_client("client_2", "secret_2")
+        assert len(reader.clients) == 3
+        assert reader.store.scan().changes == {}
+        writer.close()
+        reader.store.close()
+    
+    def test_stale_scans_are_retried(self, database):
+        """Test that a scan started before another was applied is not applied."""
+        store = SQLiteClientStore(database)
+        manager = ClientManager(store)
+        stale = store.scan()
+        store.put(make_config("client_new"))
+        asyncio.run(manager.refresh_clients())
+        
+        assert not manager._apply(stale)
+        assert manager.clients.get("client_new") is not None
+        store.close()
+
+
+class TestCreateClientStore:
+    """Tests for choosing the client store."""
+    
+    def test_configured_store(self, database):
+        """Test that the store follows the CLIENT_STORE setting."""
+        original = (settings.CLIENT_STORE, settings.CLIENT_STORE_PATH)
+        settings.CLIENT_STORE, settings.CLIENT_STORE_PATH = "sqlite", database
+        try:
+            store = create_client_store()
+            assert isinstance(store, SQLiteClientStore)
+            store.close()
+            assert isinstance(create_client_store("file"), FileClientStore)
+            with pytest.raises(ValueError):
+                create_client_store("nosql")
+        finally:
+            settings.CLIENT_STORE, settings.CLIENT_STORE_PATH = original
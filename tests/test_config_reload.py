@@ -0,0 +1,213 @@
+"""
+Tests for incremental client configuration reloads and file watching.
+"""
+import os
+import json
+import random
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+
+from app.core.config import settings
+from app.clients.auth import ClientManager, client_manager
+from app.clients.config_loader import ClientConfigLoader, ConfigWatcher, Inotify
+from tests.test_api_auth import create_test_client_config
+
+def write_clients(directory, count: int, start: int = 0) -> None:
+    """Write client configuration files named client_<i>."""
+    for i in range(start, start + count):
+        create_test_client_config(f"client_{i}", f"Client {i}", f"secret_{i}", ["openai"], str(directory))
+
+def rename_client(directory, i: int, name: str) -> None:
+    """Change the name in a client's configuration file."""
+    path = os.path.join(directory, f"client_{i}.json")
+    with open(path) as f:
+        config = json.load(f)
+    config["name"] = name
+    with open(path, "w") as f:
+        json.dump(config, f, indent=4)
+
+@pytest.fixture
+def config_dir(tmp_path):
+    """Point the client configuration directory at an empty temporary directory."""
+    original = settings.CLIENT_CONFIG_DIR
+    settings.CLIENT_CONFIG_DIR = str(tmp_path)
+    yield tmp_path
+    settings.CLIENT_CONFIG_DIR = original
+
+class TestClientConfigLoader:
+    """Tests for incremental scans."""
+    
+    def test_only_changed_files_are_parsed(self, tmp_path):
+        """Test that a rescan parses new and modified files only."""
+        write_clients(tmp_path, 5)
+        loader = ClientConfigLoader()
+        result = loader.scan(str(tmp_path))
+        loader.apply(result)
+        assert result.parsed == 5 and len(result.clients) == 5
+        
+        rename_client(tmp_path, 2, "Renamed")
+        write_clients(tmp_path, 1, start=5)
+        result = loader.scan(str(tmp_path))
+        loader.apply(result)
+        
+        assert result.parsed == 2
+        assert result.changed == {"client_2", "client_5"}
+        assert result.clients["client_2"].name == "Renamed"
+    
+    def test_touched_files_are_not_reparsed(self, tmp_path):
+        """Test that a file whose content did not change keeps its parsed configuration."""
+        write_clients(tmp_path, 2)
+        loader = ClientConfigLoader()
+        first = loader.scan(str(tmp_path))
+        loader.apply(first)
+        
+        os.utime(tmp_path / "client_0.json", ns=(0, 10 ** 18))
+        result = loader.scan(str(tmp_path))
+        
+        assert result.parsed == 0
+        assert result.changed == set()
+        assert result.clients["client_0"] is first.clients["client_0"]
+    
+    def test_removed_and_broken_files(self, tmp_path):
+        """Test that removed files drop their client and broken files keep the last good version."""
+        write_clients(tmp_path, 3)
+        loader = ClientConfigLoader()
+        loader.apply(loader.scan(str(tmp_path)))
+        
+        os.remove(tmp_path / "client_0.json")
+        (tmp_path / "client_1.json").write_text("{ not json")
+        result = loader.scan(str(tmp_path))
+        
+        assert result.removed == 1
+        assert set(result.clients) == {"client_1", "client_2"}
+        assert result.clients["client_1"].name == "Client 1"
+    
+    def test_scan_of_named_files(self, tmp_path):
+        """Test that a scan limited to changed file names updates only those clients."""
+        write_clients(tmp_path, 3)
+        loader = ClientConfigLoader()
+        loader.apply(loader.scan(str(tmp_path)))
+        
+        os.remove(tmp_path / "client_0.json")
+        rename_client(tmp_path, 1, "Renamed")
+        rename_client(tmp_path, 2, "Not checked")
+        result = loader.scan(str(tmp_path), names={"client_0.json", "client_1.json"})
+        
+        assert result.changed == {"client_0", "client_1"}
+        assert set(result.clients) == {"client_1", "client_2"}
+        assert result.clients["client_1"].name == "Renamed"
+        assert result.clients["client_2"].name == "Client 2"
+    
+    def test_stale_scans_are_dropped(self, tmp_path):
+        """Test that a scan started before another was applied is not applied."""
+        write_clients(tmp_path, 1)
+        loader = ClientConfigLoader()
+        stale = loader.scan(str(tmp_path))
+        loader.apply(loader.scan(str(tmp_path)))
+        
+        assert not loader.apply(stale)
+
+
+class TestClientManagerReload:
+    """Tests for atomic reloads in the client manager."""
+    
+    def test_no_failed_auths_during_reloads(self, config_dir):
+        """Test that requests keep authenticating while files change and reloads run."""
+        clients = 500
+        write_clients(config_dir, clients)
+        manager = ClientManager()
+        failures = 0
+        
+        async def traffic(stop: asyncio.Event):
+            nonlocal failures
+            while not stop.is_set():
+                i = random.randrange(clients)
+                try:
+                    manager.authenticate_client(f"client_{i}", f"secret_{i}")
+                except HTTPException:
+                    failures += 1
+                await asyncio.sleep(0)
+        
+        async def reloads(stop: asyncio.Event):
+            for version in range(10):
+                for i in random.sample(range(clients), 50):
+                    rename_client(config_dir, i, f"Client {i} v{version}")
+                await manager.refresh_clients()
+                manager.reload_clients()
+            stop.set()
+        
+        async def main():
+            stop = asyncio.Event()
+            await asyncio.gather(reloads(stop), *[traffic(stop) for _ in range(4)])
+        
+        asyncio.run(main())
+        assert failures == 0
+        assert len(manager.clients) == clients
+    
+    def test_reload_only_forgets_changed_secrets(self, config_dir):
+        """Test that a reload keeps verified secrets of unchanged clients."""
+        write_clients(config_dir, 2)
+        manager = ClientManager()
+        for i in range(2):
+            manager.authenticate_client(f"client_{i}", f"secret_{i}")
+        
+        rename_client(config_dir, 0, "Renamed")
+        manager.reload_clients()
+        
+        assert manager.secret_cache.stats()["entries"] == 1
+    
+    def test_reload_endpoint_scans_off_the_event_loop(self, gateway_client, gateway_headers, gateway_config, monkeypatch):
+        """Test that the reload endpoint scans the store in a worker thread and picks up new clients."""
+        on_loop = []
+        scan = client_manager.store.scan
+        
+        def recording_scan(*args):
+            try:
+                asyncio.get_running_loop()
+                on_loop.append(True)
+            except RuntimeError:
+                on_loop.append(False)
+            return scan(*args)
+        
+        monkeypatch.setattr(client_manager.store, "scan", recording_scan)
+        gateway_config(allowed_endpoints=["generate", "clients/reload"])
+        create_test_client_config("new_client", "New", "secret", ["openai"], settings.CLIENT_CONFIG_DIR)
+        on_loop.clear()
+        
+        response = gateway_client.get("/api/v1/clients/reload", headers=gateway_headers)
+        
+        assert response.status_code == 200
+        assert response.json()["count"] == 2
+        assert client_manager.get_client_config("new_client") is not None
+        assert on_loop == [False]
+
+
+class TestConfigWatcher:
+    """Tests for automatic reloads."""
+    
+    @pytest.mark.parametrize("mode", ["poll", "inotify"])
+    def test_watcher_picks_up_new_files(self, config_dir, mode):
+        """Test that a new configuration file is loaded without a reload call."""
+        if mode == "inotify":
+            try:
+                Inotify(str(config_dir)).close()
+            except OSError:
+                pytest.skip("inotify is not available")
+        manager = ClientManager()
+        
+        async def main():
+            watcher = ConfigWatcher(str(config_dir), manager.refresh_clients, mode=mode, interval=0.05, debounce=0.01)
+            watcher.start()
+            try:
+                write_clients(config_dir, 1)
+                for _ in range(100):
+                    await asyncio.sleep(0.02)
+                    if "client_0" in manager.clients:
+                        break
+            finally:
+                await watcher.stop()
+        
+        asyncio.run(main())
+        assert manager.authenticate_client("client_0", "secret_0").client_id == "client_0"
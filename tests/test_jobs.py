@@ -0,0 +1,239 @@
+"""
+Tests for the job queue and the job endpoints.
+"""
+import time
+import asyncio
+import threading
+
+import pytest
+
+from app.core.config import settings
+from app.core.jobs import JobDeferred, JobQueue, JobQueueFull
+
+class FakeClock:
+    """Manually advanced wall clock."""
+    
+    def __init__(self):
+        self.now = 1000.0
+    
+    def __call__(self) -> float:
+        return self.now
+
+@pytest.fixture
+def clock():
+    """Create a fake clock."""
+    return FakeClock()
+
+@pytest.fixture
+def queue(tmp_path, clock):
+    """Create a job queue in a temporary database."""
+    queue = JobQueue(str(tmp_path / "jobs.db"), clock)
+    yield queue
+    queue.close()
+
+@pytest.fixture
+def job_settings(tmp_path):
+    """Enable the job queue with small limits, in a temporary database."""
+    names = ("JOBS_ENABLED", "JOB_QUEUE_PATH", "JOB_POLL_INTERVAL", "JOB_QUEUE_MAX_PER_CLIENT", "JOB_MAX_ATTEMPTS")
+    original = {name: getattr(settings, name) for name in names}
+    settings.JOBS_ENABLED = True
+    settings.JOB_QUEUE_PATH = str(tmp_path / "jobs.db")
+    settings.JOB_POLL_INTERVAL = 0.05
+    settings.JOB_QUEUE_MAX_PER_CLIENT = 3
+    settings.JOB_MAX_ATTEMPTS = 2
+    yield
+    for name, value in original.items():
+        setattr(settings, name, value)
+
+def claim_all(queue: JobQueue):
+    """Claim jobs until the queue has none ready."""
+    claimed = []
+    while (job := queue.claim()) is not None:
+        claimed.append((job.client_id, job.payload))
+    return claimed
+
+class TestJobQueue:
+    """Tests for the job queue."""
+    
+    def test_clients_take_turns(self, queue):
+        """Test that clients take turns and priority only orders a client's own jobs."""
+        for i in range(3):
+            queue.submit("busy", i)
+        queue.submit("busy", "urgent", priority=9)
+        queue.submit("quiet", 0)
+        
+        assert claim_all(queue) == [("busy", "urgent"), ("quiet", 0), ("busy", 0), ("busy", 1), ("busy", 2)]
+    
+    def test_backpressure(self, queue):
+        """Test that submissions are rejected once the client's or the queue's limit is reached."""
+        original = (settings.JOB_QUEUE_MAX, settings.JOB_QUEUE_MAX_PER_CLIENT)
+        settings.JOB_QUEUE_MAX, settings.JOB_QUEUE_MAX_PER_CLIENT = 3, 2
+        try:
+            queue.submit("a", 0)
+            queue.submit("a", 1)
+            with pytest.raises(JobQueueFull) as error:
+                queue.submit("a", 2)
+            assert error.value.client_limit
+            
+            queue.submit("b", 0)
+            with pytest.raises(JobQueueFull) as error:
+                queue.submit("c", 0)
+            assert not error.value.client_limit
+            
+            # Finished jobs no longer count
+            queue.finish(queue.claim().job_id, result=[])
+            queue.submit("c", 0)
+        finally:
+            settings.JOB_QUEUE_MAX, settings.JOB_QUEUE_MAX_PER_CLIENT = original
+    
+    def test_lost_jobs_are_recovered(self, queue, clock):
+        """Test that jobs whose worker died run again, up to JOB_MAX_ATTEMPTS times."""
+        job_id = queue.submit("a", 0)
+        for attempt in range(1, settings.JOB_MAX_ATTEMPTS + 1):
+            assert queue.claim().attempts == attempt
+            clock.now += settings.JOB_TIMEOUT + 1
+            queue.maintain()
+        
+        job = queue.get(job_id)
+        assert job["status"] == "failed"
+        assert queue.claim() is None
+    
+    def test_deferral_is_capped(self, queue, clock):
+        """Test that a job can be deferred without using attempts only until JOB_MAX_DEFER has passed."""
+        job_id = queue.submit("a", 0)
+        assert queue.defer(queue.claim().job_id, 10)
+        clock.now += 10
+        assert queue.claim().attempts == 1
+        
+        clock.now += settings.JOB_MAX_DEFER
+        assert not queue.defer(job_id, 10)
+        assert queue.get(job_id)["status"] == "failed"
+        assert queue.claim() is None
+    
+    def test_results_expire(self, queue, clock):
+        """Test that results are deleted after JOB_RESULT_TTL seconds."""
+        job_id = queue.submit("a", {"prompt": "x"})
+        queue.finish(queue.claim().job_id, result=["done"])
+        assert queue.get(job_id)["result"] == ["done"]
+        
+        clock.now += settings.JOB_RESULT_TTL + 1
+        assert queue.get(job_id) is None
+        queue.maintain()
+        assert queue.stats() == {"queued": 0, "running": 0, "completed": 0, "failed": 0}
+    
+    def test_workers_defer_and_retry(self, tmp_path):
+        """Test that deferred jobs wait without using an attempt and failed jobs are retried."""
+        queue = JobQueue(str(tmp_path / "jobs.db"))
+        calls = []
+        
+        async def handler(job):
+            calls.append(job.attempts)
+            if len(calls) == 1:
+                raise JobDeferred(0.05)
+            if len(calls) == 2:
+                raise RuntimeError("provider error")
+            return "done"
+        
+        async def run():
+            job_id = await queue.enqueue("a", None)
+            queue.start(handler, 2)
+            while queue.get(job_id)["status"] != "completed":
+                await asyncio.sleep(0.01)
+            await queue.stop()
+            return queue.get(job_id)
+        
+        original = settings.JOB_POLL_INTERVAL
+        settings.JOB_POLL_INTERVAL = 0.01
+        try:
+            job = asyncio.run(run())
+        finally:
+            settings.JOB_POLL_INTERVAL = original
+            queue.close()
+        assert calls == [1, 1, 2]
+        assert job["result"] == "done"
+    
+    def test_stopped_jobs_are_released_off_the_event_loop(self, tmp_path):
+        """Test that a job interrupted by a shutdown is queued again from a worker thread."""
+        queue = JobQueue(str(tmp_path / "jobs.db"))
+        release = queue.release
+        threads = []
+        
+        def record_release(*args):
+            threads.append(threading.current_thread())
+            release(*args)
+        
+        queue.release = record_release
+        
+        async def handler(job):
+            await asyncio.sleep(60)
+        
+        async def run():
+            job_id = await queue.enqueue("a", None)
+            queue.start(handler, 1)
+            while queue.get(job_id)["status"] != "running":
+                await asyncio.sleep(0.01)
+            await queue.stop()
+            return queue.get(job_id)
+        
+        try:
+            job = asyncio.run(run())
+        finally:
+            queue.close()
+        assert job["status"] == "queued" and job["attempts"] == 0
+        assert threads and threading.main_thread() not in threads
+
+class TestJobEndpoints:
+    """Tests for the job endpoints."""
+    
+    def wait(self, client, headers, job_id):
+        """Poll a job until it has finished."""
+        deadline = time.monotonic() + 5
+        while time.monotonic() < deadline:
+            job = client.get(f"/api/v1/jobs/{job_id}", headers=headers).json()
+            if job["status"] in ("completed", "failed"):
+                return job
+            time.sleep(0.02)
+        raise AssertionError(f"Job {job_id} did not finish")
+    
+    def test_submit_and_poll(self, job_settings, gateway_client, gateway_headers, upstream):
+        """Test that a submitted job runs in the background and its results can be fetched."""
+        response = gateway_client.post("/api/v1/jobs", json={"requests": [
+            {"prompt": "one", "max_tokens": 10},
+            {"prompt": "too long", "max_tokens": 100000},
+        ]}, headers=gateway_headers)
+        assert response.status_code == 202
+        assert response.json()["status"] == "queued"
+        
+        job = self.wait(gateway_client, gateway_headers, response.json()["job_id"])
+        assert job["status"] == "completed"
+        assert [result["status"] for result in job["results"]] == [200, 400]
+        assert job["results"][0]["response"]["text"] == "echo: one"
+        assert upstream.requests == 1
+        assert gateway_client.get("/api/v1/jobs/unknown", headers=gateway_headers).status_code == 404
+    
+    def test_job_over_the_token_limit_fails(self, job_settings, gateway_config, gateway_client, gateway_headers, upstream):
+        """Test that a job whose prompts can never fit the daily token limit fails instead of being deferred."""
+        gateway_config(rate_limit={"requests_per_minute": 60, "tokens_per_day": 50})
+        response = gateway_client.post(
+            "/api/v1/jobs", json={"requests": [{"prompt": "word " * 400}]}, headers=gateway_headers
+        )
+        
+        job = self.wait(gateway_client, gateway_headers, response.json()["job_id"])
+        assert job["status"] == "failed"
+        assert "token limit" in job["detail"]
+        assert upstream.requests == 0
+    
+    def test_queue_limit(self, job_settings, gateway_client, gateway_headers, upstream):
+        """Test that a client cannot queue more than JOB_QUEUE_MAX_PER_CLIENT jobs."""
+        upstream.delay = 0.2
+        statuses = [
+            gateway_client.post("/api/v1/jobs", json={"requests": [{"prompt": f"{i}"}]}, headers=gateway_headers).status_code
+            for i in range(4)
+        ]
+        
+        assert statuses == [202, 202, 202, 429]
+    
+    def test_disabled(self, gateway_client, gateway_headers):
+        """Test that the job endpoints are unavailable unless JOBS_ENABLED is set."""
+        response = gateway_client.post("/api/v1/jobs", json={"requests": [{"prompt": "x"}]}, headers=gateway_headers)
+        assert response.status_code == 503
@@ -0,0 +1,129 @@
+"""
+Tests for Prometheus metrics.
+"""
+import os
+import json
+import asyncio
+
+from app.core.metrics import Counter, Gauge, Histogram, MetricsRegistry, merge, render
+
+def dead_pid():
+    """Find a process ID that is not running."""
+    pid = 4_000_000
+    while True:
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return pid
+        except PermissionError:
+            pass
+        pid += 1
+
+class TestMetrics:
+    """Tests for metric recording and rendering."""
+    
+    def test_render_counter_and_histogram(self):
+        """Test the text exposition of counters and cumulative histogram buckets."""
+        counter = Counter("requests_total", "Requests", ("client",))
+        counter.inc(("a",))
+        counter.inc(("a",), 2)
+        histogram = Histogram("latency_seconds", "Latency", ("stage",), buckets=(0.1, 1.0))
+        histogram.observe(0.05, ("auth",))
+        histogram.observe(0.5, ("auth",))
+        histogram.observe(5, ("auth",))
+        
+        text = render({"requests_total": counter.snapshot(), "latency_seconds": histogram.snapshot()})
+        
+        assert "# TYPE requests_total counter" in text
+        assert 'requests_total{client="a"} 3' in text
+        assert 'latency_seconds_bucket{stage="auth",le="0.1"} 1' in text
+        assert 'latency_seconds_bucket{stage="auth",le="1"} 2' in text
+        assert 'latency_seconds_bucket{stage="auth",le="+Inf"} 3' in text
+        assert 'latency_seconds_count{stage="auth"} 3' in text
+        assert 'latency_seconds_sum{stage="auth"} 5.55' in text
+    
+    def test_label_values_are_escaped(self):
+        """Test that quotes and backslashes in label values are escaped."""
+        counter = Counter("events_total", "Events", ("name",))
+        counter.inc(('say "hi"\\',))
+        
+        assert 'events_total{name="say \\"hi\\"\\\\"} 1' in render({"events_total": counter.snapshot()})
+    
+    def test_merge_sums_workers_and_drops_dead_gauges(self):
+        """Test that counters and histograms sum across workers and gauges only count live workers."""
+        def snapshot(count, in_flight, observation):
+            counter = Counter("requests_total", "Requests")
+            counter.inc(amount=count)
+            gauge = Gauge("in_flight", "In flight")
+            gauge.set(in_flight)
+            histogram = Histogram("latency_seconds", "Latency", buckets=(1.0,))
+            histogram.observe(observation)
+            return {metric.name: metric.snapshot() for metric in (counter, gauge, histogram)}
+        
+        merged = merge([(os.getpid(), snapshot(2, 3, 0.5)), (dead_pid(), snapshot(5, 7, 2.0))])
+        
+        assert merged["requests_total"]["values"] == [[[], 7]]
+        assert merged["in_flight"]["values"] == [[[], 3]]
+        assert merged["latency_seconds"]["values"] == [[[], [1, 1, 2.5]]]
+    
+    def test_multiprocess_exposition(self, tmp_path):
+        """Test that a scrape includes the snapshots written by other workers."""
+        registry = MetricsRegistry()
+        counter = registry.counter("requests_total", "Requests")
+        counter.inc(amount=2)
+        other = Counter("requests_total", "Requests")
+        other.inc(amount=40)
+        with open(tmp_path / f"{dead_pid()}.json", "w") as f:
+            json.dump({"requests_total": other.snapshot()}, f)
+        
+        async def scrape():
+            await registry.start(str(tmp_path), interval=60)
+            try:
+                return registry.exposition()
+            finally:
+                await registry.stop()
+        
+        assert "requests_total 42" in asyncio.run(scrape())
+        assert (tmp_path / f"{os.getpid()}.json").exists()
+
+
+class TestMetricsEndpoint:
+    """Tests for the metrics endpoint."""
+    
+    def test_generate_records_stage_and_token_metrics(self, gateway_client, gateway_headers):
+        """Test that a generate request records its stages, tokens and provider latency."""
+        gateway_client.post("/api/v1/generate", json={"prompt": "Hello", "max_tokens": 10}, headers=gateway_headers)
+        
+        response = gateway_client.get("/metrics")
+        
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/plain")
+        text = response.text
+        for stage in ("auth", "validation", "provider", "serialization"):
+            assert f'gateway_request_stage_seconds_count{{endpoint="/generate",stage="{stage}"}}' in text
+        assert 'gateway_request_duration_seconds_count{endpoint="/generate",status="200"}' in text
+        assert 'gateway_client_tokens_total{client="gateway_client",kind="completion"}' in text
+        assert 'gateway_provider_request_duration_seconds_count{provider="openai",model="gpt-3.5-turbo",outcome="ok"}' in text
+        assert 'gateway_cache_events_total{cache="response",event="misses"}' in text
+    
+    def test_endpoints_are_labelled_by_route(self, gateway_client, gateway_headers):
+        """Test that requests are labelled with their route template, so IDs in paths add no series."""
+        for job_id in ("job-1", "job-2"):
+            gateway_client.get(f"/api/v1/jobs/{job_id}")
+        gateway_client.get("/wp-login.php")
+        
+        text = gateway_client.get("/metrics").text
+        
+        assert 'gateway_request_duration_seconds_count{endpoint="/jobs/{job_id}",status="401"} 2' in text
+        assert 'endpoint="/jobs/job-1"' not in text
+        assert 'gateway_request_duration_seconds_count{endpoint="unmatched",status="404"}' in text
+    
+    def test_rate_limited_requests_are_counted(self, gateway_client, gateway_headers, gateway_config):
+        """Test that requests rejected by the rate limiter are counted per client."""
+        gateway_config(rate_limit={"requests_per_minute": 1, "tokens_per_day": 100000})
+        for _ in range(2):
+            gateway_client.post("/api/v1/generate", json={"prompt": "Hello", "max_tokens": 10}, headers=gateway_headers)
+        
+        text = gateway_client.get("/metrics").text
+        
+        assert 'gateway_rate_limited_total{client="gateway_client"}' in text
@@ -0,0 +1,93 @@
+"""
+Tests for the LLM model layer.
+"""
+import asyncio
+import time
+
+import pytest
+
+from app.core.config import settings
+from app.models.llm import get_model
+from app.models.provider_clients import provider_clients
+from tests.mock_upstream import run_mock_upstream
+
+UPSTREAM_DELAY = 0.2
+CONCURRENT_REQUESTS = 50
+
+@pytest.fixture
+def slow_upstream():
+    """Point both providers at a slow local mock upstream."""
+    original = (settings.OPENAI_API_KEY, settings.OPENAI_BASE_URL, settings.GROQ_API_KEY, settings.GROQ_BASE_URL)
+    
+    with run_mock_upstream(delay=UPSTREAM_DELAY) as upstream:
+        settings.OPENAI_API_KEY = "sk-test"
+        settings.OPENAI_BASE_URL = f"{upstream.base_url}/v1"
+        settings.GROQ_API_KEY = "gsk-test"
+        settings.GROQ_BASE_URL = upstream.base_url
+        yield upstream
+    
+    settings.OPENAI_API_KEY, settings.OPENAI_BASE_URL, settings.GROQ_API_KEY, settings.GROQ_BASE_URL = original
+
+def run(coro):
+    """Run a coroutine, closing the pooled clients on the same event loop."""
+    async def run_and_close():
+        try:
+            return await coro
+        finally:
+            await provider_clients.close()
+    
+    return asyncio.run(run_and_close())
+
+class TestModels:
+    """Tests for provider models."""
+    
+    def test_get_model_is_cached(self):
+        """Test that model instances are reused across calls."""
+        assert get_model("openai", "gpt-3.5-turbo") is get_model("openai", "gpt-3.5-turbo")
+        assert get_model("groq", "mixtral-8x7b-32768") is not get_model("groq", "llama2-70b-4096")
+    
+    @pytest.mark.parametrize("provider", ["openai", "groq"])
+    def test_generate(self, slow_upstream, provider):
+        """Test a single generation against the mock upstream."""
+        model = get_model(provider, "mock-model")
+        
+        response = run(model.generate(prompt="Hello", max_tokens=10))
+        
+        assert response["text"] == "echo: Hello"
+        assert response["model"] == "mock-model"
+        assert response["usage"]["total_tokens"] == 5
+    
+    @pytest.mark.parametrize("provider", ["openai", "groq"])
+    def test_generate_stream(self, slow_upstream, provider):
+        """Test that streaming yields deltas followed by a final usage event."""
+        model = get_model(provider, "mock-model")
+        slow_upstream.delay = 0
+        
+        async def collect():
+            return [event async for event in model.generate_stream(prompt="Hello there", max_tokens=10)]
+        
+        events = run(collect())
+        
+        assert "".join(event["text"] for event in events[:-1]) == "echo: Hello there"
+        assert events[-1]["done"] is True
+        assert events[-1]["usage"]["total_tokens"] == 5
+    
+    @pytest.mark.parametrize("provider", ["openai", "groq"])
+    def test_concurrent_generations_do_not_block(self, slow_upstream, provider):
+        """Test that concurrent generations overlap instead of running one at a time."""
+        model = get_model(provider, "mock-model")
+        
+        async def run_batch():
+            return await asyncio.gather(*[
+                model.generate(prompt=f"prompt {i}", max_tokens=10)
+                for i in range(CONCURRENT_REQUESTS)
+            ])
+        
+        start = time.perf_counter()
+        responses = run(run_batch())
+        elapsed = time.perf_counter() - start
+        
+        # Sequential calls would take CONCURRENT_REQUESTS * UPSTREAM_DELAY (10s)
+        assert len(responses) == CONCURRENT_REQUESTS
+        assert elapsed < UPSTREAM_DELAY * CONCURRENT_REQUESTS / 5
+        assert slow_upstream.max_in_flight > CONCURRENT_REQUESTS / 2
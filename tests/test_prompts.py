@@ -0,0 +1,98 @@
+"""
+Tests for prompt assembly and prefix caching hints.
+"""
+import json
+
+from app.models.prompts import PrefixTracker, assemble_messages, assemble_prompt, cache_hints, normalize_text, prefix_tracker
+
+SYSTEM = "You are a support assistant.  \r\nAnswer from the manual below.\r\n" + "manual text\n" * 500
+
+class TestAssembleMessages:
+    """Tests for message assembly."""
+    
+    def test_normalized_messages_are_unchanged(self):
+        """Test that already normalized messages are returned as they are."""
+        messages = [{"role": "system", "content": "Be brief."}, {"role": "user", "content": "hi  \r\n"}]
+        prompt = assemble_messages(messages)
+        
+        assert not prompt.changed
+        assert prompt.messages[1] is messages[1]
+        assert prompt.prefix_key is None
+    
+    def test_shared_prefixes_are_identical(self):
+        """Test that variants of the same system prompt assemble to identical bytes and keys."""
+        variants = [
+            [{"role": "system", "content": SYSTEM}, {"role": "user", "content": "first question"}],
+            [{"content": SYSTEM.replace("\r\n", "\n"), "role": "system"}, {"role": "user", "content": "second question"}],
+            [{"role": "user", "content": "third question"}, {"role": "system", "content": SYSTEM + "  \n"}],
+        ]
+        prompts = [assemble_messages(messages) for messages in variants]
+        
+        encoded = {json.dumps(prompt.messages[0]) for prompt in prompts}
+        assert len(encoded) == 1
+        assert prompts[0].messages[0]["content"].startswith("You are a support assistant.\nAnswer")
+        assert all(prompt.changed for prompt in prompts)
+        assert len({prompt.prefix_key for prompt in prompts}) == 1
+    
+    def test_conversation_order_is_kept(self):
+        """Test that only instructions before the first reply move and conversation text is untouched."""
+        messages = [
+            {"role": "user", "content": "question  "},
+            {"role": "assistant", "content": "answer"},
+            {"role": "system", "content": "Now be formal."},
+            {"role": "user", "content": "follow-up"},
+        ]
+        
+        assert assemble_messages(messages).messages == messages
+    
+    def test_cache_hints(self):
+        """Test that long prompts get a prefix key hint for OpenAI only."""
+        long_prompt = assemble_messages([{"role": "system", "content": SYSTEM}, {"role": "user", "content": "q"}])
+        short_prompt = assemble_prompt("short")
+        
+        assert cache_hints("openai", long_prompt) == {"prompt_cache_key": long_prompt.prefix_key}
+        assert cache_hints("groq", long_prompt) == {}
+        assert cache_hints("openai", short_prompt) == {}
+
+class TestPrefixTracker:
+    """Tests for prefix reuse tracking."""
+    
+    def test_reuse_per_client(self):
+        """Test that a prefix counts as reused only for the client that sent it recently."""
+        tracker = PrefixTracker(max_entries=2, ttl=600)
+        
+        assert tracker.record("a", "prefix") is False
+        assert tracker.record("a", "prefix") is True
+        assert tracker.record("b", "prefix") is False
+        assert tracker.record("a", None) is None
+        tracker.record("c", "prefix")
+        assert tracker.record("a", "prefix") is False
+        assert tracker.stats() == {"entries": 2, "reused": 1, "new": 4}
+
+class TestPromptAssemblyEndpoints:
+    """Tests for prompt assembly in the generation endpoints."""
+    
+    def test_chat_prefix_hints(self, gateway_client, gateway_headers, upstream):
+        """Test that chat requests with a long system prompt are normalized and hinted."""
+        for question in ("first", "second"):
+            response = gateway_client.post("/api/v1/chat/completions", json={
+                "messages": [{"content": SYSTEM, "role": "system"}, {"role": "user", "content": question}],
+            }, headers=gateway_headers)
+            assert response.status_code == 200
+        
+        sent = json.loads(upstream.last_body)
+        assert sent["messages"][0] == {"role": "system", "content": normalize_text(SYSTEM)}
+        assert sent["prompt_cache_key"]
+        assert prefix_tracker.stats()["reused"] == 1
+    
+    def test_generate_prefix_hints(self, gateway_client, gateway_headers, upstream):
+        """Test that long generate prompts are hinted and tracked."""
+        response = gateway_client.post(
+            "/api/v1/generate", json={"prompt": SYSTEM, "max_tokens": 10}, headers=gateway_headers
+        )
+        
+        assert response.status_code == 200
+        sent = json.loads(upstream.last_body)
+        assert sent["prompt_cache_key"] == assemble_prompt(SYSTEM).prefix_key
+        assert sent["messages"][0]["content"] == SYSTEM
+        assert prefix_tracker.stats()["new"] == 1
@@ -0,0 +1,66 @@
+"""
+Tests for the pooled provider client registry.
+"""
+import asyncio
+
+import httpx
+import pytest
+
+from app.core.config import settings
+from app.models.llm import get_model
+from app.models.provider_clients import ProviderClientRegistry, provider_clients
+
+@pytest.fixture
+def credentials(monkeypatch):
+    """Configure credentials for every provider."""
+    monkeypatch.setattr(settings, "OPENAI_API_KEY", "sk-test")
+    monkeypatch.setattr(settings, "OPENAI_BASE_URL", None)
+    monkeypatch.setattr(settings, "GROQ_API_KEY", "gsk-test")
+    monkeypatch.setattr(settings, "GROQ_BASE_URL", None)
+    monkeypatch.setattr(settings, "TRITON_BASE_URL", "http://triton.test")
+
+def is_closed(client) -> bool:
+    """Check whether a pooled SDK or HTTP client has been closed."""
+    if isinstance(client, httpx.AsyncClient):
+        return client.is_closed
+    return client.is_closed()
+
+class TestProviderClientRegistry:
+    """Tests for the provider client registry."""
+    
+    def test_one_client_per_key(self, credentials):
+        """Test that clients are shared per (provider, api key, base URL) and created once."""
+        registry = ProviderClientRegistry()
+        
+        client = registry.get_client("openai")
+        assert registry.get_client("openai") is client
+        assert registry.get_client("openai", api_key="sk-test") is client
+        assert registry.get_client("openai", api_key="sk-other") is not client
+        assert registry.get_client("openai", base_url="http://proxy.test/v1") is not client
+        assert registry.get_client("groq") is not client
+        assert len(registry._clients) == 4
+        
+        asyncio.run(registry.close())
+    
+    def test_models_are_cached_with_pooled_clients(self, credentials):
+        """Test that get_model returns the same model instance, which uses the pooled client."""
+        model = get_model("openai", "gpt-4o-mini")
+        
+        assert get_model("openai", "gpt-4o-mini") is model
+        assert model.client is provider_clients.get_client("openai")
+        
+        asyncio.run(provider_clients.close())
+    
+    def test_close_closes_pools(self, credentials):
+        """Test that close() closes every SDK and HTTP client and empties the registry."""
+        registry = ProviderClientRegistry()
+        registry.startup()
+        clients = [registry.get_client(provider) for provider in ("openai", "groq", "triton")]
+        clients.append(registry.get_http_client("openai"))
+        
+        asyncio.run(registry.close())
+        
+        assert all(is_closed(client) for client in clients)
+        assert registry._clients == {} and registry._http_clients == {}
+        assert registry.get_client("openai") is not clients[0]
+        asyncio.run(registry.close())
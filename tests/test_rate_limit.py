@@ -0,0 +1,218 @@
+"""
+Tests for client rate limiting.
+"""
+import asyncio
+
+import pytest
+
+from app.core.counters import InMemoryCounterBackend, RedisCounterBackend, SharedMemoryCounterBackend
+from app.core.rate_limit import RateLimiter, RateLimitExceeded, SlidingWindowCounter, TokenBucket
+from app.schemas.base import RateLimit
+from tests.fake_redis import run_fake_redis
+
+class TestTokenBucket:
+    """Tests for the token bucket."""
+    
+    def test_acquire_until_empty(self):
+        """Test that the bucket admits up to its capacity and reports the wait."""
+        bucket = TokenBucket(capacity=2, rate=1.0, now=0.0)
+        
+        assert bucket.try_acquire(0.0) == 0
+        assert bucket.try_acquire(0.0) == 0
+        assert bucket.try_acquire(0.0) == pytest.approx(1.0)
+    
+    def test_refill(self):
+        """Test that the bucket refills over time without exceeding capacity."""
+        bucket = TokenBucket(capacity=2, rate=1.0, now=0.0)
+        bucket.try_acquire(0.0, 2)
+        
+        assert bucket.try_acquire(0.5) == pytest.approx(0.5)
+        assert bucket.try_acquire(1.0) == 0
+        bucket.try_acquire(100.0)
+        assert bucket.tokens == pytest.approx(1.0)
+
+class TestSlidingWindowCounter:
+    """Tests for the sliding window counter."""
+    
+    def test_expiry(self):
+        """Test that amounts leave the window after it elapses."""
+        counter = SlidingWindowCounter(window=100, slot_seconds=10)
+        counter.add(0, 5)
+        counter.add(55, 7)
+        
+        assert counter.current(60) == 12
+        assert counter.retry_after(60) == pytest.approx(40)
+        assert counter.current(100) == 7
+        assert counter.current(160) == 0
+
+class TestRateLimiter:
+    """Tests for the per-client rate limiter."""
+    
+    def test_requests_per_minute(self):
+        """Test that requests beyond the per-minute limit are rejected."""
+        limiter = RateLimiter()
+        rate_limit = RateLimit(requests_per_minute=3, tokens_per_day=1000)
+        
+        for _ in range(3):
+            limiter.acquire("client", rate_limit)
+        with pytest.raises(RateLimitExceeded) as exc_info:
+            limiter.acquire("client", rate_limit)
+        
+        assert exc_info.value.retry_after > 0
+        
+        # Other clients have their own buckets
+        limiter.acquire("other_client", rate_limit)
+    
+    def test_tokens_per_day(self):
+        """Test that requests are rejected once the daily token usage is reached."""
+        limiter = RateLimiter()
+        rate_limit = RateLimit(requests_per_minute=100, tokens_per_day=1000)
+        
+        limiter.acquire("client", rate_limit)
+        limiter.record_tokens("client", 1000)
+        
+        with pytest.raises(RateLimitExceeded, match="Daily token limit"):
+            limiter.acquire("client", rate_limit)
+        assert limiter.get_usage("client") == 1000
+    
+    def test_token_usage_survives_limit_change(self):
+        """Test that changing a client's limits keeps its token usage."""
+        limiter = RateLimiter()
+        limiter.acquire("client", RateLimit(requests_per_minute=1, tokens_per_day=1000))
+        limiter.record_tokens("client", 500)
+        
+        limiter.acquire("client", RateLimit(requests_per_minute=2, tokens_per_day=1000))
+        
+        assert limiter.get_usage("client") == 500
+
+class TestCounterBackends:
+    """Tests for the shared counter backends."""
+    
+    def test_in_memory(self):
+        """Test that the in-memory backend adds and reads counters."""
+        backend = InMemoryCounterBackend()
+        
+        assert asyncio.run(backend.incr_many([("a", 2, 60), ("b", 1, 60)])) == [2, 1]
+        assert asyncio.run(backend.incr_many([("a", 3, 60), ("b", 0, 60)])) == [5, 1]
+    
+    def test_shared_memory_between_workers(self, tmp_path):
+        """Test that two processes mapping the same file see the same counters."""
+        path = str(tmp_path / "counters.bin")
+        worker_a = SharedMemoryCounterBackend(path, slots=64)
+        worker_b = SharedMemoryCounterBackend(path, slots=64)
+        
+        async def run():
+            await worker_a.incr_many([("client:rpm", 3, 60)])
+            values = await worker_b.incr_many([("client:rpm", 2, 60), ("other:rpm", 0, 60)])
+            await worker_a.close()
+            await worker_b.close()
+            return values
+        
+        assert asyncio.run(run()) == [5, 0]
+    
+    def test_shared_memory_lock_does_not_block(self, tmp_path):
+        """Test that a batch waits for another worker's lock without blocking the event loop."""
+        path = str(tmp_path / "counters.bin")
+        worker_a = SharedMemoryCounterBackend(path, slots=64)
+        worker_b = SharedMemoryCounterBackend(path, slots=64)
+        
+        async def run():
+            fcntl = worker_a._fcntl
+            fcntl.flock(worker_a._fd, fcntl.LOCK_EX)
+            flush = asyncio.create_task(worker_b.incr_many([("key", 1, 60)]))
+            await asyncio.sleep(0.02)
+            assert not flush.done()
+            fcntl.flock(worker_a._fd, fcntl.LOCK_UN)
+            values = await flush
+            await worker_a.close()
+            await worker_b.close()
+            return values
+        
+        assert asyncio.run(run()) == [1]
+    
+    def test_shared_memory_expiry(self, tmp_path):
+        """Test that expired counters restart from zero."""
+        backend = SharedMemoryCounterBackend(str(tmp_path / "counters.bin"), slots=64)
+        
+        async def run():
+            await backend.incr_many([("key", 5, -1)])
+            values = await backend.incr_many([("key", 1, 60)])
+            await backend.close()
+            return values
+        
+        assert asyncio.run(run()) == [1]
+    
+    def test_redis_pipelines_batches(self):
+        """Test that a whole batch is sent in one pipeline."""
+        async def run():
+            async with run_fake_redis() as fake:
+                backend = RedisCounterBackend(f"redis://127.0.0.1:{fake.port}/0")
+                increments = [(f"key:{i}", i, 60) for i in range(100)]
+                values = await backend.incr_many(increments)
+                await backend.close()
+                return fake, values
+        
+        fake, values = asyncio.run(run())
+        
+        assert values == list(range(100))
+        assert fake.commands.count("INCRBY") == 100
+        assert fake.reads <= 2
+        assert fake.ttls["key:1"] == 60
+
+class TestSharedRateLimiter:
+    """Tests for rate limiting across workers."""
+    
+    def test_limit_is_shared_across_workers(self, tmp_path):
+        """Test that two workers together cannot exceed the client's limit."""
+        path = str(tmp_path / "counters.bin")
+        rate_limit = RateLimit(requests_per_minute=4, tokens_per_day=1000)
+        
+        async def run():
+            worker_a, worker_b = RateLimiter(), RateLimiter()
+            await worker_a.start(SharedMemoryCounterBackend(path, slots=64), interval=3600)
+            await worker_b.start(SharedMemoryCounterBackend(path, slots=64), interval=3600)
+            
+            for _ in range(2):
+                worker_a.acquire("client", rate_limit)
+                worker_b.acquire("client", rate_limit)
+            await worker_a.sync()
+            await worker_b.sync()
+            await worker_a.sync()
+            
+            rejected = []
+            for worker in (worker_a, worker_b):
+                try:
+                    worker.acquire("client", rate_limit)
+                except RateLimitExceeded:
+                    rejected.append(worker)
+            
+            await worker_a.stop()
+            await worker_b.stop()
+            return len(rejected)
+        
+        assert asyncio.run(run()) == 2
+    
+    def test_tokens_are_shared_across_workers(self):
+        """Test that token usage charged on one worker counts on another."""
+        rate_limit = RateLimit(requests_per_minute=100, tokens_per_day=1000)
+        
+        async def run():
+            async with run_fake_redis() as fake:
+                url = f"redis://127.0.0.1:{fake.port}/0"
+                worker_a, worker_b = RateLimiter(), RateLimiter()
+                await worker_a.start(RedisCounterBackend(url), interval=3600)
+                await worker_b.start(RedisCounterBackend(url), interval=3600)
+                
+                worker_a.acquire("client", rate_limit)
+                worker_a.record_tokens("client", 1000)
+                worker_b.acquire("client", rate_limit)
+                await worker_a.sync()
+                await worker_b.sync()
+                
+                with pytest.raises(RateLimitExceeded, match="Daily token limit"):
+                    worker_b.acquire("client", rate_limit)
+                
+                await worker_a.stop()
+                await worker_b.stop()
+        
+        asyncio.run(run())
@@ -0,0 +1,162 @@
+"""
+Tests for the compact client registry and memory-mapped snapshots.
+"""
+import os
+
+import pytest
+
+from app.core.config import settings
+from app.clients.auth import ClientManager
+from app.clients.config_loader import ClientConfigLoader
+from app.clients import registry
+from app.clients.registry import BitTable, ClientRecord, ClientSnapshot, main, write_snapshot
+from app.schemas.base import ClientConfig
+from tests.test_config_reload import write_clients
+
+def make_config(client_id: str, **changes) -> ClientConfig:
+    """Build a client configuration with test defaults."""
+    values = {
+        "client_id": client_id,
+        "name": f"Client {client_id}",
+        "client_secret_hash": "0" * 64,
+        "allowed_providers": ["openai", "groq"],
+        "default_provider": "openai",
+        "default_model": "gpt-3.5-turbo",
+        "max_tokens_limit": 1000,
+        "rate_limit": {"requests_per_minute": 60, "tokens_per_day": 100000},
+        "allowed_endpoints": ["generate", "cache/stats"],
+        "created_at": "2024-01-01T00:00:00",
+        "updated_at": "2024-01-01T00:00:00",
+    }
+    values.update(changes)
+    return ClientConfig(**values)
+
+@pytest.fixture
+def snapshot_path(tmp_path):
+    """Point the client snapshot setting at a temporary file."""
+    path = str(tmp_path / "clients.snapshot")
+    original = settings.CLIENT_SNAPSHOT_PATH
+    settings.CLIENT_SNAPSHOT_PATH = path
+    yield path
+    settings.CLIENT_SNAPSHOT_PATH = original
+
+class TestClientRecord:
+    """Tests for compact client records."""
+    
+    def test_round_trip(self):
+        """Test that a record keeps every field of the configuration."""
+        config = make_config("a", semantic_cache_threshold=0.9, response_cache_enabled=False)
+        record = ClientRecord.from_config(config)
+        
+        assert record.to_config() == config
+        assert record.allowed_providers == ("openai", "groq")
+        assert record.allowed_endpoints == ("generate", "cache/stats")
+    
+    def test_permission_bits(self):
+        """Test provider and endpoint checks against the bitsets."""
+        record = ClientRecord.from_config(make_config("a", allowed_providers=["groq"]))
+        
+        assert record.allows_provider("groq")
+        assert not record.allows_provider("openai")
+        assert not record.allows_provider("unknown")
+        assert record.allows_endpoint("generate")
+        assert not record.allows_endpoint("circuits")
+        assert not record.allows_endpoint("never-seen-endpoint")
+    
+    def test_shared_values(self):
+        """Test that identical limits and repeated strings are shared between records."""
+        first = ClientRecord.from_config(make_config("a"))
+        second = ClientRecord.from_config(make_config("b"))
+        
+        assert first.rate_limit is second.rate_limit
+        assert first.default_model is second.default_model
+        with pytest.raises(AttributeError):
+            first.name = "changed"
+
+
+class TestClientSnapshot:
+    """Tests for snapshot files."""
+    
+    def test_lookup(self, tmp_path):
+        """Test that every record can be found and unknown IDs are not."""
+        records = [ClientRecord.from_config(make_config(f"client_{i}", max_tokens_limit=i + 1)) for i in range(100)]
+        path = str(tmp_path / "clients.snapshot")
+        write_snapshot(records, path)
+        snapshot = ClientSnapshot(path)
+        
+        assert len(snapshot) == 100
+        assert set(snapshot) == {record.client_id for record in records}
+        for record in records:
+            assert snapshot[record.client_id] == record
+        assert snapshot.get("client_100") is None
+        assert "client_100" not in snapshot
+        assert snapshot.get("client_5") is snapshot.get("client_5")
+        snapshot.close()
+    
+    def test_endpoint_bits_are_remapped(self, tmp_path, monkeypatch):
+        """Test that endpoint bits stored in a snapshot follow the endpoints known to the process."""
+        # Write the snapshot with its own endpoint bit order, as another process would
+        with monkeypatch.context() as patch:
+            patch.setattr(registry, "ENDPOINT_BITS", BitTable(["remap/b", "remap/a"]))
+            record = ClientRecord.from_config(make_config("a", allowed_endpoints=["remap/a"]))
+            path = str(tmp_path / "clients.snapshot")
+            write_snapshot([record], path)
+        assert record.endpoint_bits == 0b10
+        
+        snapshot = ClientSnapshot(path)
+        assert snapshot["a"].allowed_endpoints == ("remap/a",)
+        assert snapshot["a"].allows_endpoint("remap/a")
+        assert not snapshot["a"].allows_endpoint("remap/b")
+        snapshot.close()
+    
+    def test_invalid_file(self, tmp_path):
+        """Test that a file that is not a snapshot is rejected."""
+        path = tmp_path / "clients.snapshot"
+        path.write_bytes(b"x" * 128)
+        
+        with pytest.raises(ValueError):
+            ClientSnapshot(str(path))
+    
+    def test_build_from_directory(self, tmp_path):
+        """Test that the command line builds a snapshot equal to the loaded directory."""
+        write_clients(tmp_path / "configs", 5)
+        path = str(tmp_path / "clients.snapshot")
+        main([str(tmp_path / "configs"), path])
+        
+        expected = ClientConfigLoader().scan(str(tmp_path / "configs")).clients
+        snapshot = ClientSnapshot(path)
+        assert dict(snapshot.items()) == expected
+        snapshot.close()
+
+
+class TestClientManagerSnapshot:
+    """Tests for serving clients from a snapshot."""
+    
+    def test_authenticates_from_snapshot(self, tmp_path, snapshot_path):
+        """Test that clients authenticate from the snapshot and a replaced snapshot is picked up."""
+        write_clients(tmp_path / "configs", 3)
+        main([str(tmp_path / "configs"), snapshot_path])
+        manager = ClientManager()
+        
+        config = manager.authenticate_client("client_1", "secret_1")
+        assert config.client_id == "client_1"
+        assert manager.check_provider_permission(config, "openai")
+        assert not manager.check_provider_permission(config, "groq")
+        
+        write_clients(tmp_path / "configs", 1, start=3)
+        main([str(tmp_path / "configs"), snapshot_path])
+        assert manager.reload_clients() == 4
+        assert manager.authenticate_client("client_3", "secret_3").client_id == "client_3"
+    
+    def test_bad_snapshot_keeps_the_last_one(self, tmp_path, snapshot_path):
+        """Test that a broken snapshot does not replace the one being served."""
+        write_clients(tmp_path / "configs", 2)
+        main([str(tmp_path / "configs"), snapshot_path])
+        manager = ClientManager()
+        
+        with open(snapshot_path + ".new", "wb") as f:
+            f.write(b"broken")
+        os.replace(snapshot_path + ".new", snapshot_path)
+        
+        assert manager.reload_clients() == 2
+        assert manager.authenticate_client("client_0", "secret_0").client_id == "client_0"
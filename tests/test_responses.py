@@ -0,0 +1,50 @@
+"""
+Tests for the fast JSON request and response path.
+"""
+import json
+
+from app.api import responses
+from app.api.responses import json_dumps, json_loads
+from app.core.config import settings
+
+class TestJSONEncoding:
+    """Tests for the JSON helpers."""
+    
+    def test_standard_library_fallback(self, monkeypatch):
+        """Test that bodies are encoded the same way with and without orjson."""
+        data = {"text": "héllo ✓", "usage": {"total_tokens": 5}, "cached": False, "score": 0.5}
+        fast = json_dumps(data)
+        monkeypatch.setattr(responses, "orjson", None)
+        
+        assert json_dumps(data) == fast
+        assert json_loads(fast) == data
+
+class TestFastResponses:
+    """Tests for the fast path in the endpoints."""
+    
+    def test_generate_response_is_unchanged(self, gateway_client, gateway_headers, upstream):
+        """Test that skipping response validation returns the same bytes as the response model."""
+        bodies = []
+        original = settings.FAST_JSON_RESPONSES
+        try:
+            for fast in (False, True):
+                settings.FAST_JSON_RESPONSES = fast
+                response = gateway_client.post(
+                    "/api/v1/generate", json={"prompt": "héllo ✓", "max_tokens": 10}, headers=gateway_headers
+                )
+                assert response.status_code == 200
+                bodies.append(response.content)
+        finally:
+            settings.FAST_JSON_RESPONSES = original
+        
+        assert bodies[0] == bodies[1]
+        assert json.loads(bodies[1])["text"] == "echo: héllo ✓"
+    
+    def test_invalid_json_body(self, gateway_client, gateway_headers):
+        """Test that malformed request bodies are still reported as validation errors."""
+        response = gateway_client.post(
+            "/api/v1/generate", content=b'{"prompt": ', headers={**gateway_headers, "content-type": "application/json"}
+        )
+        
+        assert response.status_code == 422
+        assert response.json()["detail"][0]["type"] == "json_invalid"
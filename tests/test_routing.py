@@ -0,0 +1,235 @@
+"""
+Tests for latency-aware routing and hedged requests.
+"""
+import time
+import asyncio
+
+import httpx
+import pytest
+
+from app.core.config import settings
+from app.models.circuit_breaker import circuit_breakers
+from app.models.routing import Router
+from tests.mock_upstream import run_mock_upstream
+from tests.test_models import run
+
+@pytest.fixture
+def two_upstreams():
+    """Point OpenAI at a slow mock upstream and Groq at a fast one."""
+    original = (settings.OPENAI_API_KEY, settings.OPENAI_BASE_URL, settings.GROQ_API_KEY, settings.GROQ_BASE_URL)
+    
+    with run_mock_upstream(delay=1.0) as slow, run_mock_upstream(delay=0.01) as fast:
+        settings.OPENAI_API_KEY = "sk-test"
+        settings.OPENAI_BASE_URL = f"{slow.base_url}/v1"
+        settings.GROQ_API_KEY = "gsk-test"
+        settings.GROQ_BASE_URL = fast.base_url
+        yield slow, fast
+    
+    settings.OPENAI_API_KEY, settings.OPENAI_BASE_URL, settings.GROQ_API_KEY, settings.GROQ_BASE_URL = original
+
+@pytest.fixture
+def model_aliases():
+    """Configure a model alias served by both providers."""
+    original = settings.MODEL_ALIASES
+    settings.MODEL_ALIASES = {"chat": ["groq/mock-groq", "openai/mock-openai"]}
+    yield
+    settings.MODEL_ALIASES = original
+
+class FakeStream:
+    """Event stream that fails with an error or yields one event, and records whether it was closed."""
+    
+    def __init__(self, error=None):
+        """Initialize the stream."""
+        self.error = error
+        self.closed = False
+    
+    def __aiter__(self):
+        """Iterate over the stream's events."""
+        return self
+    
+    async def __anext__(self):
+        """Fail with the stream's error, or yield an event."""
+        if self.error is not None:
+            raise self.error
+        return {"text": "hello"}
+    
+    async def aclose(self):
+        """Close the stream."""
+        self.closed = True
+
+class FakeModel:
+    """Model whose generate_stream returns a given stream and whose generate takes a given time."""
+    
+    def __init__(self, stream=None, delay=0.0):
+        """Initialize the model."""
+        self.stream = stream
+        self.delay = delay
+    
+    async def generate(self, **kwargs):
+        """Generate text after the model's delay."""
+        await asyncio.sleep(self.delay)
+        return {"text": "hello"}
+    
+    def generate_stream(self, **kwargs):
+        """Start the stream."""
+        return self.stream
+
+class TestRouter:
+    """Tests for the model router."""
+    
+    def test_rank_prefers_fast_healthy_targets(self):
+        """Test that targets are ordered by latency, with unhealthy targets last."""
+        router = Router()
+        router.stats(("openai", "a")).record(0.5, False, 0.2)
+        router.stats(("groq", "b")).record(0.1, False, 0.2)
+        for _ in range(10):
+            router.stats(("triton", "c")).record(0.01, True, 0.2)
+        
+        assert router.rank([("openai", "a"), ("groq", "b"), ("triton", "c")]) == [("groq", "b"), ("openai", "a"), ("triton", "c")]
+    
+    def test_unmeasured_targets_are_tried_first(self):
+        """Test that a target without samples ranks ahead of measured ones."""
+        router = Router()
+        router.stats(("openai", "a")).record(0.1, False, 0.2)
+        
+        assert router.rank([("openai", "a"), ("groq", "b")])[0] == ("groq", "b")
+    
+    def test_unhealthy_targets_get_probed(self):
+        """Test that an unhealthy target is ranked normally again after the probe interval."""
+        router = Router()
+        stats = router.stats(("openai", "a"))
+        for _ in range(10):
+            stats.record(0.01, True, 0.2)
+        router.stats(("groq", "b")).record(0.5, False, 0.2)
+        
+        assert router.rank([("openai", "a"), ("groq", "b")])[0] == ("groq", "b")
+        stats.last_error -= settings.ROUTING_PROBE_INTERVAL
+        assert router.rank([("openai", "a"), ("groq", "b")])[0] == ("openai", "a")
+    
+    def test_resolve_filters_allowed_providers(self, model_aliases):
+        """Test that alias targets are limited to the client's providers."""
+        router = Router()
+        
+        assert router.resolve("chat", ["openai", "groq"]) == [("groq", "mock-groq"), ("openai", "mock-openai")]
+        assert router.resolve("chat", ["openai"]) == [("openai", "mock-openai")]
+        assert router.resolve("chat", ["openai", "groq"], provider="groq") == [("groq", "mock-groq")]
+        assert router.resolve("chat", ["triton"]) == []
+    
+    def test_hedge_beats_slow_primary(self, two_upstreams):
+        """Test that a slow call is hedged to the next target and the loser is cancelled."""
+        slow, fast = two_upstreams
+        router = Router()
+        targets = [("openai", "mock-openai"), ("groq", "mock-groq")]
+        # Make the slow provider look fastest so it is picked as the primary
+        router.stats(targets[0]).record(0.001, False, 0.2)
+        router.stats(targets[1]).record(0.002, False, 0.2)
+        
+        original = settings.HEDGE_DELAY
+        settings.HEDGE_DELAY = 0.05
+        try:
+            start = time.perf_counter()
+            response = run(router.generate(targets, prompt="Hello", temperature=0, max_tokens=10, hedge=True))
+            elapsed = time.perf_counter() - start
+        finally:
+            settings.HEDGE_DELAY = original
+        
+        assert response["model"] == "mock-groq"
+        assert elapsed < 0.5
+        assert router.hedges == 1
+        assert router.hedge_wins == 1
+        assert slow.requests == 1 and fast.requests == 1
+    
+    def test_hedge_loser_keeps_its_latency(self, monkeypatch):
+        """Test that a call cancelled by a hedge records no less than its target's EWMA latency."""
+        models = {("openai", "slow"): FakeModel(delay=10.0), ("groq", "fast"): FakeModel(delay=0.01)}
+        monkeypatch.setattr("app.models.routing.get_model", lambda *target: models[target])
+        monkeypatch.setattr(settings, "HEDGE_DELAY", 0.05)
+        circuit_breakers.reset()
+        router = Router()
+        stats = router.stats(("openai", "slow"))
+        stats.record(2.0, False, 0.2)
+        
+        response = run(router._attempt([("openai", "slow"), ("groq", "fast")], "hi", 0.0, 10, hedge=True))
+        
+        assert response == {"text": "hello"} and router.hedge_wins == 1
+        assert list(stats.samples) == [2.0, 2.0]
+        assert stats.latency == pytest.approx(2.0)
+        assert not router._hedge_losers
+    
+    def test_abandoned_call_records_no_sample(self, monkeypatch):
+        """Test that a call cancelled because its caller went away leaves the target's latency alone."""
+        monkeypatch.setattr("app.models.routing.get_model", lambda *target: FakeModel(delay=10.0))
+        circuit_breakers.reset()
+        router = Router()
+        stats = router.stats(("openai", "slow"))
+        stats.record(2.0, False, 0.2)
+        
+        async def disconnect():
+            call = asyncio.ensure_future(router._call(("openai", "slow"), "hi", 0.0, 10))
+            await asyncio.sleep(0.01)
+            call.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await call
+        
+        run(disconnect())
+        
+        assert list(stats.samples) == [2.0]
+        assert stats.latency == pytest.approx(2.0)
+    
+    def test_no_hedge_without_latency_samples(self):
+        """Test that hedging waits for enough samples to estimate the p95."""
+        router = Router()
+        
+        assert router.hedge_delay(("groq", "mock-groq")) is None
+        for _ in range(settings.HEDGE_MIN_SAMPLES):
+            router.stats(("groq", "mock-groq")).record(0.2, False, 0.2)
+        assert router.hedge_delay(("groq", "mock-groq")) == pytest.approx(0.2)
+    
+    
+    def test_failed_streams_are_closed(self, monkeypatch):
+        """Test that a stream failing at the transport is closed and fails over, and other errors are raised."""
+        streams = {
+            ("openai", "down"): FakeStream(httpx.ConnectError("refused")),
+            ("groq", "up"): FakeStream(),
+            ("groq", "broken"): FakeStream(TypeError("bug")),
+        }
+        monkeypatch.setattr("app.models.routing.get_model", lambda *target: FakeModel(streams[target]))
+        circuit_breakers.reset()
+        router = Router()
+        
+        first, events = run(router.start_stream([("openai", "down")], "hi", 0.0, 10, fallbacks=[("groq", "up")]))
+        assert first == {"text": "hello"} and events is streams[("groq", "up")]
+        assert streams[("openai", "down")].closed
+        assert circuit_breakers.get(("openai", "down")).failures == 1
+        
+        with pytest.raises(TypeError):
+            run(router.start_stream([("groq", "broken")], "hi", 0.0, 10, fallbacks=[("groq", "up")]))
+        assert streams[("groq", "broken")].closed
+        assert circuit_breakers.get(("groq", "broken")).failures == 0
+
+
+class TestAliasRouting:
+    """Tests for model alias routing through the generate endpoint."""
+    
+    def test_alias_routes_to_allowed_target(self, gateway_client, gateway_headers, model_aliases):
+        """Test that an alias is served by a target on one of the client's providers."""
+        response = gateway_client.post(
+            "/api/v1/generate",
+            json={"prompt": "Hello", "max_tokens": 10, "model": "chat"},
+            headers=gateway_headers
+        )
+        
+        assert response.status_code == 200
+        assert response.json()["model"] == "mock-openai"
+    
+    def test_alias_without_allowed_target_is_forbidden(self, gateway_client, gateway_headers, model_aliases):
+        """Test that an alias with no target on the client's providers is rejected."""
+        settings.MODEL_ALIASES = {"groq-only": ["groq/mock-groq"]}
+        
+        response = gateway_client.post(
+            "/api/v1/generate",
+            json={"prompt": "Hello", "max_tokens": 10, "model": "groq-only"},
+            headers=gateway_headers
+        )
+        
+        assert response.status_code == 403
@@ -0,0 +1,101 @@
+"""
+Tests for the semantic cache.
+"""
+import numpy as np
+
+from app.core.semantic_cache import HashingEmbedder, SemanticCache, VectorIndex
+
+SCOPE = ("groq", "mixtral-8x7b-32768", 0.0, 150)
+
+class TestHashingEmbedder:
+    """Tests for the hashing embedder."""
+    
+    def test_normalized(self):
+        """Test that embeddings have unit length."""
+        vector = HashingEmbedder().embed("How do I reset my password?")
+        
+        assert vector.dtype == np.float32
+        assert np.linalg.norm(vector) == np.float32(1.0)
+    
+    def test_paraphrases_are_closer_than_unrelated_prompts(self):
+        """Test that near-duplicate prompts are more similar than unrelated ones."""
+        embedder = HashingEmbedder()
+        prompt = embedder.embed("How do I reset my account password?")
+        paraphrase = embedder.embed("how do i reset my account password")
+        unrelated = embedder.embed("Summarize the quarterly sales report")
+        
+        assert float(prompt @ paraphrase) > 0.99
+        assert float(prompt @ unrelated) < 0.5
+
+class TestVectorIndex:
+    """Tests for the bucketed vector index."""
+    
+    def test_search_returns_most_similar(self):
+        """Test that search ranks results by similarity within a scope."""
+        embedder = HashingEmbedder()
+        index = VectorIndex(embedder.dim, max_entries=100)
+        for text in ("reset my password", "cancel my subscription", "update billing address"):
+            index.add(embedder.embed(text), SCOPE, text)
+        index.add(embedder.embed("reset my password"), ("openai", "gpt-4o", 0.0, 150), "other scope")
+        
+        results = index.search(embedder.embed("reset my password please"), SCOPE, k=1)
+        
+        assert results[0][1] == "reset my password"
+        assert results[0][0] > 0.8
+    
+    def test_bounded_size(self):
+        """Test that the oldest entries are evicted once the index is full."""
+        embedder = HashingEmbedder()
+        index = VectorIndex(embedder.dim, max_entries=10)
+        for i in range(25):
+            index.add(embedder.embed(f"prompt number {i}"), SCOPE, i)
+        
+        assert len(index) == 10
+        assert index.search(embedder.embed("prompt number 24"), SCOPE, k=1)[0][1] == 24
+        assert all(payload >= 15 for _, payload in index.search(embedder.embed("prompt number 1"), SCOPE, k=10))
+    
+    def test_expired_entries_are_skipped_and_evicted(self):
+        """Test that searches do not match expired vectors and remove them."""
+        embedder = HashingEmbedder()
+        index = VectorIndex(embedder.dim, max_entries=10)
+        index.add(embedder.embed("reset my password"), SCOPE, "old", expires=10.0)
+        index.add(embedder.embed("reset my password please"), SCOPE, "new", expires=20.0)
+        
+        results = index.search(embedder.embed("reset my password"), SCOPE, k=2, now=15.0)
+        
+        assert [payload for _, payload in results] == ["new"]
+        assert len(index) == 1
+
+class TestSemanticCache:
+    """Tests for semantic cache lookups."""
+    
+    def test_threshold(self):
+        """Test that only prompts above the similarity threshold hit."""
+        cache = SemanticCache(HashingEmbedder(), max_entries=100)
+        vector, cached = cache.get(SCOPE, "What is the capital of France?", threshold=0.9)
+        assert cached is None
+        cache.set(SCOPE, vector, {"text": "Paris", "model": "model", "usage": None})
+        
+        _, near_duplicate = cache.get(SCOPE, "what is the capital of france", threshold=0.9)
+        _, different = cache.get(SCOPE, "What is the capital of Spain?", threshold=0.9)
+        
+        assert near_duplicate["text"] == "Paris"
+        assert different is None
+        assert cache.stats() == {"hits": 1, "misses": 2, "entries": 1}
+    
+    def test_entries_expire_with_ttl(self, monkeypatch):
+        """Test that cached responses stop matching once their time to live has passed."""
+        now = [100.0]
+        monkeypatch.setattr("app.core.semantic_cache.time.monotonic", lambda: now[0])
+        cache = SemanticCache(HashingEmbedder(), max_entries=100, ttl=60.0)
+        vector, _ = cache.get(SCOPE, "What is the capital of France?", threshold=0.9)
+        cache.set(SCOPE, vector, {"text": "Paris", "model": "model", "usage": None})
+        
+        now[0] = 159.0
+        _, fresh = cache.get(SCOPE, "What is the capital of France?", threshold=0.9)
+        now[0] = 160.0
+        _, expired = cache.get(SCOPE, "What is the capital of France?", threshold=0.9)
+        
+        assert fresh["text"] == "Paris"
+        assert expired is None
+        assert cache.stats()["entries"] == 0
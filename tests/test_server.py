@@ -0,0 +1,98 @@
+"""
+Tests for the production server, run as a subprocess against a local mock upstream.
+"""
+import os
+import signal
+import socket
+import subprocess
+import sys
+import time
+from contextlib import contextmanager
+
+import httpx
+import pytest
+
+from tests.conftest import GATEWAY_CLIENT_ID, GATEWAY_CLIENT_SECRET
+from tests.test_api_auth import create_test_client_config
+
+pytestmark = pytest.mark.skipif(not hasattr(os, "fork"), reason="the server forks its workers")
+
+HEADERS = {"client-id": GATEWAY_CLIENT_ID, "client-secret": GATEWAY_CLIENT_SECRET}
+STREAM_BODY = {"messages": [{"role": "user", "content": "hello there"}], "stream": True}
+
+@contextmanager
+def run_server(upstream, config_dir, workers=2, **env):
+    """Start the server with the gateway client configuration and wait until it answers.
+    
+    Yields:
+        Tuple[subprocess.Popen, str]: Supervisor process and base URL
+    """
+    create_test_client_config(
+        client_id=GATEWAY_CLIENT_ID,
+        name="Gateway Client",
+        secret=GATEWAY_CLIENT_SECRET,
+        allowed_providers=["openai"],
+        output_dir=str(config_dir),
+    )
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    process = subprocess.Popen(
+        [sys.executable, "-m", "app.server", "--host", "127.0.0.1", "--port", str(port), "--workers", str(workers)],
+        env={
+            **os.environ,
+            "OPENAI_API_KEY": "sk-test",
+            "OPENAI_BASE_URL": f"{upstream.base_url}/v1",
+            "CLIENT_CONFIG_DIR": str(config_dir),
+            "METRICS_MULTIPROC_DIR": str(config_dir / "metrics"),
+            **env,
+        },
+        cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    )
+    base_url = f"http://127.0.0.1:{port}"
+    try:
+        deadline = time.monotonic() + 30
+        while True:
+            try:
+                if httpx.get(f"{base_url}/health").status_code == 200:
+                    break
+            except httpx.TransportError:
+                pass
+            assert process.poll() is None and time.monotonic() < deadline, "server did not start"
+            time.sleep(0.1)
+        yield process, base_url
+    finally:
+        if process.poll() is None:
+            process.kill()
+            process.wait()
+
+class TestServer:
+    """Tests for the pre-forked production server."""
+    
+    def test_graceful_drain(self, upstream, tmp_path):
+        """Test that SIGTERM lets a stream in flight finish before the workers exit."""
+        upstream.delay = 0.5
+        with run_server(upstream, tmp_path) as (process, base_url):
+            with httpx.stream(
+                "POST", f"{base_url}/api/v1/chat/completions", json=STREAM_BODY, headers=HEADERS, timeout=30
+            ) as response:
+                lines = response.iter_lines()
+                assert next(lines).startswith("data: ")
+                process.send_signal(signal.SIGTERM)
+                rest = [line for line in lines if line.startswith("data: ")]
+            
+            assert rest[-1] == "data: [DONE]"
+            assert process.wait(timeout=30) == 0
+            with pytest.raises(httpx.TransportError):
+                httpx.get(f"{base_url}/health")
+    
+    def test_concurrency_limit(self, upstream, tmp_path):
+        """Test that a worker over its concurrency limit answers 503."""
+        upstream.delay = 0.5
+        # The stream's connection takes one of the two places, the health check's the other
+        with run_server(upstream, tmp_path, workers=1, SERVER_LIMIT_CONCURRENCY="2") as (process, base_url):
+            with httpx.stream(
+                "POST", f"{base_url}/api/v1/chat/completions", json=STREAM_BODY, headers=HEADERS, timeout=30
+            ) as response:
+                assert response.status_code == 200
+                assert httpx.get(f"{base_url}/health").status_code == 503
@@ -0,0 +1,107 @@
+"""
+Tests for request coalescing.
+"""
+import asyncio
+
+import httpx
+import pytest
+
+from app.main import app
+from app.core.rate_limit import rate_limiter
+from app.core.singleflight import SingleFlight
+from app.models.provider_clients import provider_clients
+from tests.conftest import GATEWAY_CLIENT_ID
+
+class TestSingleFlight:
+    """Tests for the single-flight group."""
+    
+    def test_concurrent_calls_share_one_call(self):
+        """Test that concurrent callers with the same key share a single call."""
+        group = SingleFlight()
+        calls = []
+        
+        async def call():
+            calls.append(1)
+            await asyncio.sleep(0.05)
+            return {"text": "result"}
+        
+        async def run():
+            return await asyncio.gather(*[group.do("key", call) for _ in range(10)])
+        
+        results = asyncio.run(run())
+        
+        assert len(calls) == 1
+        assert all(result == {"text": "result"} for result in results)
+        assert group.shared == 9
+        assert group.in_flight() == 0
+    
+    def test_different_keys_are_not_shared(self):
+        """Test that calls with different keys run separately."""
+        group = SingleFlight()
+        
+        async def call(value):
+            await asyncio.sleep(0.01)
+            return value
+        
+        async def run():
+            return await asyncio.gather(group.do("a", lambda: call(1)), group.do("b", lambda: call(2)))
+        
+        assert asyncio.run(run()) == [1, 2]
+        assert group.calls == 2
+    
+    def test_errors_reach_every_waiter(self):
+        """Test that a failed call raises in every waiter."""
+        group = SingleFlight()
+        
+        async def call():
+            await asyncio.sleep(0.01)
+            raise RuntimeError("upstream failed")
+        
+        async def run():
+            return await asyncio.gather(*[group.do("key", call) for _ in range(3)], return_exceptions=True)
+        
+        results = asyncio.run(run())
+        
+        assert all(isinstance(result, RuntimeError) for result in results)
+    
+    def test_cancelled_waiter_does_not_cancel_call(self):
+        """Test that cancelling the first waiter leaves the call running for the others."""
+        group = SingleFlight()
+        
+        async def call():
+            await asyncio.sleep(0.05)
+            return "done"
+        
+        async def run():
+            first = asyncio.ensure_future(group.do("key", call))
+            await asyncio.sleep(0)
+            second = asyncio.ensure_future(group.do("key", call))
+            await asyncio.sleep(0.01)
+            first.cancel()
+            return await second
+        
+        assert asyncio.run(run()) == "done"
+
+class TestGenerateCoalescing:
+    """Tests for coalescing identical generate requests."""
+    
+    def test_identical_requests_share_upstream_call(self, gateway_config, gateway_headers, upstream):
+        """Test that identical concurrent requests make one upstream call and are each charged."""
+        upstream.delay = 0.2
+        request_data = {"prompt": "Popular prompt", "max_tokens": 10, "temperature": 0, "cache": False}
+        
+        async def run():
+            transport = httpx.ASGITransport(app=app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://gateway") as client:
+                responses = await asyncio.gather(*[
+                    client.post("/api/v1/generate", json=request_data, headers=gateway_headers)
+                    for _ in range(5)
+                ])
+            await provider_clients.close()
+            return responses
+        
+        responses = asyncio.run(run())
+        
+        assert [response.status_code for response in responses] == [200] * 5
+        assert upstream.requests == 1
+        assert rate_limiter.get_usage(GATEWAY_CLIENT_ID) == 5 * 5
@@ -0,0 +1,143 @@
+"""
+Tests for local token counting and the checks made with it before requests are sent upstream.
+"""
+import json
+
+import pytest
+
+from app.core.config import settings
+from app.core.rate_limit import RateLimiter, RateLimitExceeded, rate_limiter
+from app.schemas.base import RateLimit
+from app.models.tokenizer import HeuristicTokenizer, TokenCounter, Tokenizer, token_counter
+from tests.conftest import GATEWAY_CLIENT_ID
+
+class CountingTokenizer(Tokenizer):
+    """Tokenizer that counts words and how often it was called."""
+    
+    memoize = True
+    
+    def __init__(self):
+        self.calls = 0
+    
+    def count(self, text: str) -> int:
+        self.calls += 1
+        return len(text.split())
+
+@pytest.fixture
+def small_context():
+    """Give the gateway's default model a 1000-token context window."""
+    original = settings.MODEL_CONTEXT_WINDOWS
+    settings.MODEL_CONTEXT_WINDOWS = {"gpt-3.5-turbo": 1000}
+    token_counter.clear()
+    yield
+    settings.MODEL_CONTEXT_WINDOWS = original
+    token_counter.clear()
+
+class TestTokenCounter:
+    """Tests for the token counter."""
+    
+    def test_heuristic_estimates(self):
+        """Test that estimates follow the text length and weigh non-ASCII text more."""
+        tokenizer = HeuristicTokenizer(chars_per_token=4.0)
+        
+        assert tokenizer.count("") == 0
+        assert tokenizer.count("a" * 400) == 100
+        assert tokenizer.count("漢字" * 50) == 125
+    
+    def test_model_registry(self):
+        """Test that models match their longest registered prefix and windows can be overridden."""
+        counter = TokenCounter()
+        
+        assert counter.context_window("gpt-4") == 8192
+        assert counter.context_window("gpt-4o-mini") == 128000
+        assert counter.context_window("my-finetune") is None
+        
+        original = settings.MODEL_CONTEXT_WINDOWS
+        settings.MODEL_CONTEXT_WINDOWS = {"my-finetune": 16384}
+        try:
+            counter.clear()
+            assert counter.context_window("my-finetune") == 16384
+        finally:
+            settings.MODEL_CONTEXT_WINDOWS = original
+    
+    def test_repeated_segments_are_memoized(self):
+        """Test that long segments are counted once and short ones are not remembered."""
+        counter = TokenCounter(max_entries=2, min_chars=20)
+        tokenizer = CountingTokenizer()
+        counter._models["model"] = (tokenizer, None)
+        system = "Answer from the manual below. " * 10
+        
+        for question in ("first", "second", "third"):
+            tokens = counter.count_messages("model", [
+                {"role": "system", "content": system},
+                {"role": "user", "content": question},
+            ])
+        
+        assert tokens == 3 + 3 + 50 + 3 + 1
+        assert tokenizer.calls == 4
+        assert counter.stats() == {"entries": 1, "hits": 2, "misses": 1}
+        # Segments are remembered by digest, not by their text
+        assert all(system not in key for key in counter._segments)
+
+class TestTokenReservations:
+    """Tests for token reservations in the rate limiter."""
+    
+    def test_reserve_and_release(self):
+        """Test that reservations count against the daily limit until they are settled."""
+        limiter = RateLimiter()
+        rate_limit = RateLimit(requests_per_minute=100, tokens_per_day=1000)
+        
+        limiter.reserve("client", rate_limit, 600, 100)
+        with pytest.raises(RateLimitExceeded, match="Daily token limit"):
+            limiter.reserve("client", rate_limit, 600, 500)
+        
+        # Settle the first call with its actual usage
+        limiter.record_tokens("client", 150)
+        limiter.release("client", 600)
+        assert limiter.get_usage("client") == 150
+        limiter.reserve("client", rate_limit, 600, 500)
+
+class TestTokenPrechecks:
+    """Tests for the token checks made before calling the provider."""
+    
+    def test_prompt_too_long(self, small_context, gateway_client, gateway_headers, upstream):
+        """Test that prompts that cannot fit the context window are rejected without an upstream call."""
+        prompt = "word " * 1000
+        
+        response = gateway_client.post("/api/v1/generate", json={"prompt": prompt}, headers=gateway_headers)
+        assert response.status_code == 400
+        assert "Prompt too long" in response.json()["detail"]
+        
+        response = gateway_client.post("/api/v1/chat/completions", json={
+            "messages": [{"role": "user", "content": prompt}],
+        }, headers=gateway_headers)
+        assert response.status_code == 400
+        assert upstream.requests == 0
+    
+    def test_max_tokens_is_trimmed(self, small_context, gateway_client, gateway_headers, upstream):
+        """Test that max_tokens is trimmed to the room the prompt leaves in the context window."""
+        prompt = "x" * 2000
+        
+        response = gateway_client.post(
+            "/api/v1/generate", json={"prompt": prompt, "max_tokens": 900}, headers=gateway_headers
+        )
+        assert response.status_code == 200
+        assert json.loads(upstream.last_body)["max_tokens"] == 500
+        
+        gateway_client.post("/api/v1/chat/completions", json={
+            "messages": [{"role": "user", "content": prompt}], "max_completion_tokens": 900,
+        }, headers=gateway_headers)
+        assert json.loads(upstream.last_body)["max_completion_tokens"] == 1000 - 506
+    
+    def test_quota_is_reserved(self, gateway_config, gateway_client, gateway_headers, upstream):
+        """Test that prompts that do not fit the remaining daily quota are rejected before dispatch."""
+        gateway_config(rate_limit={"requests_per_minute": 60, "tokens_per_day": 100})
+        
+        response = gateway_client.post("/api/v1/generate", json={"prompt": "x" * 800}, headers=gateway_headers)
+        assert response.status_code == 429
+        assert upstream.requests == 0
+        
+        response = gateway_client.post("/api/v1/generate", json={"prompt": "hi"}, headers=gateway_headers)
+        assert response.status_code == 200
+        # The reservation is replaced by the actual usage
+        assert rate_limiter.get_usage(GATEWAY_CLIENT_ID) == 5
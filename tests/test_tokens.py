@@ -0,0 +1,135 @@
+"""
+Tests for signed bearer tokens.
+"""
+import json
+
+import pytest
+
+from app.core.config import settings
+from app.clients.tokens import TokenError, b64url_decode, b64url_encode, token_service
+from app.clients.auth import client_manager
+from tests.conftest import GATEWAY_CLIENT_ID, GATEWAY_CLIENT_SECRET
+
+@pytest.fixture
+def jwt_secret():
+    """Configure an HS256 signing secret."""
+    original = (settings.JWT_SECRET, settings.JWT_VERIFY_KEYS, settings.JWT_KEY_ID)
+    settings.JWT_SECRET = "test-signing-secret"
+    token_service.reset()
+    yield
+    settings.JWT_SECRET, settings.JWT_VERIFY_KEYS, settings.JWT_KEY_ID = original
+    token_service.reset()
+
+def reencode(token: str, **claims) -> str:
+    """Change claims of a token while keeping its original signature."""
+    header, payload, signature = token.split(".")
+    data = json.loads(b64url_decode(payload))
+    data.update(claims)
+    return f"{header}.{b64url_encode(json.dumps(data).encode())}.{signature}"
+
+class TestTokenService:
+    """Tests for issuing and verifying tokens."""
+    
+    def test_round_trip(self, gateway_config, jwt_secret):
+        """Test that a token carries the client's configuration."""
+        config = client_manager.get_client_config(GATEWAY_CLIENT_ID)
+        token, expires_in = token_service.issue(config)
+        
+        verified = token_service.verify(token)
+        assert expires_in == settings.JWT_TTL
+        assert verified.client_id == GATEWAY_CLIENT_ID
+        assert verified.allowed_providers == config.allowed_providers
+        assert verified.rate_limit == config.rate_limit
+        assert verified.client_secret_hash is None
+        assert json.loads(b64url_decode(token.split(".")[1]))["key"] == GATEWAY_CLIENT_ID
+    
+    def test_tampered_tokens_are_rejected(self, gateway_config, jwt_secret):
+        """Test that changed claims, foreign signatures and other algorithms are rejected."""
+        token, _ = token_service.issue(client_manager.get_client_config(GATEWAY_CLIENT_ID))
+        header, payload, _ = token.split(".")
+        none_header = b64url_encode(json.dumps({"alg": "none", "typ": "JWT"}).encode())
+        list_kid_header = b64url_encode(json.dumps({"alg": "HS256", "typ": "JWT", "kid": ["default"]}).encode())
+        
+        for bad in (
+            reencode(token, sub="test_client"),
+            f"{list_kid_header}.{payload}.{b64url_encode(b'x' * 32)}",
+            f"{header}.{payload}.{b64url_encode(b'x' * 32)}",
+            f"{none_header}.{payload}.",
+            "not-a-token",
+        ):
+            with pytest.raises(TokenError):
+                token_service.verify(bad)
+    
+    def test_expired_tokens_are_rejected(self, gateway_config, jwt_secret):
+        """Test that tokens past their expiry and leeway are rejected."""
+        original = settings.JWT_TTL
+        settings.JWT_TTL = -settings.JWT_LEEWAY - 1
+        try:
+            token, _ = token_service.issue(client_manager.get_client_config(GATEWAY_CLIENT_ID))
+        finally:
+            settings.JWT_TTL = original
+        
+        with pytest.raises(TokenError, match="expired"):
+            token_service.verify(token)
+    
+    def test_rotated_keys_still_verify(self, gateway_config, jwt_secret):
+        """Test that tokens signed with a retired key verify while it is listed in JWT_VERIFY_KEYS."""
+        token, _ = token_service.issue(client_manager.get_client_config(GATEWAY_CLIENT_ID))
+        settings.JWT_VERIFY_KEYS = {"default": settings.JWT_SECRET}
+        settings.JWT_SECRET = "new-signing-secret"
+        settings.JWT_KEY_ID = "2"
+        token_service.reset()
+        
+        assert token_service.verify(token).client_id == GATEWAY_CLIENT_ID
+        new_token, _ = token_service.issue(client_manager.get_client_config(GATEWAY_CLIENT_ID))
+        assert token_service.verify(new_token).client_id == GATEWAY_CLIENT_ID
+
+
+class TestTokenEndpoint:
+    """Tests for the token endpoint and bearer authentication."""
+    
+    def test_bearer_token_authorizes_requests(self, gateway_client, jwt_secret):
+        """Test that a token from the token endpoint works without the client secret."""
+        response = gateway_client.post(
+            "/api/v1/token", json={"client_id": GATEWAY_CLIENT_ID, "client_secret": GATEWAY_CLIENT_SECRET}
+        )
+        assert response.status_code == 200
+        token = response.json()["access_token"]
+        assert response.json()["token_type"] == "bearer"
+        
+        response = gateway_client.post(
+            "/api/v1/generate",
+            json={"prompt": "Hello", "max_tokens": 10},
+            headers={"Authorization": f"Bearer {token}"}
+        )
+        assert response.status_code == 200
+        assert response.json()["text"] == "echo: Hello"
+    
+    def test_token_keeps_permissions(self, gateway_client, jwt_secret):
+        """Test that endpoint permissions from the claims are enforced."""
+        token = gateway_client.post(
+            "/api/v1/token", json={"client_id": GATEWAY_CLIENT_ID, "client_secret": GATEWAY_CLIENT_SECRET}
+        ).json()["access_token"]
+        
+        response = gateway_client.get("/api/v1/circuits", headers={"Authorization": f"Bearer {token}"})
+        assert response.status_code == 403
+    
+    def test_invalid_credentials_and_tokens(self, gateway_client, jwt_secret):
+        """Test that bad credentials get no token and bad tokens are rejected."""
+        response = gateway_client.post("/api/v1/token", json={"client_id": GATEWAY_CLIENT_ID, "client_secret": "wrong"})
+        assert response.status_code == 401
+        
+        response = gateway_client.post(
+            "/api/v1/generate",
+            json={"prompt": "Hello", "max_tokens": 10},
+            headers={"Authorization": "Bearer not.a.token"}
+        )
+        assert response.status_code == 401
+        assert response.headers["www-authenticate"] == "Bearer"
+    
+    def test_token_endpoint_needs_a_key(self, gateway_client):
+        """Test that the token endpoint is unavailable without a signing key."""
+        response = gateway_client.post(
+            "/api/v1/token", json={"client_id": GATEWAY_CLIENT_ID, "client_secret": GATEWAY_CLIENT_SECRET}
+        )
+        assert response.status_code == 503
@@ -0,0 +1,112 @@
+"""
+Tests for request tracing.
+"""
+import logging
+
+import pytest
+
+from app.core.config import settings
+from app.core.tracing import parse_traceparent, start_trace
+
+TRACE_ID = "4bf92f3577b34da6a3ce929d0e0e4736"
+PARENT_ID = "00f067aa0ba902b7"
+TRACEPARENT = f"00-{TRACE_ID}-{PARENT_ID}-01"
+
+@pytest.fixture
+def body_sampling():
+    """Sample every request body, capped at a few bytes."""
+    original = (settings.TRACE_BODY_SAMPLE_RATE, settings.TRACE_BODY_MAX_BYTES)
+    settings.TRACE_BODY_SAMPLE_RATE = 1.0
+    settings.TRACE_BODY_MAX_BYTES = 16
+    yield
+    settings.TRACE_BODY_SAMPLE_RATE, settings.TRACE_BODY_MAX_BYTES = original
+
+class TestTraceContext:
+    """Tests for W3C trace context handling."""
+    
+    def test_parse_traceparent(self):
+        """Test that valid headers are parsed and invalid ones rejected."""
+        assert parse_traceparent(TRACEPARENT) == (TRACE_ID, PARENT_ID, "01")
+        assert parse_traceparent(None) is None
+        assert parse_traceparent("garbage") is None
+        assert parse_traceparent(f"ff-{TRACE_ID}-{PARENT_ID}-01") is None
+        assert parse_traceparent(f"00-{'0' * 32}-{PARENT_ID}-01") is None
+        assert parse_traceparent(f"00-{TRACE_ID}-{'0' * 16}-01") is None
+        assert parse_traceparent(f"00-{TRACE_ID.upper()}-{PARENT_ID}-01") is None
+        # Later versions may append fields
+        assert parse_traceparent(f"01-{TRACE_ID}-{PARENT_ID}-01-extra") == (TRACE_ID, PARENT_ID, "01")
+    
+    def test_start_trace(self):
+        """Test that a trace continues the caller's trace with a new span."""
+        trace = start_trace(TRACEPARENT, "vendor=1")
+        
+        assert trace.trace_id == TRACE_ID
+        assert trace.parent_id == PARENT_ID
+        assert trace.span_id != PARENT_ID and len(trace.span_id) == 16
+        assert trace.traceparent == f"00-{TRACE_ID}-{trace.span_id}-01"
+        assert trace.request_id == TRACE_ID
+        
+        new_trace = start_trace("invalid", request_id="x" * 500)
+        assert len(new_trace.trace_id) == 32 and new_trace.trace_id != TRACE_ID
+        assert new_trace.parent_id is None
+        assert new_trace.request_id == new_trace.trace_id
+
+
+class TestTracingMiddleware:
+    """Tests for the tracing middleware."""
+    
+    def test_response_carries_trace_headers(self, gateway_client):
+        """Test that responses echo the request ID and continue the trace."""
+        response = gateway_client.get("/health", headers={"traceparent": TRACEPARENT, "X-Request-ID": "req-123"})
+        
+        assert response.headers["x-request-id"] == "req-123"
+        assert response.headers["traceparent"].startswith(f"00-{TRACE_ID}-")
+        assert not response.headers["traceparent"].endswith(f"{PARENT_ID}-01")
+        assert response.headers["server-timing"].startswith("app;dur=")
+    
+    def test_trace_propagates_to_provider(self, gateway_client, gateway_headers, upstream):
+        """Test that provider calls carry the request's traceparent and tracestate."""
+        response = gateway_client.post(
+            "/api/v1/generate",
+            json={"prompt": "Hello", "max_tokens": 10},
+            headers={**gateway_headers, "traceparent": TRACEPARENT, "tracestate": "vendor=1"}
+        )
+        
+        assert response.status_code == 200
+        assert upstream.last_headers["traceparent"] == response.headers["traceparent"]
+        assert upstream.last_headers["tracestate"] == "vendor=1"
+    
+    def test_sampled_bodies_are_capped(self, gateway_client, gateway_headers, body_sampling, caplog):
+        """Test that sampled bodies are logged up to the size cap."""
+        with caplog.at_level(logging.INFO, logger="app.middleware.tracing_middleware"):
+            response = gateway_client.post(
+                "/api/v1/generate",
+                json={"prompt": "Hello there", "max_tokens": 10},
+                headers=gateway_headers
+            )
+        
+        assert response.status_code == 200
+        request_id = response.headers["x-request-id"]
+        body_logs = [r.getMessage() for r in caplog.records if r.getMessage().startswith(f"Request {request_id} body")]
+        assert body_logs == [f"Request {request_id} body: {response.request.content[:16].decode()!r} response body: {response.content[:16].decode()!r}"]
+    
+    def test_credential_bodies_are_not_sampled(self, gateway_client, body_sampling, caplog):
+        """Test that token requests, which carry client secrets and tokens, are never sampled."""
+        with caplog.at_level(logging.INFO, logger="app.middleware.tracing_middleware"):
+            response = gateway_client.post("/api/v1/token", json={"client_id": "gateway_client", "client_secret": "secret"})
+        
+        request_id = response.headers["x-request-id"]
+        assert [r for r in caplog.records if r.getMessage().startswith(f"Request {request_id} body")] == []
+    
+    def test_streaming_response_is_not_buffered(self, gateway_client, gateway_headers, body_sampling):
+        """Test that streamed responses pass through the middleware intact while sampled."""
+        with gateway_client.stream(
+            "POST",
+            "/api/v1/generate",
+            json={"prompt": "Hello there", "max_tokens": 10, "stream": True},
+            headers=gateway_headers
+        ) as response:
+            assert "x-request-id" in response.headers
+            body = "".join(response.iter_text())
+        
+        assert 'echo:' in body and '"done": true' in body